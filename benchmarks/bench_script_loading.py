@@ -0,0 +1,104 @@
+# benchmarks/bench_script_loading.py
+# Compares eager script parsing with the lazy memory-mapped index on a generated script.
+# Each mode runs in a fresh subprocess so the RSS numbers are not polluted by the other run.
+#
+#   python benchmarks/bench_script_loading.py [--lines 100000] [--repeat 3]
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def generate_script(path: Path, lines: int, seed: int = 7):
+    rng = random.Random(seed)
+    phrases = ["欢迎来到直播间", "今天我们聊聊", "感谢大哥的礼物", "接下来是下一个环节", "大家把弹幕刷起来", "Let's go"]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(lines):
+            roll = rng.random()
+            if roll < 0.05:
+                f.write(f"# 第 {i} 段注释\n")
+            elif roll < 0.10:
+                f.write("\n")
+            else:
+                f.write(f"{rng.choice(phrases)}，第{i}句，{rng.choice(phrases)}{'！' * rng.randint(0, 3)}\n")
+
+
+def run_child(mode: str, path: str):
+    """Runs inside the subprocess: load once, touch a few events, report timings and RSS."""
+    import logging
+    logging.disable(logging.CRITICAL)
+    from script_parser import parse_script_file, build_lazy_script
+
+    rss_before = _rss_bytes()
+    started = time.perf_counter()
+    events = build_lazy_script(path) if mode == "lazy" else parse_script_file(path)
+    load_seconds = time.perf_counter() - started
+    rss_after = _rss_bytes()
+
+    # Presenter-style access: step through 1000 consecutive events from the middle
+    total = len(events)
+    started = time.perf_counter()
+    middle = total // 2
+    for i in range(middle, min(total, middle + 1000)):
+        events[i]["line"]
+    access_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        "mode": mode,
+        "events": total,
+        "load_ms": round(load_seconds * 1000, 2),
+        "access_1000_ms": round(access_seconds * 1000, 3),
+        "rss_delta_mb": round((rss_after - rss_before) / (1024 * 1024), 2),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark eager vs lazy script loading.")
+    parser.add_argument("--lines", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench_script.txt"
+        generate_script(path, args.lines)
+        print(f"Generated {args.lines} lines ({path.stat().st_size / (1024 * 1024):.1f} MB)")
+        results = {}
+        for mode in ("eager", "lazy"):
+            runs = []
+            for _ in range(args.repeat):
+                output = subprocess.run([sys.executable, __file__, "--child", mode, str(path)], capture_output=True, text=True, check=True)
+                runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+            best = min(runs, key=lambda r: r["load_ms"])
+            results[mode] = best
+            print(f"{mode:>5}: {best['events']} events, load {best['load_ms']} ms, "
+                  f"1000 accesses {best['access_1000_ms']} ms, RSS +{best['rss_delta_mb']} MB (best of {args.repeat})")
+
+        eager, lazy = results["eager"], results["lazy"]
+        if lazy["load_ms"] > 0 and lazy["rss_delta_mb"] > 0:
+            print(f"lazy vs eager: load x{eager['load_ms'] / lazy['load_ms']:.2f}, RSS x{eager['rss_delta_mb'] / lazy['rss_delta_mb']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+# benchmarks/load_test.py
+# Load test: starts server.py on free ports against a generated local content snapshot
+# (DB_BACKEND=sqlite, no MongoDB needed), opens N audience and M presenter WebSocket
+# connections that do the register handshake, and drives scripted presenter actions:
+#   presenter 0     next_event (rewinds with jump_to_event at the end of the script), get_roast_sequence / advance_roast
+#   presenter M-1   auto_send_danmaku and send_boss_danmaku in a loop (handlers run inline per connection,
+#                   so the long-running flows get their own connection)
+# Reports danmaku fan-out latency (server broadcast timestamp -> audience receive), state delta
+# fan-out latency (action sent -> every presenter received the delta), throughput, dropped
+# messages and server RSS per connection, as JSON.
+# --audience-profiles runs the whole test once per audience transport profile (config.WS_TRANSPORT_PROFILES)
+# to compare memory per connection and broadcast throughput; --uvloop runs the server on uvloop.
+# --heartbeat-modes runs an idle test per keepalive implementation (config.HEARTBEAT_MODE): N audience
+# connections, no traffic, a short PING_INTERVAL; reports server CPU and the loop's timer count.
+# --handoff tests a graceful restart (server_handoff.py): N audience connections and a presenter on a
+# running server, a second server.py --takeover on the same ports; reports the reconnect gap per client
+# (close 1012 -> registered again, with the pages' 0.1-0.5 s jitter), lost clients and whether the
+# presenter's position survived.
+#
+#   python benchmarks/load_test.py [--audience 200] [--presenters 5] [--duration 20] [--output results.json]
+#   python benchmarks/load_test.py --audience-profiles default,audience_lean,audience_deflate_small [--uvloop]
+#   python benchmarks/load_test.py --heartbeat-modes library,wheel --audience 2000 [--idle-seconds 20] [--ping-interval 2]
+#   python benchmarks/load_test.py --handoff --audience 1000
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+import websockets
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+STREAMER_NAME = "压测主播"
+BOSS_NAME = "压测大哥"
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _process_rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _process_cpu_seconds(pid):
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK") # utime + stime
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _scrape_metric(flask_port, name):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{flask_port}/metrics", timeout=5) as response:
+            for line in response.read().decode().splitlines():
+                if line.startswith(name + " "):
+                    return float(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _latency_summary(seconds):
+    return {
+        "count": len(seconds),
+        "p50_ms": None if not seconds else round(_percentile(seconds, 0.50) * 1000, 3),
+        "p99_ms": None if not seconds else round(_percentile(seconds, 0.99) * 1000, 3),
+        "max_ms": None if not seconds else round(max(seconds) * 1000, 3),
+    }
+
+
+def build_content_snapshot(path: Path, quotes: int = 200):
+    """Local content stand-in with just what the driven actions read."""
+    from database import db_config
+    from database.db_local_backend import LocalSnapshotWriter
+
+    with LocalSnapshotWriter(path) as writer:
+        writer.add_documents(db_config.WELCOME_COLLECTION, [
+            {"streamer_name": STREAMER_NAME, "name": STREAMER_NAME, "generated_danmaku": [f"欢迎{STREAMER_NAME}，第{i}条" for i in range(20)]}])
+        writer.add_documents(db_config.MOCK_COLLECTION, [
+            {"streamer_name": STREAMER_NAME, "name": STREAMER_NAME, "generated_danmaku": [f"吐槽{STREAMER_NAME}，第{i}条" for i in range(20)]}])
+        writer.add_documents(db_config.ANTI_FAN_COLLECTION, [{"quote_text": f"{{}}你又来了，第{i}句回怼"} for i in range(quotes)])
+        writer.add_documents(db_config.BIG_BROTHERS_COLLECTION, [{"welcome_text": f"欢迎{{}}大哥驾到 #{i}"} for i in range(40)])
+        writer.set_meta("source_db", "load_test")
+        writer.set_meta("exported_at", time.strftime("%Y-%m-%dT%H:%M:%S"))
+
+
+class Client:
+    """One registered connection; a reader task records what arrives."""
+
+    def __init__(self, client_type, index):
+        self.client_type = client_type
+        self.index = index
+        self.ws = None
+        self.received = 0
+        self.danmaku = {} # (text, server timestamp) -> receive time
+        self.deltas = {} # state version -> receive time
+        self.replies = [] # Message types this connection received, for the drivers
+        self.closed_early = False
+
+    async def connect(self, uri):
+        # Same paths as the real pages (the server picks the transport profile from the path); compression is offered like browsers do
+        self.ws = await websockets.connect(f"{uri}/{self.client_type}", max_size=None, ping_interval=None, close_timeout=1)
+        await self.ws.send(json.dumps({"action": "register", "client_type": self.client_type}))
+        while True:
+            message = json.loads(await self.ws.recv())
+            if message.get("type") == "registration_success":
+                return
+            if message.get("type") == "error":
+                raise RuntimeError(f"{self.client_type} {self.index}: registration failed: {message.get('message')}")
+
+    async def read(self):
+        try:
+            async for raw in self.ws:
+                now = time.time()
+                self.received += 1
+                message = json.loads(raw)
+                message_type = message.get("type")
+                if message_type == "danmaku":
+                    self.danmaku[(message.get("text"), message.get("timestamp"))] = now
+                elif message_type == "state_delta" and "base_version" not in message:
+                    self.deltas.setdefault(message.get("version"), now)
+                elif message_type:
+                    self.replies.append(message_type)
+        except websockets.ConnectionClosed:
+            self.closed_early = True
+
+    async def send(self, action, **data):
+        await self.ws.send(json.dumps({"action": action, **data}))
+
+
+async def drive_navigation(presenter, stop_at, interval, script, action_sent):
+    """Steps through the script and the roast sequence; records when each state-changing action was sent."""
+    await presenter.send("load_script", filename=script)
+    await presenter.send("get_roast_sequence", target_name=BOSS_NAME)
+    actions = 0
+    seen = 0
+    while time.time() < stop_at:
+        replies, seen = presenter.replies[seen:], len(presenter.replies)
+        if "end_of_script" in replies:
+            await presenter.send("jump_to_event", event_index=0)
+        if "roast_sequence_finished" in replies:
+            await presenter.send("get_roast_sequence", target_name=BOSS_NAME)
+        action = "next_event" if actions % 2 == 0 else "advance_roast"
+        action_sent.append(time.time())
+        await presenter.send(action)
+        actions += 1
+        await asyncio.sleep(interval)
+    return actions
+
+
+async def drive_danmaku(presenter, stop_at, interval):
+    """Keeps an auto-send flow and a boss flow running."""
+    actions = 0
+    while time.time() < stop_at:
+        await presenter.send("send_boss_danmaku", danmaku_type="welcome_boss", boss_name=BOSS_NAME)
+        await presenter.send("auto_send_danmaku", streamer_name=STREAMER_NAME) # Replies when the whole flow is done
+        actions += 2
+        await asyncio.sleep(interval)
+    return actions
+
+
+async def _connect_all(clients, uri, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def connect(client):
+        async with semaphore:
+            await client.connect(uri)
+
+    await asyncio.gather(*(connect(client) for client in clients))
+
+
+async def run_load(args, uri, server_pid):
+    audience = [Client("audience", i) for i in range(args.audience)]
+    presenters = [Client("presenter", i) for i in range(max(1, args.presenters))]
+    rss_idle = _process_rss_bytes(server_pid)
+
+    started = time.perf_counter()
+    await _connect_all(audience + presenters, uri, args.connect_concurrency)
+    connect_seconds = time.perf_counter() - started
+    await asyncio.sleep(0.5) # Let the server settle before measuring
+    rss_connected = _process_rss_bytes(server_pid)
+    readers = [asyncio.create_task(client.read()) for client in audience + presenters]
+
+    action_sent = [] # Send times of navigation/roast actions, in order
+    stop_at = time.time() + args.duration
+    started = time.perf_counter()
+    navigation = asyncio.create_task(drive_navigation(presenters[0], stop_at, args.action_interval, args.script, action_sent))
+    danmaku = asyncio.create_task(drive_danmaku(presenters[-1], stop_at, args.flow_interval))
+    nav_actions, danmaku_actions = await asyncio.gather(navigation, danmaku)
+    await asyncio.sleep(args.drain)
+    elapsed = time.perf_counter() - started
+    rss_loaded = _process_rss_bytes(server_pid)
+    # Flows still running keep broadcasting; only broadcasts older than the drain window must have reached everyone
+    cutoff = time.time() - args.drain
+
+    for client in audience + presenters:
+        await client.ws.close()
+    await asyncio.gather(*readers, return_exceptions=True)
+
+    # Danmaku: every audience connection should get every broadcast
+    broadcasts = set()
+    for client in audience:
+        broadcasts.update(key for key in client.danmaku if isinstance(key[1], (int, float)) and key[1] < cutoff)
+    danmaku_latencies = [client.danmaku[key] - key[1] for client in audience for key in broadcasts if key in client.danmaku]
+    danmaku_received = len(danmaku_latencies)
+    danmaku_dropped = len(broadcasts) * len(audience) - danmaku_received
+
+    # State deltas: every presenter should get every version; latency from the action that caused it
+    versions = set()
+    for client in presenters:
+        versions.update(client.deltas)
+    first_seen = {version: min(client.deltas[version] for client in presenters if version in client.deltas) for version in versions}
+    delta_latencies = []
+    sent_times = sorted(action_sent)
+    for client in presenters:
+        for version, received in client.deltas.items():
+            # The latest action sent before the delta was first seen anywhere caused it
+            cause = [t for t in sent_times if t <= first_seen[version]]
+            if cause:
+                delta_latencies.append(received - cause[-1])
+    deltas_dropped = len(versions) * len(presenters) - sum(len(client.deltas) for client in presenters)
+
+    connections = len(audience) + len(presenters)
+    total_received = sum(client.received for client in audience + presenters)
+    return {
+        "config": {"audience": len(audience), "presenters": len(presenters), "duration_s": args.duration,
+                   "action_interval_s": args.action_interval, "send_interval_ms": args.send_interval_ms},
+        "connect_seconds": round(connect_seconds, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "actions": {"navigation_and_roast": nav_actions, "danmaku_flows": danmaku_actions},
+        "danmaku": {"broadcasts": len(broadcasts), "delivered": danmaku_received, "dropped": danmaku_dropped,
+                    "fanout_latency": _latency_summary(danmaku_latencies)},
+        "state_deltas": {"versions": len(versions), "delivered": sum(len(client.deltas) for client in presenters),
+                         "dropped": deltas_dropped, "fanout_latency": _latency_summary(delta_latencies)},
+        "throughput": {"messages_received": total_received, "messages_per_second": round(total_received / elapsed, 1) if elapsed else None,
+                       "danmaku_deliveries_per_second": round(danmaku_received / elapsed, 1) if elapsed else None},
+        "memory": {
+            "server_rss_idle_mb": None if rss_idle is None else round(rss_idle / (1024 * 1024), 2),
+            "server_rss_connected_mb": None if rss_connected is None else round(rss_connected / (1024 * 1024), 2),
+            "server_rss_loaded_mb": None if rss_loaded is None else round(rss_loaded / (1024 * 1024), 2),
+            "per_connection_kb": None if rss_idle is None or rss_connected is None else round((rss_connected - rss_idle) / connections / 1024, 2),
+            "per_connection_loaded_kb": None if rss_idle is None or rss_loaded is None else round((rss_loaded - rss_idle) / connections / 1024, 2),
+        },
+        "connections_closed_early": sum(client.closed_early for client in audience + presenters),
+    }
+
+
+async def run_idle(args, uri, server_pid, flask_port):
+    """Keepalive cost: N idle audience connections for args.idle_seconds; server CPU and loop timer count."""
+    audience = [Client("audience", i) for i in range(args.audience)]
+    await _connect_all(audience, uri, args.connect_concurrency)
+    readers = [asyncio.create_task(client.read()) for client in audience]
+    await asyncio.sleep(args.ping_interval) # First pings of every connection are out
+    cpu_before = _process_cpu_seconds(server_pid)
+    started = time.perf_counter()
+    timers = []
+    while time.perf_counter() - started < args.idle_seconds:
+        value = await asyncio.to_thread(_scrape_metric, flask_port, "danmaku_event_loop_timers")
+        if value is not None:
+            timers.append(value)
+        await asyncio.sleep(1.0)
+    elapsed = time.perf_counter() - started
+    cpu_after = _process_cpu_seconds(server_pid)
+    pings = await asyncio.to_thread(_scrape_metric, flask_port, "danmaku_heartbeat_pings_total")
+    for client in audience:
+        await client.ws.close()
+    await asyncio.gather(*readers, return_exceptions=True)
+    cpu = None if cpu_before is None or cpu_after is None else cpu_after - cpu_before
+    return {
+        "config": {"audience": len(audience), "idle_seconds": round(elapsed, 1), "ping_interval_s": args.ping_interval},
+        "server_cpu_seconds": None if cpu is None else round(cpu, 3),
+        "server_cpu_percent": None if cpu is None else round(cpu / elapsed * 100, 2),
+        "loop_timers_max": max(timers) if timers else None,
+        "loop_timers_mean": round(sum(timers) / len(timers), 1) if timers else None,
+        "wheel_pings_sent": pings,
+        "connections_closed_early": sum(client.closed_early for client in audience),
+    }
+
+
+def _track_position(message, position):
+    """Presenter's event_index from state_snapshot / state_delta messages (None if the message has none)."""
+    if message.get("type") == "state_snapshot":
+        return message.get("state", {}).get("event_index", position)
+    if message.get("type") == "state_delta":
+        return message.get("changes", {}).get("event_index", position)
+    return position
+
+
+async def _read_position(client, seconds):
+    """Reads the presenter's messages for `seconds`; returns the last event_index seen."""
+    position = None
+    deadline = time.perf_counter() + seconds
+    while (remaining := deadline - time.perf_counter()) > 0:
+        try:
+            raw = await asyncio.wait_for(client.ws.recv(), remaining)
+        except asyncio.TimeoutError:
+            break
+        position = _track_position(json.loads(raw), position)
+    return position
+
+
+async def _follow_handoff(client, uri, timeout):
+    """Reads until the server closes the connection, then reconnects like the pages do on 1012. Returns (close code, gap seconds)."""
+    try:
+        async for _ in client.ws:
+            client.received += 1
+    except websockets.ConnectionClosed:
+        pass
+    closed_at = time.perf_counter()
+    code = client.ws.close_code
+    if code != 1012:
+        client.closed_early = True
+        return code, None
+    await asyncio.sleep(random.uniform(0.1, 0.5)) # audience_display.html / presenter_core.js jitter
+    while time.perf_counter() - closed_at < timeout:
+        try:
+            await client.connect(uri)
+            return code, time.perf_counter() - closed_at
+        except (OSError, websockets.WebSocketException, RuntimeError):
+            await asyncio.sleep(0.1)
+    client.closed_early = True
+    return code, None
+
+
+async def run_handoff(args, uri, start_successor):
+    """Graceful restart under N connected clients: reconnect gap, lost clients, presenter position carried over."""
+    audience = [Client("audience", i) for i in range(args.audience)]
+    presenter = Client("presenter", 0)
+    await _connect_all(audience + [presenter], uri, args.connect_concurrency)
+    await presenter.send("load_script", filename=args.script)
+    for _ in range(3):
+        await presenter.send("next_event")
+    position_before = await _read_position(presenter, 1.0)
+
+    followers = [asyncio.create_task(_follow_handoff(client, uri, 30)) for client in audience + [presenter]]
+    started = time.perf_counter()
+    successor, old_exit = await asyncio.to_thread(start_successor)
+    results = await asyncio.gather(*followers)
+    handoff_seconds = time.perf_counter() - started
+    position_after = await _read_position(presenter, 1.0)
+    for client in audience + [presenter]:
+        await client.ws.close()
+
+    gaps = [gap for _, gap in results if gap is not None]
+    codes = {}
+    for code, _ in results:
+        codes[str(code)] = codes.get(str(code), 0) + 1
+    return {
+        "config": {"audience": len(audience), "presenters": 1},
+        "close_codes": codes,
+        "reconnected": len(gaps),
+        "lost": len(results) - len(gaps),
+        "reconnect_gap": _latency_summary(gaps),
+        "handoff_seconds": round(handoff_seconds, 3),
+        "old_server_exit_code": old_exit,
+        "presenter_position": {"before": position_before, "after": position_after},
+    }, successor
+
+
+def run_handoff_against_server(args, env_overrides, tmp: Path):
+    """Starts server.py, connects the clients, starts server.py --takeover on the same ports, measures, stops both."""
+    ws_port = _free_port()
+    flask_port = _free_port()
+    env = dict(os.environ, FLASK_PORT=str(flask_port), WEBSOCKET_PORT=str(ws_port), HANDOFF_SOCKET_PATH=str(tmp / "handoff.sock"), **env_overrides)
+    log_path = Path(args.server_log) if args.server_log else tmp / "server.log"
+    processes = []
+    with open(log_path, "w", encoding="utf-8") as log_file:
+        def start_successor():
+            process = subprocess.Popen([sys.executable, str(ROOT / "server.py"), "--takeover"], cwd=ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+            processes.append(process)
+            try:
+                old_exit = processes[0].wait(60)
+            except subprocess.TimeoutExpired:
+                old_exit = None
+            return process, old_exit
+
+        processes.append(subprocess.Popen([sys.executable, str(ROOT / "server.py")], cwd=ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT))
+        try:
+            asyncio.run(_wait_for_port(ws_port, processes[0], 30))
+            results, _ = asyncio.run(run_handoff(args, f"ws://127.0.0.1:{ws_port}", start_successor))
+        finally:
+            for process in processes:
+                process.terminate()
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+    return results
+
+
+def run_against_server(args, env_overrides, tmp: Path, log_suffix="", idle=False):
+    """Starts server.py with env_overrides on free ports, runs the load (or the idle keepalive test) against it and stops it."""
+    ws_port = _free_port()
+    flask_port = _free_port()
+    env = dict(os.environ, FLASK_PORT=str(flask_port), WEBSOCKET_PORT=str(ws_port), **env_overrides)
+    log_path = Path(args.server_log + log_suffix) if args.server_log else tmp / f"server{log_suffix}.log"
+    with open(log_path, "w", encoding="utf-8") as log_file:
+        process = subprocess.Popen([sys.executable, str(ROOT / "server.py")], cwd=ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+        try:
+            asyncio.run(_wait_for_port(ws_port, process, 30))
+            if idle:
+                results = asyncio.run(run_idle(args, f"ws://127.0.0.1:{ws_port}", process.pid, flask_port))
+            else:
+                results = asyncio.run(run_load(args, f"ws://127.0.0.1:{ws_port}", process.pid))
+        finally:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    results["config"].update({key.lower(): value for key, value in env_overrides.items() if key in ("WS_AUDIENCE_PROFILE", "USE_UVLOOP", "HEARTBEAT_MODE")})
+    return results
+
+
+async def _wait_for_port(port, process, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py exited with code {process.returncode} during startup")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server.py did not listen on port {port} within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the WebSocket server with simulated audience and presenter clients.")
+    parser.add_argument("--audience", type=int, default=200)
+    parser.add_argument("--presenters", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of driven actions")
+    parser.add_argument("--drain", type=float, default=2.0, help="Seconds to wait for in-flight messages afterwards")
+    parser.add_argument("--action-interval", type=float, default=0.1, help="Seconds between navigation/roast actions")
+    parser.add_argument("--flow-interval", type=float, default=0.5, help="Seconds between danmaku flows")
+    parser.add_argument("--send-interval-ms", type=int, default=50, help="SEND_INTERVAL_MS/GROUP_PAUSE_MS for the server under test")
+    parser.add_argument("--connect-concurrency", type=int, default=50)
+    parser.add_argument("--script", default="test.txt", help="Script under scripts/ to step through")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--server-log", help="Keep the server output in this file")
+    parser.add_argument("--audience-profiles", help="Comma-separated WS_AUDIENCE_PROFILE values; one run per profile")
+    parser.add_argument("--uvloop", action="store_true", help="Run the server with USE_UVLOOP=1")
+    parser.add_argument("--heartbeat-modes", help="Comma-separated HEARTBEAT_MODE values (library, wheel); one idle run per mode")
+    parser.add_argument("--idle-seconds", type=float, default=20.0, help="Measurement window of the idle keepalive test")
+    parser.add_argument("--ping-interval", type=int, default=2, help="PING_INTERVAL for the idle keepalive test")
+    parser.add_argument("--handoff", action="store_true", help="Graceful restart test: a second server takes over the sockets")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        build_content_snapshot(tmp / "content.sqlite3")
+        base_env = {"DB_BACKEND": "sqlite", "LOCAL_DB_PATH": str(tmp / "content.sqlite3"), "STATE_JOURNAL_DIR": str(tmp / "state"),
+                    "SEND_INTERVAL_MS": str(args.send_interval_ms), "GROUP_PAUSE_MS": str(args.send_interval_ms),
+                    "USE_UVLOOP": "1" if args.uvloop else "0",
+                    # Every simulated client connects from 127.0.0.1 at once: lift the admission caps (ws_admission.py)
+                    "WS_MAX_CONNECTIONS_PER_IP": "100000", "WS_MAX_PENDING_REGISTRATIONS": "100000",
+                    "WS_REGISTER_RATE": "100000", "WS_REGISTER_BURST": "100000"}
+        if args.handoff:
+            results = run_handoff_against_server(args, base_env, tmp)
+        elif args.heartbeat_modes:
+            results = {"heartbeat_modes": {}}
+            idle_env = dict(base_env, PING_INTERVAL=str(args.ping_interval), PING_TIMEOUT=str(args.ping_interval * 2))
+            for mode in args.heartbeat_modes.split(","):
+                results["heartbeat_modes"][mode] = run_against_server(args, dict(idle_env, HEARTBEAT_MODE=mode), tmp, f"-{mode}", idle=True)
+        elif args.audience_profiles:
+            results = {"profiles": {}}
+            for profile in args.audience_profiles.split(","):
+                results["profiles"][profile] = run_against_server(args, dict(base_env, WS_AUDIENCE_PROFILE=profile), tmp, f"-{profile}")
+        else:
+            results = run_against_server(args, base_env, tmp)
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
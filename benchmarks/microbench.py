@@ -0,0 +1,299 @@
+# benchmarks/microbench.py
+# Microbenchmarks for the hot paths: content queries (local snapshot backend, and db_queries
+# against an in-process MongoDB stand-in when mongomock is installed), script parsing, state
+# manager navigation, roast template splitting, boss template filling and broadcast fan-out
+# to fake sockets. Inputs are generated with fixed seeds at realistic sizes, so runs on the
+# same machine are comparable.
+#
+# Results can be saved as a baseline and later runs compared against it; a benchmark slower
+# than the baseline by more than --threshold is flagged and the exit code is 1.
+#
+#   python benchmarks/microbench.py --save-baseline            # record benchmarks/microbench_baseline.json
+#   python benchmarks/microbench.py [--threshold 0.25] [--filter db.] [--output results.json]
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench_script_loading import generate_script
+from database import db_config, db_queries
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "microbench_baseline.json"
+
+STREAMERS = 500
+DANMAKU_PER_STREAMER = 50
+ANTI_FAN_QUOTES = 5000
+REVERSAL_ENTRIES = 3000
+SOCIAL_TOPICS = 300
+BOSS_TEMPLATES = 500
+SCRIPT_LINES = 50_000
+FANOUT_CLIENTS = 500
+
+BENCHMARKS = [] # (name, setup(context) -> zero-argument callable)
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+def benchmark(name):
+    def decorator(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return decorator
+
+
+# --- Inputs ---
+def content_documents(seed: int = 11):
+    """{collection: [documents]} shaped like the production collections."""
+    rng = random.Random(seed)
+    streamers = [f"主播{i:04d}" for i in range(STREAMERS)]
+    return {
+        db_config.WELCOME_COLLECTION: [{"streamer_name": name, "name": name, "generated_danmaku": [f"欢迎{name}，今天第{j}次来" for j in range(DANMAKU_PER_STREAMER)]} for name in streamers],
+        db_config.MOCK_COLLECTION: [{"streamer_name": name, "name": name, "generated_danmaku": [f"{name}又在摸鱼，第{j}条" for j in range(DANMAKU_PER_STREAMER)]} for name in streamers],
+        db_config.ANTI_FAN_COLLECTION: [{"quote_text": f"{{}}你说的第{i}句我记住了，回去练练吧"} for i in range(ANTI_FAN_QUOTES)],
+        db_config.REVERSAL_COLLECTION: [{"source_name": rng.choice(streamers), "danmaku_part": f"反转{i}", "read_part": f"其实是{i}"} for i in range(REVERSAL_ENTRIES)],
+        db_config.SOCIAL_TOPICS_COLLECTION: [{"topic_name": f"话题{i:03d}", "streamer_name": rng.choice(streamers), "generated_danmaku": [f"话题{i}的第{j}条" for j in range(50)]} for i in range(SOCIAL_TOPICS)],
+        db_config.BIG_BROTHERS_COLLECTION: [{"welcome_text": f"欢迎{{}}大哥驾到，第{i}种排面"} for i in range(BOSS_TEMPLATES)],
+        db_config.GIFT_THANKS_COLLECTION: [{"danmaku_text": f"感谢{{}}送的{{}}，第{i}种感谢"} for i in range(BOSS_TEMPLATES)],
+    }
+
+
+class Context:
+    """Generated inputs shared by the benchmarks, built on first use."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._script_path = None
+        self._sqlite_backend = None
+        self._mongo_db = None
+
+    @property
+    def script_path(self):
+        if self._script_path is None:
+            self._script_path = self.directory / "bench_script.txt"
+            generate_script(self._script_path, SCRIPT_LINES)
+        return self._script_path
+
+    @property
+    def sqlite_backend(self):
+        if self._sqlite_backend is None:
+            from database.db_local_backend import LocalSnapshotWriter, SQLiteContentBackend
+
+            path = self.directory / "content.sqlite3"
+            with LocalSnapshotWriter(path) as writer:
+                for collection_name, documents in content_documents().items():
+                    writer.add_documents(collection_name, documents)
+            self._sqlite_backend = SQLiteContentBackend(path)
+            if not self._sqlite_backend.connect():
+                raise SkipBenchmark("local snapshot could not be opened")
+        return self._sqlite_backend
+
+    @property
+    def mongo_db(self):
+        if self._mongo_db is None:
+            try:
+                import mongomock
+            except ImportError:
+                raise SkipBenchmark("mongomock not installed (pip install mongomock)")
+            db = mongomock.MongoClient()["microbench"]
+            for collection_name, documents in content_documents().items():
+                db[collection_name].insert_many([dict(doc) for doc in documents])
+            self._mongo_db = db
+        return self._mongo_db
+
+
+# --- Content queries ---
+def _query_benchmarks(prefix, get_target, calls):
+    for suffix, call in calls.items():
+        def setup(context, call=call):
+            target = get_target(context)
+            return lambda: call(target)
+        benchmark(f"{prefix}.{suffix}")(setup)
+
+
+_query_benchmarks("db.sqlite", lambda context: context.sqlite_backend, {
+    "search_streamer_names": lambda backend: backend.search_streamer_names("主播01", 20),
+    "fetch_danmaku_welcome": lambda backend: backend.fetch_danmaku("主播0123", "welcome", 10),
+    "fetch_anti_fan_quotes_pool": lambda backend: backend.fetch_anti_fan_quotes(2000),
+    "fetch_reversal_copy_data": lambda backend: backend.fetch_reversal_copy_data("主播0042", 10),
+    "fetch_social_topics_data": lambda backend: backend.fetch_social_topics_data("话题042", 10),
+    "get_random_danmaku": lambda backend: backend.get_random_danmaku(db_config.BIG_BROTHERS_COLLECTION, 30),
+    "fetch_distinct_values": lambda backend: backend.fetch_distinct_values(db_config.BIG_BROTHERS_COLLECTION, "welcome_text"),
+})
+
+
+_query_benchmarks("db.mongo_queries", lambda context: context.mongo_db, {
+    "search_streamer_names": lambda db: db_queries.search_streamer_names_in_db(db, "主播01", 20),
+    "fetch_danmaku_welcome": lambda db: db_queries.fetch_danmaku_from_db(db, "主播0123", "welcome", 10),
+    "fetch_anti_fan_quotes_pool": lambda db: db_queries.fetch_anti_fan_quotes_from_db(db, 2000),
+    "fetch_reversal_copy_data": lambda db: db_queries.fetch_reversal_copy_data_from_db(db, "主播0042", 10),
+    "fetch_social_topics_data": lambda db: db_queries.fetch_social_topics_data_from_db(db, "话题042", 10),
+    "get_random_danmaku": lambda db: db_queries.get_random_danmaku_from_db(db, db_config.BIG_BROTHERS_COLLECTION, 30),
+    "fetch_distinct_values": lambda db: db_queries.fetch_distinct_values_from_db(db, db_config.BIG_BROTHERS_COLLECTION, "welcome_text"),
+})
+
+
+# --- Script parsing and navigation ---
+@benchmark("script.parse_script_file")
+def bench_parse_script(context):
+    from script_parser import parse_script_file
+    path = context.script_path
+    return lambda: parse_script_file(path)
+
+
+@benchmark("state.navigate_1000")
+def bench_navigation(context):
+    from script_parser import parse_script_file
+    from state_manager import ApplicationStateManager
+
+    manager = ApplicationStateManager()
+    manager._apply_loaded_script(context.script_path, parse_script_file(context.script_path))
+    middle = manager.get_current_state()["total_events"] // 2
+
+    def navigate():
+        manager.jump_to_event(middle)
+        for _ in range(500):
+            manager.advance_event()
+            manager.get_current_state()
+        for _ in range(500):
+            manager.prev_event()
+    return navigate
+
+
+# --- Templating ---
+@benchmark("roast.compile_roast_template_x1000")
+def bench_roast_split(context):
+    from roast_engine import compile_roast_template
+    templates = [f"{{}}你说的第{i}句我记住了，回去练练吧" for i in range(1000)]
+
+    def split():
+        for template in templates:
+            compile_roast_template(template, "黑粉头子")
+    return split
+
+
+@benchmark("boss.fill_boss_template_x1000")
+def bench_boss_fill(context):
+    from ws_danmaku_send_handlers import fill_boss_template
+    welcome = [f"欢迎{{}}大哥驾到，第{i}种排面" for i in range(500)]
+    thanks = [f"感谢{{}}送的{{}}，第{i}种感谢" for i in range(500)]
+
+    def fill():
+        for template in welcome:
+            fill_boss_template(template, "welcome_boss", "榜一大哥")
+        for template in thanks:
+            fill_boss_template(template, "thanks_boss_gift", "榜一大哥", "火箭")
+    return fill
+
+
+# --- Broadcast fan-out ---
+class FakeSocket:
+    """Stands in for a websockets connection; send() just counts, so the benchmark measures the server side only."""
+
+    def __init__(self, index):
+        self.remote_address = ("127.0.0.1", 40000 + index)
+        self.sent = 0
+
+    async def send(self, data):
+        self.sent += 1
+
+
+@benchmark(f"server.broadcast_audience_{FANOUT_CLIENTS}")
+def bench_broadcast(context):
+    import server
+    from ws_sessions import SESSIONS
+    from ws_danmaku_send_handlers import build_danmaku_message
+
+    SESSIONS.clear()
+    for i in range(FANOUT_CLIENTS):
+        SESSIONS.add(FakeSocket(i), "audience")
+    loop = asyncio.new_event_loop()
+    message = build_danmaku_message("欢迎榜一大哥驾到")
+    return lambda: loop.run_until_complete(server._broadcast_message_to_group("audience", dict(message)))
+
+
+# --- Runner ---
+def run_benchmarks(name_filter: str | None, repeat: int, min_seconds: float):
+    results, skipped = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        context = Context(Path(tmp))
+        for name, setup in BENCHMARKS:
+            if name_filter and name_filter not in name:
+                continue
+            try:
+                func = setup(context)
+            except SkipBenchmark as e:
+                skipped[name] = str(e)
+                print(f"{name:<45} skipped: {e}")
+                continue
+            timer = timeit.Timer(func)
+            number = 1
+            while timer.timeit(number) < min_seconds and number < 1_000_000:
+                number *= 2
+            runs = sorted(t / number for t in timer.repeat(repeat=repeat, number=number))
+            results[name] = {"us_per_op": round(runs[0] * 1e6, 3), "median_us": round(runs[len(runs) // 2] * 1e6, 3), "number": number}
+            print(f"{name:<45} {results[name]['us_per_op']:>14.3f} us/op (median {results[name]['median_us']:.3f}, x{number})")
+    return results, skipped
+
+
+def compare(results, baseline, threshold):
+    """Benchmarks slower than baseline * (1 + threshold), as {name: {"baseline_us", "us", "ratio"}}."""
+    regressions = {}
+    for name, result in results.items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous or not previous.get("us_per_op"):
+            continue
+        ratio = result["us_per_op"] / previous["us_per_op"]
+        if ratio > 1 + threshold:
+            regressions[name] = {"baseline_us": previous["us_per_op"], "us": result["us_per_op"], "ratio": round(ratio, 3)}
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for query, parsing and templating hot paths.")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-seconds", type=float, default=0.2, help="Minimum duration of one timing run")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline file to compare against (and to write with --save-baseline)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Flag benchmarks slower than the baseline by more than this fraction")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL) # The hot paths log; keep the output readable (f-string arguments are still built)
+    results, skipped = run_benchmarks(args.filter, args.repeat, args.min_seconds)
+    report = {"python": platform.python_version(), "machine": platform.machine(), "benchmarks": results, "skipped": skipped}
+
+    baseline_path = Path(args.baseline)
+    exit_code = 0
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline written to {baseline_path}")
+    elif baseline_path.is_file():
+        regressions = compare(results, json.loads(baseline_path.read_text(encoding="utf-8")), args.threshold)
+        report["regressions"] = regressions
+        for name, regression in regressions.items():
+            print(f"REGRESSION {name}: {regression['baseline_us']} -> {regression['us']} us/op (x{regression['ratio']})")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"No regressions above {args.threshold:.0%} against {baseline_path}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
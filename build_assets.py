@@ -0,0 +1,403 @@
+# build_assets.py
+# Static asset build: bundles the presenter scripts in <script> tag order, minifies them
+# conservatively, writes content-hashed files with precompressed .gz/.br variants and
+# rewritten HTML pages into static/dist/. server.py serves static/dist when a manifest exists
+# and the source hashes recorded in it still match (see static_assets.stale_sources).
+#
+#   python build_assets.py [--no-minify]
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+try:
+    import brotli # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+import config
+
+DIST_DIR = config.STATIC_FOLDER / "dist"
+MANIFEST_NAME = "manifest.json"
+
+# Source page -> bundle name for its local /static/*.js scripts (None: page has only inline scripts)
+PAGES = {
+    "presenter_control.html": "presenter",
+    "audience_display.html": None,
+}
+
+_SCRIPT_TAG_RE = re.compile(r'[ \t]*<script\s+src="/static/([\w./-]+\.js)"[^>]*>\s*</script>[ \t]*\n?')
+
+# Tokens after which a '/' starts a regex literal instead of a division
+_REGEX_PRECEDING_WORDS = {"return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void", "throw", "instanceof", "yield", "await"}
+_WORD_CHARS = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$")
+
+
+class AssetBuildError(Exception):
+    pass
+
+
+# --- JS tokenizer (just enough to strip comments/whitespace and find top-level declarations safely) ---
+def _tokenize_js(src: str, name: str = "<js>"):
+    """Yields (kind, text): kind is one of ws, nl, comment, str, regex, punct, word."""
+    i, n = 0, len(src)
+    last_significant = None # (kind, text) of the previous non-ws/comment token
+    template_brace_stack = [] # brace depth at which each open `${ ... }` resumes its template
+
+    def regex_allowed():
+        if last_significant is None:
+            return True
+        kind, text = last_significant
+        if kind == "word":
+            return text in _REGEX_PRECEDING_WORDS
+        if kind == "punct":
+            return text not in (")", "]", "}")
+        return False
+
+    def scan_template(start):
+        # start points at the opening backtick or the '}' closing a ${...}; returns index after the chunk
+        j = start + 1
+        while j < n:
+            c = src[j]
+            if c == "\\":
+                j += 2
+                continue
+            if c == "`":
+                return j + 1, False
+            if c == "$" and j + 1 < n and src[j + 1] == "{":
+                return j + 2, True
+            j += 1
+        raise AssetBuildError(f"{name}: unterminated template literal")
+
+    brace_depth = 0
+    while i < n:
+        c = src[i]
+        if c == "\n":
+            j = i
+            while j < n and src[j] in "\r\n \t":
+                j += 1
+            yield "nl", src[i:j]
+            i = j
+        elif c in " \t\r":
+            j = i
+            while j < n and src[j] in " \t\r":
+                j += 1
+            yield "ws", src[i:j]
+            i = j
+        elif c == "/" and i + 1 < n and src[i + 1] == "/":
+            j = src.find("\n", i)
+            j = n if j == -1 else j
+            yield "comment", src[i:j]
+            i = j
+        elif c == "/" and i + 1 < n and src[i + 1] == "*":
+            j = src.find("*/", i + 2)
+            if j == -1:
+                raise AssetBuildError(f"{name}: unterminated block comment")
+            yield "comment", src[i:j + 2]
+            i = j + 2
+        elif c in "'\"":
+            j = i + 1
+            while j < n and src[j] != c:
+                if src[j] == "\\":
+                    j += 1
+                elif src[j] == "\n":
+                    raise AssetBuildError(f"{name}: unterminated string literal at offset {i}")
+                j += 1
+            last_significant = ("str", src[i:j + 1])
+            yield last_significant
+            i = j + 1
+        elif c == "`" or (c == "}" and template_brace_stack and template_brace_stack[-1] == brace_depth):
+            if c == "}":
+                template_brace_stack.pop()
+            j, opens_expression = scan_template(i)
+            if opens_expression:
+                template_brace_stack.append(brace_depth)
+            last_significant = ("str", src[i:j])
+            yield last_significant
+            i = j
+        elif c == "/" and regex_allowed():
+            j = i + 1
+            in_class = False
+            while j < n:
+                d = src[j]
+                if d == "\\":
+                    j += 2
+                    continue
+                if d == "\n":
+                    raise AssetBuildError(f"{name}: unterminated regex literal at offset {i}")
+                if d == "[":
+                    in_class = True
+                elif d == "]":
+                    in_class = False
+                elif d == "/" and not in_class:
+                    break
+                j += 1
+            j += 1
+            while j < n and src[j] in _WORD_CHARS: # flags
+                j += 1
+            last_significant = ("regex", src[i:j])
+            yield last_significant
+            i = j
+        elif c in _WORD_CHARS:
+            j = i
+            while j < n and src[j] in _WORD_CHARS:
+                j += 1
+            last_significant = ("word", src[i:j])
+            yield last_significant
+            i = j
+        else:
+            if c == "{":
+                brace_depth += 1
+            elif c == "}":
+                brace_depth -= 1
+            last_significant = ("punct", c)
+            yield last_significant
+            i += 1
+
+
+def minify_js(src: str, name: str = "<js>") -> str:
+    """
+    Conservative minifier: drops comments, indentation and blank lines, collapses runs of spaces.
+    Line breaks are kept, so automatic semicolon insertion behaves exactly as in the source.
+    """
+    out = []
+    pending_space = False
+    at_line_start = True
+    for kind, text in _tokenize_js(src, name):
+        if kind == "comment":
+            continue
+        if kind == "ws":
+            pending_space = not at_line_start
+            continue
+        if kind == "nl":
+            if not at_line_start:
+                out.append("\n")
+            at_line_start = True
+            pending_space = False
+            continue
+        if pending_space and out and out[-1][-1:] in _WORD_CHARS and text[:1] in _WORD_CHARS:
+            out.append(" ")
+        elif pending_space and out and not (out[-1][-1:] in "{}()[];,:=<>+-*/&|!?.\n" or text[:1] in "{}()[];,:=<>*/&|!?."):
+            out.append(" ")
+        elif pending_space and out and out[-1][-1:] in "+-" and text[:1] in "+-":
+            out.append(" ") # keep 'a + +b' / 'a - -b' apart
+        out.append(text)
+        pending_space = False
+        at_line_start = False
+    return "".join(out).rstrip() + "\n"
+
+
+def top_level_declarations(src: str, name: str = "<js>"):
+    """Returns [(keyword, identifier)] declared at the top level of a classic script."""
+    declarations = []
+    depth = 0
+    declaring = None # 'let'/'const'/'var' while inside a top-level declaration list
+    expecting = None # keyword whose identifier comes next
+    statement_start = True
+    last_text = None
+    for kind, text in _tokenize_js(src, name):
+        if kind in ("ws", "comment"):
+            continue
+        if kind == "nl":
+            # ASI ends a declaration list at a line break unless the line ends in ',' or '='
+            if depth == 0 and last_text not in (",", "="):
+                declaring = None
+                statement_start = True
+            continue
+        last_text = text
+        if kind == "punct":
+            expecting = None
+            if text in "([{":
+                depth += 1
+            elif text in ")]}":
+                depth -= 1
+                statement_start = depth == 0 and text == "}"
+                continue
+            elif depth == 0 and text == "," and declaring:
+                expecting = declaring
+            elif depth == 0 and text == ";":
+                declaring = None
+                statement_start = True
+                continue
+            statement_start = False
+            continue
+        if kind == "word" and depth == 0:
+            if expecting:
+                declarations.append((expecting, text))
+                expecting = None
+                statement_start = False
+                continue
+            if statement_start and text in ("let", "const", "var"):
+                declaring = expecting = text
+                statement_start = False
+                continue
+            if statement_start and text in ("class", "function"):
+                expecting = text
+                statement_start = False
+                continue
+            if statement_start and text == "async":
+                continue
+        statement_start = False
+    return declarations
+
+
+def check_duplicate_declarations(sources) -> list:
+    """
+    Classic <script>s share one global lexical scope, so a top-level let/const/class declared in
+    two files (or clashing with a var/function) is a SyntaxError that kills the whole bundle.
+    """
+    seen = {} # identifier -> (keyword, filename)
+    problems = []
+    for filename, src in sources:
+        for keyword, identifier in top_level_declarations(src, filename):
+            previous = seen.get(identifier)
+            if previous:
+                prev_keyword, prev_file = previous
+                lexical = {"let", "const", "class"}
+                if keyword in lexical or prev_keyword in lexical:
+                    problems.append(f"'{identifier}' declared with {prev_keyword} in {prev_file} and again with {keyword} in {filename}")
+                continue
+            seen[identifier] = (keyword, filename)
+    return problems
+
+
+# --- Output helpers ---
+def _write_with_variants(path, data: bytes):
+    """Writes data plus precompressed .gz (and .br when brotli is available) next to it."""
+    path.write_bytes(data)
+    (path.parent / (path.name + ".gz")).write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        (path.parent / (path.name + ".br")).write_bytes(brotli.compress(data, quality=11))
+
+
+def _node_check(path):
+    """Extra syntax check with `node --check` when Node.js is installed."""
+    node = shutil.which("node")
+    if not node:
+        return
+    result = subprocess.run([node, "--check", str(path)], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise AssetBuildError(f"node --check failed for {path.name}:\n{result.stderr.strip()}")
+
+
+def source_digest(path) -> str:
+    """Short content hash of a source file, recorded in the manifest to detect stale builds."""
+    return hashlib.sha256(path.read_bytes()).hexdigest()[:12]
+
+
+def build_bundle(bundle_name: str, script_files, minify: bool = True):
+    sources = []
+    for rel in script_files:
+        source_path = config.STATIC_FOLDER / rel
+        if not source_path.is_file():
+            raise AssetBuildError(f"Script referenced by HTML not found: {source_path}")
+        sources.append((rel, source_path.read_text(encoding="utf-8")))
+
+    problems = check_duplicate_declarations(sources)
+    if problems:
+        raise AssetBuildError("Duplicate top-level declarations:\n  " + "\n  ".join(problems))
+
+    parts = []
+    for rel, src in sources:
+        body = minify_js(src, rel) if minify else src
+        # ';' guards against a file ending in an expression without a semicolon
+        parts.append(f"/* {rel} */\n{body.rstrip()}\n;")
+    data = ("\n".join(parts) + "\n").encode("utf-8")
+
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    filename = f"{bundle_name}.{digest}.js"
+    out_path = DIST_DIR / filename
+    _write_with_variants(out_path, data)
+    _node_check(out_path)
+    original_size = sum(len(src.encode("utf-8")) for _, src in sources)
+    logging.info(f"build_assets: {filename}: {len(script_files)} files, {original_size} -> {len(data)} bytes")
+    return filename
+
+
+def build_page(page: str, bundle_name, minify: bool = True, source_hashes: dict | None = None):
+    """Writes the rewritten page (and its bundle). source_hashes collects {source path: digest} of every input."""
+    page_path = config.BASE_DIR / page
+    html = page_path.read_text(encoding="utf-8")
+    bundle_file = None
+    script_files = _SCRIPT_TAG_RE.findall(html)
+    if source_hashes is not None:
+        source_hashes[page] = source_digest(page_path)
+        if bundle_name:
+            for rel in script_files:
+                source_path = config.STATIC_FOLDER / rel
+                if source_path.is_file(): # A missing one fails in build_bundle
+                    source_hashes[f"static/{rel}"] = source_digest(source_path)
+    if bundle_name and script_files:
+        bundle_file = build_bundle(bundle_name, script_files, minify)
+        first = True
+
+        def replace_tag(match):
+            nonlocal first
+            if first:
+                first = False
+                return f'    <script src="/static/dist/{bundle_file}" defer></script>\n'
+            return ""
+        html = _SCRIPT_TAG_RE.sub(replace_tag, html)
+
+    _write_with_variants(DIST_DIR / page, html.encode("utf-8"))
+    return bundle_file
+
+
+def _previous_bundles() -> list:
+    """Bundles of the build being replaced, read from its manifest (empty if there is none)."""
+    try:
+        previous = json.loads((DIST_DIR / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return []
+    return sorted(set(previous.get("bundles", {}).values()))
+
+
+def build_all(minify: bool = True) -> dict:
+    started = time.perf_counter()
+    DIST_DIR.mkdir(parents=True, exist_ok=True)
+    old_files = {p for p in DIST_DIR.iterdir() if p.is_file()}
+    previous_bundles = _previous_bundles()
+
+    manifest = {"built_at": int(time.time()), "pages": {}, "bundles": {}, "sources": {}, "previous_bundles": []}
+    for page, bundle_name in PAGES.items():
+        bundle_file = build_page(page, bundle_name, minify, manifest["sources"])
+        manifest["pages"][page] = page
+        if bundle_file:
+            manifest["bundles"][bundle_name] = bundle_file
+    manifest["previous_bundles"] = [name for name in previous_bundles if name not in manifest["bundles"].values()]
+
+    (DIST_DIR / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+    # Keep the previous generation of bundles: a client that loaded the old HTML just before the
+    # deploy still fetches the old hash. Anything older than that is removed.
+    keep_prefixes = (tuple(manifest["bundles"].values()) + tuple(manifest["previous_bundles"])
+                     + tuple(manifest["pages"].values()) + (MANIFEST_NAME,))
+    for path in old_files:
+        if not path.name.startswith(keep_prefixes) and path.exists():
+            path.unlink()
+    logging.info(f"build_assets: Build finished in {time.perf_counter() - started:.2f}s -> {DIST_DIR}")
+    return manifest
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Bundle, minify and precompress the presenter/audience assets.")
+    parser.add_argument("--no-minify", action="store_true", help="Concatenate without minifying")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        build_all(minify=not args.no_minify)
+    except AssetBuildError as e:
+        logging.error(f"build_assets: Build failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,11 +4,13 @@ import os
 from pathlib import Path
 
 import logging
+import socket
 from pathlib import Path
 
 # --- Application Configuration ---
-FLASK_PORT = 5000
-WEBSOCKET_PORT = 8765
+# Ports can be overridden from the environment (e.g. benchmarks/load_test.py runs a server on free ports)
+FLASK_PORT = int(os.getenv("FLASK_PORT", "5000"))
+WEBSOCKET_PORT = int(os.getenv("WEBSOCKET_PORT", "8765"))
 
 # Determine the base directory of the script (assuming config.py is in the same dir as server.py)
 
@@ -24,19 +26,136 @@ SCRIPTS_DIR = BASE_DIR / "scripts"
 MONGO_URI = os.getenv("mongodb_url")
 DB_NAME = "trae_data"
 
+# Content backend behind the database facade: "mongo" (default) or "sqlite" (embedded local snapshot)
+# The local snapshot is produced from MongoDB with: python -m database.db_export
+DB_BACKEND = os.getenv("DB_BACKEND", "mongo").strip().lower()
+LOCAL_DB_PATH = Path(os.getenv("LOCAL_DB_PATH", BASE_DIR / "data" / "content.sqlite3"))
+
 # --- WebSocket Core Configuration (Moved from ws_core.py if they were there) ---
-PING_INTERVAL = 20  # 例如，服务器每20秒发送一次 PING 
-PING_TIMEOUT_FOR_WEBSOCKETS_LIB = 30 # 例如，服务器发送PING后，等待PONG的最长时间为30秒 
+PING_INTERVAL = int(os.getenv("PING_INTERVAL", "20"))  # 例如，服务器每20秒发送一次 PING 
+PING_TIMEOUT_FOR_WEBSOCKETS_LIB = int(os.getenv("PING_TIMEOUT", "30")) # 例如，服务器发送PING后，等待PONG的最长时间为30秒 
+# Keepalive implementation: "wheel" = one shared hashed timing wheel for all connections (ws_heartbeat.py),
+# pings sent in staggered batches every tick; "library" = the websockets per-connection keepalive task
+# (one sleeping task plus a wait_for timer per connection). Interval/timeout above apply to both.
+# Measured with benchmarks/load_test.py --heartbeat-modes library,wheel --audience 2000 (ping interval 2 s, idle):
+#   library  ~2800 loop timers (max 3757), 16.2% server CPU
+#   wheel    ~5 loop timers (max 11),        6.5% server CPU
+HEARTBEAT_MODE = os.getenv("HEARTBEAT_MODE", "wheel").strip().lower()
+HEARTBEAT_TICK = 0.25 # Seconds per wheel slot
+HEARTBEAT_WHEEL_SLOTS = 128 # Slots per revolution (32 s at 0.25 s); longer delays wait extra rounds
+# Transport profiles (ws_transport.py): chosen by path at the handshake ("/presenter" vs anything else)
+# and re-applied per client type after register. compression: "deflate" or None; window_bits/mem_level
+# size the per-connection zlib state (the library default is 12 / 5); max_size/max_queue limit incoming
+# messages, write_limit is the outgoing buffer high-water mark.
+# Measured with benchmarks/load_test.py --audience 400 --presenters 3 --audience-profiles ... (asyncio loop):
+#   default                 62 KB server RSS per connection, 3.1k danmaku deliveries/s
+#   audience_lean           22 KB per connection,            4.3k deliveries/s
+#   audience_deflate_small  39 KB per connection,            2.8k deliveries/s
+WS_TRANSPORT_PROFILES = {
+    "default": {"compression": "deflate", "window_bits": 12, "mem_level": 5, "max_size": 2**20, "max_queue": 32, "write_limit": 2**16}, # websockets defaults
+    "audience_lean": {"compression": None, "max_size": 8 * 1024, "max_queue": 4, "write_limit": 32 * 1024},
+    "audience_deflate_small": {"compression": "deflate", "window_bits": 9, "mem_level": 1, "max_size": 8 * 1024, "max_queue": 4, "write_limit": 32 * 1024},
+    "presenter": {"compression": "deflate", "window_bits": 15, "mem_level": 8, "max_size": 4 * 2**20, "max_queue": 64, "write_limit": 2**18},
+}
+WS_AUDIENCE_PROFILE = os.getenv("WS_AUDIENCE_PROFILE", "audience_lean")
+WS_PRESENTER_PROFILE = os.getenv("WS_PRESENTER_PROFILE", "presenter")
+WS_PRESENTER_PATH = "/presenter"
+WS_READ_LIMIT = 2**16 # StreamReader limit, fixed per connection before the path is known
+# Admission control (ws_admission.py). Handshakes over a cap, or while the loop is lagging, are refused
+# with HTTP 503 + Retry-After before the upgrade; registrations beyond the token bucket are closed with
+# 1013 "try again later" and a jittered retry_after_ms hint in the close reason. The presenter path is
+# only subject to the global cap.
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "2000"))
+WS_MAX_CONNECTIONS_PER_IP = int(os.getenv("WS_MAX_CONNECTIONS_PER_IP", "200")) # Venue displays often share one NAT address
+WS_MAX_PENDING_REGISTRATIONS = int(os.getenv("WS_MAX_PENDING_REGISTRATIONS", "200")) # Open connections that have not registered yet
+WS_REGISTER_RATE = float(os.getenv("WS_REGISTER_RATE", "50")) # Registrations per second (token bucket refill)
+WS_REGISTER_BURST = int(os.getenv("WS_REGISTER_BURST", "100")) # Token bucket size
+WS_REGISTER_TIMEOUT = 5.0 # Seconds a new connection may take to send "register"
+WS_ADMISSION_MAX_LOOP_LAG = 0.25 # Seconds of event loop lag (metrics sampler) above which new handshakes are refused
+WS_RETRY_AFTER_MIN_MS = 2000 # Retry hint range; the upper end grows with recent rejections
+WS_RETRY_AFTER_MAX_MS = 30000
+WS_LIBRARY_LOG_LEVEL = os.getenv("WS_LIBRARY_LOG_LEVEL", "INFO").upper() # websockets.server/protocol loggers (DEBUG logs every frame)
+# Run the asyncio loop on uvloop when it is installed (pip install uvloop)
+USE_UVLOOP = os.getenv("USE_UVLOOP", "0").strip().lower() not in ("0", "false", "no")
 # TIMEOUT_DURATION = 100 # 自定义心跳用的，现在不需要了，可以注释或删除 
 
 # --- Danmaku Send Configuration (Moved from ws_danmaku_send_handlers.py) ---
-SEND_INTERVAL_MS = 2200 # Interval between sending individual danmaku within an auto-send group
-GROUP_PAUSE_MS = 3000 # Pause duration between sending different groups
+SEND_INTERVAL_MS = int(os.getenv("SEND_INTERVAL_MS", "2200")) # Interval between sending individual danmaku within an auto-send group
+GROUP_PAUSE_MS = int(os.getenv("GROUP_PAUSE_MS", "3000")) # Pause duration between sending different groups
 AUTO_SEND_DURATION_MS = 22000 # Duration for each danmaku sent in bulk auto-send
 
+# --- HTTP API Response Cache (http_cache.py) ---
+API_CACHE_TTL_SECONDS = float(os.getenv("API_CACHE_TTL_SECONDS", "5")) # 0 disables caching
+API_CACHE_MAX_ENTRIES = 1024 # LRU bound on cached responses
+API_COMPRESS_MIN_BYTES = 1024 # Responses smaller than this are sent uncompressed
+
+# --- Script Loading ---
+# "eager": parse the whole file into event dicts (default)
+# "lazy": memory-map the file and keep only line offsets, decoding events on demand
+# "auto": lazy for files of at least SCRIPT_LAZY_MIN_BYTES
+# Note: in lazy mode the file must not be truncated in place while loaded (save-to-temp-and-rename is fine).
+SCRIPT_LOAD_MODE = os.getenv("SCRIPT_LOAD_MODE", "eager").strip().lower()
+SCRIPT_LAZY_MIN_BYTES = 1024 * 1024
+# Parsed-script LRU cache (script_cache.py): memory budget, and background pre-parse of the browsed directory
+SCRIPT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+SCRIPT_PREPARSE_ENABLED = os.getenv("SCRIPT_PREPARSE_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+SCRIPT_PREPARSE_MAX_FILES = 20 # Newest .txt files per directory
+# browse_scripts: cached directory listings (script_tree.py) and the largest page a client may request
+SCRIPT_TREE_CACHE_MAX_DIRS = 256
+SCRIPT_BROWSE_MAX_PAGE_SIZE = 1000
+# search_scripts: full-text index over scripts/ (script_search.py); changed files are re-indexed at most this often
+SCRIPT_SEARCH_REFRESH_SECONDS = 5.0
+SCRIPT_SEARCH_MAX_RESULTS = 50
+# Timed cues in scripts (cue_scheduler.py): how many welcome/roast danmaku a cue fetches
+CUE_FETCH_LIMIT = 10
+# Presenter state sync (state_sync.py): recent deltas kept so reconnecting consoles can catch up without a full snapshot
+STATE_DELTA_HISTORY = 256
+# Events before/after the current one pushed with each position change, so the console can show next/prev lines instantly (0 disables)
+PRESENTER_PREFETCH_EVENTS = 5
+# Roast mode (roast_engine.py): quotes per sequence / per extend_roast, in-memory pool size and background refresh age
+ROAST_SEQUENCE_LENGTH = 3
+ROAST_EXTEND_MAX = 20
+ROAST_POOL_MAX_QUOTES = 2000
+ROAST_POOL_REFRESH_SECONDS = 300.0
+# Crash-safe persistence of the show state (state_journal.py): restored on startup
+STATE_JOURNAL_ENABLED = os.getenv("STATE_JOURNAL_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+STATE_JOURNAL_DIR = Path(os.getenv("STATE_JOURNAL_DIR", BASE_DIR / "data" / "state"))
+STATE_JOURNAL_FSYNC_INTERVAL = 0.2 # Seconds; journal appends are batched into one fsync per interval
+STATE_JOURNAL_SNAPSHOT_EVERY = 200 # Journal records between full snapshots
+# Graceful restart (server_handoff.py): `python server.py --takeover` (or HANDOFF_TAKEOVER=1) asks the running
+# process over a Unix control socket for its listening sockets (fd passing), serves on them, and the old
+# process drains its outgoing queues and closes its clients with 1012 so they reconnect immediately.
+HANDOFF_ENABLED = hasattr(socket, "send_fds") and os.getenv("HANDOFF_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+HANDOFF_SOCKET_PATH = Path(os.getenv("HANDOFF_SOCKET_PATH", BASE_DIR / "data" / "handoff.sock"))
+HANDOFF_TAKEOVER = os.getenv("HANDOFF_TAKEOVER", "0").strip().lower() not in ("0", "false", "no")
+HANDOFF_TIMEOUT = 10.0 # Seconds the old process waits for the new one to start serving before it resumes
+HANDOFF_WARMUP_TIMEOUT = 30.0 # Seconds the new process may spend connecting the content backend before taking over
+HANDOFF_DRAIN_TIMEOUT = 2.0 # Seconds the old process waits for queued frames to reach its clients
+HANDOFF_RECONNECT_WINDOW = 15.0 # Seconds the new process admits the old process's clients without the burst caps
+# Hot-reload of the loaded script when it is edited on disk (script_watcher.py).
+# Uses watchdog (inotify on Linux) when installed; the poll interval is the fallback/safety net.
+SCRIPT_WATCH_ENABLED = os.getenv("SCRIPT_WATCH_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+SCRIPT_WATCH_POLL_INTERVAL = 1.0 # Seconds between stat() checks
+SCRIPT_WATCH_DEBOUNCE = 0.3 # Wait for the editor to finish writing before re-parsing
+
+# --- Metrics (/metrics) ---
+METRICS_LOOP_LAG_INTERVAL = 1.0 # Seconds between event loop lag samples
+
+# --- Profiling (profiler.py), opt-in ---
+# Stall watchdog (stalls attributed to the WebSocket action holding the loop) + sampling profiler
+# controlled by the presenter "profiler" action or /api/profiler/start|stop. Output goes to PROFILE_DIR.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0").strip().lower() not in ("0", "false", "no")
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", BASE_DIR / "data" / "profiles"))
+PROFILER_SAMPLE_HZ = 100 # Stack samples per second while the sampling profiler runs
+PROFILER_MAX_SECONDS = 600 # A profile stops by itself after this long
+PROFILER_STALL_THRESHOLD_MS = 100 # Loop blocked longer than this is reported as a stall
+PROFILER_STALL_CHECK_INTERVAL = 0.05 # Seconds between loop heartbeats
+# asyncio debug mode with slow-callback logging at the stall threshold (expensive; not for live shows)
+PROFILER_ASYNCIO_DEBUG = os.getenv("PROFILER_ASYNCIO_DEBUG", "0").strip().lower() not in ("0", "false", "no")
+
 def log_config():
     """Logs key configuration values (avoiding sensitive info)."""
-    uri_to_log = MONGO_URI
+    uri_to_log = MONGO_URI or ""
     if "@" in uri_to_log:
         uri_to_log = "mongodb://" + uri_to_log.split('@')[-1]
 
@@ -51,10 +170,14 @@ def log_config():
     logging.info("Database Configuration:")
     logging.info(f"  MONGO_URI (sanitized): {uri_to_log}")
     logging.info(f"  DB_NAME: {DB_NAME}")
+    logging.info(f"  DB_BACKEND: {DB_BACKEND}")
+    if DB_BACKEND == "sqlite":
+        logging.info(f"  LOCAL_DB_PATH: {LOCAL_DB_PATH}")
     logging.info("-" * 20)
-    logging.info("WebSocket Heartbeat (Library Managed):")
+    logging.info("WebSocket Heartbeat:")
     logging.info(f"  PING Interval (server to client): {PING_INTERVAL}s")
     logging.info(f"  PONG Timeout (server waits for PONG): {PING_TIMEOUT_FOR_WEBSOCKETS_LIB}s")
+    logging.info(f"  Keepalive: {HEARTBEAT_MODE} (tick {HEARTBEAT_TICK}s, {HEARTBEAT_WHEEL_SLOTS} slots)")
     # logging.info(f"  Timeout Duration: {TIMEOUT_DURATION}s")
     logging.info("-" * 20)
     logging.info("Danmaku Send Timing:")
@@ -62,4 +185,21 @@ def log_config():
     logging.info(f"  Group Pause: {GROUP_PAUSE_MS}ms")
     logging.info(f"  Auto-Send Duration: {AUTO_SEND_DURATION_MS}ms")
     logging.info("-" * 20)
+    logging.info(f"Script Load Mode: {SCRIPT_LOAD_MODE} (lazy threshold for auto: {SCRIPT_LAZY_MIN_BYTES} bytes)")
+    logging.info(f"Script Cache: {SCRIPT_CACHE_MAX_BYTES} bytes, Pre-parse: {SCRIPT_PREPARSE_ENABLED} (max {SCRIPT_PREPARSE_MAX_FILES} files)")
+    logging.info(f"Script Browse: listing cache {SCRIPT_TREE_CACHE_MAX_DIRS} dirs, max page size {SCRIPT_BROWSE_MAX_PAGE_SIZE}")
+    logging.info(f"Script Search: refresh every {SCRIPT_SEARCH_REFRESH_SECONDS}s, max {SCRIPT_SEARCH_MAX_RESULTS} results")
+    logging.info(f"Script Cues: fetch limit {CUE_FETCH_LIMIT}")
+    logging.info(f"Presenter State Sync: {STATE_DELTA_HISTORY} deltas of history, prefetch window +/-{PRESENTER_PREFETCH_EVENTS} events")
+    logging.info(f"Roast Mode: {ROAST_SEQUENCE_LENGTH} quotes per sequence (extend max {ROAST_EXTEND_MAX}), pool max {ROAST_POOL_MAX_QUOTES}, refresh every {ROAST_POOL_REFRESH_SECONDS}s")
+    logging.info(f"State Journal: {STATE_JOURNAL_ENABLED} ({STATE_JOURNAL_DIR}, fsync every {STATE_JOURNAL_FSYNC_INTERVAL}s, snapshot every {STATE_JOURNAL_SNAPSHOT_EVERY} records)")
+    logging.info(f"Graceful Restart: {HANDOFF_ENABLED} (control socket {HANDOFF_SOCKET_PATH}, timeout {HANDOFF_TIMEOUT}s, drain {HANDOFF_DRAIN_TIMEOUT}s, reconnect window {HANDOFF_RECONNECT_WINDOW}s)")
+    logging.info(f"Script Hot-Reload: {SCRIPT_WATCH_ENABLED} (poll {SCRIPT_WATCH_POLL_INTERVAL}s, debounce {SCRIPT_WATCH_DEBOUNCE}s)")
+    logging.info(f"WebSocket Transport: audience profile '{WS_AUDIENCE_PROFILE}', presenter profile '{WS_PRESENTER_PROFILE}', read limit {WS_READ_LIMIT}, uvloop {USE_UVLOOP}")
+    logging.info(f"WebSocket Admission: max {WS_MAX_CONNECTIONS} connections ({WS_MAX_CONNECTIONS_PER_IP} per IP, {WS_MAX_PENDING_REGISTRATIONS} unregistered), register rate {WS_REGISTER_RATE}/s burst {WS_REGISTER_BURST}, max loop lag {WS_ADMISSION_MAX_LOOP_LAG}s")
+    logging.info(f"Profiling: {PROFILING_ENABLED} ({PROFILE_DIR}, {PROFILER_SAMPLE_HZ} Hz, stall threshold {PROFILER_STALL_THRESHOLD_MS} ms, asyncio debug {PROFILER_ASYNCIO_DEBUG})")
+    logging.info("-" * 20)
+    logging.info("HTTP API Cache:")
+    logging.info(f"  TTL: {API_CACHE_TTL_SECONDS}s, Max Entries: {API_CACHE_MAX_ENTRIES}, Compress Min: {API_COMPRESS_MIN_BYTES} bytes")
+    logging.info("-" * 20)
 
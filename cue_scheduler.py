@@ -0,0 +1,150 @@
+# cue_scheduler.py
+# Fires the timed cues embedded in scripts (see the format notes in script_parser.py).
+# The loaded script's cues form a timeline {event index: [cue, ...]}; when the presenter
+# advances onto an event, its cues are scheduled with loop.call_at() on the event loop's
+# monotonic clock. Multi-message cues compute every send time from the cue's own start
+# time (start + k * interval) instead of sleeping interval after interval, so a slow
+# broadcast or DB fetch does not push the rest of the show back.
+
+import asyncio
+import logging
+
+from database import fetch_danmaku
+from metrics import ACTIVE_JOBS
+from script_parser import script_cues
+from ws_danmaku_send_handlers import build_danmaku_message, SEND_INTERVAL_MS, AUTO_SEND_DURATION_MS
+
+try:
+    from config import CUE_FETCH_LIMIT
+except ImportError:
+    CUE_FETCH_LIMIT = 10
+
+
+class CueScheduler:
+    """Owns the cue timeline of the loaded script and the cues that are pending or running."""
+
+    def __init__(self, state_manager, broadcast_func):
+        self._state_manager = state_manager
+        self._broadcast = broadcast_func
+        self._timeline = {}
+        self._timeline_source = None # Event sequence the timeline was compiled from
+        self._timeline_path = None
+        self._handles = set() # TimerHandles of delayed cues
+        self._tasks = set() # Cues currently sending
+        self.fired_count = 0
+
+    def _sync_timeline(self):
+        """Recompiles the timeline when the loaded script changed (load or hot-reload). O(1) when it did not."""
+        events = self._state_manager.get_script_events()
+        if events is self._timeline_source:
+            return
+        path = self._state_manager.get_script_path()
+        if path != self._timeline_path:
+            self.cancel_all() # Another script: its pending cues no longer apply
+        self._timeline = script_cues(events) if events else {}
+        self._timeline_source = events
+        self._timeline_path = path
+        if self._timeline:
+            logging.info(f"cue_scheduler: Timeline for {path}: {sum(len(cues) for cues in self._timeline.values())} cue(s) on {len(self._timeline)} event(s).")
+
+    def on_event_reached(self, index):
+        """Called when the presenter advances onto event `index`: schedules that event's cues. Returns how many."""
+        self._sync_timeline()
+        cues = self._timeline.get(index)
+        if not cues:
+            return 0
+        loop = asyncio.get_running_loop()
+        anchor = loop.time()
+        for cue in cues:
+            fire_at = anchor + cue["delay"]
+            handle = loop.call_at(fire_at, self._fire, cue, fire_at, index)
+            self._handles.add(handle)
+        logging.info(f"cue_scheduler: Scheduled {len(cues)} cue(s) for event {index}.")
+        return len(cues)
+
+    def _fire(self, cue, fire_at, index):
+        # Runs as a loop callback: forget handles that are due (fired) or cancelled
+        now = asyncio.get_running_loop().time()
+        self._handles = {handle for handle in self._handles if not handle.cancelled() and handle.when() > now}
+        task = asyncio.create_task(self._run_cue(cue, fire_at, index), name=f"cue_{cue['kind']}_{index}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _sleep_until(self, deadline):
+        delay = deadline - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _run_cue(self, cue, start, index):
+        kind = cue["kind"]
+        ACTIVE_JOBS.inc("cue")
+        try:
+            if kind == "danmaku":
+                messages = cue["messages"]
+                is_roast = False
+                label = f"{len(messages)} 条弹幕"
+            else:
+                # Same source as the presenter's auto-send buttons; the DB call runs in a worker thread
+                messages = [text for text in await asyncio.to_thread(fetch_danmaku, cue["target"], kind, CUE_FETCH_LIMIT)
+                            if isinstance(text, str) and text.strip()]
+                is_roast = kind == "roast"
+                label = f"{cue['target']} 的{'吐槽' if is_roast else '欢迎'}弹幕 ({len(messages)} 条)"
+                if not messages:
+                    logging.warning(f"cue_scheduler: No {kind} danmaku found for '{cue['target']}' (cue on event {index}).")
+                    await self._broadcast("presenter", {"type": "warning", "message": f"提示触发失败：未找到 {cue['target']} 的弹幕。", "context": "cue_no_data"})
+                    return
+
+            await self._broadcast("presenter", {"type": "info", "message": f"提示已触发：发送{label}", "context": "cue_fired", "event_index": index, "cue": cue})
+            self.fired_count += 1
+            # Spread over the cue's duration if it has one, else the usual auto-send pacing
+            duration = cue.get("duration") or 0.0
+            interval = duration / len(messages) if duration > 0 else SEND_INTERVAL_MS / 1000
+            for k, text in enumerate(messages):
+                await self._sleep_until(start + k * interval)
+                await self._broadcast("audience", build_danmaku_message(text, AUTO_SEND_DURATION_MS, is_roast))
+            logging.info(f"cue_scheduler: Cue '{kind}' on event {index} sent {len(messages)} danmaku "
+                         f"over {asyncio.get_running_loop().time() - start:.2f}s from its scheduled start.")
+        except asyncio.CancelledError:
+            logging.info(f"cue_scheduler: Cue '{kind}' on event {index} cancelled.")
+            raise
+        except Exception as e:
+            logging.error(f"cue_scheduler: Cue '{kind}' on event {index} failed: {e}", exc_info=True)
+        finally:
+            ACTIVE_JOBS.dec("cue")
+
+    def cancel_all(self):
+        """Cancels delayed and running cues. Returns how many were cancelled."""
+        cancelled = 0
+        for handle in self._handles:
+            if not handle.cancelled():
+                handle.cancel()
+                cancelled += 1
+        self._handles.clear()
+        for task in list(self._tasks):
+            if not task.done():
+                task.cancel()
+                cancelled += 1
+        if cancelled:
+            logging.info(f"cue_scheduler: Cancelled {cancelled} pending cue(s).")
+        return cancelled
+
+    def pending_count(self) -> int:
+        return len([handle for handle in self._handles if not handle.cancelled()]) + len(self._tasks)
+
+
+_cue_scheduler = None
+
+
+def init_cue_scheduler(state_manager_instance, broadcast_message_func):
+    """Creates the module-level scheduler (called by server.start_servers)."""
+    global _cue_scheduler
+    _cue_scheduler = CueScheduler(state_manager_instance, broadcast_message_func)
+    logging.info("cue_scheduler: Module initialized.")
+    return _cue_scheduler
+
+
+def get_cue_scheduler():
+    return _cue_scheduler
+
+
+__all__ = ['CueScheduler', 'init_cue_scheduler', 'get_cue_scheduler']
@@ -17,7 +17,8 @@ from .db_facade import (
     fetch_anti_fan_quotes,
     fetch_reversal_copy_data,
     fetch_social_topics_data,
-    get_random_danmaku
+    get_random_danmaku,
+    fetch_distinct_values
 )
 
 __all__ = [
@@ -28,6 +29,7 @@ __all__ = [
     'BIG_BROTHERS_COLLECTION', 'GIFT_THANKS_COLLECTION',
     'search_streamer_names', 'fetch_danmaku', 'fetch_anti_fan_quotes',
     'fetch_reversal_copy_data', 'fetch_social_topics_data', 'get_random_danmaku',  # 修正：添加逗号
+    'fetch_distinct_values',
     'SOCIAL_TOPICS_COLLECTION'  # 新增到 __all__ 列表
 ]
 
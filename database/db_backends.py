@@ -0,0 +1,106 @@
+# database/db_backends.py
+import logging
+from abc import ABC, abstractmethod
+
+from . import db_queries
+
+
+class ContentBackend(ABC):
+    """
+    Interface for the content store behind the database facade.
+    The facade functions in db_facade.py only talk to this interface, so the
+    server can run against MongoDB or the embedded local snapshot unchanged.
+    """
+    name = "base"
+
+    @abstractmethod
+    def connect(self) -> bool:
+        ...
+
+    def close(self): # Optional: backends without resources of their own need not override it
+        pass
+
+    @abstractmethod
+    def is_connected(self) -> bool:
+        ...
+
+    @abstractmethod
+    def search_streamer_names(self, term: str, limit: int = 20):
+        ...
+
+    @abstractmethod
+    def fetch_danmaku(self, streamer_name: str | None, danmaku_type: str, limit: int = 10):
+        ...
+
+    @abstractmethod
+    def fetch_anti_fan_quotes(self, limit: int = 3):
+        ...
+
+    @abstractmethod
+    def fetch_reversal_copy_data(self, streamer_name: str, limit: int = 10):
+        ...
+
+    @abstractmethod
+    def fetch_social_topics_data(self, topic_name: str, limit: int = 10):
+        ...
+
+    @abstractmethod
+    def get_random_danmaku(self, collection_name: str, count: int):
+        ...
+
+    @abstractmethod
+    def fetch_distinct_values(self, collection_name: str, field_name: str, term: str | None = None, limit: int = 0):
+        ...
+
+
+class MongoContentBackend(ContentBackend):
+    """Content backend reading from a connected pymongo Database (delegates to db_queries)."""
+    name = "mongo"
+
+    def __init__(self, db):
+        self.db = db
+
+    def connect(self) -> bool:
+        # The pymongo connection itself is owned by DatabaseConnectionManager
+        return self.db is not None
+
+    def close(self):
+        self.db = None
+
+    def is_connected(self) -> bool:
+        return self.db is not None
+
+    def search_streamer_names(self, term: str, limit: int = 20):
+        return db_queries.search_streamer_names_in_db(self.db, term, limit)
+
+    def fetch_danmaku(self, streamer_name: str | None, danmaku_type: str, limit: int = 10):
+        return db_queries.fetch_danmaku_from_db(self.db, streamer_name, danmaku_type, limit)
+
+    def fetch_anti_fan_quotes(self, limit: int = 3):
+        return db_queries.fetch_anti_fan_quotes_from_db(self.db, limit)
+
+    def fetch_reversal_copy_data(self, streamer_name: str, limit: int = 10):
+        return db_queries.fetch_reversal_copy_data_from_db(self.db, streamer_name, limit)
+
+    def fetch_social_topics_data(self, topic_name: str, limit: int = 10):
+        return db_queries.fetch_social_topics_data_from_db(self.db, topic_name, limit)
+
+    def get_random_danmaku(self, collection_name: str, count: int):
+        return db_queries.get_random_danmaku_from_db(self.db, collection_name, count)
+
+    def fetch_distinct_values(self, collection_name: str, field_name: str, term: str | None = None, limit: int = 0):
+        return db_queries.fetch_distinct_values_from_db(self.db, collection_name, field_name, term, limit)
+
+
+def create_backend(backend_name: str, **kwargs) -> ContentBackend | None:
+    """Builds a content backend by name ("mongo" needs db=..., "sqlite" needs path=...)."""
+    if backend_name == "mongo":
+        return MongoContentBackend(kwargs.get("db"))
+    if backend_name == "sqlite":
+        from .db_local_backend import SQLiteContentBackend
+        return SQLiteContentBackend(kwargs.get("path"))
+    logging.error(f"db_backends: Unknown content backend '{backend_name}'.")
+    return None
+
+
+__all__ = ['ContentBackend', 'MongoContentBackend', 'create_backend']
@@ -10,7 +10,7 @@ import logging
 # You might need to adjust this import based on your project structure.
 # Example: If your structure is project_root/server.py, project_root/config.py, project_root/database/__init__.py etc.
 try:
-    from config import MONGO_URI, DB_NAME
+    from config import MONGO_URI, DB_NAME, DB_BACKEND, LOCAL_DB_PATH
     # Import collection names which are *defined* within the database package's config file
     # Ensure these are defined below in this file
 except ImportError:
@@ -18,6 +18,8 @@ except ImportError:
     # Provide dummy values to prevent immediate errors, though DB will likely fail
     MONGO_URI = "mongodb://localhost:27017/"
     DB_NAME = "default_db"
+    DB_BACKEND = "mongo"
+    LOCAL_DB_PATH = "content.sqlite3"
 
 
 # Collection names (Defined here, specific to the database structure)
@@ -29,6 +31,30 @@ SOCIAL_TOPICS_COLLECTION = "Social_Topics" # 用于“加载主题/段子” (
 BIG_BROTHERS_COLLECTION = "Big_Brothers"
 GIFT_THANKS_COLLECTION = "Gift_Thanks_Danmaku"
 
+# Field used to look up a single document per streamer/topic (case-insensitive exact match in the queries)
+COLLECTION_KEY_FIELDS = {
+    WELCOME_COLLECTION: "streamer_name",
+    MOCK_COLLECTION: "streamer_name",
+    REVERSAL_COLLECTION: "source_name",
+    SOCIAL_TOPICS_COLLECTION: "topic_name",
+}
+
+# Fields feeding the streamer/topic name search (mirrors search_streamer_names_in_db)
+NAME_SEARCH_FIELDS = {
+    WELCOME_COLLECTION: ["name"],
+    MOCK_COLLECTION: ["name"],
+    REVERSAL_COLLECTION: ["source_name"],
+    SOCIAL_TOPICS_COLLECTION: ["topic_name", "streamer_name"],
+}
+
+# Text field holding the danmaku string in flat (one template per document) collections.
+# Every reader (queries, local backend, boss auto-send) and db_import use these names.
+TEXT_FIELDS = {
+    ANTI_FAN_COLLECTION: "quote_text",
+    BIG_BROTHERS_COLLECTION: "welcome_text",
+    GIFT_THANKS_COLLECTION: "danmaku_text", # The field the production Gift_Thanks_Danmaku documents use
+}
+
 # You can keep a logging function here specific to DB config if needed, but general config is in config.py
 # def log_db_specific_config():
 #     logging.info(f"DB_Config: Welcome Collection: {WELCOME_COLLECTION}")
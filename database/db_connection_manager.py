@@ -3,27 +3,33 @@ import logging
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, OperationFailure, ConfigurationError
 # Assuming db_config.py is in the same directory or package
-from .db_config import MONGO_URI, DB_NAME # Use relative import if in a package
+from .db_config import MONGO_URI, DB_NAME, DB_BACKEND, LOCAL_DB_PATH # Use relative import if in a package
+from .db_backends import ContentBackend, create_backend
 
 
 _db_manager_instance = None
 
 class DatabaseConnectionManager:
-    """Manages the MongoDB connection."""
+    """Manages the content store connection (MongoDB or the embedded local snapshot)."""
 
-    def __init__(self):
-        logging.info("DatabaseConnectionManager: Instance created.")
+    def __init__(self, backend_name: str = DB_BACKEND):
+        logging.info(f"DatabaseConnectionManager: Instance created (backend: {backend_name}).")
+        self.backend_name = backend_name
+        self.backend = None # ContentBackend used by the facade
         self.client = None
         self.db = None
         self._is_connected = False
 
     def connect_db(self):
-        """Attempts to connect to the MongoDB database."""
+        """Attempts to connect to the configured content backend."""
+        if self.backend_name != "mongo":
+            return self._connect_local_backend()
+
         if self._is_connected and self.client is not None:
             logging.info("DatabaseConnectionManager: Already connected to MongoDB.")
             return True
 
-        uri_to_log = MONGO_URI
+        uri_to_log = MONGO_URI or ""
         if "@" in uri_to_log: # Avoid logging credentials
             uri_to_log = "mongodb://" + uri_to_log.split('@')[-1]
         logging.info(f"DatabaseConnectionManager: Attempting connection to MongoDB: {uri_to_log}")
@@ -32,6 +38,7 @@ class DatabaseConnectionManager:
             self.client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000) # 5 second timeout
             self.client.admin.command('ismaster') # Verify connection
             self.db = self.client[DB_NAME]
+            self.backend = create_backend("mongo", db=self.db)
             self._is_connected = True
             logging.info(f"DatabaseConnectionManager: Successfully connected to MongoDB database: '{self.db.name}'")
             return True
@@ -53,11 +60,35 @@ class DatabaseConnectionManager:
                 logging.error(f"DatabaseConnectionManager: Error closing client after connection failure: {close_e}")
         self.client = None
         self.db = None
+        self.backend = None
+        return False
+
+    def _connect_local_backend(self):
+        """Opens the embedded local content snapshot (no network needed)."""
+        if self._is_connected and self.backend is not None:
+            logging.info(f"DatabaseConnectionManager: Already connected to local backend '{self.backend_name}'.")
+            return True
+
+        backend = create_backend(self.backend_name, path=LOCAL_DB_PATH)
+        if backend is not None and backend.connect():
+            self.backend = backend
+            self._is_connected = True
+            logging.info(f"DatabaseConnectionManager: Using local content backend '{self.backend_name}'.")
+            return True
+
+        logging.error(f"DatabaseConnectionManager: Failed to open local content backend '{self.backend_name}'.")
+        self.backend = None
+        self._is_connected = False
         return False
 
     def disconnect_db(self):
-        """Disconnects from the MongoDB database."""
-        if self.client:
+        """Disconnects from the content backend."""
+        if self.backend is not None and self.client is None:
+            logging.info(f"DatabaseConnectionManager: Closing local content backend '{self.backend_name}'.")
+            self.backend.close()
+            self.backend = None
+            self._is_connected = False
+        elif self.client:
             logging.info("DatabaseConnectionManager: Closing MongoDB connection.")
             try:
                 self.client.close()
@@ -67,6 +98,7 @@ class DatabaseConnectionManager:
             finally:
                 self.client = None
                 self.db = None
+                self.backend = None
                 self._is_connected = False
         else:
             logging.info("DatabaseConnectionManager: MongoDB client was not connected or already closed.")
@@ -76,8 +108,14 @@ class DatabaseConnectionManager:
         """Checks if the database connection is currently active."""
         return self._is_connected
 
+    def get_backend(self) -> ContentBackend | None:
+        """Returns the ContentBackend serving the facade if connected, otherwise None."""
+        if self.is_connected():
+            return self.backend
+        return None
+
     def get_db(self):
-        """Returns the database object if connected, otherwise None."""
+        """Returns the MongoDB database object if connected to MongoDB, otherwise None."""
         # Fix: Check self.db explicitly against None
         if self.is_connected() and self.db is not None: # <-- Modified this line
             return self.db
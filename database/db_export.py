@@ -0,0 +1,71 @@
+# database/db_export.py
+"""
+Exports the MongoDB content collections into the embedded local snapshot used by DB_BACKEND=sqlite.
+
+    python -m database.db_export [--output data/content.sqlite3] [--batch-size 1000]
+"""
+import argparse
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from .db_config import MONGO_URI, DB_NAME, LOCAL_DB_PATH
+from .db_local_backend import LocalSnapshotWriter
+
+
+def export_collections(db, output_path, batch_size: int = 1000, collections=None) -> int:
+    """Streams every (or the given) collection from db into a new local snapshot. Returns the document count."""
+    collection_names = collections or sorted(db.list_collection_names())
+    with LocalSnapshotWriter(output_path) as writer:
+        for collection_name in collection_names:
+            started = time.perf_counter()
+            count = 0
+            batch = []
+            for doc in db[collection_name].find({}, {"_id": 0}, batch_size=batch_size):
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    writer.add_documents(collection_name, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                writer.add_documents(collection_name, batch)
+                count += len(batch)
+            logging.info(f"db_export: Exported {count} documents from '{collection_name}' in {time.perf_counter() - started:.2f}s.")
+        writer.set_meta("source_db", DB_NAME)
+        writer.set_meta("exported_at", datetime.now(timezone.utc).isoformat(timespec="seconds"))
+        return writer.document_count
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export MongoDB content into a local SQLite snapshot.")
+    parser.add_argument("--output", default=str(LOCAL_DB_PATH), help="Snapshot path (default: LOCAL_DB_PATH)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents per insert batch")
+    parser.add_argument("--collection", action="append", dest="collections", help="Only export this collection (repeatable)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not MONGO_URI:
+        logging.error("db_export: MONGO_URI is not set; nothing to export from.")
+        return 1
+
+    client = None
+    try:
+        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+        client.admin.command('ismaster')
+        total = export_collections(client[DB_NAME], args.output, max(1, args.batch_size), args.collections)
+        logging.info(f"db_export: Done. {total} documents written to {args.output}.")
+        return 0
+    except PyMongoError as e:
+        logging.error(f"db_export: MongoDB error during export: {e}")
+        return 1
+    finally:
+        if client:
+            client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
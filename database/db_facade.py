@@ -1,20 +1,44 @@
 # database/db_facade.py
+import functools
 import logging
-from pymongo.database import Database # Import for type hinting
+import time
 
 # If in a sub-package 'database':
 from .db_connection_manager import get_db_manager, DatabaseConnectionManager
-from . import db_queries
+from .db_backends import ContentBackend
 from . import db_config
 
 # If in the same directory:
 # from db_connection_manager import get_db_manager, DatabaseConnectionManager
-# import db_queries
 # import db_config
 
-
-def _get_db_or_log_error() -> Database | None:
-    """Helper to get DB instance and return None if connection is missing."""
+try:
+    from metrics import DB_QUERY_SECONDS, DB_QUERY_ERRORS # Top-level metrics module (served at /metrics)
+except ImportError:
+    DB_QUERY_SECONDS = DB_QUERY_ERRORS = None
+
+
+def _timed_query(func):
+    """Records facade call latency per operation in the /metrics DB histogram."""
+    if DB_QUERY_SECONDS is None:
+        return func
+    operation = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            DB_QUERY_ERRORS.inc(operation)
+            raise
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, operation)
+    return wrapper
+
+
+def _get_backend_or_none() -> ContentBackend | None:
+    """Helper to get the active content backend and return None if connection is missing."""
     manager = get_db_manager()
     # First, check if the manager itself exists and is connected
     if manager is None or not manager.is_connected():
@@ -22,63 +46,71 @@ def _get_db_or_log_error() -> Database | None:
         # No need for repeated logging here for every check.
         return None # Return None if manager or connection is missing
 
-    # Now that we know manager exists and is connected, get the db object
-    # manager.get_db() internally checks if self.db is None
-    db = manager.get_db()
-
-    # Although manager.is_connected() implies db is not None if successful,
-    # returning db directly is the goal of this helper.
-    # The caller is responsible for checking if the returned db is None.
-    return db # <-- This helper function itself looks correct
+    # The backend is either MongoContentBackend (wrapping db_queries) or the local SQLite snapshot.
+    # The caller is responsible for checking if the returned backend is None.
+    return manager.get_backend()
 
 
-# Rest of the facade functions, APPLY THE FIX HERE:
+@_timed_query
 def search_streamer_names(term: str, limit: int = 20):
     """Searches for streamer names via the facade."""
-    db = _get_db_or_log_error()
-    if db is not None: # <-- Corrected
-        return db_queries.search_streamer_names_in_db(db, term, limit)
+    backend = _get_backend_or_none()
+    if backend is not None:
+        return backend.search_streamer_names(term, limit)
     return []
 
 
+@_timed_query
 def fetch_danmaku(streamer_name: str | None, danmaku_type: str, limit: int = 10):
     """Fetches specific type of danmaku via the facade."""
-    db = _get_db_or_log_error()
-    if db is not None: # <-- Corrected
-        return db_queries.fetch_danmaku_from_db(db, streamer_name, danmaku_type, limit)
+    backend = _get_backend_or_none()
+    if backend is not None:
+        return backend.fetch_danmaku(streamer_name, danmaku_type, limit)
     return []
 
 
+@_timed_query
 def fetch_anti_fan_quotes(limit: int = 3):
     """Fetches anti-fan quotes via the facade."""
-    db = _get_db_or_log_error()
-    if db is not None: # <-- Corrected (This is the line indicated in the traceback)
-        return db_queries.fetch_anti_fan_quotes_from_db(db, limit)
+    backend = _get_backend_or_none()
+    if backend is not None:
+        return backend.fetch_anti_fan_quotes(limit)
     return []
 
 
+@_timed_query
 def fetch_reversal_copy_data(streamer_name: str, limit: int = 10):
     """Fetches Reversal_Copy data via the facade."""
-    db = _get_db_or_log_error()
-    if db is not None: # <-- Corrected
-        return db_queries.fetch_reversal_copy_data_from_db(db, streamer_name, limit)
+    backend = _get_backend_or_none()
+    if backend is not None:
+        return backend.fetch_reversal_copy_data(streamer_name, limit)
     return []
 
 
+@_timed_query
 def fetch_social_topics_data(topic_name: str, limit: int = 10):
     """Fetches Social_Topics data via the facade."""
-    db = _get_db_or_log_error()
-    if db is not None: # <-- Corrected
-        return db_queries.fetch_social_topics_data_from_db(db, topic_name, limit)
+    backend = _get_backend_or_none()
+    if backend is not None:
+        return backend.fetch_social_topics_data(topic_name, limit)
     return []
 
 # FIX: Change to 'def' as the underlying db_queries function is synchronous
+@_timed_query
 def get_random_danmaku(collection_name: str, count: int):
     """Fetches random danmaku via the facade."""
-    db = _get_db_or_log_error()
-    if db is not None:
-        # FIX: Remove 'await' as db_queries.get_random_danmaku_from_db is synchronous
-        return db_queries.get_random_danmaku_from_db(db, collection_name, count)
+    backend = _get_backend_or_none()
+    if backend is not None:
+        return backend.get_random_danmaku(collection_name, count)
+    return []
+
+
+@_timed_query
+def fetch_distinct_values(collection_name: str, field_name: str, term: str | None = None, limit: int = 0):
+    """Fetches distinct non-empty string values of a field (e.g. all boss templates, matching topic names) via the facade."""
+    backend = _get_backend_or_none()
+    if backend is not None:
+        return backend.fetch_distinct_values(collection_name, field_name, term, limit)
     return []
 
 # Make sure db_config is exposed for access to collection names
@@ -94,6 +126,7 @@ __all__ = [
     'fetch_reversal_copy_data',
     'fetch_social_topics_data',
     'get_random_danmaku',
+    'fetch_distinct_values',
     'db_config' # Expose db_config
 ]
 
@@ -0,0 +1,299 @@
+# database/db_import.py
+"""
+Streams a JSONL or CSV corpus into one content collection.
+
+    python -m database.db_import Welcome_Danmaku welcome.jsonl [--batch-size 1000] [--dry-run]
+
+Rows are validated against the fields the queries read, names are normalized,
+templates are deduplicated by hash and everything is written with batched,
+unordered bulk_write upserts, so re-running an import is idempotent.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import re
+import sys
+import time
+import unicodedata
+from pathlib import Path
+
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from . import db_config
+from .db_config import MONGO_URI, DB_NAME
+
+
+# How each collection is shaped:
+#  - grouped: one document per key holding a 'generated_danmaku' array (rows are merged with $addToSet)
+#  - flat: one document per template; 'fields' are required non-empty strings, deduped via content_hash
+IMPORT_RULES = {
+    db_config.WELCOME_COLLECTION: {"key": "streamer_name", "list_field": "generated_danmaku", "name_field": "name"},
+    db_config.MOCK_COLLECTION: {"key": "streamer_name", "list_field": "generated_danmaku", "name_field": "name"},
+    db_config.SOCIAL_TOPICS_COLLECTION: {"key": "topic_name", "list_field": "generated_danmaku"},
+    db_config.REVERSAL_COLLECTION: {"key": "source_name", "fields": ["danmaku_part", "read_part"]},
+    db_config.ANTI_FAN_COLLECTION: {"fields": [db_config.TEXT_FIELDS[db_config.ANTI_FAN_COLLECTION]]},
+    db_config.BIG_BROTHERS_COLLECTION: {"fields": [db_config.TEXT_FIELDS[db_config.BIG_BROTHERS_COLLECTION]]},
+    db_config.GIFT_THANKS_COLLECTION: {"fields": [db_config.TEXT_FIELDS[db_config.GIFT_THANKS_COLLECTION]]},
+}
+
+HASH_FIELD = "content_hash"
+MATCH_KEY_SUFFIX = "_key" # Grouped collections: casefolded copy of the key (e.g. streamer_name_key), matched exactly and indexed
+_WHITESPACE_RE = re.compile(r"\s+")
+_MAX_INVALID_ROW_LOGS = 20
+
+
+def normalize_name(value) -> str:
+    """NFKC-folds (full-width letters/digits -> ASCII), strips and collapses whitespace in a streamer/topic name."""
+    if not isinstance(value, str):
+        return ""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", value)).strip()
+
+
+def normalize_text(value) -> str:
+    """Strips and collapses whitespace in a template. No NFKC here: roast templates are split on the full-width '，'."""
+    if not isinstance(value, str):
+        return ""
+    return _WHITESPACE_RE.sub(" ", value).strip()
+
+
+def content_hash(*parts: str) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+def match_key_field(key_field: str) -> str:
+    return key_field + MATCH_KEY_SUFFIX
+
+
+def iter_rows(path: Path, file_format: str):
+    """Yields (line_number, row_dict) from a JSONL or CSV file without reading it into memory."""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if file_format == "csv":
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                yield line_number, row
+            return
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, ValueError(f"invalid JSON: {e}")
+
+
+def _templates_from_cell(value) -> list:
+    """generated_danmaku may be a JSON array, a JSON-encoded array string (CSV) or a single template."""
+    if isinstance(value, str) and value.lstrip().startswith("["):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            pass
+    if isinstance(value, list):
+        return [normalize_text(item) for item in value if isinstance(item, str)]
+    return [normalize_text(value)]
+
+
+class ContentImporter:
+    """Validates rows for one collection and writes them in bounded batches."""
+
+    def __init__(self, collection, collection_name: str, batch_size: int = 1000, dedupe_cache_size: int = 2_000_000):
+        self.collection = collection # None for --dry-run
+        self.collection_name = collection_name
+        self.rules = IMPORT_RULES[collection_name]
+        self.batch_size = batch_size
+        self.dedupe_cache_size = dedupe_cache_size
+        self._seen = set()
+        self._grouped = {} # casefolded key -> (first-seen spelling, templates pending for this batch)
+        self._pending = [] # UpdateOne ops pending for this batch
+        self._pending_templates = 0
+        self.stats = {"rows": 0, "templates": 0, "duplicates": 0, "invalid": 0, "upserted": 0, "modified": 0, "write_errors": 0}
+
+    def _is_duplicate(self, digest: str) -> bool:
+        # In-run dedupe only; the upserts make cross-run duplicates no-ops. The cache is
+        # cleared when full so memory stays bounded on very large files.
+        if digest in self._seen:
+            self.stats["duplicates"] += 1
+            return True
+        if len(self._seen) >= self.dedupe_cache_size:
+            self._seen.clear()
+        self._seen.add(digest)
+        return False
+
+    def _invalid(self, line_number: int, reason: str):
+        self.stats["invalid"] += 1
+        if self.stats["invalid"] <= _MAX_INVALID_ROW_LOGS:
+            logging.warning(f"db_import: Skipping line {line_number}: {reason}")
+        elif self.stats["invalid"] == _MAX_INVALID_ROW_LOGS + 1:
+            logging.warning("db_import: Further invalid rows will only be counted.")
+
+    def add_row(self, line_number: int, row):
+        self.stats["rows"] += 1
+        if isinstance(row, Exception):
+            self._invalid(line_number, str(row))
+            return
+        if not isinstance(row, dict):
+            self._invalid(line_number, "row is not an object")
+            return
+
+        key_field = self.rules.get("key")
+        key = ""
+        if key_field:
+            key = normalize_name(row.get(key_field))
+            if not key:
+                self._invalid(line_number, f"missing '{key_field}'")
+                return
+
+        list_field = self.rules.get("list_field")
+        if list_field:
+            templates = [tpl for tpl in _templates_from_cell(row.get(list_field)) if tpl]
+            if not templates:
+                self._invalid(line_number, f"missing or empty '{list_field}'")
+                return
+            _, bucket = self._grouped.setdefault(key.casefold(), (key, []))
+            for tpl in templates:
+                if not self._is_duplicate(content_hash(key.casefold(), tpl)):
+                    bucket.append(tpl)
+                    self._pending_templates += 1
+        else:
+            doc = {}
+            for field in self.rules["fields"]:
+                value = normalize_text(row.get(field))
+                if not value:
+                    self._invalid(line_number, f"missing '{field}'")
+                    return
+                doc[field] = value
+            if key_field:
+                doc[key_field] = key
+            digest = content_hash(key.casefold(), *(doc[field] for field in self.rules["fields"]))
+            if self._is_duplicate(digest):
+                return
+            doc[HASH_FIELD] = digest
+            self._pending.append(UpdateOne({HASH_FIELD: digest}, {"$setOnInsert": doc}, upsert=True))
+            self._pending_templates += 1
+
+        if self._pending_templates >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        key_field = self.rules.get("key")
+        list_field = self.rules.get("list_field")
+        name_field = self.rules.get("name_field")
+        for match_key, (key, templates) in self._grouped.items():
+            if not templates:
+                continue
+            on_insert = {key_field: key} # The match key comes from the filter on insert
+            if name_field:
+                on_insert[name_field] = key # search_streamer_names reads 'name'
+            # Exact match on the casefolded key (indexed), so "Jack" and "jack" share one document
+            # like fetch_danmaku_from_db's case-insensitive lookup, without a collection scan per key
+            self._pending.append(UpdateOne(
+                {match_key_field(key_field): match_key},
+                {"$setOnInsert": on_insert, "$addToSet": {list_field: {"$each": templates}}},
+                upsert=True,
+            ))
+        self._grouped = {}
+        self.stats["templates"] += self._pending_templates
+        self._pending_templates = 0
+
+        ops, self._pending = self._pending, []
+        if not ops or self.collection is None:
+            return
+        try:
+            result = self.collection.bulk_write(ops, ordered=False)
+            self.stats["upserted"] += result.upserted_count
+            self.stats["modified"] += result.modified_count
+        except BulkWriteError as e:
+            details = e.details or {}
+            self.stats["upserted"] += details.get("nUpserted", 0)
+            self.stats["modified"] += details.get("nModified", 0)
+            self.stats["write_errors"] += len(details.get("writeErrors", []))
+            logging.error(f"db_import: {len(details.get('writeErrors', []))} write errors in batch; first: {(details.get('writeErrors') or [{}])[0].get('errmsg')}")
+
+    def ensure_indexes(self):
+        if self.collection is None:
+            return
+        if self.rules.get("list_field"):
+            self._backfill_match_keys()
+            self.collection.create_index(match_key_field(self.rules["key"]))
+        else:
+            self.collection.create_index(HASH_FIELD)
+
+    def _backfill_match_keys(self):
+        """Gives documents written without the match key (older imports, other tools) one, so the upserts find them."""
+        key_field = self.rules["key"]
+        match_field = match_key_field(key_field)
+        ops = []
+        for doc in self.collection.find({match_field: {"$exists": False}}, {key_field: 1}):
+            key = normalize_name(doc.get(key_field))
+            if key:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {match_field: key.casefold()}}))
+            if len(ops) >= self.batch_size:
+                self.collection.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+
+
+def run_import(collection, collection_name: str, path: Path, file_format: str, batch_size: int = 1000,
+               dedupe_cache_size: int = 2_000_000, progress_every: int = 100_000) -> dict:
+    importer = ContentImporter(collection, collection_name, batch_size, dedupe_cache_size)
+    importer.ensure_indexes()
+    started = time.perf_counter()
+    for line_number, row in iter_rows(path, file_format):
+        importer.add_row(line_number, row)
+        if progress_every and importer.stats["rows"] % progress_every == 0:
+            elapsed = time.perf_counter() - started
+            logging.info(f"db_import: {importer.stats['rows']} rows ({importer.stats['rows'] / elapsed:.0f} rows/s), {importer.stats['duplicates']} duplicates, {importer.stats['invalid']} invalid.")
+    importer.flush()
+    elapsed = time.perf_counter() - started
+    stats = dict(importer.stats, seconds=round(elapsed, 2), rows_per_second=round(importer.stats["rows"] / elapsed) if elapsed > 0 else 0)
+    logging.info(f"db_import: Finished '{collection_name}' from {path}: {stats}")
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Stream a JSONL/CSV corpus into a content collection.")
+    parser.add_argument("collection", choices=sorted(IMPORT_RULES), help="Target collection")
+    parser.add_argument("path", type=Path, help="JSONL (.jsonl/.json) or CSV (.csv) file")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from file extension)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Templates per bulk_write batch")
+    parser.add_argument("--dedupe-cache", type=int, default=2_000_000, help="Max template hashes kept in memory for in-run dedupe")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and count only, do not write")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not args.path.is_file():
+        logging.error(f"db_import: Input file not found: {args.path}")
+        return 1
+    file_format = args.format or ("csv" if args.path.suffix.lower() == ".csv" else "jsonl")
+
+    if args.dry_run:
+        stats = run_import(None, args.collection, args.path, file_format, max(1, args.batch_size), args.dedupe_cache)
+        return 0 if stats["invalid"] == 0 else 2
+
+    if not MONGO_URI:
+        logging.error("db_import: MONGO_URI is not set.")
+        return 1
+    client = None
+    try:
+        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+        client.admin.command('ismaster')
+        stats = run_import(client[DB_NAME][args.collection], args.collection, args.path, file_format, max(1, args.batch_size), args.dedupe_cache)
+        return 0 if stats["write_errors"] == 0 else 2
+    except PyMongoError as e:
+        logging.error(f"db_import: MongoDB error during import: {e}")
+        return 1
+    finally:
+        if client:
+            client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
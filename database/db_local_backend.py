@@ -0,0 +1,282 @@
+# database/db_local_backend.py
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+from pathlib import Path
+
+from . import db_config
+from .db_backends import ContentBackend
+
+
+SCHEMA_VERSION = 1
+
+_SCHEMA_STATEMENTS = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    # One row per MongoDB document; lookup_key holds the COLLECTION_KEY_FIELDS value (if any)
+    "CREATE TABLE IF NOT EXISTS documents (collection TEXT NOT NULL, lookup_key TEXT COLLATE NOCASE, doc TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_documents_lookup ON documents (collection, lookup_key)",
+]
+
+
+def _fts_trigram_available(conn: sqlite3.Connection) -> bool:
+    """FTS5 with the trigram tokenizer (SQLite >= 3.34) gives indexed substring search on names."""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts_probe USING fts5(name, tokenize='trigram')")
+        conn.execute("DROP TABLE temp._fts_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def create_local_schema(conn: sqlite3.Connection):
+    """Creates the local snapshot tables in an empty SQLite database."""
+    for statement in _SCHEMA_STATEMENTS:
+        conn.execute(statement)
+    if _fts_trigram_available(conn):
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS streamer_names USING fts5(name, tokenize='trigram')")
+    else:
+        logging.warning("db_local_backend: SQLite FTS5 trigram tokenizer unavailable. Falling back to a plain name table.")
+        conn.execute("CREATE TABLE IF NOT EXISTS streamer_names (name TEXT PRIMARY KEY)")
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+
+
+def _like_pattern(term: str) -> str:
+    """
+    Literal substring pattern, matching the Mongo backend (which regex-escapes the term).
+    One difference remains: SQLite LIKE folds ASCII case only, so "Ä" does not match "ä" here
+    while Mongo's case-insensitive regex folds it.
+    """
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class SQLiteContentBackend(ContentBackend):
+    """
+    Embedded, read-only content backend over a local SQLite snapshot exported from MongoDB.
+    One read-only connection shared by all threads (asyncio loop, Flask request threads) behind a
+    lock: the queries are short indexed reads, and a per-thread connection would never be released
+    by werkzeug's thread-per-request server.
+    """
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = Path(path) if path else None
+        self._connection = None
+        self._lock = threading.Lock() # Serializes use of the shared connection
+        self._is_connected = False
+
+    def _query(self, sql: str, params=()) -> list:
+        """Runs one query on the shared connection (opened on first use) and returns all rows."""
+        with self._lock:
+            if self._connection is None:
+                conn = sqlite3.connect(f"file:{self.path.as_posix()}?mode=ro", uri=True, check_same_thread=False)
+                conn.execute("PRAGMA query_only = ON")
+                self._connection = conn
+            return self._connection.execute(sql, params).fetchall()
+
+    def connect(self) -> bool:
+        if self.path is None or not self.path.is_file():
+            logging.error(f"db_local_backend: Local content snapshot not found at {self.path}. Run 'python -m database.db_export' first.")
+            return False
+        try:
+            row = self._query("SELECT value FROM meta WHERE key = 'schema_version'")
+            count = self._query("SELECT COUNT(*) FROM documents")[0][0]
+            exported_at = self._query("SELECT value FROM meta WHERE key = 'exported_at'")
+            logging.info(f"db_local_backend: Opened local snapshot {self.path} (schema {row[0][0] if row else '?'}, {count} documents, exported at {exported_at[0][0] if exported_at else 'unknown'}).")
+            self._is_connected = True
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"db_local_backend: Failed to open local snapshot {self.path}: {e}")
+            self._is_connected = False
+            return False
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self._connection.close()
+                except sqlite3.Error:
+                    pass
+                self._connection = None
+        self._is_connected = False
+
+    def is_connected(self) -> bool:
+        return self._is_connected
+
+    # --- Helpers ---
+    def _find_docs(self, collection_name: str, key: str | None = None, limit: int = 0):
+        sql = "SELECT doc FROM documents WHERE collection = ?"
+        params = [collection_name]
+        if key is not None:
+            sql += " AND lookup_key = ?"
+            params.append(key)
+        if limit > 0:
+            sql += " LIMIT ?"
+            params.append(limit)
+        try:
+            return [json.loads(row[0]) for row in self._query(sql, params)]
+        except sqlite3.Error as e:
+            logging.error(f"db_local_backend: Error fetching from '{collection_name}': {e}")
+            return []
+
+    # --- ContentBackend interface ---
+    def search_streamer_names(self, term: str, limit: int = 20):
+        sql = "SELECT name FROM streamer_names"
+        params = []
+        if term:
+            sql += " WHERE name LIKE ? ESCAPE '\\'"
+            params.append(_like_pattern(term))
+        if limit > 0:
+            sql += " LIMIT ?"
+            params.append(limit)
+        try:
+            return [row[0] for row in self._query(sql, params)]
+        except sqlite3.Error as e:
+            logging.error(f"db_local_backend: Error searching streamer names for '{term}': {e}")
+            return []
+
+    def fetch_danmaku(self, streamer_name: str | None, danmaku_type: str, limit: int = 10):
+        collection_map = {
+            "welcome": db_config.WELCOME_COLLECTION,
+            "roast": db_config.MOCK_COLLECTION,
+            "big_brother_welcome": db_config.BIG_BROTHERS_COLLECTION,
+            "gift_thanks": db_config.GIFT_THANKS_COLLECTION,
+        }
+        if danmaku_type not in collection_map:
+            logging.warning(f"db_local_backend: Unknown danmaku_type '{danmaku_type}' requested in fetch_danmaku.")
+            return []
+        collection_name = collection_map[danmaku_type]
+
+        if danmaku_type in ["welcome", "roast"]:
+            docs = self._find_docs(collection_name, streamer_name or None, 1)
+            if not docs or not isinstance(docs[0].get("generated_danmaku"), list):
+                return []
+            source_list = docs[0]["generated_danmaku"]
+            if len(source_list) > limit:
+                random.shuffle(source_list)
+                return source_list[:limit]
+            return source_list
+
+        field_name = db_config.TEXT_FIELDS[collection_name]
+        docs = self._find_docs(collection_name, None, limit)
+        return [doc.get(field_name, "") for doc in docs if doc and doc.get(field_name)]
+
+    def fetch_anti_fan_quotes(self, limit: int = 3):
+        docs = self._find_docs(db_config.ANTI_FAN_COLLECTION, None, limit)
+        return [doc["quote_text"] for doc in docs if isinstance(doc.get("quote_text"), str) and doc.get("quote_text")]
+
+    def fetch_reversal_copy_data(self, streamer_name: str, limit: int = 10):
+        docs = self._find_docs(db_config.REVERSAL_COLLECTION, streamer_name)
+        valid_entries = [
+            {"danmaku_part": doc["danmaku_part"], "read_part": doc["read_part"]}
+            for doc in docs
+            if isinstance(doc.get("danmaku_part"), str) and isinstance(doc.get("read_part"), str)
+        ]
+        random.shuffle(valid_entries)
+        return valid_entries[:limit]
+
+    def fetch_social_topics_data(self, topic_name: str, limit: int = 10):
+        docs = self._find_docs(db_config.SOCIAL_TOPICS_COLLECTION, topic_name, 1)
+        if not docs or not isinstance(docs[0].get("generated_danmaku"), list):
+            return []
+        topic_items = [item for item in docs[0]["generated_danmaku"] if item and isinstance(item, str) and item.strip()]
+        random.shuffle(topic_items)
+        return topic_items[:limit]
+
+    def get_random_danmaku(self, collection_name: str, count: int):
+        if not collection_name:
+            logging.error("db_local_backend: collection_name cannot be empty for get_random_danmaku.")
+            return []
+        try:
+            rows = self._query(
+                "SELECT doc FROM documents WHERE collection = ? ORDER BY random() LIMIT ?", (collection_name, count)
+            )
+        except sqlite3.Error as e:
+            logging.error(f"db_local_backend: Error fetching random danmaku from '{collection_name}': {e}")
+            return []
+        docs = [json.loads(row[0]) for row in rows]
+
+        known_collections = [
+            db_config.WELCOME_COLLECTION, db_config.MOCK_COLLECTION, db_config.ANTI_FAN_COLLECTION,
+            db_config.BIG_BROTHERS_COLLECTION, db_config.GIFT_THANKS_COLLECTION,
+        ]
+        if collection_name in known_collections:
+            field_name = db_config.TEXT_FIELDS.get(collection_name, "text")
+            return [doc.get(field_name) for doc in docs if isinstance(doc.get(field_name), str)]
+        return docs
+
+    def fetch_distinct_values(self, collection_name: str, field_name: str, term: str | None = None, limit: int = 0):
+        sql = "SELECT DISTINCT json_extract(doc, ?) AS value FROM documents WHERE collection = ? AND value IS NOT NULL"
+        params = [f'$."{field_name}"', collection_name]
+        if term:
+            sql += " AND value LIKE ? ESCAPE '\\'"
+            params.append(_like_pattern(term))
+        try:
+            values = [row[0] for row in self._query(sql, params)]
+        except sqlite3.Error as e:
+            logging.error(f"db_local_backend: Error fetching distinct '{field_name}' from '{collection_name}': {e}")
+            return []
+        result = [value for value in values if isinstance(value, str) and value.strip()]
+        if limit > 0:
+            return result[:limit]
+        return result
+
+
+class LocalSnapshotWriter:
+    """
+    Writes a fresh local snapshot to a temporary file and atomically swaps it into place on commit,
+    so a running server never sees a half-written snapshot.
+    """
+
+    def __init__(self, output_path):
+        self.output_path = Path(output_path)
+        self.tmp_path = self.output_path.with_name(self.output_path.name + ".tmp")
+        self._names = set()
+        self.document_count = 0
+
+    def __enter__(self):
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.tmp_path.exists():
+            self.tmp_path.unlink()
+        self.conn = sqlite3.connect(self.tmp_path)
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+        create_local_schema(self.conn)
+        return self
+
+    def add_documents(self, collection_name: str, documents):
+        """Adds a batch of documents (dicts without '_id') for one collection."""
+        key_field = db_config.COLLECTION_KEY_FIELDS.get(collection_name)
+        name_fields = db_config.NAME_SEARCH_FIELDS.get(collection_name, [])
+        rows = []
+        for doc in documents:
+            key = doc.get(key_field) if key_field else None
+            rows.append((collection_name, key if isinstance(key, str) else None, json.dumps(doc, ensure_ascii=False, default=str)))
+            for field in name_fields:
+                value = doc.get(field)
+                if isinstance(value, str) and value:
+                    self._names.add(value)
+        self.conn.executemany("INSERT INTO documents (collection, lookup_key, doc) VALUES (?, ?, ?)", rows)
+        self.document_count += len(rows)
+
+    def set_meta(self, key: str, value: str):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.conn.close()
+            self.tmp_path.unlink(missing_ok=True)
+            return False
+        self.conn.executemany("INSERT INTO streamer_names (name) VALUES (?)", ((name,) for name in sorted(self._names)))
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+        self.conn.close()
+        os.replace(self.tmp_path, self.output_path)
+        logging.info(f"db_local_backend: Wrote local snapshot {self.output_path} ({self.document_count} documents, {len(self._names)} names).")
+        return False
+
+
+__all__ = ['SQLiteContentBackend', 'LocalSnapshotWriter', 'create_local_schema']
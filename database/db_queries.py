@@ -31,14 +31,17 @@ def _fetch_documents_from_db(db: Database | None, collection_name: str, query, l
 
 
 def search_streamer_names_in_db(db: Database | None, term: str, limit: int = 20):
-    """Searches for streamer names in multiple collections using regex."""
+    """
+    Searches for streamer names in multiple collections: literal, case-insensitive substring match
+    (the term is regex-escaped, like the LIKE pattern of the local backend).
+    """
     if db is None: return []
     all_names = set()
     
     # 从 WELCOME_COLLECTION 中查询
     try:
         collection = db[db_config.WELCOME_COLLECTION]
-        regex_query = {"$regex": term, "$options": "i"} if term else {"$exists": True}
+        regex_query = {"$regex": re.escape(term), "$options": "i"} if term else {"$exists": True}
         names = collection.distinct("name", {"name": regex_query})
         all_names.update(names)
     except Exception as e:
@@ -102,11 +105,8 @@ def fetch_danmaku_from_db(db: Database | None, streamer_name: str | None, danmak
         projection = {"generated_danmaku": 1, "_id": 0}
         # 获取特定主播的弹幕时，我们期望只找到一个文档 
         docs = _fetch_documents_from_db(db, collection_name, query, 1, projection)
-    elif danmaku_type == "big_brother_welcome":
-        projection = {"welcome_text": 1, "_id": 0}
-        docs = _fetch_documents_from_db(db, collection_name, query, limit, projection)
-    elif danmaku_type == "gift_thanks":
-        projection = {"template": 1, "_id": 0}
+    elif danmaku_type in ["big_brother_welcome", "gift_thanks"]:
+        projection = {db_config.TEXT_FIELDS[collection_name]: 1, "_id": 0}
         docs = _fetch_documents_from_db(db, collection_name, query, limit, projection)
 
     if danmaku_type in ["welcome", "roast"]:
@@ -121,10 +121,9 @@ def fetch_danmaku_from_db(db: Database | None, streamer_name: str | None, danmak
                 else: 
                     danmaku_list = source_list 
         return danmaku_list
-    elif danmaku_type == "big_brother_welcome":
-        return [doc.get("welcome_text", "") for doc in docs if doc and doc.get("welcome_text")]
-    elif danmaku_type == "gift_thanks":
-        return [doc.get("template", "") for doc in docs if doc and doc.get("template")]
+    elif danmaku_type in ["big_brother_welcome", "gift_thanks"]:
+        field_name = db_config.TEXT_FIELDS[collection_name]
+        return [doc.get(field_name, "") for doc in docs if doc and doc.get(field_name)]
 
     return [doc.get("text", "") for doc in docs if doc and doc.get("text") and isinstance(doc.get("text"), str)]
 
@@ -211,16 +210,7 @@ def get_random_danmaku_from_db(db: Database | None, collection_name: str, count:
     try: 
         collection = db[collection_name] 
  
-        field_name = 'text'  # Default field 
-        if collection_name == db_config.ANTI_FAN_COLLECTION: 
-            field_name = 'quote_text' 
-        # 修改 Big_Brothers 集合对应的字段名
-        elif collection_name == db_config.BIG_BROTHERS_COLLECTION: 
-            field_name = 'welcome_text' 
-        # 可根据实际情况修改 Gift_Thanks_Danmaku 集合对应的字段名
-        elif collection_name == db_config.GIFT_THANKS_COLLECTION: 
-            # 如果 Gift_Thanks_Danmaku 也使用 'welcome_text'，可修改为 field_name = 'welcome_text'
-            field_name = 'template' 
+        field_name = db_config.TEXT_FIELDS.get(collection_name, 'text')  # Same field names as db_local_backend and db_import
  
         pipeline = [{"$sample": {"size": count}}] 
  
@@ -254,3 +244,20 @@ def get_random_danmaku_from_db(db: Database | None, collection_name: str, count:
     except Exception as e: 
         logging.error(f"db_queries: Unexpected error fetching random danmaku from '{collection_name}': {e}", exc_info=True) 
         return []
+
+
+def fetch_distinct_values_from_db(db: Database | None, collection_name: str, field_name: str, term: str | None = None, limit: int = 0):
+    """Fetches the distinct non-empty string values of a field, optionally filtered by a literal case-insensitive substring."""
+    if db is None: return []
+
+    query = {field_name: {"$regex": re.escape(term), "$options": "i"}} if term else {}
+    try:
+        values = db[collection_name].distinct(field_name, query)
+    except Exception as e:
+        logging.error(f"db_queries: Error fetching distinct '{field_name}' from '{collection_name}': {e}", exc_info=True)
+        return []
+
+    result = [value for value in values if isinstance(value, str) and value.strip()]
+    if limit > 0:
+        return result[:limit]
+    return result
@@ -1,6 +1,6 @@
 # flask_routes.py
 
-from flask import Flask, jsonify, request, send_from_directory, Blueprint
+from flask import Flask, jsonify, request, send_from_directory, Blueprint, Response
 import logging
 import re
 
@@ -16,6 +16,21 @@ from database import get_db_manager, search_streamer_names, fetch_danmaku, fetch
 # Import state manager getter
 from state_manager import get_state_manager
 
+# Versioned presenter state (GET /api/state reports the same version as the state_delta messages)
+from state_sync import get_state_sync
+
+# Short-TTL response cache / ETag / compression for the GET API routes
+from http_cache import cached_response, get_cache_stats
+
+# Prometheus-style text metrics
+from metrics import render_metrics
+
+# On-demand sampling profiler (opt-in, PROFILING_ENABLED)
+from profiler import profiler_command
+
+# Staged startup: /healthz, /readyz
+from readiness import readiness_report, is_warming_up
+
 # Global references to dependencies (will be set by init_flask_routes)
 # _db_manager = None # REMOVED - Use get_db_manager() instead
 _state_manager = None
@@ -26,32 +41,38 @@ _streamer_names_list = []
 
 
 def init_flask_routes(db_m, state_m, broadcast_f):
-    global db_manager, state_manager, broadcast_func, _state_manager, _broadcast_message, _streamer_names_list
+    global db_manager, state_manager, broadcast_func, _state_manager, _broadcast_message
     db_manager = db_m 
     state_manager = state_m 
     broadcast_func = broadcast_f
     _state_manager = state_m
     _broadcast_message = broadcast_f
 
-    # Fetch initial list of streamer names for the search suggestions
+    # The streamer-name list for search suggestions is loaded by load_streamer_names() once the
+    # content backend is connected (server._warm_up, in the background after the ports are bound)
+
+    logging.info("flask_routes: Flask routes module initialized.")
+
+
+def load_streamer_names():
+    """Loads the streamer names for the search suggestions. Blocking; run in a worker thread. Returns the count."""
+    global _streamer_names_list
     # Use the database facade function, NOT the db_manager_instance directly for the query
-    # Check if the instance is connected before attempting the fetch via facade
-    if db_manager and db_manager.is_connected():
+    manager = get_db_manager()
+    if manager and manager.is_connected():
         try:
-             # CALL THE FACADE FUNCTION HERE
-             _streamer_names_list = search_streamer_names(term="", limit=0)
-             logging.info(f"flask_routes: Loaded initial list of {len(_streamer_names_list)} streamer names for search suggestions.")
+             names = search_streamer_names(term="", limit=0)
+             _streamer_names_list = names
+             logging.info(f"flask_routes: Loaded initial list of {len(names)} streamer names for search suggestions.")
+             return len(names)
         except Exception as e:
             logging.error(f"flask_routes: Failed to load initial streamer names for search: {e}", exc_info=True)
             _streamer_names_list = [] # Ensure it's an empty list on failure
-    else:
-         # This warning should be less critical now as the DB connection is handled elsewhere
-         # But it indicates the search suggestion list won't be pre-loaded.
-         logging.warning("flask_routes: DB not connected during init. Streamer search suggestions may be unavailable.")
-         _streamer_names_list = []
-
-
-    logging.info("flask_routes: Flask routes module initialized.")
+            raise
+    # The API falls back to direct DB searches if the list is empty
+    logging.warning("flask_routes: DB not connected. Streamer search suggestions may be unavailable.")
+    _streamer_names_list = []
+    return 0
 
 
 # Function to register routes on the Flask app instance
@@ -68,8 +89,17 @@ def register_flask_routes(flask_app_instance):
         manager = get_db_manager()
         return manager and manager.is_connected()
 
+    def _search_unavailable():
+        # 503 rather than an empty 200: cached_response() only stores 200s, so suggestions work
+        # again as soon as the backend is up instead of serving "no matches" for the TTL
+        response = jsonify([])
+        response.status_code = 503
+        response.headers["Retry-After"] = "1" if is_warming_up() else "5"
+        return response
+
 
     @api_bp.route('/search_streamers', methods=['GET'])
+    @cached_response()
     def search_streamers():
         """Provides fuzzy search suggestions for streamer names."""
         term = request.args.get('term', '').strip()
@@ -77,9 +107,8 @@ def register_flask_routes(flask_app_instance):
 
         if not _is_db_connected():
             logging.warning("flask_routes: API: DB not connected. Cannot perform streamer search.")
-            # Return empty list for suggestions if DB is not connected, or 500 error?
-            # Frontend might expect empty list for no suggestions. Let's return empty list.
-            return jsonify([]) # Return empty list instead of 500 for search suggestions
+            # The frontend hides the suggestions on any non-OK status
+            return _search_unavailable()
 
 
         if not term:
@@ -103,22 +132,23 @@ def register_flask_routes(flask_app_instance):
 
         except Exception as e:
             logging.error(f"flask_routes: API: Error during streamer search for term '{term}': {e}", exc_info=True)
-            # On error, return empty list or an error response?
-            # For search suggestions, returning empty list is often better UX than 500.
-            return jsonify([]) # Return empty list on error
+            # Still an empty list for the suggestions box, but a 500 so the failure is not cached
+            return jsonify([]), 500
 
 
 
     # Keeping redundant routes but renaming to avoid clashes as before
     @api_bp.route('/api/search_streamer_names', methods=['GET'])
+    @cached_response()
     def search_streamer_names_old():
         term = request.args.get('term', '').strip()
         if not _is_db_connected():
-            return jsonify([])
+            return _search_unavailable()
         names = search_streamer_names(term, limit=20)
         return jsonify(names)
 
     @api_bp.route('/streamer_danmaku', methods=['GET'])
+    @cached_response()
     def get_streamer_danmaku():
         name = request.args.get('name', '').strip()
         danmaku_type = request.args.get('type', '').strip().lower()
@@ -154,6 +184,7 @@ def register_flask_routes(flask_app_instance):
 
 
     @api_bp.route('/streamer_reversal_copy', methods=['GET'])
+    @cached_response()
     def get_streamer_reversal_copy():
         name = request.args.get('name', '').strip()
         requester_addr = request.remote_addr
@@ -186,6 +217,7 @@ def register_flask_routes(flask_app_instance):
 
 
     @api_bp.route('/streamer_social_topics', methods=['GET'])
+    @cached_response()
     def get_streamer_social_topics():
         name = request.args.get('name', '').strip()
         requester_addr = request.remote_addr
@@ -217,6 +249,7 @@ def register_flask_routes(flask_app_instance):
 
     # Keeping redundant routes but renaming to avoid clashes
     @api_bp.route('/reversal_copy', methods=['GET'])
+    @cached_response()
     def get_reversal_copy_old():
         name = request.args.get('name', '').strip()
         if not _is_db_connected():
@@ -233,6 +266,7 @@ def register_flask_routes(flask_app_instance):
 
     # Keeping redundant routes but renaming to avoid clashes
     @api_bp.route('/generated_captions', methods=['GET'])
+    @cached_response()
     def get_generated_captions_old():
         event = request.args.get('event', '').strip()
         if not _is_db_connected():
@@ -249,6 +283,7 @@ def register_flask_routes(flask_app_instance):
 
 
     @api_bp.route('/anti_fan_quotes', methods=['GET'])
+    @cached_response()
     def get_anti_fan_quotes():
         """Fetches anti-fan quotes."""
         requester_addr = request.remote_addr
@@ -276,15 +311,64 @@ def register_flask_routes(flask_app_instance):
             return jsonify({"error": "Error fetching anti-fan quotes."}), 500
 
 
+    @api_bp.route('/state', methods=['GET'])
+    def current_state():
+        """
+        Current show state. Reads one immutable snapshot (no lock against the asyncio thread); its JSON is cached per version.
+        X-State-Version / X-State-Epoch are the StateSync version and epoch the presenters' state_delta messages carry.
+        """
+        state_sync = get_state_sync()
+        if state_sync is None:
+            return jsonify({"error": "State sync not initialized."}), 503
+        version, snapshot = state_sync.recorded_snapshot()
+        response = Response(snapshot.to_json(), mimetype="application/json")
+        response.headers["X-State-Version"] = str(version)
+        response.headers["X-State-Epoch"] = str(state_sync.epoch)
+        return response
+
+
+    @api_bp.route('/cache_stats', methods=['GET'])
+    def cache_stats():
+        """Hit/miss counters of the API response cache."""
+        return jsonify(get_cache_stats())
+
+
+    @api_bp.route('/profiler', methods=['GET'])
+    @api_bp.route('/profiler/<command>', methods=['POST'])
+    def profiler(command="status"):
+        """Sampling profiler control: POST /api/profiler/start?seconds=60, POST /api/profiler/stop, GET /api/profiler."""
+        result = profiler_command(command, request.args.get("seconds", type=float))
+        if "error" in result:
+            return jsonify(result), 404 if command in ("start", "stop", "status") else 400
+        return jsonify(result)
+
+
     # Register the blueprint with the app
     flask_app_instance.register_blueprint(api_bp)
 
+    @flask_app_instance.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus text exposition of the in-process metrics."""
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+    @flask_app_instance.route('/healthz', methods=['GET'])
+    def healthz():
+        """Liveness: the process is up and serving (also while the content backend is still warming up)."""
+        return jsonify(readiness_report())
+
+    @flask_app_instance.route('/readyz', methods=['GET'])
+    def readyz():
+        """Readiness: 200 once the content backend and caches are warm, 503 before (or if a stage failed)."""
+        report = readiness_report()
+        return jsonify(report), 200 if report["ready"] else 503
+
     logging.info("flask_routes: Flask routes registered using the provided app instance.")
 
 
 # From __all__ 列表中移除 'app'
 __all__ = [
     'init_flask_routes',
+    'load_streamer_names',
     'register_flask_routes',
     # 'app' 已移除
 ]
@@ -0,0 +1,222 @@
+# http_cache.py
+# Short-TTL response cache for the Flask /api/* routes:
+#  - keyed by route path + sorted query args
+#  - ETag / If-None-Match -> 304
+#  - gzip (or brotli if installed) above a size threshold, compressed once per cache entry
+#  - hit/miss counters exposed via get_cache_stats()
+
+import functools
+import gzip
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, make_response
+
+try:
+    import brotli # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+try:
+    import config
+    _DEFAULT_TTL = getattr(config, 'API_CACHE_TTL_SECONDS', 5.0)
+    _MAX_ENTRIES = getattr(config, 'API_CACHE_MAX_ENTRIES', 1024)
+    _COMPRESS_MIN_BYTES = getattr(config, 'API_COMPRESS_MIN_BYTES', 1024)
+except ImportError:
+    _DEFAULT_TTL = 5.0
+    _MAX_ENTRIES = 1024
+    _COMPRESS_MIN_BYTES = 1024
+
+
+class _CacheEntry:
+    __slots__ = ("expires_at", "body", "etag", "mimetype", "encoded")
+
+    def __init__(self, expires_at, body, etag, mimetype):
+        self.expires_at = expires_at
+        self.body = body
+        self.etag = etag
+        self.mimetype = mimetype
+        self.encoded = {} # content-encoding -> compressed body, filled lazily
+
+
+class ResponseCache:
+    """Thread-safe TTL + LRU cache of successful (200) response bodies. Flask serves requests from several threads."""
+
+    def __init__(self, max_entries: int = _MAX_ENTRIES, compress_min_bytes: int = _COMPRESS_MIN_BYTES):
+        self.max_entries = max_entries
+        self.compress_min_bytes = compress_min_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0, "stores": 0, "evictions": 0, "compressed": 0}
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body: bytes, mimetype: str, ttl: float) -> _CacheEntry:
+        etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        entry = _CacheEntry(time.monotonic() + ttl, body, etag, mimetype)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["brotli_available"] = brotli is not None
+        return stats
+
+    def encoded_body(self, entry: _CacheEntry, encoding: str) -> bytes:
+        body = entry.encoded.get(encoding)
+        if body is None:
+            if encoding == "br":
+                body = brotli.compress(entry.body, quality=5)
+            else:
+                body = gzip.compress(entry.body, compresslevel=6)
+            entry.encoded[encoding] = body # Benign race: two threads may compress the same entry once each
+            self._count("compressed")
+        return body
+
+
+_response_cache = ResponseCache()
+
+
+def _cache_key():
+    return (request.path, tuple(sorted(request.args.items(multi=True))))
+
+
+def _etag_matches(etag: str) -> bool:
+    header = request.headers.get("If-None-Match", "")
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """Accept-Encoding -> {coding: q}. Malformed q-values count as 0 (refused)."""
+    accepted = {}
+    for part in header.lower().split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def _choose_encoding(body_size: int):
+    if body_size < _response_cache.compress_min_bytes:
+        return None
+    accepted = parse_accept_encoding(request.headers.get("Accept-Encoding", ""))
+    wildcard = accepted.get("*", 0.0)
+    candidates = ("br", "gzip") if brotli is not None else ("gzip",)
+    # Highest q wins, br before gzip on a tie; q=0 means "not acceptable"
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _build_response(entry: _CacheEntry, ttl: float, cache_status: str):
+    if _etag_matches(entry.etag):
+        _response_cache._count("not_modified")
+        response = make_response("", 304)
+    else:
+        encoding = _choose_encoding(len(entry.body))
+        body = _response_cache.encoded_body(entry, encoding) if encoding else entry.body
+        response = make_response(body, 200)
+        response.mimetype = entry.mimetype
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    # Weak ETag: the same entity may be sent with different content-encodings
+    response.headers["ETag"] = f'W/"{entry.etag}"'
+    response.headers["Cache-Control"] = f"private, max-age={int(ttl)}"
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["X-Cache"] = cache_status
+    return response
+
+
+def cached_response(ttl: float | None = None):
+    """
+    Decorator for GET API views. Successful responses are cached for `ttl` seconds
+    (config.API_CACHE_TTL_SECONDS by default); error responses pass through uncached.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(*args, **kwargs):
+            entry_ttl = _DEFAULT_TTL if ttl is None else ttl
+            if request.method != "GET" or entry_ttl <= 0:
+                return view_func(*args, **kwargs)
+
+            key = _cache_key()
+            entry = _response_cache.get(key)
+            if entry is not None:
+                _response_cache._count("hits")
+                return _build_response(entry, entry_ttl, "HIT")
+
+            _response_cache._count("misses")
+            response = make_response(view_func(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            entry = _response_cache.put(key, response.get_data(), response.mimetype, entry_ttl)
+            return _build_response(entry, entry_ttl, "MISS")
+        return wrapper
+    return decorator
+
+
+def get_cache_stats() -> dict:
+    return _response_cache.stats()
+
+
+def clear_response_cache():
+    """Drops all cached API responses. Called when the content backend has (re)connected (server._warm_up)."""
+    _response_cache.clear()
+    logging.info("http_cache: Response cache cleared.")
+
+
+__all__ = ['ResponseCache', 'cached_response', 'get_cache_stats', 'clear_response_cache', 'parse_accept_encoding']
@@ -0,0 +1,263 @@
+# metrics.py
+# Cheap in-process metrics with Prometheus text exposition (served at /metrics by flask_routes).
+# Gauge updates are plain dict/float operations on the asyncio thread; counters and histograms
+# are also updated from Flask worker threads (DB queries), so they take a per-metric lock.
+# Scrapes only read. Values that are cheap to compute on demand (client counts, RSS) are
+# callback gauges, so they cost nothing between scrapes.
+
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+
+_REGISTRY = []
+_registry_lock = threading.Lock()
+
+# Latency buckets in seconds (1ms .. 10s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        with _registry_lock:
+            _REGISTRY.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        # inc() is a read-modify-write and DB_QUERY_ERRORS is incremented from Flask worker threads
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge set directly (set/inc/dec) or computed at scrape time from callback()."""
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._callback = callback
+
+    def set(self, value: float, *labelvalues):
+        self._values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1.0):
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) - amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self):
+        lines = self._header()
+        values = self._values
+        if self._callback is not None:
+            try:
+                result = self._callback()
+                values = result if isinstance(result, dict) else {(): result}
+            except Exception as e:
+                logging.debug(f"metrics: Gauge callback for {self.name} failed: {e}")
+                values = {}
+        for labelvalues, value in list(values.items()):
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(float(value))}")
+        return lines
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # labelvalues -> [bucket counts..., +Inf count, sum]
+        # observe() may also be called from Flask worker threads (DB queries), so keep it consistent
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labelvalues):
+        return _HistogramTimer(self, labelvalues)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labelvalues, series in snapshot.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, ('le', _format_value(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labelvalues)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labelvalues)} {cumulative}")
+        return lines
+
+
+class _HistogramTimer:
+    __slots__ = ("histogram", "labelvalues", "started")
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+        return False
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition format (version 0.0.4) of every registered metric."""
+    with _registry_lock:
+        metrics = list(_REGISTRY)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Process metrics ---
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _process_rss_bytes():
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource # Not on Windows; ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if os.uname().sysname == "Darwin" else maxrss * 1024
+    except (ImportError, AttributeError):
+        return None
+
+
+def _connected_clients():
+    from ws_sessions import SESSIONS
+    return {("presenter",): SESSIONS.count("presenter"), ("audience",): SESSIONS.count("audience")}
+
+
+_PROCESS_START = time.time()
+_MONITORED_LOOP = None # Set by monitor_event_loop_lag
+
+
+def _event_loop_timers():
+    # Timer handles (call_later, asyncio.sleep, wait_for timeouts) waiting on the loop; asyncio only (None on uvloop)
+    scheduled = getattr(_MONITORED_LOOP, "_scheduled", None)
+    return None if scheduled is None else len(scheduled)
+
+# --- Application metrics ---
+CONNECTED_CLIENTS = Gauge("danmaku_connected_clients", "Registered WebSocket clients by type.", ["client_type"], callback=_connected_clients)
+PROCESS_RSS = Gauge("process_resident_memory_bytes", "Resident memory size in bytes.", callback=_process_rss_bytes)
+PROCESS_START_TIME = Gauge("process_start_time_seconds", "Start time of the process since unix epoch in seconds.", callback=lambda: _PROCESS_START)
+
+BROADCASTS = Counter("danmaku_broadcasts_total", "Broadcasts by target group (rate() gives broadcasts per second).", ["target"])
+BROADCAST_RECIPIENTS = Counter("danmaku_broadcast_recipients_total", "Messages queued to clients by broadcasts.", ["target"])
+BROADCAST_FANOUT_SECONDS = Histogram("danmaku_broadcast_fanout_seconds", "Time to hand one broadcast to every client in the group.", ["target"])
+SEND_FAILURES = Counter("danmaku_send_failures_total", "Failed sends to a WebSocket client.", ["reason"])
+
+DISPATCH_TOTAL = Counter("danmaku_ws_dispatch_total", "WebSocket messages dispatched, by action and outcome.", ["action", "outcome"])
+DISPATCH_SECONDS = Histogram("danmaku_ws_dispatch_seconds", "Handler latency per WebSocket action.", ["action"])
+
+DB_QUERY_SECONDS = Histogram("danmaku_db_query_seconds", "Content backend query latency via the database facade.", ["operation"])
+DB_QUERY_ERRORS = Counter("danmaku_db_query_errors_total", "Content backend queries that raised.", ["operation"])
+
+ACTIVE_JOBS = Gauge("danmaku_active_jobs", "Long-running send jobs in progress.", ["kind"])
+
+EVENT_LOOP_LAG = Gauge("danmaku_event_loop_lag_last_seconds", "Most recent asyncio event loop scheduling lag.")
+EVENT_LOOP_LAG_SECONDS = Histogram("danmaku_event_loop_lag_seconds", "Distribution of asyncio event loop scheduling lag.",
+                                   buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+EVENT_LOOP_TIMERS = Gauge("danmaku_event_loop_timers", "Timer handles scheduled on the asyncio event loop.", callback=_event_loop_timers)
+EVENT_LOOP_STALLS = Counter("danmaku_event_loop_stalls_total", "Event loop stalls over the profiler threshold, by the action (or task) holding the loop.", ["action"])
+
+HEARTBEAT_PINGS = Counter("danmaku_heartbeat_pings_total", "Keepalive pings sent by the shared heartbeat (ws_heartbeat.py).")
+HEARTBEAT_TIMEOUTS = Counter("danmaku_heartbeat_timeouts_total", "Connections closed by the shared heartbeat for not answering a ping.")
+WS_ADMISSION_REJECTS = Counter("danmaku_ws_admission_rejects_total", "WebSocket connections refused by admission control, by reason.", ["reason"])
+
+
+async def monitor_event_loop_lag(interval: float = 1.0):
+    """Background task: sleeps `interval` and records how late the loop woke it up."""
+    global _MONITORED_LOOP
+    loop = asyncio.get_running_loop()
+    _MONITORED_LOOP = loop
+    logging.info(f"metrics: Event loop lag monitor started (interval {interval}s).")
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_SECONDS.observe(lag)
+
+
+__all__ = [
+    'Counter', 'Gauge', 'Histogram', 'render_metrics', 'monitor_event_loop_lag',
+    'CONNECTED_CLIENTS', 'PROCESS_RSS', 'BROADCASTS', 'BROADCAST_RECIPIENTS', 'BROADCAST_FANOUT_SECONDS',
+    'SEND_FAILURES', 'DISPATCH_TOTAL', 'DISPATCH_SECONDS', 'DB_QUERY_SECONDS', 'DB_QUERY_ERRORS',
+    'ACTIVE_JOBS', 'EVENT_LOOP_LAG', 'EVENT_LOOP_LAG_SECONDS', 'EVENT_LOOP_TIMERS', 'EVENT_LOOP_STALLS',
+    'HEARTBEAT_PINGS', 'HEARTBEAT_TIMEOUTS', 'WS_ADMISSION_REJECTS',
+]
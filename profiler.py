@@ -0,0 +1,318 @@
+# profiler.py
+# Opt-in (PROFILING_ENABLED) diagnostics for event loop stutters during a show.
+#
+# StallWatchdog: the loop re-arms a heartbeat every PROFILER_STALL_CHECK_INTERVAL; a daemon
+# thread notices when it is late by more than PROFILER_STALL_THRESHOLD_MS, grabs the loop
+# thread's stack (sys._current_frames) and finds the ws_core.dispatch_message frame on it,
+# so the stall is attributed to the WebSocket action (or else the running task) that held
+# the loop. Stalls are logged, counted in /metrics and appended to stalls.jsonl.
+# asyncio's own slow-callback log (debug mode) can be switched on as well with
+# PROFILER_ASYNCIO_DEBUG; it only names the connection task, and debug mode is too
+# expensive to leave on for a show.
+#
+# SamplingProfiler: a daemon thread samples every thread's stack PROFILER_SAMPLE_HZ times a
+# second (one sys._current_frames() call per sample, nothing runs on the loop) and counts
+# folded stacks. Loop-thread stacks are rooted at the action being handled. On stop the
+# profile is written as profile-*.folded (flamegraph.pl / speedscope input) plus a JSON
+# summary of the hottest functions. Started/stopped with the "profiler" WebSocket action
+# (presenters only) or /api/profiler/start|stop.
+
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+from collections import Counter as _StackCounter
+from pathlib import Path
+
+from metrics import EVENT_LOOP_STALLS
+
+try:
+    from config import (PROFILE_DIR, PROFILER_SAMPLE_HZ, PROFILER_MAX_SECONDS, PROFILER_STALL_THRESHOLD_MS,
+                        PROFILER_STALL_CHECK_INTERVAL, PROFILER_ASYNCIO_DEBUG)
+except ImportError:
+    PROFILE_DIR = Path(__file__).parent / "data" / "profiles"
+    PROFILER_SAMPLE_HZ = 100
+    PROFILER_MAX_SECONDS = 600
+    PROFILER_STALL_THRESHOLD_MS = 100
+    PROFILER_STALL_CHECK_INTERVAL = 0.05
+    PROFILER_ASYNCIO_DEBUG = False
+
+_MAX_STACK_DEPTH = 64
+_DISPATCH_FUNCTION = "dispatch_message"
+_DISPATCH_FILE = "ws_core.py"
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{Path(code.co_filename).name}:{code.co_name}"
+
+
+def _walk_stack(frame):
+    """(labels outermost first, action or None) of a thread's current stack."""
+    labels, action = [], None
+    depth = 0
+    while frame is not None and depth < _MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        if action is None and frame.f_code.co_name == _DISPATCH_FUNCTION and frame.f_code.co_filename.endswith(_DISPATCH_FILE):
+            action = frame.f_locals.get("action")
+        frame = frame.f_back
+        depth += 1
+    labels.reverse()
+    return labels, action
+
+
+def _running_task_name(loop):
+    # Read from another thread: a best-effort label when no action is being dispatched
+    try:
+        task = asyncio.current_task(loop)
+    except RuntimeError:
+        return None
+    return task.get_name() if task is not None else None
+
+
+def _append_jsonl(path, record):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class StallWatchdog:
+    """Detects event loop stalls from a helper thread and attributes them to the running action."""
+
+    def __init__(self, loop, directory=PROFILE_DIR, threshold_ms: float = PROFILER_STALL_THRESHOLD_MS,
+                 check_interval: float = PROFILER_STALL_CHECK_INTERVAL):
+        self._loop = loop
+        self.directory = Path(directory)
+        self.threshold = threshold_ms / 1000
+        self.check_interval = check_interval
+        self.stalls = 0
+        self._loop_thread_id = None
+        self._last_beat = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+        if not self._stop.is_set():
+            self._loop.call_later(self.check_interval, self._beat)
+
+    def start(self):
+        """Call on the loop thread."""
+        self._loop_thread_id = threading.get_ident()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._beat()
+        self._thread = threading.Thread(target=self._watch, name="stall_watchdog", daemon=True)
+        self._thread.start()
+        logging.info(f"profiler: Stall watchdog started (threshold {self.threshold * 1000:.0f} ms).")
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        stall = None # {"beat", "started", "stack", "in_dispatch", "action"} of the stall in progress
+        while not self._stop.wait(self.check_interval / 2):
+            beat = self._last_beat
+            late = time.monotonic() - beat - self.check_interval
+            if stall is not None and beat != stall["beat"]:
+                self._report(stall, beat - stall["beat"] - self.check_interval)
+                stall = None
+            if stall is None and late > self.threshold:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                stack, action = _walk_stack(frame)
+                stall = {"beat": beat, "started": time.time() - late, "stack": stack, "in_dispatch": action is not None,
+                         "action": str(action) if action is not None else (_running_task_name(self._loop) or "unknown")}
+
+    def _report(self, stall, duration):
+        from ws_core import ACTION_HANDLERS
+        self.stalls += 1
+        action = stall["action"]
+        # Bounded metric labels: registered actions, named tasks, else a catch-all
+        if stall["in_dispatch"]:
+            label = action if action in ACTION_HANDLERS else "unknown_action"
+        else:
+            label = "task" if action.startswith("Task-") else action
+        EVENT_LOOP_STALLS.inc(label)
+        logging.warning(f"profiler: Event loop stalled for {duration * 1000:.0f} ms in '{action}' at {' -> '.join(stall['stack'][-4:])}")
+        try:
+            _append_jsonl(self.directory / "stalls.jsonl", {"t": round(stall["started"], 3), "duration_ms": round(duration * 1000, 1),
+                                                            "action": action, "stack": stall["stack"]})
+        except OSError as e:
+            logging.error(f"profiler: Could not record stall: {e}")
+
+
+class SamplingProfiler:
+    """Wall-clock stack sampler for every thread; folded stacks are written on stop()."""
+
+    def __init__(self, loop_thread_id=None, directory=PROFILE_DIR, hz: int = PROFILER_SAMPLE_HZ, max_seconds: float = PROFILER_MAX_SECONDS):
+        self.loop_thread_id = loop_thread_id # Stacks of this thread are rooted at the action being dispatched
+        self.directory = Path(directory)
+        self.hz = hz
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stacks = _StackCounter()
+        self._samples = 0
+        self._started_at = None
+        self.last_result = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds=None):
+        """Starts sampling (no-op if already running). Stops by itself after `seconds` (at most max_seconds)."""
+        with self._lock:
+            if self.is_running():
+                return False
+            self._stacks = _StackCounter()
+            self._samples = 0
+            self._started_at = time.time()
+            self._stop.clear()
+            duration = min(float(seconds), self.max_seconds) if seconds else self.max_seconds
+            self._thread = threading.Thread(target=self._sample, args=(duration,), name="sampling_profiler", daemon=True)
+            self._thread.start()
+        logging.info(f"profiler: Sampling profiler started ({self.hz} Hz, stops after {duration:.0f}s at the latest).")
+        return True
+
+    def stop(self):
+        """Stops sampling and writes the profile. Returns the result dict (None if it was not running)."""
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return None
+            self._stop.set()
+        thread.join()
+        return self.last_result
+
+    def _sample(self, duration):
+        interval = 1.0 / self.hz
+        me = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + duration
+        while not self._stop.wait(interval) and time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack, action = _walk_stack(frame)
+                if thread_id == self.loop_thread_id:
+                    root = f"action:{action}" if action else "event_loop"
+                else:
+                    if thread_id not in names:
+                        names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    root = f"thread:{names.get(thread_id, thread_id)}"
+                self._stacks[";".join([root] + stack)] += 1
+            self._samples += 1
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            stacks, samples, started_at = self._stacks, self._samples, self._started_at
+            self._thread = None
+        try:
+            self.last_result = self._write(stacks, samples, started_at)
+            logging.info(f"profiler: Profile written to {self.last_result['folded']} ({samples} samples).")
+        except OSError as e:
+            logging.error(f"profiler: Could not write profile: {e}")
+            self.last_result = {"error": str(e), "samples": samples}
+
+    def _write(self, stacks, samples, started_at):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stem = "profile-" + time.strftime("%Y%m%d-%H%M%S", time.localtime(started_at))
+        folded_path = self.directory / f"{stem}.folded"
+        with open(folded_path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        self_counts, total_counts = _StackCounter(), _StackCounter()
+        for stack, count in stacks.items():
+            frames = stack.split(";")[1:]
+            if frames:
+                self_counts[frames[-1]] += count
+            for label in set(frames):
+                total_counts[label] += count
+        summary = {
+            "started_at": round(started_at, 3), "seconds": round(time.time() - started_at, 3),
+            "hz": self.hz, "samples": samples, "folded": str(folded_path),
+            "top_self": self_counts.most_common(25), "top_total": total_counts.most_common(25),
+        }
+        with open(self.directory / f"{stem}.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+    def status(self) -> dict:
+        return {"running": self.is_running(), "hz": self.hz, "samples": self._samples,
+                "started_at": self._started_at if self.is_running() else None, "last_profile": self.last_result}
+
+
+_profiler = None
+_watchdog = None
+
+
+def init_profiler(loop):
+    """Starts the stall watchdog and creates the sampling profiler (called on the loop thread by server.start_servers)."""
+    global _profiler, _watchdog
+    if PROFILER_ASYNCIO_DEBUG:
+        loop.set_debug(True)
+        loop.slow_callback_duration = PROFILER_STALL_THRESHOLD_MS / 1000
+    _watchdog = StallWatchdog(loop)
+    _watchdog.start()
+    _profiler = SamplingProfiler(threading.get_ident())
+    logging.info("profiler: Module initialized.")
+    return _profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+def shutdown_profiler():
+    if _watchdog is not None:
+        _watchdog.stop()
+    if _profiler is not None and _profiler.is_running():
+        _profiler.stop()
+
+
+def profiler_command(command, seconds=None) -> dict:
+    """start / stop / status; shared by the WebSocket action and the HTTP endpoints (any thread)."""
+    if _profiler is None:
+        return {"error": "Profiling is disabled (set PROFILING_ENABLED=1)."}
+    if command == "start":
+        started = _profiler.start(seconds)
+        return {"started": started, **_profiler.status()}
+    if command == "stop":
+        result = _profiler.stop()
+        return {"stopped": result is not None, **_profiler.status()}
+    if command == "status":
+        return {**_profiler.status(), "stalls": _watchdog.stalls if _watchdog else 0}
+    return {"error": f"Unknown profiler command: {command}"}
+
+
+async def handle_profiler(websocket, data):
+    """
+    Presenter-only admin action.
+    data: {"command": "start" | "stop" | "status", "seconds": optional auto-stop for start}
+    """
+    from ws_sessions import get_session
+    session = get_session(websocket)
+    if session is None or session.client_type != "presenter":
+        await websocket.send(json.dumps({"type": "error", "message": "Only presenters can control the profiler.", "action": "profiler", "context": "profiler_forbidden"}))
+        return
+    command = str(data.get("command") or "status")
+    # stop() joins the sampler thread and writes files: keep that off the loop
+    result = await asyncio.to_thread(profiler_command, command, data.get("seconds"))
+    await websocket.send(json.dumps({"type": "profiler_status", "command": command, **result}, ensure_ascii=False))
+
+
+def register_profiler_handlers():
+    if _profiler is None:
+        return {}
+    handlers = {"profiler": handle_profiler}
+    logging.info(f"profiler: Registering handlers: {list(handlers.keys())}")
+    return handlers
+
+
+__all__ = [
+    'StallWatchdog', 'SamplingProfiler', 'init_profiler', 'get_profiler', 'shutdown_profiler',
+    'profiler_command', 'register_profiler_handlers',
+]
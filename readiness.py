@@ -0,0 +1,93 @@
+# readiness.py
+# Staged startup. server.start_servers binds the WebSocket and HTTP ports right after the
+# in-process setup and connects the content backend / warms caches in the background, so
+# audience displays reconnecting during a restart are accepted immediately.
+# Until the content warm-up has finished, handlers wrapped with requires_content() answer
+# with a cheap {"type": "warming_up"} instead of touching the database, and /readyz is 503.
+# Startup timings (ports bound, first accepted connection, content ready) are logged and
+# reported by /healthz and /readyz.
+
+import json
+import logging
+import time
+
+_STARTED = time.monotonic() # Module import ≈ process start (server.py imports it with everything else)
+
+WARMING_UP_RETRY_MS = 1000
+
+_components = {} # name -> {"state": "pending" | "ready" | "failed", "error", "ms"}
+_timings = {} # "ports_bound_ms", "first_accept_ms", "content_ready_ms"
+_warmup_done = False
+
+
+def _elapsed_ms():
+    return round((time.monotonic() - _STARTED) * 1000, 1)
+
+
+def mark_pending(name):
+    _components[name] = {"state": "pending"}
+
+
+def mark_ready(name):
+    _components[name] = {"state": "ready", "ms": _elapsed_ms()}
+    logging.info(f"readiness: {name} ready at {_components[name]['ms']:.0f} ms after start.")
+
+
+def mark_failed(name, error):
+    _components[name] = {"state": "failed", "error": str(error), "ms": _elapsed_ms()}
+    logging.error(f"readiness: {name} failed at {_components[name]['ms']:.0f} ms after start: {error}")
+
+
+def mark_ports_bound():
+    _timings["ports_bound_ms"] = _elapsed_ms()
+    logging.info(f"readiness: Ports bound {_timings['ports_bound_ms']:.0f} ms after start.")
+
+
+def record_accept():
+    """Called for every accepted connection; only the first one is recorded."""
+    if "first_accept_ms" not in _timings:
+        _timings["first_accept_ms"] = _elapsed_ms()
+        logging.info(f"readiness: First connection accepted {_timings['first_accept_ms']:.0f} ms after start.")
+
+
+def finish_warmup():
+    """Content warm-up is over (successfully or not): handlers stop answering warming_up."""
+    global _warmup_done
+    _warmup_done = True
+    _timings["content_ready_ms"] = _elapsed_ms()
+    logging.info(f"readiness: Warm-up finished {_timings['content_ready_ms']:.0f} ms after start ({'ready' if is_ready() else 'not ready'}).")
+
+
+def is_warming_up() -> bool:
+    return not _warmup_done
+
+
+def is_ready() -> bool:
+    return _warmup_done and all(component["state"] == "ready" for component in _components.values())
+
+
+def readiness_report() -> dict:
+    return {"ready": is_ready(), "warming_up": is_warming_up(), "uptime_ms": _elapsed_ms(),
+            "components": {name: dict(component) for name, component in _components.items()},
+            "startup": dict(_timings)}
+
+
+def requires_content(handler):
+    """Wraps a WebSocket handler that needs the content backend: answers warming_up until the warm-up is over."""
+    async def wrapper(websocket, data):
+        if not _warmup_done:
+            await websocket.send(json.dumps({
+                "type": "warming_up", "action": data.get("action"), "retry_after_ms": WARMING_UP_RETRY_MS,
+                "message": "服务器正在启动预热，请稍后再试。", "context": "warming_up",
+            }))
+            return
+        await handler(websocket, data)
+    wrapper.__name__ = getattr(handler, "__name__", "handler")
+    wrapper.__wrapped__ = handler
+    return wrapper
+
+
+__all__ = [
+    'mark_pending', 'mark_ready', 'mark_failed', 'mark_ports_bound', 'record_accept', 'finish_warmup',
+    'is_warming_up', 'is_ready', 'readiness_report', 'requires_content',
+]
@@ -0,0 +1,126 @@
+# roast_engine.py
+# Quote source for roast mode (怼黑粉). The Anti_Fan_Quotes collection is small, so it is
+# loaded once (in a worker thread) and kept in memory; drawing a roast sequence is pure
+# in-memory work. Every target gets its own shuffled deck of the pool, so the same target
+# does not hear a quote again until the whole pool has been used. The pool is refreshed
+# in the background when it is older than ROAST_POOL_REFRESH_SECONDS (stale-while-revalidate),
+# so neither starting nor extending a roast waits for the database after the first load.
+
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+
+from database import fetch_anti_fan_quotes
+
+try:
+    from config import ROAST_POOL_MAX_QUOTES, ROAST_POOL_REFRESH_SECONDS
+except ImportError:
+    ROAST_POOL_MAX_QUOTES = 2000
+    ROAST_POOL_REFRESH_SECONDS = 300.0
+
+# Separator between the danmaku part and the presenter part of a template
+ROAST_SPLIT_CHAR = "，"
+_MAX_TARGET_DECKS = 256
+
+
+def compile_roast_template(raw_template, target_name):
+    """
+    (danmaku_part, presenter_part) of a template: the text before the last full-width comma,
+    with {} replaced by the target name, is sent as danmaku; the text after it is the presenter's line.
+    Without a comma the whole template is the presenter's line and there is no danmaku.
+    """
+    last_comma_index = raw_template.rfind(ROAST_SPLIT_CHAR)
+    if last_comma_index == -1:
+        logging.warning(f"roast_engine: Roast template has no fullwidth comma '{ROAST_SPLIT_CHAR}': '{raw_template}'. Treating whole string as presenter part.")
+        return "", raw_template.strip()
+    danmaku_part = raw_template[:last_comma_index].strip().replace("{}", target_name)
+    return danmaku_part, raw_template[last_comma_index + 1:].strip()
+
+
+class RoastQuotePool:
+    """In-memory Anti_Fan_Quotes with one non-repeating shuffled deck per target."""
+
+    def __init__(self, max_quotes: int = ROAST_POOL_MAX_QUOTES, refresh_seconds: float = ROAST_POOL_REFRESH_SECONDS):
+        self.max_quotes = max_quotes
+        self.refresh_seconds = refresh_seconds
+        self._quotes = ()
+        self._generation = 0 # Bumped when the quote set changes; decks of older generations are reshuffled
+        self._loaded_at = None
+        self._refresh_task = None
+        self._decks = OrderedDict() # target key -> {"generation", "order", "position"}
+
+    def _load(self):
+        quotes = fetch_anti_fan_quotes(limit=self.max_quotes)
+        return list(dict.fromkeys(quote.strip() for quote in quotes if quote and quote.strip())) # Drop duplicates, keep order
+
+    async def refresh(self):
+        """Reloads the pool from the database in a worker thread. Keeps the old pool if the fetch fails or is empty."""
+        try:
+            quotes = await asyncio.to_thread(self._load)
+        except Exception as e:
+            logging.error(f"roast_engine: Failed to load anti-fan quotes: {e}", exc_info=True)
+            return len(self._quotes)
+        self._loaded_at = time.monotonic()
+        if quotes and tuple(quotes) != self._quotes:
+            self._quotes = tuple(quotes)
+            self._generation += 1
+            logging.info(f"roast_engine: Loaded {len(self._quotes)} anti-fan quotes.")
+        return len(self._quotes)
+
+    def _refresh_done(self, task):
+        self._refresh_task = None
+
+    async def ensure_loaded(self):
+        """Waits for the first load only; a stale pool is served as is and refreshed in the background."""
+        if not self._quotes:
+            await self.refresh()
+        elif time.monotonic() - self._loaded_at > self.refresh_seconds and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self.refresh(), name="roast_pool_refresh")
+            self._refresh_task.add_done_callback(self._refresh_done)
+        return len(self._quotes)
+
+    def draw(self, target_name, count):
+        """
+        count quote templates for target_name (fewer if the pool is smaller), none repeated
+        until the target's deck is used up. In-memory only.
+        """
+        quotes = self._quotes
+        if not quotes or count <= 0:
+            return []
+        count = min(count, len(quotes))
+        key = target_name.strip().casefold()
+        deck = self._decks.get(key)
+        if deck is None or deck["generation"] != self._generation:
+            deck = {"generation": self._generation, "order": random.sample(range(len(quotes)), len(quotes)), "position": 0}
+        self._decks[key] = deck
+        self._decks.move_to_end(key)
+        while len(self._decks) > _MAX_TARGET_DECKS:
+            self._decks.popitem(last=False)
+
+        drawn = []
+        while len(drawn) < count:
+            if deck["position"] >= len(deck["order"]):
+                # Deck used up: reshuffle, putting the quotes of this draw and the one just heard last
+                recent = set(drawn) | {deck["order"][-1]}
+                order = random.sample(range(len(quotes)), len(quotes))
+                deck["order"] = [i for i in order if i not in recent] + [i for i in order if i in recent]
+                deck["position"] = 0
+            drawn.append(deck["order"][deck["position"]])
+            deck["position"] += 1
+        return [quotes[i] for i in drawn]
+
+    def stats(self) -> dict:
+        return {"quotes": len(self._quotes), "targets": len(self._decks),
+                "age_seconds": None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 1)}
+
+
+_roast_pool = RoastQuotePool()
+
+
+def get_roast_pool() -> RoastQuotePool:
+    return _roast_pool
+
+
+__all__ = ['RoastQuotePool', 'get_roast_pool', 'compile_roast_template', 'ROAST_SPLIT_CHAR']
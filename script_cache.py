@@ -0,0 +1,151 @@
+# script_cache.py
+# LRU cache of parsed scripts keyed by (path, mtime_ns, size, load mode), bounded by an
+# estimate of their memory footprint. Presenters flipping between the same few scripts
+# during a show get them back without touching the disk again.
+# Entries are only dropped from the cache, never closed: a LazyScript that is still the
+# loaded script keeps its memory map until the state manager lets go of it.
+
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from script_parser import LazyScript, load_script_events
+
+try:
+    import config
+    _MAX_BYTES = getattr(config, 'SCRIPT_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+    _PREPARSE_MAX_FILES = getattr(config, 'SCRIPT_PREPARSE_MAX_FILES', 20)
+except ImportError:
+    _MAX_BYTES = 64 * 1024 * 1024
+    _PREPARSE_MAX_FILES = 20
+
+
+def estimate_script_nbytes(events) -> int:
+    """Rough memory footprint of a parsed script (list of event dicts or LazyScript)."""
+    if isinstance(events, LazyScript):
+        # The mapped file itself is page cache, not heap; count the offset arrays
+        return sys.getsizeof(events._starts) + sys.getsizeof(events._ends)
+    total = sys.getsizeof(events)
+    for event in events:
+        total += sys.getsizeof(event)
+        for value in event.values():
+            total += sys.getsizeof(value)
+    return total
+
+
+class ParsedScriptCache:
+    """Thread-safe: scripts are parsed in worker threads (load_script_async, background pre-parse)."""
+
+    def __init__(self, max_bytes: int = _MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # path -> (signature, events, nbytes)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def signature(path, mode: str):
+        """Cache validity key for path: (mtime_ns, size, mode). Raises OSError if the file is gone."""
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, mode)
+
+    def get(self, path, mode: str):
+        """Returns the cached events if the file is unchanged since it was parsed, else None."""
+        key = str(path)
+        try:
+            signature = self.signature(key, mode)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, path, mode: str, events, signature=None):
+        key = str(path)
+        if signature is None:
+            try:
+                signature = self.signature(key, mode)
+            except OSError:
+                return
+        nbytes = estimate_script_nbytes(events)
+        if nbytes > self.max_bytes:
+            logging.info(f"script_cache: Not caching {key} (~{nbytes} bytes exceeds cache budget {self.max_bytes}).")
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous[2]
+            self._entries[key] = (signature, events, nbytes)
+            self._total_bytes += nbytes
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                evicted_key, (_, _, evicted_bytes) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_bytes
+                logging.debug(f"script_cache: Evicted {evicted_key} (~{evicted_bytes} bytes).")
+
+    def load(self, path, mode: str = "eager", lazy_min_bytes: int = 0):
+        """Returns cached events for path, parsing (and caching) on a miss. Blocking; call from a worker thread."""
+        key = str(path)
+        cached = self.get(key, mode)
+        if cached is not None:
+            logging.info(f"script_cache: Cache hit for {key}.")
+            return cached
+        # Stat before parsing: if the file changes while we parse, the next get() sees a new signature
+        try:
+            signature = self.signature(key, mode)
+        except OSError:
+            signature = None
+        events = load_script_events(key, mode, lazy_min_bytes)
+        if signature is not None and (events or os.path.getsize(key) == 0):
+            self.put(key, mode, events, signature)
+        return events
+
+    def contains_current(self, path, mode: str) -> bool:
+        key = str(path)
+        try:
+            signature = self.signature(key, mode)
+        except OSError:
+            return False
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] == signature
+
+    def preparse_directory(self, directory, mode: str = "eager", lazy_min_bytes: int = 0, max_files: int = _PREPARSE_MAX_FILES) -> int:
+        """Parses the .txt scripts in directory that are not cached yet (newest first). Returns how many were parsed."""
+        try:
+            candidates = [p for p in Path(directory).iterdir() if p.suffix.lower() == ".txt" and p.is_file()]
+            candidates.sort(key=lambda p: p.stat().st_mtime_ns, reverse=True)
+        except OSError as e:
+            logging.warning(f"script_cache: Cannot list {directory} for pre-parse: {e}")
+            return 0
+        parsed = 0
+        for script_path in candidates[:max_files]:
+            if self.contains_current(script_path, mode):
+                continue
+            self.load(script_path, mode, lazy_min_bytes)
+            parsed += 1
+        if parsed:
+            logging.info(f"script_cache: Pre-parsed {parsed} scripts in {directory}.")
+        return parsed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+
+_script_cache = ParsedScriptCache()
+
+
+def get_script_cache() -> ParsedScriptCache:
+    return _script_cache
+
+
+__all__ = ['ParsedScriptCache', 'estimate_script_nbytes', 'get_script_cache']
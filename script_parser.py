@@ -1,38 +1,130 @@
 # script_parser.py
+import codecs
+import difflib
 import logging
+import mmap
 import os
+import re
+from array import array
+from collections.abc import Sequence
 
 # Define an Event class or dictionary structure for parsed events
-# Assuming each event has at least 'line' and 'prompt'
+# Each event has 'line' and 'prompt', plus 'cues' when the script attaches timed cues to it
 # Example structure: {"line": "这是要读的台词", "prompt": "这是给主播的提示"}
+#
+# Script format (one event per line):
+#   # comment
+#   台词                          -> an event; the whole line is read out, the prompt is empty
+#
+# Prompts and cues are opt-in per file, so existing scripts (which may contain "||" or start a
+# line with "@welcome" as plain text) keep parsing exactly as before. A file enables them with
+# the directive below as a comment before its first event line:
+#   # script-format: 2
+#   台词 || 给主播的提示            -> line + prompt ("||" separates them; a single "|" is plain text)
+#   @welcome 张三                 -> cue attached to the NEXT event line: send 张三's welcome danmaku
+#   @roast 张三                   -> send 张三's roast (吐槽) danmaku
+#   @danmaku 10s 第一条 / 第二条    -> send these danmaku, spread evenly over 10 s
+#   @+30s welcome 张三            -> same, fired 30 s after the event is reached
+# Chinese keywords work too (@欢迎 / @吐槽 / @弹幕). Durations: 500ms, 10s, 2m (a bare "+30" delay is seconds).
+# A line starting with "@" that is not a valid cue stays an ordinary event line.
+# Cues are compiled into a timeline and fired by cue_scheduler.py when the presenter advances.
+# Migrating a script: add "# script-format: 2" at the top, then check its lines for a literal "||"
+# or a leading "@welcome"/"@roast"/"@danmaku" (and the Chinese keywords) meant as plain text.
+
+PROMPT_SEPARATOR = "||"
+FORMAT_DIRECTIVE = "# script-format: 2"
+_FORMAT_DIRECTIVE_RE = re.compile(r"^#\s*script-format:\s*2$")
+_UNIVERSAL_NEWLINE_RE = re.compile(r"\r\n|\r|\n")
+
+
+def is_format_directive(stripped_line):
+    """True for the '# script-format: 2' comment that enables prompts and cues in a script file."""
+    return bool(_FORMAT_DIRECTIVE_RE.match(stripped_line))
+
+_CUE_KINDS = {"welcome": "welcome", "欢迎": "welcome", "roast": "roast", "吐槽": "roast", "danmaku": "danmaku", "弹幕": "danmaku"}
+_DURATION_RE = r"(\d+(?:\.\d+)?)(ms|s|m)?"
+_CUE_RE = re.compile(rf"^@(?:\+{_DURATION_RE}\s+)?(\S+)\s*(.*)$")
+# The spread duration of @danmaku needs an explicit unit, so a message that is just a number stays a message
+_CUE_DURATION_PREFIX_RE = re.compile(r"^(\d+(?:\.\d+)?)(ms|s|m)(?:\s+(.*))?$")
+
+
+def _duration_seconds(number, unit):
+    value = float(number)
+    return value / 1000 if unit == "ms" else value * 60 if unit == "m" else value
+
+
+def parse_cue(text):
+    """
+    Parses a stripped '@...' directive line into a cue dict, or returns None if it is not a cue.
+    Cue: {"kind": "welcome"|"roast"|"danmaku", "delay": seconds, "target": name, "messages": [...], "duration": seconds}
+    """
+    match = _CUE_RE.match(text)
+    if not match:
+        return None
+    delay_number, delay_unit, keyword, argument = match.groups()
+    kind = _CUE_KINDS.get(keyword.lower())
+    argument = argument.strip()
+    if kind is None or not argument:
+        return None
+    cue = {"kind": kind, "delay": _duration_seconds(delay_number, delay_unit) if delay_number else 0.0}
+    if kind == "danmaku":
+        duration_match = _CUE_DURATION_PREFIX_RE.match(argument)
+        cue["duration"] = _duration_seconds(*duration_match.group(1, 2)) if duration_match else 0.0
+        if duration_match:
+            argument = duration_match.group(3) or ""
+        cue["messages"] = [message.strip() for message in argument.split("/") if message.strip()]
+        if not cue["messages"]:
+            return None
+    else:
+        cue["target"] = argument
+    return cue
+
+
+def _event_from_text(text, cues=None, extended=True):
+    """Builds the event dict for one stripped, non-comment, non-cue script line (extended: '# script-format: 2' file)."""
+    if not extended:
+        return {"line": text, "prompt": ""}
+    line, separator, prompt = text.partition(PROMPT_SEPARATOR)
+    event = {
+        "line": line.strip() if separator else text,
+        "prompt": prompt.strip(),
+    }
+    if cues:
+        event["cues"] = cues
+    return event
+
 
 def parse_script_file(filepath):
     """
-    Parses a simple text script file into a list of event dictionaries.
-    Assumes each event is a single line in the text file.
+    Parses a text script file into a list of event dictionaries (format above).
     Lines starting with '#' are considered comments and are ignored.
     Empty lines are ignored.
-    Each non-empty, non-comment line is treated as a single event's "line",
-    with an empty "prompt" for simplicity in this basic parser.
-    You can modify this parser based on your actual script file format.
+    In a '# script-format: 2' file, "||" splits off the prompt and '@' cue lines are attached
+    to the next event line; cues after the last event are dropped.
     """
     events = []
+    pending_cues = []
+    extended = False
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
             for line_num, line in enumerate(f, 1):
                 line = line.strip()
                 # Ignore comments and empty lines
                 if not line or line.startswith('#'):
+                    if not events and is_format_directive(line):
+                        extended = True
                     continue
+                if extended and line.startswith('@'):
+                    cue = parse_cue(line)
+                    if cue is not None:
+                        pending_cues.append(cue)
+                        continue
 
-                # Basic parsing: treat the whole line as the 'line' part, prompt is empty
-                # Modify this logic if your script format is more complex (e.g., line | prompt)
-                events.append({
-                    "line": line,
-                    "prompt": "", # Basic parser assumes no prompt in file line
-                    # Add other metadata if needed, like original_line_num
-                })
+                events.append(_event_from_text(line, pending_cues, extended))
+                pending_cues = []
 
+        if pending_cues:
+            logging.warning(f"script_parser: {len(pending_cues)} cue(s) after the last event in {filepath} were ignored.")
         logging.info(f"script_parser: Successfully parsed {len(events)} events from {filepath}")
         return events
 
@@ -43,5 +135,267 @@ def parse_script_file(filepath):
         logging.error(f"script_parser: Error parsing script file {filepath}: {e}", exc_info=True)
         return []
 
+# A line whose first non-whitespace byte is not '#': candidate event line in lazy mode.
+# \x1c-\x1f count as whitespace for str.strip(), so they are skipped here too.
+_EVENT_LINE_RE = re.compile(rb"^[ \t\r\x0b\x0c\x1c-\x1f]*([^\s#\x1c-\x1f]).*$", re.MULTILINE)
+# Same, for files with a lone \r (old Mac line endings): lines end at \n, \r\n or \r, like the
+# universal newlines of parse_script_file's text-mode file. About half as fast as the \n-only scan,
+# so it is only used when needed.
+_EVENT_LINE_UNIVERSAL_RE = re.compile(rb"(?<![^\r\n])[ \t\x0b\x0c\x1c-\x1f]*([^\s#\x1c-\x1f])[^\r\n]*")
+_LONE_CR_RE = re.compile(rb"\r(?!\n)")
+# UTF-8 lead bytes of the non-ASCII characters str.strip() treats as whitespace
+# (U+0085, U+00A0, U+1680, U+2000-U+200A, U+2028/9, U+202F, U+205F, U+3000)
+_UNICODE_SPACE_LEAD_BYTES = frozenset(b"\xc2\xe1\xe2\xe3")
+
+
+_CUE_LEAD_BYTE = ord("@")
+
+
+class LazyScript(Sequence):
+    """
+    Read-only sequence of script events backed by a memory-mapped file.
+    Only the byte offsets of event lines are kept (two array('Q') = 16 bytes per event);
+    an event dict is decoded when it is indexed, so loading a long script costs one scan.
+    """
+
+    def __init__(self, filepath, mm=None, starts=None, ends=None, cues=None, extended=False):
+        self.filepath = str(filepath)
+        self.extended = extended # '# script-format: 2' file: "||" prompts and cues
+        self._mm = mm
+        self._starts = starts if starts is not None else array("Q")
+        self._ends = ends if ends is not None else array("Q")
+        self._cues = cues if cues is not None else {} # event index -> [cue, ...] (few; parsed up front)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if self._mm is None or not 0 <= index < len(self._starts):
+            raise IndexError("script event index out of range")
+        # Validated at build time; "replace" only matters if the file is rewritten in place under the map
+        return _event_from_text(self.raw_line(index).decode("utf-8", errors="replace").strip(), self._cues.get(index), self.extended)
+
+    @property
+    def cues(self):
+        """{event index: [cue, ...]} without decoding any event line."""
+        return self._cues
+
+    def raw_line(self, index) -> bytes:
+        """Undecoded bytes of event line `index` (cheap equality checks when diffing reloads)."""
+        return self._mm[self._starts[index]:self._ends[index]]
+
+    def close(self):
+        """Releases the memory map. Indexing afterwards raises IndexError."""
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+
+_UTF8_CHECK_CHUNK = 1 << 20
+
+
+def _check_utf8(mm):
+    """Raises UnicodeDecodeError unless the whole map is valid UTF-8. Chunked, so memory stays bounded."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    size = len(mm)
+    for offset in range(0, size, _UTF8_CHECK_CHUNK):
+        decoder.decode(mm[offset:offset + _UTF8_CHECK_CHUNK], final=offset + _UTF8_CHECK_CHUNK >= size)
+
+
+def _header_has_format_directive(header: bytes) -> bool:
+    """Whether the comment/blank lines before the first event contain FORMAT_DIRECTIVE (split like text-mode universal newlines)."""
+    text = header.decode("utf-8") # Validated by _check_utf8
+    return any(is_format_directive(line.strip()) for line in _UNIVERSAL_NEWLINE_RE.split(text))
+
+
+def build_lazy_script(filepath):
+    """
+    Memory-maps a script file and indexes its event lines (blocking; run it in a worker thread).
+    Returns a LazyScript, or an empty list on error (matching parse_script_file).
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                logging.info(f"script_parser: Indexed 0 events from empty file {filepath}")
+                return LazyScript(filepath)
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # The map stays valid after the file is closed
+    except FileNotFoundError:
+        logging.error(f"script_parser: Script file not found: {filepath}")
+        return []
+    except (OSError, ValueError) as e:
+        logging.error(f"script_parser: Error memory-mapping script file {filepath}: {e}", exc_info=True)
+        return []
+    try:
+        # Eager mode reads the file with a strict UTF-8 decoder and rejects it on the first invalid byte
+        _check_utf8(mm)
+    except UnicodeDecodeError as e:
+        mm.close()
+        logging.error(f"script_parser: Error parsing script file {filepath}: {e}")
+        return []
+
+    starts = array("Q")
+    ends = array("Q")
+    cues = {}
+    pending_cues = []
+    extended = None # Known once the first event line is reached (the directive must come before it)
+    size = len(mm)
+    line_re = _EVENT_LINE_UNIVERSAL_RE if mm.find(b"\r") != -1 and _LONE_CR_RE.search(mm) else _EVENT_LINE_RE
+    # The regex scan runs in C over the mapped pages; only lines that may start with a
+    # Unicode space or with '@' (a cue) need to be decoded and checked exactly
+    for match in line_re.finditer(mm):
+        lead = match.group(1)[0]
+        text = None
+        if lead in _UNICODE_SPACE_LEAD_BYTES or lead == _CUE_LEAD_BYTE:
+            # Same filter as parse_script_file (after str.strip(), which also removes Unicode spaces such as U+3000)
+            text = match.group(0).decode("utf-8").strip()
+            if not text or text.startswith("#"):
+                continue
+        if extended is None:
+            extended = _header_has_format_directive(mm[:match.start()])
+        if extended and text is not None and text.startswith("@"):
+            cue = parse_cue(text)
+            if cue is not None:
+                pending_cues.append(cue)
+                continue
+        if pending_cues:
+            cues[len(starts)] = pending_cues
+            pending_cues = []
+        starts.append(match.start())
+        ends.append(match.end())
+
+    if pending_cues:
+        logging.warning(f"script_parser: {len(pending_cues)} cue(s) after the last event in {filepath} were ignored.")
+    logging.info(f"script_parser: Indexed {len(starts)} events from {filepath} ({size} bytes, lazy mode)")
+    return LazyScript(filepath, mm, starts, ends, cues, bool(extended))
+
+
+def _resolve_load_mode(filepath, mode, lazy_min_bytes):
+    if mode == "auto":
+        try:
+            return "lazy" if os.path.getsize(filepath) >= lazy_min_bytes else "eager"
+        except OSError:
+            return "eager" # parse_script_file logs the error
+    return mode
+
+
+def load_script_events(filepath, mode="eager", lazy_min_bytes=0):
+    """
+    Loads a script in the given mode:
+    'eager' -> list of event dicts (parse_script_file), 'lazy' -> LazyScript,
+    'auto' -> lazy only for files of at least lazy_min_bytes.
+    """
+    if _resolve_load_mode(filepath, mode, lazy_min_bytes) == "lazy":
+        return build_lazy_script(filepath)
+    return parse_script_file(filepath)
+
+
+# --- Reloading an edited script ---
+# Above this many changed events on either side, skip difflib and map positions proportionally
+_DIFF_MAX_CHANGED = 20000
+
+
+def _same_lazy_format(old_events, new_events):
+    """Raw line bytes identify an event only between two LazyScripts of the same format (see FORMAT_DIRECTIVE)."""
+    return (isinstance(old_events, LazyScript) and isinstance(new_events, LazyScript)
+            and old_events.extended == new_events.extended)
+
+
+def _event_keys_equal(old_events, i, new_events, j):
+    if _same_lazy_format(old_events, new_events):
+        return old_events.raw_line(i) == new_events.raw_line(j) and old_events.cues.get(i) == new_events.cues.get(j)
+    return old_events[i] == new_events[j]
+
+
+def diff_script_events(old_events, new_events):
+    """
+    difflib-style opcodes [(tag, i1, i2, j1, j2), ...] turning old_events into new_events.
+    The common head and tail are matched first, so only the edited region goes through difflib.
+    """
+    old_total, new_total = len(old_events), len(new_events)
+    head = 0
+    while head < old_total and head < new_total and _event_keys_equal(old_events, head, new_events, head):
+        head += 1
+    tail = 0
+    while (tail < old_total - head and tail < new_total - head
+           and _event_keys_equal(old_events, old_total - 1 - tail, new_events, new_total - 1 - tail)):
+        tail += 1
+
+    opcodes = []
+    if head:
+        opcodes.append(("equal", 0, head, 0, head))
+    old_mid_end, new_mid_end = old_total - tail, new_total - tail
+    if old_mid_end - head > _DIFF_MAX_CHANGED or new_mid_end - head > _DIFF_MAX_CHANGED:
+        opcodes.append(("replace", head, old_mid_end, head, new_mid_end))
+    elif old_mid_end > head or new_mid_end > head:
+        key = (lambda events, k: (events.raw_line(k), repr(events.cues.get(k)))) if _same_lazy_format(old_events, new_events) \
+            else (lambda events, k: (events[k].get("line"), events[k].get("prompt"), repr(events[k].get("cues"))))
+        matcher = difflib.SequenceMatcher(None,
+                                          [key(old_events, k) for k in range(head, old_mid_end)],
+                                          [key(new_events, k) for k in range(head, new_mid_end)],
+                                          autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            opcodes.append((tag, i1 + head, i2 + head, j1 + head, j2 + head))
+    if tail:
+        opcodes.append(("equal", old_total - tail, old_total, new_total - tail, new_total))
+    return opcodes
+
+
+def remap_event_index(opcodes, index, old_total, new_total):
+    """
+    Maps a position in the old script to the new one: unchanged events keep their place,
+    an edited event maps to its replacement, a deleted one to the next surviving event.
+    -1 (before the first event) and the finished position (== total) are preserved.
+    """
+    if index < 0 or new_total == 0:
+        return -1
+    if index >= old_total:
+        return new_total
+    for tag, i1, i2, j1, j2 in opcodes:
+        if not i1 <= index < i2:
+            continue
+        if tag == "equal":
+            return j1 + (index - i1)
+        if tag == "replace" and j2 > j1:
+            # Proportional position inside the rewritten block
+            return j1 + min(j2 - j1 - 1, (index - i1) * (j2 - j1) // (i2 - i1))
+        return min(j1, new_total - 1) # Deleted: next event that survived
+    return min(index, new_total - 1)
+
+
+def reparse_script_events(old_events, filepath, mode="eager", lazy_min_bytes=0):
+    """
+    Re-reads an edited script and diffs it against the loaded events (blocking; run it in a worker thread).
+    In eager mode, events outside the edited region are reused as-is, so only the changed lines become new dicts.
+    Returns (new_events, opcodes).
+    """
+    if _resolve_load_mode(filepath, mode, lazy_min_bytes) == "lazy":
+        new_events = build_lazy_script(filepath)
+        return new_events, diff_script_events(old_events, new_events)
+
+    fresh = parse_script_file(filepath)
+    opcodes = diff_script_events(old_events, fresh)
+    if isinstance(old_events, LazyScript):
+        return fresh, opcodes
+    new_events = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        new_events.extend(old_events[i1:i2] if tag == "equal" else fresh[j1:j2])
+    return new_events, opcodes
+
+
+def script_cues(events):
+    """{event index: [cue, ...]} for a parsed script (list of event dicts or LazyScript): the script's cue timeline."""
+    if isinstance(events, LazyScript):
+        return events.cues
+    return {index: event["cues"] for index, event in enumerate(events) if event.get("cues")}
+
+
 # Expose the main parsing function
-__all__ = ['parse_script_file']
+__all__ = [
+    'parse_script_file', 'LazyScript', 'build_lazy_script', 'load_script_events',
+    'diff_script_events', 'remap_event_index', 'reparse_script_events',
+    'parse_cue', 'script_cues', 'PROMPT_SEPARATOR', 'FORMAT_DIRECTIVE', 'is_format_directive',
+]
@@ -0,0 +1,211 @@
+# script_search.py
+# Full-text search over every script in scripts/ (the 'search_scripts' WebSocket action).
+# Inverted index: token -> {file: [event indices]}. CJK text has no word boundaries, so it
+# is indexed as overlapping character bigrams (single characters for 1-char runs); Latin
+# letters and digits are indexed as whole lowercase words. Event indices are the same as
+# the loaded script's (both come from script_parser.parse_script_file), so a hit can be
+# jumped to directly. Files are re-indexed individually when their (mtime, size) changes.
+# Index building is blocking file I/O: call refresh()/search() through asyncio.to_thread.
+
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from script_parser import parse_script_file
+
+try:
+    from config import SCRIPTS_DIR, SCRIPT_SEARCH_REFRESH_SECONDS
+except ImportError:
+    from pathlib import Path
+    SCRIPTS_DIR = Path(__file__).parent / "scripts"
+    SCRIPT_SEARCH_REFRESH_SECONDS = 5.0
+
+# Runs of CJK ideographs / kana / hangul, or of Latin letters and digits
+_CJK_RANGES = "぀-ヿ㐀-䶿一-鿿가-힯豈-﫿"
+_TOKEN_RUN_RE = re.compile(f"([{_CJK_RANGES}]+)|([0-9a-z]+)")
+
+
+def normalize_text(text: str) -> str:
+    """NFKC + casefold, so full-width letters/digits match their ASCII forms."""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def tokenize(text: str, normalized: bool = False):
+    """Tokens of text, in order (duplicates kept): CJK bigrams and Latin/digit words."""
+    if not normalized:
+        text = normalize_text(text)
+    tokens = []
+    for match in _TOKEN_RUN_RE.finditer(text):
+        cjk_run, word = match.groups()
+        if word:
+            tokens.append(word)
+        elif len(cjk_run) == 1:
+            tokens.append(cjk_run)
+        else:
+            tokens.extend(cjk_run[i:i + 2] for i in range(len(cjk_run) - 1))
+    return tokens
+
+
+def _event_text(event) -> str:
+    line = event.get("line") or ""
+    prompt = event.get("prompt") or ""
+    return f"{line} {prompt}" if prompt else line
+
+
+class ScriptSearchIndex:
+    """Inverted index over the .txt scripts below a root directory. Thread-safe."""
+
+    def __init__(self, root=SCRIPTS_DIR):
+        self.root = os.fspath(root)
+        self._postings = {} # token -> {relative path: [event index, ...]}
+        self._files = {} # relative path -> {"signature", "lines", "normalized", "tokens"}
+        self._lock = threading.RLock()
+        self._last_refresh = 0.0
+
+    # --- Building ---
+    def _scan_signatures(self):
+        signatures = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for filename in filenames:
+                if not filename.lower().endswith(".txt"):
+                    continue
+                full_path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(full_path)
+                except OSError:
+                    continue
+                relative_path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                signatures[relative_path] = (st.st_mtime_ns, st.st_size)
+        return signatures
+
+    def _remove_file(self, relative_path):
+        entry = self._files.pop(relative_path, None)
+        if entry is None:
+            return
+        for token in entry["tokens"]:
+            by_file = self._postings.get(token)
+            if by_file is None:
+                continue
+            by_file.pop(relative_path, None)
+            if not by_file:
+                del self._postings[token]
+
+    def _index_file(self, relative_path, signature):
+        events = parse_script_file(os.path.join(self.root, relative_path))
+        lines = [_event_text(event) for event in events]
+        normalized = [normalize_text(line) for line in lines]
+        file_tokens = set()
+        for event_index, text in enumerate(normalized):
+            for token in set(tokenize(text, normalized=True)):
+                self._postings.setdefault(token, {}).setdefault(relative_path, []).append(event_index)
+                file_tokens.add(token)
+        self._files[relative_path] = {"signature": signature, "lines": lines, "normalized": normalized, "tokens": file_tokens}
+
+    def refresh(self, force: bool = False):
+        """
+        Re-indexes new/changed files and drops deleted ones. Cheap when nothing changed (one stat per file).
+        Without force, does nothing if the last refresh is younger than SCRIPT_SEARCH_REFRESH_SECONDS.
+        Returns the number of files (re)indexed or removed.
+        """
+        with self._lock:
+            if not force and time.monotonic() - self._last_refresh < SCRIPT_SEARCH_REFRESH_SECONDS:
+                return 0
+            started = time.perf_counter()
+            signatures = self._scan_signatures()
+            changed = 0
+            for relative_path in [path for path in self._files if path not in signatures]:
+                self._remove_file(relative_path)
+                changed += 1
+            for relative_path, signature in signatures.items():
+                entry = self._files.get(relative_path)
+                if entry is not None and entry["signature"] == signature:
+                    continue
+                self._remove_file(relative_path)
+                self._index_file(relative_path, signature)
+                changed += 1
+            self._last_refresh = time.monotonic()
+            if changed:
+                logging.info(f"script_search: Indexed {changed} changed script(s) in {time.perf_counter() - started:.3f}s "
+                             f"({len(self._files)} scripts, {len(self._postings)} tokens).")
+            return changed
+
+    # --- Querying ---
+    def _lookup(self, token):
+        """Postings for a query token. A lone CJK character also matches every bigram containing it."""
+        if len(token) == 1 and not token.isascii():
+            merged = {}
+            for indexed_token, by_file in self._postings.items():
+                if token in indexed_token:
+                    for relative_path, indices in by_file.items():
+                        merged.setdefault(relative_path, set()).update(indices)
+            return merged
+        return self._postings.get(token)
+
+    def search(self, query: str, limit: int = 20, refresh: bool = True):
+        """
+        Ranked hits for query: [{"filename", "event_index", "line", "score"}, ...].
+        Score: idf-weighted share of the query tokens an event contains, plus a bonus
+        when the whole query appears verbatim; ties favour shorter lines.
+        """
+        if refresh:
+            self.refresh()
+        normalized_query = normalize_text(query).strip()
+        query_tokens = set(tokenize(normalized_query, normalized=True))
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            total_events = sum(len(entry["lines"]) for entry in self._files.values()) or 1
+            scores = {}
+            weights = {}
+            for token in query_tokens:
+                by_file = self._lookup(token)
+                if not by_file:
+                    weights[token] = math.log(1 + total_events) # Unknown token still counts against coverage
+                    continue
+                document_frequency = sum(len(indices) for indices in by_file.values())
+                weight = weights[token] = math.log(1 + total_events / document_frequency)
+                for relative_path, indices in by_file.items():
+                    for event_index in indices:
+                        key = (relative_path, event_index)
+                        scores[key] = scores.get(key, 0.0) + weight
+            total_weight = sum(weights.values())
+
+            ranked = []
+            for (relative_path, event_index), weight in scores.items():
+                entry = self._files[relative_path]
+                score = weight / total_weight
+                if normalized_query in entry["normalized"][event_index]:
+                    score += 1.0
+                ranked.append((score, -len(entry["lines"][event_index]), relative_path, event_index))
+            best = heapq.nlargest(limit, ranked)
+            return [{
+                "filename": relative_path,
+                "event_index": event_index,
+                "line": self._files[relative_path]["lines"][event_index],
+                "score": round(score, 4),
+            } for score, _, relative_path, event_index in best]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"scripts": len(self._files), "tokens": len(self._postings),
+                    "events": sum(len(entry["lines"]) for entry in self._files.values())}
+
+
+_search_index = None
+
+
+def get_search_index() -> ScriptSearchIndex:
+    global _search_index
+    if _search_index is None:
+        _search_index = ScriptSearchIndex()
+    return _search_index
+
+
+__all__ = ['ScriptSearchIndex', 'get_search_index', 'tokenize', 'normalize_text']
@@ -0,0 +1,106 @@
+# script_tree.py
+# Cached listings of the scripts/ directory tree for 'browse_scripts'.
+# A listing is one os.scandir() pass (the entry type usually comes from the directory
+# read itself, no per-entry stat) and is reused until the directory's mtime changes,
+# which happens whenever an entry is added, removed or renamed. All filesystem access
+# here is blocking: ws_script_handlers calls it through asyncio.to_thread.
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    from config import SCRIPT_TREE_CACHE_MAX_DIRS
+except ImportError:
+    SCRIPT_TREE_CACHE_MAX_DIRS = 256
+
+DIR_ENTRY = "browse_dir"
+SCRIPT_ENTRY = "script_file"
+
+
+class DirectoryListingCache:
+    """LRU of directory -> (mtime_ns, sorted [(name, type)]) with only directories and .txt scripts."""
+
+    def __init__(self, max_dirs: int = SCRIPT_TREE_CACHE_MAX_DIRS):
+        self.max_dirs = max_dirs
+        self._listings = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _scan(directory):
+        entries = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        entries.append((entry.name, DIR_ENTRY))
+                    elif entry.name.lower().endswith(".txt") and entry.is_file(): # Only list .txt files as scripts
+                        entries.append((entry.name, SCRIPT_ENTRY))
+                except OSError as e:
+                    logging.debug(f"script_tree: Skipping unreadable entry {entry.path}: {e}")
+        entries.sort()
+        return entries
+
+    def get_entries(self, directory):
+        """
+        Sorted [(name, type)] for directory. Raises FileNotFoundError / NotADirectoryError
+        like os.scandir when the path is missing or not a directory.
+        """
+        key = os.fspath(directory)
+        mtime_ns = os.stat(key).st_mtime_ns
+        with self._lock:
+            cached = self._listings.get(key)
+            if cached is not None and cached[0] == mtime_ns:
+                self._listings.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        entries = self._scan(key)
+        with self._lock:
+            self._listings[key] = (mtime_ns, entries)
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_dirs:
+                self._listings.popitem(last=False)
+        logging.debug(f"script_tree: Listed {key} ({len(entries)} entries).")
+        return entries
+
+    def invalidate(self, directory=None):
+        """Drops one cached listing (or all), e.g. on a file watch event."""
+        with self._lock:
+            if directory is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(os.fspath(directory), None)
+
+    def list_page(self, directory, name_filter: str = "", offset: int = 0, limit=None):
+        """
+        One page of the (optionally filtered) listing.
+        name_filter is a case-insensitive substring match on the entry name; limit=None returns everything.
+        Returns (page_entries, total_matching).
+        """
+        entries = self.get_entries(directory)
+        if name_filter:
+            needle = name_filter.casefold()
+            entries = [entry for entry in entries if needle in entry[0].casefold()]
+        total = len(entries)
+        offset = max(0, offset)
+        page = entries[offset:] if limit is None else entries[offset:offset + limit]
+        return page, total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"directories": len(self._listings), "hits": self.hits, "misses": self.misses}
+
+
+_listing_cache = DirectoryListingCache()
+
+
+def get_listing_cache() -> DirectoryListingCache:
+    return _listing_cache
+
+
+__all__ = ['DirectoryListingCache', 'get_listing_cache', 'DIR_ENTRY', 'SCRIPT_ENTRY']
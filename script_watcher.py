@@ -0,0 +1,195 @@
+# script_watcher.py
+# Hot-reload of the loaded script: when the writer edits the file in scripts/ mid-show,
+# the script is re-parsed, diffed against what is loaded, and the presenter keeps their place.
+# Change detection uses watchdog (inotify on Linux, FSEvents/ReadDirectoryChangesW elsewhere)
+# when it is installed; a stat() poll always runs as the fallback and catches anything missed.
+
+import asyncio
+import logging
+import os
+
+from script_cache import get_script_cache
+from script_parser import reparse_script_events
+from state_sync import publish_state
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+try:
+    import config
+    _POLL_INTERVAL = config.SCRIPT_WATCH_POLL_INTERVAL
+    _DEBOUNCE = config.SCRIPT_WATCH_DEBOUNCE
+    _LOAD_MODE = config.SCRIPT_LOAD_MODE
+    _LAZY_MIN_BYTES = config.SCRIPT_LAZY_MIN_BYTES
+except (ImportError, AttributeError):
+    _POLL_INTERVAL = 1.0
+    _DEBOUNCE = 0.3
+    _LOAD_MODE = "eager"
+    _LAZY_MIN_BYTES = 1024 * 1024
+
+
+class _WakeOnChange(FileSystemEventHandler):
+    """watchdog handler (runs on the observer thread): wakes the watcher loop for events on the watched file."""
+
+    def __init__(self, watcher):
+        self._watcher = watcher
+
+    def on_any_event(self, event):
+        # Editors often save via temp file + rename, so the file can show up as dest_path
+        paths = (getattr(event, "src_path", None), getattr(event, "dest_path", None))
+        if self._watcher.watched_path in paths:
+            self._watcher.notify_threadsafe()
+
+
+class ScriptWatcher:
+    """Watches the state manager's loaded script and applies edits in place."""
+
+    def __init__(self, state_manager, broadcast_func, poll_interval: float = _POLL_INTERVAL, debounce: float = _DEBOUNCE):
+        self._state_manager = state_manager
+        self._broadcast = broadcast_func
+        self._poll_interval = poll_interval
+        self._debounce = debounce
+        self._loop = None
+        self._wake = None
+        self._observer = None
+        self._observed_dir = None
+        self.watched_path = None
+        self._last_signature = None
+        self.reload_count = 0
+
+    def notify_threadsafe(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _observe_directory(self, directory):
+        """(Re)points the watchdog observer at the directory of the loaded script."""
+        if Observer is None or directory == self._observed_dir:
+            return
+        self._stop_observer()
+        try:
+            self._observer = Observer()
+            self._observer.schedule(_WakeOnChange(self), directory, recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+            self._observed_dir = directory
+            logging.info(f"script_watcher: Watching {directory} for script edits.")
+        except Exception as e:
+            logging.warning(f"script_watcher: Could not start file observer for {directory}, polling only: {e}")
+            self._observer = None
+            self._observed_dir = None
+
+    def _stop_observer(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+            self._observed_dir = None
+
+    def _track_loaded_script(self):
+        """Picks up a newly loaded (or cleared) script. Returns the current signature of the watched file."""
+        path = self._state_manager.get_script_path()
+        if path != self.watched_path:
+            self.watched_path = path
+            self._last_signature = None
+            if path is not None:
+                self._observe_directory(os.path.dirname(path))
+        if path is None:
+            return None
+        try:
+            return get_script_cache().signature(path, _LOAD_MODE)
+        except OSError:
+            return None # Mid-rename or deleted: keep the loaded copy until the file is back
+
+    async def run(self):
+        """Background task: started by server.start_servers, cancelled on shutdown."""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        mode = "watchdog + polling" if Observer is not None else "polling"
+        logging.info(f"script_watcher: Script hot-reload started ({mode}, poll {self._poll_interval}s).")
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                try:
+                    await self._check_once()
+                except Exception as e:
+                    logging.error(f"script_watcher: Error while checking for script edits: {e}", exc_info=True)
+        finally:
+            self._stop_observer()
+
+    async def _check_once(self):
+        signature = self._track_loaded_script()
+        if signature is None:
+            return
+        if self._last_signature is None:
+            self._last_signature = signature # First sighting of this script: nothing to reload
+            return
+        if signature == self._last_signature:
+            return
+
+        # Let the editor finish writing (several events per save), then re-stat
+        await asyncio.sleep(self._debounce)
+        self._wake.clear()
+        signature = self._track_loaded_script()
+        if signature is None or signature == self._last_signature:
+            return
+        await self.reload(signature)
+
+    async def reload(self, signature):
+        path = self.watched_path
+        old_events = self._state_manager.get_script_events()
+        new_events, opcodes = await asyncio.to_thread(reparse_script_events, old_events, path, _LOAD_MODE, _LAZY_MIN_BYTES)
+        self._last_signature = signature
+
+        # The presenter may have loaded another script while we were parsing
+        if self._state_manager.get_script_path() != path or self._state_manager.get_script_events() is not old_events:
+            logging.info(f"script_watcher: Loaded script changed during reload of {path}; discarding.")
+            return
+        if not new_events and old_events:
+            # Usually a half-written save or a read error (the parser returns [] for both)
+            logging.warning(f"script_watcher: Re-parse of {path} returned no events; keeping the loaded version.")
+            return
+
+        get_script_cache().put(path, _LOAD_MODE, new_events, signature)
+        changed = [op for op in opcodes if op[0] != "equal"]
+        if not changed:
+            logging.info(f"script_watcher: {path} was saved without event changes.")
+            return
+
+        old_index = self._state_manager.get_current_state()["event_index"]
+        self._state_manager.apply_script_reload(new_events, opcodes)
+        self.reload_count += 1
+        current_state = self._state_manager.get_current_state()
+        await publish_state(refresh_window=True) # Remapped position/total and the edited prefetch window
+        await self._broadcast("presenter", {
+            "type": "script_reloaded",
+            "script_filename": current_state["script_filename"],
+            "event_index": current_state["event_index"],
+            "previous_event_index": old_index,
+            "changed_regions": [{"old_start": i1, "old_end": i2, "new_start": j1, "new_end": j2} for _, i1, i2, j1, j2 in changed[:50]],
+            "message": f"脚本已更新：{current_state['script_filename']}（{len(changed)} 处修改）",
+        })
+
+
+_script_watcher = None
+
+
+def init_script_watcher(state_manager_instance, broadcast_message_func):
+    """Creates the module-level watcher. Call run() on the returned instance from the event loop."""
+    global _script_watcher
+    _script_watcher = ScriptWatcher(state_manager_instance, broadcast_message_func)
+    logging.info("script_watcher: Module initialized.")
+    return _script_watcher
+
+
+def get_script_watcher():
+    return _script_watcher
+
+
+__all__ = ['ScriptWatcher', 'init_script_watcher', 'get_script_watcher']
@@ -8,6 +8,7 @@ import os
 import sys # For sys.exit
 from threading import Thread
 from flask import Flask, jsonify, request, send_from_directory
+from werkzeug.serving import make_server
 from flask_cors import CORS
 # pathlib already imported by config
 import time # For time.time() if needed
@@ -37,17 +38,39 @@ try:
     from state_manager import ApplicationStateManager, init_state_manager, get_state_manager # Also need getter now
 
     # Import core WebSocket dispatcher and helpers
-    from ws_core import init_ws_core, dispatch_message, unregister_client, broadcast_message, PRESENTER_CLIENTS, AUDIENCE_CLIENTS
+    from ws_core import init_ws_core, dispatch_message, unregister_client, broadcast_message
+    from ws_sessions import SESSIONS
 
     # Import init and register functions for all WebSocket handlers
     # These handlers now get DB/State via their getters
-    from ws_script_handlers import init_script_handlers, register_script_handlers, send_initial_script_options, clear_presenter_browse_path, handle_get_current_event_for_presenter
+    from ws_script_handlers import init_script_handlers, register_script_handlers, send_initial_script_options, handle_get_current_event_for_presenter
     from ws_roast_handlers import init_roast_handlers, register_roast_handlers
     from ws_danmaku_fetch_handlers import init_danmaku_fetch_handlers, register_danmaku_fetch_handlers
     from ws_danmaku_send_handlers import init_danmaku_send_handlers, register_danmaku_send_handlers
 
     # Import Flask Routes module
-    from flask_routes import init_flask_routes, register_flask_routes
+    from flask_routes import init_flask_routes, register_flask_routes, load_streamer_names
+    from http_cache import clear_response_cache
+
+    # In-process metrics (exported at /metrics)
+    from metrics import BROADCASTS, BROADCAST_RECIPIENTS, BROADCAST_FANOUT_SECONDS, SEND_FAILURES, monitor_event_loop_lag
+
+    # Hot-reload of the loaded script when it is edited on disk
+    from script_watcher import init_script_watcher
+    from script_search import get_search_index
+    from cue_scheduler import init_cue_scheduler
+    from state_sync import init_state_sync
+    from state_journal import init_state_journal
+    from profiler import init_profiler, register_profiler_handlers, shutdown_profiler
+    from ws_transport import ProfiledServerProtocol, apply_transport_profile
+    from ws_admission import AdmissionServerProtocol, init_admission, admit_registration, get_admission_controller
+    from ws_heartbeat import HeartbeatServerProtocol, init_heartbeat
+    from server_handoff import HandoffListener, request_takeover, CLOSE_SERVICE_RESTART # Graceful restart (--takeover)
+    from roast_engine import get_roast_pool
+    import readiness # Staged startup: ports first, content backend and caches in the background
+
+    # Built (bundled, hashed, precompressed) static assets, see build_assets.py
+    from static_assets import register_static_asset_routes, serve_page
 
 
 except ImportError as e:
@@ -73,33 +96,34 @@ state_manager_instance = None
 
 # --- Root Routes for HTML files ---
 # Serve presenter_control.html and audience_display.html from the BASE_DIR
+# serve_page uses the built copy from static/dist when 'python build_assets.py' has been run, else config.BASE_DIR
 @app.route('/presenter_control.html')
 def serve_presenter_control():
-    # Use config.BASE_DIR
-    return send_from_directory(config.BASE_DIR, 'presenter_control.html')
+    return serve_page('presenter_control.html')
 
 @app.route('/audience_display.html')
 def serve_audience_display():
-     # Use config.BASE_DIR
-     return send_from_directory(config.BASE_DIR, 'audience_display.html')
+     return serve_page('audience_display.html')
 
 @app.route('/')
 def index():
-    # Use config.BASE_DIR
-    return send_from_directory(config.BASE_DIR, 'presenter_control.html')
+    return serve_page('presenter_control.html')
+
+register_static_asset_routes(app)
 
 
 # --- WebSocket Server ---
 async def websocket_handler(websocket, path):
     """Handles incoming WebSocket connections and dispatches messages."""
     addr = websocket.remote_address
-    logging.info(f"connection open: {addr} on path {path}")
+    logging.debug(f"connection open: {addr} on path {path}") # debug: one line per connection floods the log during reconnect storms
+    readiness.record_accept() # Time-to-first-accept
 
     client_type = None # Track client type after registration
 
     try:
         # Wait for the initial 'register' message
-        message = await asyncio.wait_for(websocket.recv(), timeout=10.0)
+        message = await asyncio.wait_for(websocket.recv(), timeout=config.WS_REGISTER_TIMEOUT)
 
         try:
             data = json.loads(message)
@@ -109,9 +133,12 @@ async def websocket_handler(websocket, path):
                  client_type = data.get("client_type") # Extract type early if valid format
                  if client_type not in ["presenter", "audience"]:
                      raise ValueError(f"Invalid client_type: {client_type}") # Raise error for invalid type
+                 if not await admit_registration(websocket, client_type): # Registration token bucket; closed with 1013 + retry hint
+                     return # Exit handler
 
                  # Dispatch the register message. ws_core will handle adding client to sets and sending success.
                  await dispatch_message(websocket, data)
+                 apply_transport_profile(websocket, client_type) # Buffer limits of the registered client type
 
                  # --- Initial State Sync AFTER Successful Registration ---
                  # After a presenter registers successfully, send them the initial script options and current script state
@@ -205,7 +232,10 @@ async def websocket_handler(websocket, path):
     except websockets.exceptions.ConnectionClosedOK:
         logging.info(f"connection closed (OK): {addr}")
     except websockets.exceptions.ConnectionClosedError as e:
-        logging.warning(f"connection closed (Error): {addr}: {e}")
+        if e.sent is not None and e.sent.code == CLOSE_SERVICE_RESTART: # Closed by us for a handoff; one per client
+            logging.debug(f"connection closed (handoff): {addr}")
+        else:
+            logging.warning(f"connection closed (Error): {addr}: {e}")
     except Exception as e:
         logging.error(f"server: Unexpected error in WebSocket handler loop for {addr}: {e}", exc_info=True)
     finally:
@@ -219,11 +249,11 @@ async def websocket_handler(websocket, path):
 # These functions are defined here in server.py because they need access to the
 # websocket instances and the websockets library's send/close methods.
 async def _send_message_to_ws(websocket, message):
-    """Internal helper to send a JSON message to a specific websocket."""
+    """Internal helper to send a JSON message to a specific websocket. Returns True if it was handed to the connection."""
     try:
         if not isinstance(message, dict):
             logging.error(f"server: Attempted to send non-dictionary message to {websocket.remote_address}: {message}")
-            return
+            return False
 
         # Add a timestamp for potential client-side display sync/debugging
         if "timestamp" not in message:
@@ -231,14 +261,18 @@ async def _send_message_to_ws(websocket, message):
 
         await websocket.send(json.dumps(message))
         # logging.debug(f"server: Sent message to {websocket.remote_address}: {message.get('type')}") # Too noisy
+        return True
     except websockets.exceptions.ConnectionClosed:
         # This happens often during graceful disconnect, just log debug
+        SEND_FAILURES.inc("connection_closed")
         logging.debug(f"server: Failed to send message to closed connection {websocket.remote_address}.")
     except Exception as e:
+        SEND_FAILURES.inc("error")
         logging.error(f"server: Error sending message to {websocket.remote_address}: {e}", exc_info=True)
+    return False
 
-async def _broadcast_message_to_group(target_type, message):
-    """Internal helper to broadcast a JSON message to a group of websockets."""
+async def _broadcast_message_to_group(target_type, message, room=None):
+    """Internal helper to broadcast a JSON message to a group of websockets (optionally only those in one room)."""
     if not isinstance(message, dict):
         logging.error(f"server: Attempted to broadcast non-dictionary message to {target_type}: {message}")
         return
@@ -246,47 +280,80 @@ async def _broadcast_message_to_group(target_type, message):
     if "timestamp" not in message:
         message["timestamp"] = time.time()
 
-    clients_source = []
-    # Access client sets from ws_core module
-    if target_type == "presenter":
-        clients_source = PRESENTER_CLIENTS
-        logging.debug(f"server: Broadcasting {message.get('type')} to presenter group ({len(clients_source)} total).")
-    elif target_type == "audience":
-        clients_source = AUDIENCE_CLIENTS
-        # 使用 INFO 级别确保能看到 
-        logging.info(f"server: Broadcasting to audience. AUDIENCE_CLIENTS size: {len(clients_source)}. Clients: {[str(c.remote_address) if c else 'None' for c in clients_source]}") 
-        logging.debug(f"server: Broadcasting {message.get('type')} to audience group ({len(clients_source)} total).")
+    # Session snapshots (ws_sessions.py) are tuples reused until a client registers/unregisters;
+    # they do not change under us while the sends below yield
+    if target_type in ("presenter", "audience"):
+        clients_to_send = SESSIONS.snapshot(target_type, room)
     elif target_type == "all":
-        clients_source = PRESENTER_CLIENTS.union(AUDIENCE_CLIENTS)
-        logging.debug(f"server: Broadcasting {message.get('type')} to all clients ({len(clients_source)} total).")
+        clients_to_send = SESSIONS.snapshot(None, room)
     else:
         logging.error(f"server: Unknown target type for broadcast: {target_type}")
         return
+    logging.debug(f"server: Broadcasting {message.get('type')} to {target_type} group ({len(clients_to_send)} total).")
 
-    # Create a list from the source set/union and explicitly filter out None values
-    clients_to_send = [c for c in list(clients_source) if c is not None]
-
+    BROADCASTS.inc(target_type)
     if clients_to_send:
+        BROADCAST_RECIPIENTS.inc(target_type, amount=len(clients_to_send))
+        fanout_started = time.perf_counter()
         # Use asyncio.gather for concurrent sending
-        tasks = [_send_message_to_ws(client, message.copy()) for client in clients_to_send]
+        tasks = [_send_message_to_ws(session.websocket, message.copy()) for session in clients_to_send]
         if tasks:
             # Use return_exceptions=True to allow some sends to fail without stopping others
             results = await asyncio.gather(*tasks, return_exceptions=True)
-            # Log any exceptions during individual sends
-            for i, result in enumerate(results):
+            # Per-session counters; log any exceptions during individual sends
+            for session, result in zip(clients_to_send, results):
+                if result is True:
+                    session.messages_out += 1
+                    continue
+                session.send_failures += 1
                 if isinstance(result, Exception):
-                    client_addr_str = "Unknown Client"
-                    try:
-                        if i < len(clients_to_send) and clients_to_send[i] and hasattr(clients_to_send[i], 'remote_address'):
-                            client_addr_str = str(clients_to_send[i].remote_address)
-                    except Exception as e_addr:
-                        logging.debug(f"server: Could not get client address for error logging during broadcast error: {e_addr}")
-                    logging.warning(f"server: Error during broadcast to {client_addr_str}: {result}")
+                    logging.warning(f"server: Error during broadcast to {session.remote_address}: {result}")
+        BROADCAST_FANOUT_SECONDS.observe(time.perf_counter() - fanout_started, target_type)
             # logging.debug(f"server: Broadcast of '{message.get('type')}' to {len(clients_to_send)} clients completed (individual success/failure logged).")
     else:
         logging.debug(f"server: No active clients in target group '{target_type}' to broadcast to after filtering.")
 
 
+def _restore_journaled_state(state_journal):
+    try:
+        state_journal.restore()
+    except Exception as e:
+        logging.error(f"server: Could not restore journaled state: {e}", exc_info=True)
+
+
+# --- Background warm-up ---
+WARMUP_STAGES = ("database", "streamer_names", "roast_pool")
+
+async def _warm_up():
+    """Connects the content backend and fills the caches that used to be loaded before the ports were bound."""
+    try:
+        connected = await asyncio.to_thread(db_manager_instance.connect_db)
+    except Exception as e:
+        connected = False
+        logging.error(f"server: Error connecting the content backend: {e}", exc_info=True)
+    if not connected:
+        # Features requiring the DB fail gracefully through their usual "DB not connected" paths
+        logging.critical("server: Failed to connect to the content backend during startup. Dependent features will be unavailable.")
+        readiness.mark_failed("database", "connect_db failed")
+        readiness.finish_warmup()
+        return
+    readiness.mark_ready("database")
+
+    try:
+        await asyncio.to_thread(load_streamer_names)
+        readiness.mark_ready("streamer_names")
+    except Exception as e:
+        readiness.mark_failed("streamer_names", e)
+
+    # Load the roast quote pool now so the first roast sequence does not wait for the database
+    # (refresh() logs and keeps an empty pool on failure; roast handlers retry via ensure_loaded)
+    await get_roast_pool().refresh()
+    readiness.mark_ready("roast_pool")
+    # Anything the API cached while the backend was still connecting was computed without it
+    clear_response_cache()
+    readiness.finish_warmup()
+
+
 # --- Async Server Startup ---
 async def start_servers():
     """Starts the WebSocket and Flask servers."""
@@ -297,18 +364,27 @@ async def start_servers():
     global db_manager_instance, state_manager_instance
 
     # Initialize DatabaseManager using the init_db_manager from the database package
+    # The connection itself is made by _warm_up() after the ports are bound (up to 5 s of server selection)
     db_manager_instance = init_db_manager() # Get the singleton instance
-    if not db_manager_instance.connect_db():
-        logging.critical("server: Failed to connect to MongoDB during startup. Dependent features will be unavailable.")
-        # Decide if you want to exit or continue with limited functionality
-        # For now, let's allow startup but features requiring DB will fail gracefully.
-        # sys.exit(1) # Uncomment to exit on DB connection failure
+    for stage in WARMUP_STAGES:
+        readiness.mark_pending(stage)
 
     # Initialize State Manager
     state_manager_instance = ApplicationStateManager()
     init_state_manager(state_manager_instance)
     logging.info("state_manager: Application state initialized.")
 
+    # Graceful restart: take the sockets and show state over from the running server (server_handoff.py)
+    takeover_requested = config.HANDOFF_ENABLED and (config.HANDOFF_TAKEOVER or "--takeover" in sys.argv[1:])
+
+    # Bring back the show state (script, position, roast sequence) from before a restart/crash.
+    # On a takeover the running server still writes the journal; it is restored once it has handed over.
+    state_journal = None
+    if config.STATE_JOURNAL_ENABLED:
+        state_journal = init_state_journal(state_manager_instance)
+        if not takeover_requested:
+            _restore_journaled_state(state_journal)
+
     # 2. Initialize WebSocket handler modules with dependencies
     logging.info("server: Initializing WebSocket handler modules.")
     # Handlers now get DB via get_db_manager(), State via get_state_manager()
@@ -318,6 +394,12 @@ async def start_servers():
     init_roast_handlers(state_manager_instance, db_manager_instance, _broadcast_message_to_group) # Pass state manager, db manager instance, and broadcast
     init_danmaku_fetch_handlers() # No specific deps needed here, it uses getters
     init_danmaku_send_handlers(_broadcast_message_to_group) # Needs broadcast, uses getters
+    init_cue_scheduler(state_manager_instance, _broadcast_message_to_group) # Fires timed cues embedded in scripts
+    state_sync = init_state_sync(state_manager_instance, _broadcast_message_to_group) # Versioned state deltas to all presenters
+    if state_journal is not None:
+        state_sync.add_listener(state_journal.record) # Journal every state change
+    if config.PROFILING_ENABLED:
+        init_profiler(asyncio.get_running_loop()) # Stall watchdog now; sampling on demand
 
 
     # 3. Initialize WebSocket core dispatcher and register handlers
@@ -327,7 +409,8 @@ async def start_servers():
                  register_script_handlers,
                  register_roast_handlers,
                  register_danmaku_fetch_handlers,
-                 register_danmaku_send_handlers)
+                 register_danmaku_send_handlers,
+                 register_profiler_handlers)
     logging.info(f"ws_core: WebSocket core initialized.")
 
     # 4. Initialize Flask routes module and register routes
@@ -341,15 +424,40 @@ async def start_servers():
     logging.info("flask_routes: Flask routes registered successfully.")
 
 
-    # 5. Start the Flask app in a separate thread
+    # 5. Take over from the running server: connect the content backend first so we are ready to serve
+    # when the sockets arrive, then ask for them (None when no server is running: start normally)
+    content_warmup_task = None
+    takeover = None
+    if takeover_requested:
+        content_warmup_task = asyncio.create_task(_warm_up(), name="content_warmup")
+        done, _ = await asyncio.wait({content_warmup_task}, timeout=config.HANDOFF_WARMUP_TIMEOUT)
+        if not done:
+            logging.warning(f"server: Content backend not ready after {config.HANDOFF_WARMUP_TIMEOUT}s; taking over anyway (content requests answer 'warming_up').")
+        takeover = await asyncio.to_thread(request_takeover)
+        if takeover is None:
+            logging.warning(f"server: No running server answered on {config.HANDOFF_SOCKET_PATH}; starting normally.")
+        if state_journal is not None:
+            _restore_journaled_state(state_journal) # The previous server has written its final snapshot
+        elif takeover is not None:
+            state_manager_instance.restore_persistent_state(takeover.state)
+
+    # 6. Start the Flask app in a separate thread
     logging.info(f"server: Flask app thread starting on http://0.0.0.0:{config.FLASK_PORT}")
     # Use config.FLASK_PORT
     # For production, use a WSGI server like Gunicorn or uWSGI.
-    flask_thread = Thread(target=lambda: app.run(host="0.0.0.0", port=config.FLASK_PORT, debug=False, use_reloader=False))
+    # Same werkzeug server as app.run(), created here so it can serve on a socket handed over by the previous process
+    try:
+        http_server = make_server("0.0.0.0", config.FLASK_PORT, app, threaded=True,
+                                  fd=takeover.http_fd if takeover is not None else None)
+    except BaseException as e: # make_server exits on bind errors
+        if takeover is not None:
+            takeover.abort(e)
+        raise
+    flask_thread = Thread(target=http_server.serve_forever, name="flask_http")
     flask_thread.daemon = True # Daemonize thread so it exits when main thread exits
     flask_thread.start()
 
-    # 6. Start the WebSocket server 
+    # 7. Start the WebSocket server 
     # Use config.WEBSOCKET_PORT 
     logging.info(f"server listening on 0.0.0.0:{config.WEBSOCKET_PORT}") 
      
@@ -359,36 +467,62 @@ async def start_servers():
     # logging.getLogger("websockets").addHandler(logging.StreamHandler()) 
     # 为了更精细控制，可以针对 server 和 protocol 分别设置 
     server_logger = logging.getLogger("websockets.server") 
-    server_logger.setLevel(logging.DEBUG) # 或者 INFO 
+    server_logger.setLevel(config.WS_LIBRARY_LOG_LEVEL) # DEBUG 会记录每一帧，重连风暴时日志量很大
     if not server_logger.hasHandlers(): # 避免重复添加处理器 
         server_logger.addHandler(logging.StreamHandler()) 
  
     protocol_logger = logging.getLogger("websockets.protocol") 
-    protocol_logger.setLevel(logging.DEBUG) # 或者 INFO 
+    protocol_logger.setLevel(config.WS_LIBRARY_LOG_LEVEL)
     if not protocol_logger.hasHandlers(): # 避免重复添加处理器 
         protocol_logger.addHandler(logging.StreamHandler()) 
  
-    class CustomServerProtocol(websockets.WebSocketServerProtocol): 
-        async def process_pong(self, data: bytes) -> None: 
-            # 你可以选择在这里记录PONG，或者完全依赖库的日志 
-            logging.debug(f"CustomServerProtocol: PONG received from {self.remote_address}. Data: {data!r} (Handled by library)") 
-            await super().process_pong(data) 
-            # 移除调用 update_client_activity
+    # Admission caps before the upgrade (ws_admission.py), shared keepalive (ws_heartbeat.py),
+    # then compression/limits per transport profile (ws_transport.py)
+    init_admission()
+    heartbeat = init_heartbeat() if config.HEARTBEAT_MODE == "wheel" else None
+    library_keepalive = heartbeat is None # Per-connection keepalive task of the websockets library
+    class CustomServerProtocol(AdmissionServerProtocol, HeartbeatServerProtocol, ProfiledServerProtocol):
+        pass
+
+    # Bind 0.0.0.0 (one listening socket), or serve on the one handed over by the previous process
+    listen_on = {"sock": takeover.ws_sockets[0]} if takeover is not None else {"host": "0.0.0.0", "port": config.WEBSOCKET_PORT}
 
     # ***** 将 websockets.serve 的结果赋值给 ws_server ***** 
-    ws_server = await websockets.serve( 
-        websocket_handler, # 注意这里是 websocket_handler 而不是 ws_handler_entry 
-        "0.0.0.0", 
-        config.WEBSOCKET_PORT, 
-        ping_interval=config.PING_INTERVAL, 
-        ping_timeout=config.PING_TIMEOUT_FOR_WEBSOCKETS_LIB, # 确保这个值在 config.py 中定义且合理 
-        create_protocol=CustomServerProtocol 
-    ) 
+    try:
+        ws_server = await websockets.serve( 
+            websocket_handler, # 注意这里是 websocket_handler 而不是 ws_handler_entry 
+            ping_interval=config.PING_INTERVAL if library_keepalive else None, 
+            ping_timeout=config.PING_TIMEOUT_FOR_WEBSOCKETS_LIB if library_keepalive else None, # 确保这个值在 config.py 中定义且合理 
+            read_limit=config.WS_READ_LIMIT,
+            create_protocol=CustomServerProtocol,
+            **listen_on
+        ) 
+    except BaseException as e:
+        if takeover is not None:
+            http_server.shutdown()
+            http_server.server_close()
+            takeover.abort(e)
+        raise
     logging.info(f"server: WebSocket server started on ws://0.0.0.0:{config.WEBSOCKET_PORT}") 
-    logging.info(f"server: PING Interval: {config.PING_INTERVAL}s, PING Timeout (websockets lib): {getattr(config, 'PING_TIMEOUT_FOR_WEBSOCKETS_LIB', 'N/A')}s") 
+    readiness.mark_ports_bound()
+    if takeover is not None:
+        # Let the previous server's clients back in at once, then tell it to close them with 1012
+        get_admission_controller().open_reconnect_window(takeover.clients, config.HANDOFF_RECONNECT_WINDOW)
+        await asyncio.to_thread(takeover.ready)
+        logging.info(f"server: Took over from process {takeover.previous_pid}.")
+    # Wait for the next graceful restart
+    handoff_listener = None
+    if config.HANDOFF_ENABLED:
+        handoff_listener = HandoffListener(ws_server, http_server, state_manager_instance, state_journal)
+        try:
+            handoff_listener.start()
+        except OSError as e:
+            logging.error(f"server: Could not open the handoff control socket {config.HANDOFF_SOCKET_PATH}: {e}")
+            handoff_listener = None
+    logging.info(f"server: PING Interval: {config.PING_INTERVAL}s, PING Timeout: {getattr(config, 'PING_TIMEOUT_FOR_WEBSOCKETS_LIB', 'N/A')}s, keepalive: {'library' if library_keepalive else 'shared timing wheel'}") 
  
  
-    # 7. Start background cleanup tasks (e.g., heartbeat checks)
+    # 8. Start background cleanup tasks (e.g., heartbeat checks)
     logging.info("server: Background cleanup task starting.")
     # periodic_heartbeat_and_timeout_check needs access to client sets in ws_core and the unregister function
     # These are available via importing ws_core
@@ -396,6 +530,30 @@ async def start_servers():
     # cleanup_task = asyncio.create_task(periodic_heartbeat_and_timeout_check())
     logging.info("server: Background cleanup task started.")
 
+    # One timer for the keepalive of every connection
+    heartbeat_task = asyncio.create_task(heartbeat.run(), name="ws_heartbeat") if heartbeat is not None else None
+
+    # Event loop lag sampling for /metrics
+    loop_lag_task = asyncio.create_task(monitor_event_loop_lag(config.METRICS_LOOP_LAG_INTERVAL), name="metrics_loop_lag")
+
+    # Build the full-text script index in the background so the first search_scripts is fast
+    # (the task reference is kept so it is not garbage-collected while running)
+    search_warmup_task = asyncio.create_task(asyncio.to_thread(get_search_index().refresh, True), name="script_search_warmup")
+    # Connect the content backend, then load the streamer names and the roast quote pool;
+    # content handlers answer "warming_up" until this has finished (already started on a takeover)
+    if content_warmup_task is None:
+        content_warmup_task = asyncio.create_task(_warm_up(), name="content_warmup")
+
+    # Watch the loaded script for edits (re-parse the changed region, keep the presenter's position)
+    script_watch_task = None
+    if config.SCRIPT_WATCH_ENABLED:
+        script_watch_task = asyncio.create_task(init_script_watcher(state_manager_instance, _broadcast_message_to_group).run(), name="script_watcher")
+
+    # Batched fsync of the state journal
+    state_journal_task = None
+    if state_journal is not None:
+        state_journal_task = asyncio.create_task(state_journal.run(), name="state_journal")
+
     # Keep the asyncio loop running indefinitely
     logging.info("server: Application running. Press CTRL+C to quit")
     try:
@@ -416,6 +574,18 @@ async def start_servers():
         #     except Exception as e:
         #         logging.error(f"server: Error waiting for cleanup task cancellation: {e}")
 
+        if handoff_listener is not None:
+            handoff_listener.close()
+        loop_lag_task.cancel()
+        if heartbeat_task is not None:
+            heartbeat_task.cancel()
+        content_warmup_task.cancel()
+        if script_watch_task is not None:
+            script_watch_task.cancel()
+        if state_journal_task is not None:
+            state_journal_task.cancel()
+            state_journal.close() # Final flush + snapshot (nothing after a handoff: the successor journals now)
+        shutdown_profiler() # Writes a running profile
         logging.info("server: WebSocket server stopping.")
 
         # Perform database disconnect on shutdown using the instance initialized earlier
@@ -430,6 +600,13 @@ if __name__ == "__main__":
     try:
         # This will run the async start_servers function
         # asyncio.run handles creating/closing the loop
+        if config.USE_UVLOOP:
+            try:
+                import uvloop
+                asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+                logging.info("server: Using the uvloop event loop.")
+            except ImportError:
+                logging.warning("server: USE_UVLOOP is set but uvloop is not installed. Using the default asyncio loop.")
         asyncio.run(start_servers())
     except KeyboardInterrupt:
         logging.info("server: Server shutting down due to KeyboardInterrupt.")
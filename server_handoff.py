@@ -0,0 +1,276 @@
+# server_handoff.py
+# Graceful restart: a new server process takes over the listening sockets of the running one, so
+# a deploy or config change does not drop every OBS source and presenter console mid-show.
+#
+#   old process                                   new process (python server.py --takeover)
+#   HandoffListener on HANDOFF_SOCKET_PATH        init, connect the content backend (warm-up)
+#                                        <------  {"op": "takeover"}
+#   stop handling actions (ws_core draining),
+#   final state journal flush, then
+#   {"op": "sockets", state, ...} + the WebSocket
+#   and HTTP listening fds (SCM_RIGHTS)   ------>  restore the show state, serve on the received fds,
+#                                        <------  {"op": "ready"}
+#   stop accepting, wait for queued frames to reach
+#   the clients, close them with 1012 "reconnect now"
+#   (they reconnect after 0.1-0.5 s), exit
+#
+# Both processes hold the same listening sockets, so connections arriving during the handoff
+# wait in the kernel's accept queue instead of being refused. If the new process fails or
+# does not answer within HANDOFF_TIMEOUT, the old one resumes handling actions and keeps serving.
+# The control socket is a Unix SOCK_SEQPACKET socket (one JSON message per packet), mode 0600.
+# Danmaku sequences still running in the old process (auto-send / boss flows) are not moved;
+# what they already queued is delivered before the close, the presenter restarts the rest.
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+try:
+    from config import HANDOFF_SOCKET_PATH, HANDOFF_TIMEOUT, HANDOFF_DRAIN_TIMEOUT
+except ImportError:
+    HANDOFF_SOCKET_PATH = Path(__file__).parent / "data" / "handoff.sock"
+    HANDOFF_TIMEOUT = 10.0
+    HANDOFF_DRAIN_TIMEOUT = 2.0
+
+from ws_core import set_draining
+from ws_sessions import SESSIONS
+
+CLOSE_SERVICE_RESTART = 1012 # "Service Restart": clients reconnect right away (audience_display.html, presenter_core.js)
+CLOSE_REASON = "reconnect now"
+_MAX_MESSAGE_BYTES = 1 << 20 # The persistent state is small (script path, position, roast sequence)
+_MAX_FDS = 8
+
+
+def _send(conn, message, fds=()):
+    data = json.dumps(message, ensure_ascii=False, default=str).encode("utf-8")
+    if fds:
+        socket.send_fds(conn, [data], list(fds))
+    else:
+        conn.sendall(data)
+
+
+def _recv(conn):
+    data, fds, _flags, _address = socket.recv_fds(conn, _MAX_MESSAGE_BYTES, _MAX_FDS)
+    if not data:
+        for fd in fds:
+            os.close(fd)
+        raise ConnectionError("handoff peer closed the control socket")
+    return json.loads(data), fds
+
+
+# --- Old process ---
+class HandoffListener:
+    """Waits on the control socket for a successor and hands the listening sockets over to it."""
+
+    def __init__(self, ws_server, http_server, state_manager, state_journal=None, path=HANDOFF_SOCKET_PATH):
+        self.ws_server = ws_server # websockets.WebSocketServer
+        self.http_server = http_server # werkzeug BaseWSGIServer (serve_forever in the Flask thread)
+        self.state_manager = state_manager
+        self.state_journal = state_journal
+        self.path = Path(path)
+        self.handed_off = False
+        self._loop = None
+        self._sock = None
+
+    def start(self):
+        """Binds the control socket (replacing the one of a process we took over from) and starts the accept thread."""
+        self._loop = asyncio.get_running_loop()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        sock.bind(str(self.path))
+        os.chmod(self.path, 0o600)
+        sock.listen(1)
+        self._sock = sock
+        threading.Thread(target=self._accept_loop, name="handoff_listener", daemon=True).start()
+        logging.info(f"server_handoff: Listening for a successor on {self.path} (pid {os.getpid()}).")
+
+    def close(self):
+        """Stops listening. The socket file is left alone after a handoff: it belongs to the successor now."""
+        if self._sock is None:
+            return
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR) # Wakes the accept() in the listener thread
+        except OSError:
+            pass
+        self._sock.close()
+        self._sock = None
+        if not self.handed_off:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except (OSError, AttributeError): # Closed
+                return
+            with conn:
+                conn.settimeout(HANDOFF_TIMEOUT)
+                try:
+                    self._serve_successor(conn)
+                except Exception as e:
+                    logging.error(f"server_handoff: Handoff failed: {e}", exc_info=True)
+            if self.handed_off:
+                return
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _serve_successor(self, conn):
+        """Listener thread: one takeover conversation. Loop work is scheduled onto the event loop."""
+        request, _ = _recv(conn)
+        if request.get("op") != "takeover":
+            _send(conn, {"op": "error", "error": f"unknown op {request.get('op')!r}"})
+            return
+        started = time.perf_counter()
+        logging.info(f"server_handoff: Process {request.get('pid')} is taking over.")
+        message = self._run(self._prepare())
+        fds = [listener.fileno() for listener in self.ws_server.server.sockets] + [self.http_server.socket.fileno()]
+        try:
+            _send(conn, message, fds)
+            reply, _ = _recv(conn)
+        except (OSError, ValueError) as e:
+            reply = {"op": "abort", "error": str(e)}
+        if reply.get("op") != "ready":
+            logging.error(f"server_handoff: Successor did not take over ({reply.get('error', reply.get('op'))}); resuming service.")
+            self._run(self._resume())
+            return
+
+        # The successor serves on the same sockets now
+        self.handed_off = True
+        self._run(self._stop_accepting())
+        closed = self._run(self._drain_and_close_clients())
+        self.http_server.shutdown() # Returns once serve_forever() in the Flask thread has stopped (up to its 0.5 s poll)
+        self.http_server.server_close()
+        logging.info(f"server_handoff: Handed over to process {request.get('pid')} in {(time.perf_counter() - started) * 1000:.0f} ms; "
+                     f"{closed} clients asked to reconnect.")
+        self._run(self._finish())
+
+    async def _prepare(self):
+        set_draining(True) # From here the state may only change in the successor
+        if self.state_journal is not None:
+            self.state_journal.suspend() # Final flush + snapshot; the successor restores from it
+        return {
+            "op": "sockets", "pid": os.getpid(), "ws_sockets": len(self.ws_server.server.sockets),
+            "state": self.state_manager.export_persistent_state(), "journal": self.state_journal is not None,
+            "clients": len(self.ws_server.websockets), "sessions": len(SESSIONS),
+        }
+
+    async def _resume(self):
+        if self.state_journal is not None:
+            self.state_journal.resume()
+        set_draining(False)
+
+    async def _stop_accepting(self):
+        self.ws_server.server.close() # Closes our copy of the WebSocket listening socket only
+
+    async def _drain_and_close_clients(self):
+        websockets_open = list(self.ws_server.websockets)
+        running_jobs = sum(session.active_jobs() for session in SESSIONS.snapshot())
+        if running_jobs:
+            logging.info(f"server_handoff: {running_jobs} danmaku job(s) still running; they stop with this process.")
+        # Let what is already queued (danmaku, state updates) reach the clients first
+        deadline = time.monotonic() + HANDOFF_DRAIN_TIMEOUT
+        while time.monotonic() < deadline and any(_write_buffer_size(ws) for ws in websockets_open):
+            await asyncio.sleep(0.02)
+        undelivered = sum(1 for ws in websockets_open if _write_buffer_size(ws))
+        if undelivered:
+            logging.warning(f"server_handoff: {undelivered} clients still had queued data after {HANDOFF_DRAIN_TIMEOUT}s.")
+        closing = [asyncio.create_task(ws.close(CLOSE_SERVICE_RESTART, CLOSE_REASON)) for ws in websockets_open]
+        if closing:
+            # The close frame goes out immediately; only the clients' acknowledgements are waited for
+            await asyncio.wait(closing, timeout=HANDOFF_DRAIN_TIMEOUT)
+        return len(websockets_open)
+
+    async def _finish(self):
+        self.ws_server.close() # Remaining connections, then wait_closed() in start_servers returns
+
+
+def _write_buffer_size(websocket):
+    transport = websocket.transport
+    if transport is None or transport.is_closing():
+        return 0
+    return transport.get_write_buffer_size()
+
+
+# --- New process ---
+class Takeover:
+    """The listening sockets and show state received from the previous process."""
+
+    def __init__(self, conn, message, fds):
+        self._conn = conn
+        self.message = message
+        ws_count = int(message.get("ws_sockets", 0))
+        self.ws_sockets = [socket.socket(fileno=fd) for fd in fds[:ws_count]]
+        self.http_fd = fds[ws_count] if len(fds) > ws_count else None
+        self.previous_pid = message.get("pid")
+        self.state = message.get("state") or {}
+        self.clients = int(message.get("clients", 0))
+
+    def ready(self):
+        """Tells the previous process we are serving; it stops accepting and closes its clients."""
+        try:
+            _send(self._conn, {"op": "ready", "pid": os.getpid()})
+        finally:
+            self._conn.close()
+        if self.http_fd is not None:
+            os.close(self.http_fd) # werkzeug serves on its own duplicate (socket.fromfd)
+            self.http_fd = None
+
+    def abort(self, error):
+        """Gives the sockets back: the previous process resumes as if nothing happened."""
+        try:
+            _send(self._conn, {"op": "abort", "error": str(error)})
+        except OSError:
+            pass
+        finally:
+            self._conn.close()
+        for listener in self.ws_sockets:
+            listener.close()
+        if self.http_fd is not None:
+            os.close(self.http_fd)
+            self.http_fd = None
+
+
+def request_takeover(path=HANDOFF_SOCKET_PATH, timeout=HANDOFF_TIMEOUT):
+    """
+    Blocking (run it in a thread). Asks the process listening on `path` for its sockets.
+    Returns a Takeover, or None if no server is running there.
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    conn.settimeout(timeout)
+    try:
+        conn.connect(str(path))
+    except (FileNotFoundError, ConnectionRefusedError):
+        conn.close()
+        return None
+    try:
+        _send(conn, {"op": "takeover", "pid": os.getpid()})
+        message, fds = _recv(conn)
+    except Exception:
+        conn.close()
+        raise
+    if message.get("op") != "sockets" or not fds:
+        conn.close()
+        for fd in fds:
+            os.close(fd)
+        raise RuntimeError(f"server_handoff: Unexpected answer from the running server: {message.get('error', message.get('op'))}")
+    logging.info(f"server_handoff: Received {len(fds)} listening sockets from process {message.get('pid')} "
+                 f"({message.get('clients', 0)} clients connected there).")
+    return Takeover(conn, message, fds)
+
+
+__all__ = [
+    'HandoffListener', 'Takeover', 'request_takeover', 'CLOSE_SERVICE_RESTART',
+]
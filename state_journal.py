@@ -0,0 +1,219 @@
+# state_journal.py
+# Crash-safe persistence of the show state (loaded script + position, roast sequence).
+# Every state change appends one line {"seq", "changes"} (only the fields that changed) to
+# journal.jsonl. Appends are batched: lines are queued on the event loop and written +
+# fsync'd by run() at most every STATE_JOURNAL_FSYNC_INTERVAL seconds, so a crash loses at
+# most that window. Every STATE_JOURNAL_SNAPSHOT_EVERY records the full state is written
+# to snapshot.json atomically (temp file, fsync, os.replace) and the journal is truncated.
+# restore() at startup = read the snapshot + replay the journal tail; a torn last line
+# (crash mid-write) is ignored.
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    from config import STATE_JOURNAL_DIR, STATE_JOURNAL_FSYNC_INTERVAL, STATE_JOURNAL_SNAPSHOT_EVERY
+except ImportError:
+    STATE_JOURNAL_DIR = Path(__file__).parent / "data" / "state"
+    STATE_JOURNAL_FSYNC_INTERVAL = 0.2
+    STATE_JOURNAL_SNAPSHOT_EVERY = 200
+
+SNAPSHOT_NAME = "snapshot.json"
+JOURNAL_NAME = "journal.jsonl"
+
+
+def _fsync_directory(directory):
+    # Makes the os.replace() of the snapshot itself durable (no-op where directories cannot be opened)
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class StateJournal:
+    """Append-only journal + periodic snapshot of ApplicationStateManager.export_persistent_state()."""
+
+    def __init__(self, state_manager, directory=STATE_JOURNAL_DIR,
+                 fsync_interval: float = STATE_JOURNAL_FSYNC_INTERVAL, snapshot_every: int = STATE_JOURNAL_SNAPSHOT_EVERY):
+        self._state_manager = state_manager
+        self.directory = Path(directory)
+        self.snapshot_path = self.directory / SNAPSHOT_NAME
+        self.journal_path = self.directory / JOURNAL_NAME
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.seq = 0
+        self._last_state = {}
+        self._pending = [] # Encoded journal lines not yet written
+        self._records_since_snapshot = 0
+        self._journal_file = None
+        self._file_lock = threading.Lock() # close() may run while a worker thread is still writing
+        self._suspended = False # Handed over to a new process (suspend()): this one must not write any more
+
+    # --- Startup ---
+    def _read_saved_state(self):
+        """(state, seq) from the snapshot plus the journal lines after it."""
+        state, seq = {}, 0
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            state, seq = dict(snapshot.get("state") or {}), int(snapshot.get("seq", 0))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.error(f"state_journal: Unreadable snapshot {self.snapshot_path}: {e}")
+
+        replayed = 0
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logging.warning("state_journal: Ignoring torn journal line (crash during write).")
+                        break
+                    if record.get("seq", 0) <= seq:
+                        continue # Already in the snapshot (crash between snapshot and truncation)
+                    state.update(record.get("changes") or {})
+                    seq = record["seq"]
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        return state, seq, replayed
+
+    def restore(self):
+        """Restores the last journaled state into the state manager. Returns True if there was one."""
+        started = time.perf_counter()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        state, seq, replayed = self._read_saved_state()
+        restored = bool(state) and self._state_manager.restore_persistent_state(state)
+        self.seq = seq
+        # Start from what was actually restored (e.g. index clamped to an edited script) and compact
+        self._last_state = self._state_manager.export_persistent_state()
+        self._write_snapshot(self._last_state, self.seq)
+        if restored:
+            logging.info(f"state_journal: Restored state (seq {seq}, {replayed} journal records replayed) "
+                         f"in {(time.perf_counter() - started) * 1000:.1f} ms.")
+        return restored
+
+    # --- Recording (event loop thread) ---
+    def record(self):
+        """Queues the persistent fields that changed since the last record. Cheap; written by run()."""
+        current = self._state_manager.export_persistent_state()
+        changes = {key: value for key, value in current.items() if self._last_state.get(key) != value}
+        if not changes:
+            return False
+        self._last_state = current
+        self.seq += 1
+        self._pending.append(json.dumps({"seq": self.seq, "t": round(time.time(), 3), "changes": changes}, ensure_ascii=False, default=str) + "\n")
+        self._records_since_snapshot += 1
+        return True
+
+    # --- Writing (worker thread) ---
+    def _open_journal(self):
+        if self._journal_file is None:
+            self._journal_file = open(self.journal_path, "a", encoding="utf-8")
+        return self._journal_file
+
+    def _write_lines(self, lines):
+        with self._file_lock:
+            journal_file = self._open_journal()
+            journal_file.writelines(lines)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def _write_snapshot(self, state, seq):
+        with self._file_lock:
+            self._write_snapshot_locked(state, seq)
+
+    def _write_snapshot_locked(self, state, seq):
+        temp_path = self.snapshot_path.with_suffix(".json.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"seq": seq, "t": round(time.time(), 3), "state": state}, f, ensure_ascii=False, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        _fsync_directory(self.directory)
+        # Everything up to seq is in the snapshot now
+        journal_file = self._open_journal()
+        journal_file.truncate(0)
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+
+    async def flush(self):
+        """Writes and fsyncs the queued records (one fsync for the batch), snapshotting when due."""
+        if self._suspended:
+            return
+        lines, self._pending = self._pending, []
+        if lines:
+            await asyncio.to_thread(self._write_lines, lines)
+        if self._records_since_snapshot >= self.snapshot_every:
+            self._records_since_snapshot = 0
+            await asyncio.to_thread(self._write_snapshot, dict(self._last_state), self.seq)
+            logging.debug(f"state_journal: Snapshot written at seq {self.seq}.")
+
+    async def run(self):
+        """Background writer: batches fsyncs every fsync_interval seconds."""
+        logging.info(f"state_journal: Journaling to {self.directory} (fsync every {self.fsync_interval}s, snapshot every {self.snapshot_every} records).")
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            try:
+                await self.flush()
+            except OSError as e:
+                logging.error(f"state_journal: Write failed: {e}")
+
+    def close(self):
+        """Final synchronous flush + snapshot on shutdown."""
+        if self._suspended:
+            return
+        try:
+            lines, self._pending = self._pending, []
+            if lines:
+                self._write_lines(lines)
+            self._write_snapshot(dict(self._last_state), self.seq)
+        except OSError as e:
+            logging.error(f"state_journal: Final write failed: {e}")
+        finally:
+            with self._file_lock:
+                if self._journal_file is not None:
+                    self._journal_file.close()
+                    self._journal_file = None
+
+    # --- Handoff (server_handoff.py) ---
+    def suspend(self):
+        """Final flush + snapshot, then no more writes: the process taking over restores and journals from here."""
+        self.close()
+        self._suspended = True
+
+    def resume(self):
+        """Handoff rolled back: records queued meanwhile are written by the next flush (the file reopens lazily)."""
+        self._suspended = False
+
+
+
+_state_journal = None
+
+
+def init_state_journal(state_manager_instance, directory=STATE_JOURNAL_DIR):
+    """Creates the module-level journal (called by server.start_servers). Call restore() before serving."""
+    global _state_journal
+    _state_journal = StateJournal(state_manager_instance, directory)
+    logging.info("state_journal: Module initialized.")
+    return _state_journal
+
+
+def get_state_journal():
+    return _state_journal
+
+
+__all__ = ['StateJournal', 'init_state_journal', 'get_state_journal']
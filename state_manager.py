@@ -1,21 +1,59 @@
 # state_manager.py
+import asyncio
+import json
 import logging
 import os # For path handling if needed later, though path handled in ws_script_handlers
+from types import MappingProxyType
 try:
-    from script_parser import parse_script_file # Assuming script_parser.py exists and works
+    from script_parser import parse_script_file, remap_event_index # Assuming script_parser.py exists and works
+    from script_cache import get_script_cache # LRU of parsed scripts keyed by (path, mtime, size)
 except ImportError:
     logging.error("state_manager: Failed to import script_parser. Script parsing will be unavailable in state manager.")
     parse_script_file = None # Set to None if import fails
 
+try:
+    from roast_engine import compile_roast_template # Splits a roast template into danmaku / presenter parts
+except ImportError:
+    logging.error("state_manager: Failed to import roast_engine. Roast mode will be unavailable in state manager.")
+    compile_roast_template = None
+
+try:
+    from config import SCRIPT_LOAD_MODE, SCRIPT_LAZY_MIN_BYTES
+except ImportError:
+    SCRIPT_LOAD_MODE = "eager"
+    SCRIPT_LAZY_MIN_BYTES = 1024 * 1024
+
 
 # Global instance of ApplicationStateManager
 _state_manager_instance = None
 
+
+class StateSnapshot:
+    """
+    Immutable, versioned view of the state returned by get_current_state().
+    The manager builds a new one after each change and swaps the reference, so a reader on
+    any thread (Flask routes) that takes one snapshot sees a consistent state without locks.
+    """
+    __slots__ = ("version", "state", "_json")
+
+    def __init__(self, version, state):
+        self.version = version
+        self.state = MappingProxyType(state)
+        self._json = None
+
+    def to_json(self) -> str:
+        """JSON of the state, serialized once per snapshot (a racing duplicate serialization is harmless)."""
+        if self._json is None:
+            self._json = json.dumps(dict(self.state), ensure_ascii=False)
+        return self._json
+
+
 class ApplicationStateManager:
     """Manages the global state of the application, such as loaded script and current event."""
     def __init__(self):
         logging.info("state_manager: Application state manager instance created.")
         self._script_filename = None
+        self._script_path = None # Full path of the loaded script (watched for edits by script_watcher)
         self._script_content = [] # List of events from the parsed script
         self._current_event_index = -1 # -1 means no event selected yet or before the first event
         self._total_events = 0
@@ -23,6 +61,7 @@ class ApplicationStateManager:
         # State for roast sequence
         self._roast_target_name = None
         self._roast_templates = [] # List of raw string templates from DB
+        self._roast_parts = [] # (danmaku_part, presenter_part) per template, compiled when the sequence starts
         self._current_roast_index = -1
         self._total_roasts = 0
 
@@ -31,59 +70,155 @@ class ApplicationStateManager:
         self._roast_raw_template = ""
         self._roast_danmaku_sent = ""
 
+        self._snapshot = None
+        self._commit()
         logging.info("state_manager: Application state initialized.")
 
-    def load_script(self, script_full_path):
+    def _build_state(self):
+        current_event = self.get_current_event()
+        in_roast = self._roast_target_name is not None
+        return {
+            "script_filename": self._script_filename,
+            "total_events": self._total_events,
+            "event_index": self._current_event_index,
+            "current_line": current_event.get("line") if current_event else "",
+            "current_prompt": current_event.get("prompt") if current_event else "",
+            "is_roast_mode": in_roast,
+            "current_roast_index": self._current_roast_index,
+            "total_roasts": self._total_roasts,
+            "current_roast_target": self._roast_target_name,
+            "roast_presenter_cue": self._roast_presenter_cue if in_roast else "",
+            "roast_raw_template": self._roast_raw_template if in_roast else "",
+            "roast_danmaku_sent": self._roast_danmaku_sent if in_roast else "",
+        }
+
+    def _commit(self):
         """
-        Parses a script file and loads its content into the state.
-        Resets current event index.
-        Returns True on success, False on failure.
+        Publishes the state after a change as a new immutable snapshot (single reference swap).
+        Called at the end of every mutating method; unchanged state keeps the current snapshot and version.
+        """
+        state = self._build_state()
+        previous = self._snapshot
+        if previous is not None and previous.state == state:
+            return previous
+        self._snapshot = StateSnapshot(previous.version + 1 if previous is not None else 0, state)
+        return self._snapshot
+
+    def _set_script_content(self, filename, events):
         """
+        Swaps in a parsed script (list or LazyScript). The events may be shared with the
+        parsed-script cache, so they are treated as read-only and never closed here.
+        """
+        self._script_filename = filename
+        self._script_content = events
+        self._total_events = len(events)
+        self._current_event_index = -1 # Reset to before the first event on load
+        self._commit()
+
+    def _clear_script(self):
+        self._set_script_content(None, [])
+        self._script_path = None
+
+    def _check_script_loadable(self, script_full_path):
         if not os.path.exists(script_full_path):
             logging.error(f"state_manager: Script file not found: {script_full_path}")
-            self._script_filename = None
-            self._script_content = []
-            self._current_event_index = -1
-            self._total_events = 0
+            self._clear_script()
             return False
 
         if parse_script_file is None:
              logging.error("state_manager: script_parser is not available. Cannot load script.")
-             self._script_filename = None
-             self._script_content = []
-             self._current_event_index = -1
-             self._total_events = 0
+             self._clear_script()
              return False
+        return True
 
+    def _apply_loaded_script(self, script_full_path, parsed_events):
+        self._set_script_content(os.path.basename(script_full_path), parsed_events)
+        self._script_path = str(script_full_path)
+        logging.info(f"state_manager: Script loaded successfully: '{self._script_filename}' with {self._total_events} events.")
+        return True
+
+    def load_script(self, script_full_path):
+        """
+        Parses a script file and loads its content into the state.
+        Resets current event index.
+        Returns True on success, False on failure.
+        """
+        if not self._check_script_loadable(script_full_path):
+            return False
 
         try:
-            # Use the imported parse_script_file function
-            parsed_events = parse_script_file(script_full_path)
+            # Parsed-script cache in front of the parser (eager list or lazy memory-mapped index, see config.SCRIPT_LOAD_MODE)
+            parsed_events = get_script_cache().load(script_full_path, SCRIPT_LOAD_MODE, SCRIPT_LAZY_MIN_BYTES)
+            return self._apply_loaded_script(script_full_path, parsed_events)
 
-            # Update state with loaded script
-            self._script_filename = os.path.basename(script_full_path)
-            self._script_content = parsed_events # Assuming parse_script_file returns a list of event objects/dicts
-            self._total_events = len(self._script_content)
-            self._current_event_index = -1 # Reset to before the first event on load
+        except Exception as e:
+            logging.error(f"state_manager: Error loading or parsing script '{script_full_path}': {e}", exc_info=True)
+            self._clear_script()
+            return False
 
-            logging.info(f"state_manager: Script loaded successfully: '{self._script_filename}' with {self._total_events} events.")
-            return True
+    async def load_script_async(self, script_full_path):
+        """
+        Same as load_script, but reads/indexes the file in a worker thread so the event loop
+        is not blocked. The state itself is only updated back on the loop thread.
+        """
+        if not self._check_script_loadable(script_full_path):
+            return False
+
+        try:
+            parsed_events = await asyncio.to_thread(get_script_cache().load, script_full_path, SCRIPT_LOAD_MODE, SCRIPT_LAZY_MIN_BYTES)
+            return self._apply_loaded_script(script_full_path, parsed_events)
 
         except Exception as e:
             logging.error(f"state_manager: Error loading or parsing script '{script_full_path}': {e}", exc_info=True)
-            self._script_filename = None
-            self._script_content = []
-            self._current_event_index = -1
-            self._total_events = 0
+            self._clear_script()
             return False
 
 
+    def get_script_path(self):
+        """Full path of the loaded script, or None."""
+        return self._script_path
+
+    def get_script_events(self):
+        """The loaded (read-only) event sequence."""
+        return self._script_content
+
+    def apply_script_reload(self, new_events, opcodes):
+        """
+        Swaps in a re-parsed version of the loaded script and moves the current position
+        with it (opcodes from script_parser.diff_script_events). Returns the new index.
+        """
+        old_index = self._current_event_index
+        new_index = remap_event_index(opcodes, old_index, self._total_events, len(new_events))
+        self._script_content = new_events
+        self._total_events = len(new_events)
+        self._current_event_index = new_index
+        self._commit()
+        logging.info(f"state_manager: Script '{self._script_filename}' reloaded with {self._total_events} events. Index {old_index} -> {new_index}.")
+        return new_index
+
     def get_current_event(self):
         """Returns the current event object/dict, or None if no script is loaded or index is invalid."""
         if not self._script_content or self._current_event_index < 0 or self._current_event_index >= self._total_events:
             return None
         return self._script_content[self._current_event_index]
 
+    def get_event_window(self, before, after):
+        """
+        The events around the current position, for the presenter's prefetch:
+        {"start": index of the first event, "events": [{"line", "prompt"}, ...]}.
+        Before the first event (index -1) the window starts at 0. O(before + after), also for lazy scripts.
+        """
+        if not self._script_content:
+            return {"start": 0, "events": []}
+        center = min(max(self._current_event_index, 0), self._total_events - 1)
+        start = max(0, center - before)
+        end = min(self._total_events, center + after + 1)
+        events = []
+        for index in range(start, end):
+            event = self._script_content[index]
+            events.append({"line": event.get("line") or "", "prompt": event.get("prompt") or ""})
+        return {"start": start, "events": events}
+
     def advance_roast_sequence(self, processed_danmaku, presenter_line, raw_template): 
         """Advances the roast sequence to the next item and updates presenter display info.""" 
         if self._roast_target_name is None: 
@@ -102,6 +237,7 @@ class ApplicationStateManager:
         self._roast_danmaku_sent = processed_danmaku
         self._roast_presenter_cue = presenter_line 
         self._roast_raw_template = raw_template 
+        self._commit()
 
         logging.debug(f"state_manager: Advanced roast sequence to index {current_index}. Total: {total_templates}. Target: {self._roast_target_name}") 
         # FIX: 确保这一行也被删除或注释掉！ 
@@ -110,24 +246,12 @@ class ApplicationStateManager:
         return True 
 
     def get_current_state(self):
-        """Returns the current application state."""
-        current_event = self.get_current_event()
-        state_to_return = {
-            "script_filename": self._script_filename,
-            "total_events": self._total_events,
-            "event_index": self._current_event_index,
-            "current_line": current_event.get("line") if current_event else "" if self._roast_target_name is None else "",
-            "current_prompt": current_event.get("prompt") if current_event else "" if self._roast_target_name is None else "",
-            "is_roast_mode": self._roast_target_name is not None,
-            "current_roast_index": self._current_roast_index,
-            "total_roasts": self._total_roasts,
-            "current_roast_target": self._roast_target_name,
-            "roast_presenter_cue": self._roast_presenter_cue if self._roast_target_name is not None else "",
-            "roast_raw_template": self._roast_raw_template if self._roast_target_name is not None else "",
-            "roast_danmaku_sent": self._roast_danmaku_sent if self._roast_target_name is not None else "",
-        }
+        """Returns the current application state (read-only mapping of the current snapshot; safe from any thread)."""
+        return self._snapshot.state
 
-        return state_to_return
+    def get_snapshot(self):
+        """The current StateSnapshot (version + state + cached JSON); safe from any thread."""
+        return self._snapshot
 
     def advance_event(self):
         """Moves to the next event in the script. Returns the new index or -1 if finished."""
@@ -140,10 +264,12 @@ class ApplicationStateManager:
         # Check if we are at or past the last event
         if new_index >= self._total_events:
             self._current_event_index = self._total_events # Cap index at total_events to indicate finish
+            self._commit()
             logging.info(f"state_manager: Reached end of script: '{self._script_filename}'.")
             return self._total_events # Return total events to signal end
 
         self._current_event_index = new_index
+        self._commit()
         logging.info(f"state_manager: Advanced to event index: {self._current_event_index} / {self._total_events - 1}.")
         return self._current_event_index
 
@@ -160,9 +286,19 @@ class ApplicationStateManager:
              new_index = -1
 
         self._current_event_index = new_index
+        self._commit()
         logging.info(f"state_manager: Moved to previous event index: {self._current_event_index} / {self._total_events - 1}.")
         return self._current_event_index
 
+    def jump_to_event(self, index):
+        """Moves straight to event `index` (O(1), e.g. a search hit). Returns the new index, or None if out of range."""
+        if not self._script_content or not 0 <= index < self._total_events:
+            return None
+        self._current_event_index = index
+        self._commit()
+        logging.info(f"state_manager: Jumped to event index: {self._current_event_index} / {self._total_events - 1}.")
+        return self._current_event_index
+
     # --- Roast Sequence Management ---
     def start_roast_sequence(self, target_name, templates_list):
         """Initializes the roast sequence state."""
@@ -170,26 +306,51 @@ class ApplicationStateManager:
             logging.warning("state_manager: Attempted to start roast sequence with no templates.")
             self._roast_target_name = None
             self._roast_templates = []
+            self._roast_parts = []
             self._current_roast_index = -1
             self._total_roasts = 0
+            self._commit()
             return False
 
         logging.info(f"state_manager: Roast sequence started for target '{target_name}' with {len(templates_list)} templates.")
         
         # 存储完整的模板列表和目标名称
         self._roast_target_name = target_name
-        self._roast_templates = templates_list
+        self._roast_templates = list(templates_list)
+        self._roast_parts = [compile_roast_template(template, target_name) for template in templates_list] # Split once, not per advance
         self._current_roast_index = -1
         self._total_roasts = len(templates_list)
 
         # 清空当前显示相关的状态
-        self._script_filename = None
-        self._script_content = []
-        self._current_event_index = -1
-        self._total_events = 0
+        self._clear_script()
 
         return True
 
+    def extend_roast_sequence(self, templates_list):
+        """Appends templates to the running roast sequence. Returns the new total, or None if no sequence is active."""
+        if self._roast_target_name is None:
+            logging.warning("state_manager: Attempted to extend roast sequence, but not in roast mode.")
+            return None
+        self._roast_templates.extend(templates_list)
+        self._roast_parts.extend(compile_roast_template(template, self._roast_target_name) for template in templates_list)
+        self._total_roasts = len(self._roast_templates)
+        self._commit()
+        logging.info(f"state_manager: Roast sequence for '{self._roast_target_name}' extended by {len(templates_list)} to {self._total_roasts} templates.")
+        return self._total_roasts
+
+
+    def peek_next_roast_template(self):
+        """
+        The template parts get_next_roast_template() would return, without moving the index
+        (preview of the first quote when a sequence starts, and what advance_roast is about to send).
+        """
+        if self._roast_target_name is None or not self._roast_templates:
+            return None, None, None, -1, 0
+        index = self._current_roast_index + 1
+        if index >= self._total_roasts:
+            return None, None, None, self._total_roasts, self._total_roasts
+        danmaku_part, presenter_part = self._roast_parts[index]
+        return danmaku_part, presenter_part, self._roast_templates[index], index + 1, self._total_roasts
 
     def get_next_roast_template(self):
         """
@@ -203,6 +364,7 @@ class ApplicationStateManager:
 
         # Increment the index
         self._current_roast_index += 1
+        self._commit()
 
         # Check if the sequence has finished
         if self._current_roast_index >= self._total_roasts:
@@ -211,28 +373,11 @@ class ApplicationStateManager:
              # self.exit_roast_sequence() # Let exit_roast_sequence handle cleanup
              return None, None, None, self._total_roasts, self._total_roasts # Signal finish
 
-        # Get the current template string
+        # Parts were compiled when the sequence started: advancing is a list lookup
         raw_template = self._roast_templates[self._current_roast_index]
+        danmaku_part, presenter_part = self._roast_parts[self._current_roast_index]
         logging.debug(f"state_manager: Getting roast template at index {self._current_roast_index}: '{raw_template}'")
 
-        # Split the template into danmaku and presenter parts using the last comma (，)
-        # Use rfind to find the last occurrence of the fullwidth comma
-        last_comma_index = raw_template.rfind('，')
-
-        if last_comma_index != -1:
-            danmaku_part_template = raw_template[:last_comma_index].strip()
-            presenter_part = raw_template[last_comma_index + 1:].strip()
-        else:
-             # If no comma found, use the whole string as presenter part and no danmaku (or handle as error)
-             # Let's define behavior: If no comma, treat the whole string as presenter part
-            danmaku_part_template = "" # No danmaku part if no comma
-            presenter_part = raw_template.strip() # Whole string is the presenter part
-            logging.warning(f"state_manager: Roast template has no fullwidth comma '，': '{raw_template}'. Treating whole string as presenter part.")
-
-
-        # Replace {} in danmaku_part_template with the target name
-        danmaku_part = danmaku_part_template.replace("{}", self._roast_target_name)
-
         # Return parts and current progress
         return danmaku_part, presenter_part, raw_template, self._current_roast_index + 1, self._total_roasts
 
@@ -242,15 +387,64 @@ class ApplicationStateManager:
         if self._roast_target_name is not None:
             logging.info(f"state_manager: Exiting roast sequence for target '{self._roast_target_name}'.")
             self._roast_templates = []
+            self._roast_parts = []
             self._roast_target_name = None
             self._current_roast_index = -1
             self._roast_presenter_cue = ""
             self._roast_raw_template = ""
             self._roast_danmaku_sent = ""
+            self._commit()
             logging.debug("state_manager: Roast sequence state cleared.")
             return True
         return False
 
+    # --- Persistence (state_journal.py) ---
+    def export_persistent_state(self):
+        """Flat, JSON-serializable dict of what is needed to rebuild the show state after a restart."""
+        return {
+            "script_path": self._script_path,
+            "event_index": self._current_event_index,
+            "roast_target": self._roast_target_name,
+            "roast_templates": list(self._roast_templates),
+            "roast_index": self._current_roast_index,
+            "roast_presenter_cue": self._roast_presenter_cue,
+            "roast_raw_template": self._roast_raw_template,
+            "roast_danmaku_sent": self._roast_danmaku_sent,
+        }
+
+    def restore_persistent_state(self, state):
+        """
+        Rebuilds the state from export_persistent_state() output: reloads the script (parsed-script
+        cache, lazy for large files) and puts back the position and roast sequence.
+        Returns True if anything was restored.
+        """
+        restored = False
+        script_path = state.get("script_path")
+        if script_path:
+            if self.load_script(script_path):
+                index = state.get("event_index", -1)
+                self._current_event_index = min(max(int(index), -1), self._total_events) # The file may have changed while we were down
+                restored = True
+            else:
+                logging.warning(f"state_manager: Could not restore script '{script_path}'.")
+
+        if state.get("roast_target") and state.get("roast_templates"):
+            self._roast_target_name = state["roast_target"]
+            self._roast_templates = list(state["roast_templates"])
+            self._roast_parts = [compile_roast_template(template, self._roast_target_name) for template in self._roast_templates]
+            self._total_roasts = len(self._roast_templates)
+            self._current_roast_index = min(int(state.get("roast_index", -1)), self._total_roasts)
+            self._roast_presenter_cue = state.get("roast_presenter_cue") or ""
+            self._roast_raw_template = state.get("roast_raw_template") or ""
+            self._roast_danmaku_sent = state.get("roast_danmaku_sent") or ""
+            restored = True
+
+        self._commit()
+        if restored:
+            logging.info(f"state_manager: Restored state: script '{self._script_filename}' at index {self._current_event_index}, "
+                         f"roast target {self._roast_target_name!r}.")
+        return restored
+
 
 # Function to be called by server.py to initialize the instance and set module global
 def init_state_manager(manager_instance):
@@ -273,6 +467,7 @@ def get_state_manager():
 # Expose the necessary components for server.py and other modules
 __all__ = [
     'ApplicationStateManager', # Expose the class itself
+    'StateSnapshot',           # Immutable state published by the manager
     'init_state_manager',      # Expose the initialization function
     'get_state_manager',       # Expose the getter function
 ]
@@ -0,0 +1,149 @@
+# state_sync.py
+# Versioned presenter state. Every change to ApplicationStateManager.get_current_state()
+# that is published gets the next version number and goes to ALL presenters as a delta
+# holding only the fields that changed ({"type": "state_delta", "version", "changes"}).
+# Recent deltas are kept in a ring buffer, so a presenter that reconnects (or notices a
+# gap in versions) sends get_current_state with since_version and gets the merged missing
+# deltas, or a full "state_snapshot" when it is too far behind.
+# Messages that move the position (or swap the script) also carry a prefetch "window" of
+# the events around it, so the console can show the next/previous line before the server
+# confirms the navigation. The window is derived from the state and is not versioned.
+# Versions restart at 0 with the process, so every message carries the server's "epoch";
+# a resync from another epoch (the server restarted) always gets a full snapshot.
+
+import logging
+import time
+from collections import deque
+
+try:
+    from config import STATE_DELTA_HISTORY, PRESENTER_PREFETCH_EVENTS
+except ImportError:
+    STATE_DELTA_HISTORY = 256
+    PRESENTER_PREFETCH_EVENTS = 5
+
+# Changes to these fields move the prefetch window
+_WINDOW_FIELDS = ("event_index", "total_events", "script_filename")
+
+
+class StateSync:
+    def __init__(self, state_manager, broadcast_func, history: int = STATE_DELTA_HISTORY, prefetch: int = PRESENTER_PREFETCH_EVENTS):
+        self._state_manager = state_manager
+        self._broadcast = broadcast_func
+        self.prefetch = prefetch
+        self.version = 0
+        self.epoch = int(time.time() * 1000) # Distinguishes versions of different server runs
+        self._listeners = [] # Called after every recorded change (e.g. the state journal)
+        self._last_snapshot = state_manager.get_snapshot()
+        self._last_state = dict(self._last_snapshot.state)
+        self._deltas = deque(maxlen=history) # (version, changes)
+        # (version, StateSnapshot) of the last recorded state, swapped as one reference so other
+        # threads (GET /api/state) read a state and the sync version it has without a lock
+        self._recorded = (self.version, self._last_snapshot)
+
+    def _record_changes(self):
+        """Diffs the current state against the last published one. Returns (version, changes) or None."""
+        snapshot = self._state_manager.get_snapshot()
+        if snapshot is self._last_snapshot:
+            return None # Snapshots are immutable: same object, nothing changed
+        self._last_snapshot = snapshot
+        changes = {key: value for key, value in snapshot.state.items() if self._last_state.get(key, object()) != value}
+        if not changes:
+            return None
+        self._last_state = dict(snapshot.state)
+        self.version += 1
+        self._deltas.append((self.version, changes))
+        self._recorded = (self.version, snapshot)
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                logging.error(f"state_sync: State listener {listener!r} failed: {e}", exc_info=True)
+        return self.version, changes
+
+    def recorded_snapshot(self):
+        """
+        (version, StateSnapshot) of the last recorded state. Safe from any thread; the version is the
+        one presenters sync on, so HTTP readers can be matched against the WebSocket deltas.
+        """
+        return self._recorded
+
+    def add_listener(self, callback):
+        """callback() runs on the event loop after each state change is recorded."""
+        self._listeners.append(callback)
+
+    def event_window(self):
+        """Events around the current position: PRESENTER_PREFETCH_EVENTS before and after it."""
+        return self._state_manager.get_event_window(self.prefetch, self.prefetch)
+
+    async def publish(self, refresh_window: bool = False):
+        """
+        Broadcasts the fields that changed since the last publish to every presenter. Returns the new version or None.
+        refresh_window: resend the prefetch window even if the position did not move (script content edited).
+        """
+        recorded = self._record_changes()
+        if recorded is None:
+            if refresh_window and self.prefetch > 0:
+                await self._broadcast("presenter", {"type": "event_window", "epoch": self.epoch, "version": self.version, "window": self.event_window()})
+            return None
+        version, changes = recorded
+        message = {"type": "state_delta", "epoch": self.epoch, "version": version, "changes": changes}
+        if self.prefetch > 0 and (refresh_window or any(field in changes for field in _WINDOW_FIELDS)):
+            message["window"] = self.event_window()
+        await self._broadcast("presenter", message)
+        logging.debug(f"state_sync: Published state v{version}: {list(changes)}")
+        return version
+
+    def snapshot_message(self):
+        # Pending (unpublished) changes are folded in first so the snapshot version is exact
+        self._record_changes()
+        message = {"type": "state_snapshot", "epoch": self.epoch, "version": self.version, "state": dict(self._last_state)}
+        if self.prefetch > 0:
+            message["window"] = self.event_window()
+        return message
+
+    def resync_message(self, since_version, epoch=None):
+        """
+        What a presenter at since_version (of server run `epoch`) needs to catch up: one merged
+        delta if the ring buffer still covers the gap, otherwise a full snapshot.
+        """
+        self._record_changes()
+        if since_version is None or epoch != self.epoch or since_version > self.version:
+            return self.snapshot_message() # Unknown version (e.g. the server restarted)
+        if since_version == self.version:
+            return {"type": "state_delta", "epoch": self.epoch, "version": self.version, "changes": {}}
+        oldest_available = self._deltas[0][0] if self._deltas else self.version + 1
+        if since_version + 1 < oldest_available:
+            return self.snapshot_message()
+        merged = {}
+        for version, changes in self._deltas:
+            if version > since_version:
+                merged.update(changes)
+        message = {"type": "state_delta", "epoch": self.epoch, "version": self.version, "base_version": since_version, "changes": merged}
+        if self.prefetch > 0:
+            message["window"] = self.event_window()
+        return message
+
+
+_state_sync = None
+
+
+def init_state_sync(state_manager_instance, broadcast_message_func):
+    """Creates the module-level StateSync (called by server.start_servers)."""
+    global _state_sync
+    _state_sync = StateSync(state_manager_instance, broadcast_message_func)
+    logging.info("state_sync: Module initialized.")
+    return _state_sync
+
+
+def get_state_sync():
+    return _state_sync
+
+
+async def publish_state(refresh_window: bool = False):
+    """Publishes pending state changes to all presenters; no-op before init_state_sync."""
+    if _state_sync is None:
+        return None
+    return await _state_sync.publish(refresh_window)
+
+
+__all__ = ['StateSync', 'init_state_sync', 'get_state_sync', 'publish_state']
@@ -168,8 +168,13 @@ function connectWebSocket() {
 
         if (reconnectTimer) clearTimeout(reconnectTimer);
         if (event.code !== 1000 && event.code !== 1008 && event.code !== 1001) {
-            console.log(`Presenter_core: Attempting to reconnect in ${reconnectDelay / 1000} seconds...`); // DEBUG
-            reconnectTimer = setTimeout(connectWebSocket, reconnectDelay);
+            // Server restart handoff (1012): the new process is already serving, come back right away.
+            // Server refusal (1013) carries a retry hint; otherwise add jitter so several consoles don't reconnect in lockstep
+            const hint = event.code === 1013 && /retry_after_ms=(\d+)/.exec(event.reason || "");
+            const delayMs = event.code === 1012 ? 100 + Math.round(Math.random() * 400)
+                : hint ? parseInt(hint[1], 10) : Math.round(reconnectDelay * (0.75 + Math.random() * 0.5));
+            console.log(`Presenter_core: Attempting to reconnect in ${delayMs / 1000} seconds...`); // DEBUG
+            reconnectTimer = setTimeout(connectWebSocket, delayMs);
         } else {
              console.log(`Presenter_core: Disconnect code ${event.code}, not attempting reconnect.`);
         }
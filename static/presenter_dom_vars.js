@@ -3,9 +3,10 @@
 // These will be assigned in presenter_init.js after DOMContentLoaded.
 
 // Script Browsing & Loading
-let scriptSelect, loadSelectedScriptBtn, scriptPathBreadcrumb, scriptBrowseUpBtn;
+let scriptSelect, loadSelectedScriptBtn, scriptPathBreadcrumb, scriptBrowseUpBtn, scriptFilterInput;
+let scriptSearchInput, scriptSearchBtn, scriptSearchResultsDiv;
 let scriptNameSpan, progressSpan, currentEventIndexSpan, totalEventsSpan, currentLineDiv, currentPromptDiv;
-let prevEventBtn, nextEventBtn;
+let prevEventBtn, nextEventBtn, cancelCuesBtn;
 
 // Roast Mode Elements
 let roastTargetNameInput, startRoastBtn, advanceRoastBtn, exitRoastBtn, roastStatusDiv;
@@ -21,9 +22,8 @@ let fetchWelcomeDanmakuBtn, fetchRoastDanmakuBtn, fetchReversalBtn, fetchCaption
 let danmakuOutputArea; // Common output area for fetched lists
 let autoSendDanmakuBtn; // Auto send button for fetched Welcome/Mock
 
-// Status Display Elements (Declared here, assigned in presenter_init.js, used by presenter_core.js and ui_utils)
-let statusMessageDiv;
-let connectionStatusCircle, connectionStatusCircleFooter, statusTextFooter; // References to status elements
+// Status Display Elements (statusMessageDiv, connectionStatusCircle, connectionStatusCircleFooter, statusTextFooter)
+// are declared in presenter_core.js; re-declaring them here with let is a SyntaxError that stops this whole file.
 
 // Feature-specific Global Variables (State variables - minimal, related to UI state)
 // Keeping these here as they relate to UI state (which list was last fetched)
@@ -24,6 +24,10 @@ document.addEventListener('DOMContentLoaded', function() {
      window.loadSelectedScriptBtn = document.getElementById('load-selected-script-btn');
      window.scriptPathBreadcrumb = document.getElementById('script-path-breadcrumb');
      window.scriptBrowseUpBtn = document.getElementById('script-browse-up-btn');
+     window.scriptFilterInput = document.getElementById('script-filter-input');
+     window.scriptSearchInput = document.getElementById('script-search-input');
+     window.scriptSearchBtn = document.getElementById('script-search-btn');
+     window.scriptSearchResultsDiv = document.getElementById('script-search-results');
      window.scriptNameSpan = document.getElementById('scriptName');
      window.progressSpan = document.getElementById('progress');
      window.currentEventIndexSpan = document.getElementById('currentEventIndex');
@@ -34,12 +38,14 @@ document.addEventListener('DOMContentLoaded', function() {
      // NAVIGATION section
      window.prevEventBtn = document.getElementById('prevEventBtn');
      window.nextEventBtn = document.getElementById('nextEventBtn');
+     window.cancelCuesBtn = document.getElementById('cancelCuesBtn');
  
      // ROAST section
      window.roastTargetNameInput = document.getElementById('roastTargetName');
      window.startRoastBtn = document.getElementById('startRoastBtn');
      window.advanceRoastBtn = document.getElementById('advanceRoastBtn');
      window.exitRoastBtn = document.getElementById('exitRoastBtn');
+     window.extendRoastBtn = document.getElementById('extendRoastBtn');
      window.roastStatusDiv = document.getElementById('roastStatus');
  
      // BOSS DANMAKU section
@@ -162,6 +168,8 @@ document.addEventListener('DOMContentLoaded', function() {
                   break;
               case "warning":
                   window.updateStatus(data.message || "警告", "warning");
+                  // 服务器正在交接给新进程，请求未执行；连接会自动恢复
+                  if (data.context === "server_restarting" && typeof window.reEnableAutoSendButtons === 'function') window.reEnableAutoSendButtons();
                   break;
               case "error":
                   window.updateStatus(data.message || "错误", "error");
@@ -171,6 +179,11 @@ document.addEventListener('DOMContentLoaded', function() {
                   //      if (typeof window.reEnableAutoSendButtons === 'function') window.reEnableAutoSendButtons();
                   // }
                   break;
+              case "warming_up":
+                  // 服务器刚启动，内容库还在连接；稍后重试即可
+                  window.updateStatus(data.message || "服务器正在启动预热，请稍后再试。", "warning");
+                  if (typeof window.reEnableAutoSendButtons === 'function') window.reEnableAutoSendButtons(); // Buttons disabled by auto_send/boss/roast requests
+                  break;
               // registration_success and pong are handled by core's handleCoreMessage
               // re_enable_auto_send_buttons is handled below
           }
@@ -187,8 +200,10 @@ document.addEventListener('DOMContentLoaded', function() {
               // This message indicates connection is ready. Trigger initial requests.
               console.log("presenter_init.js: Handling registration_success - sending initial requests.");
               if (typeof window.sendMessage === 'function') {
-                   window.sendMessage({ action: "browse_scripts", path: "." }); // Request initial script list
-                   window.sendMessage({ action: "get_current_state" }); // Request current script state
+                   if (typeof window.requestScriptOptions === 'function') window.requestScriptOptions("."); // Request initial script list (first page)
+                   else window.sendMessage({ action: "browse_scripts", path: "." });
+                   if (typeof window.requestStateResync === 'function') window.requestStateResync(); // Snapshot, or what we missed since our last state version
+                   else window.sendMessage({ action: "get_current_state" });
                    // Server also sends re_enable_auto_send_buttons after successful registration
               } else {
                   console.error("presenter_init.js: sendMessage function not available for initial requests.");
@@ -204,11 +219,32 @@ document.addEventListener('DOMContentLoaded', function() {
              else console.warn(`presenter_init.js: Handler for ${type} not found (window.handleScriptOptionsMessage).`);
              break;
  
+         case "script_search_results":
+             if (typeof window.handleScriptSearchResultsMessage === 'function') window.handleScriptSearchResultsMessage(data);
+             else console.warn(`presenter_init.js: Handler for ${type} not found (window.handleScriptSearchResultsMessage).`);
+             break;
+
          // Script Navigation & Display
          case "current_event_update":
              if (typeof window.handleCurrentEventUpdateMessage === 'function') window.handleCurrentEventUpdateMessage(data);
               else console.warn(`presenter_init.js: Handler for ${type} not found (window.handleCurrentEventUpdateMessage).`);
              break;
+          case "state_delta": // Versioned changes broadcast to every presenter
+             if (typeof window.handleStateDeltaMessage === 'function') window.handleStateDeltaMessage(data);
+              else console.warn(`presenter_init.js: Handler for ${type} not found (window.handleStateDeltaMessage).`);
+             break;
+          case "event_window": // Refreshed prefetch window (script edited, position unchanged)
+             if (typeof window.handleEventWindowMessage === 'function') window.handleEventWindowMessage(data);
+              else console.warn(`presenter_init.js: Handler for ${type} not found (window.handleEventWindowMessage).`);
+             break;
+          case "state_snapshot": // Full state (resync)
+          case "script_loaded_presenter":
+             if (typeof window.handleStateSnapshotMessage === 'function') window.handleStateSnapshotMessage(data);
+              else console.warn(`presenter_init.js: Handler for ${type} not found (window.handleStateSnapshotMessage).`);
+             break;
+          case "script_reloaded": // Loaded script was edited on disk; the remapped position follows as a state_delta
+              if (typeof window.updateStatus === 'function') window.updateStatus(data.message || "脚本已更新。", "info");
+              break;
           case "end_of_script": // Server sends when next_event reaches end
               // Status update handled above
               // Navigation buttons state handled by current_event_update which follows.
@@ -224,6 +260,10 @@ document.addEventListener('DOMContentLoaded', function() {
              if (typeof window.handlePresenterRoastUpdateMessage === 'function') window.handlePresenterRoastUpdateMessage(data);
               else console.warn(`presenter_init.js: Handler for ${type} not found (window.handlePresenterRoastUpdateMessage).`);
              break;
+         case "roast_sequence_extended":
+             if (typeof window.handleRoastSequenceExtendedMessage === 'function') window.handleRoastSequenceExtendedMessage(data);
+              else console.warn(`presenter_init.js: Handler for ${type} not found (window.handleRoastSequenceExtendedMessage).`);
+             break;
          case "roast_sequence_finished":
              if (typeof window.handleRoastSequenceFinishedMessage === 'function') window.handleRoastSequenceFinishedMessage(data);
               else console.warn(`presenter_init.js: Handler for ${type} not found (window.handleRoastSequenceFinishedMessage).`);
@@ -297,6 +337,20 @@ document.addEventListener('DOMContentLoaded', function() {
           console.log("INIT.JS: loadSelectedScriptBtn click listener added.");
      } else { console.warn("INIT.JS: loadSelectedScriptBtn element not found, listener not added."); }
  
+     if (window.scriptFilterInput) {
+          window.scriptFilterInput.addEventListener('input', window.handleScriptFilterInput);
+          console.log("INIT.JS: scriptFilterInput input listener added.");
+     } else { console.warn("INIT.JS: scriptFilterInput element not found, listener not added."); }
+
+     if (window.scriptSearchBtn) {
+          window.scriptSearchBtn.addEventListener('click', window.handleScriptSearch);
+          console.log("INIT.JS: scriptSearchBtn click listener added.");
+     } else { console.warn("INIT.JS: scriptSearchBtn element not found, listener not added."); }
+     if (window.scriptSearchInput) {
+          window.scriptSearchInput.addEventListener('keydown', (event) => { if (event.key === 'Enter') window.handleScriptSearch(); });
+          console.log("INIT.JS: scriptSearchInput keydown listener added.");
+     } else { console.warn("INIT.JS: scriptSearchInput element not found, listener not added."); }
+
      if (window.scriptBrowseUpBtn) {
           window.scriptBrowseUpBtn.addEventListener('click', window.handleBrowseUp);
           console.log("INIT.JS: scriptBrowseUpBtn click listener added.");
@@ -317,6 +371,11 @@ document.addEventListener('DOMContentLoaded', function() {
           window.nextEventBtn.addEventListener('click', window.handleNextEvent);
           console.log("INIT.JS: nextEventBtn click listener added.");
      } else { console.warn("INIT.JS: nextEventBtn element not found, listener not added."); }
+
+     if (window.cancelCuesBtn) {
+          window.cancelCuesBtn.addEventListener('click', window.handleCancelCues);
+          console.log("INIT.JS: cancelCuesBtn click listener added.");
+     } else { console.warn("INIT.JS: cancelCuesBtn element not found, listener not added."); }
  
      // Add keyboard shortcuts (Space/PgDn for next/advance, PgUp for prev)
      // Assumes handleKeyboardShortcuts is a global handler.
@@ -337,6 +396,11 @@ document.addEventListener('DOMContentLoaded', function() {
           console.log("presenter_init.js: advanceRoastBtn click listener added.");
      } else { console.warn("presenter_init.js: advanceRoastBtn element not found, listener not added."); }
  
+     if (window.extendRoastBtn) {
+          window.extendRoastBtn.addEventListener('click', window.handleExtendRoastSequence);
+          console.log("presenter_init.js: extendRoastBtn click listener added.");
+     } else { console.warn("presenter_init.js: extendRoastBtn element not found, listener not added."); }
+
      if (window.exitRoastBtn) {
           window.exitRoastBtn.addEventListener('click', window.handleExitRoastMode);
           console.log("presenter_init.js: exitRoastBtn click listener added.");
@@ -69,6 +69,19 @@ function handleAdvanceRoastSequence() {
     }
 }
 
+// Handles click on the "More Quotes" button: appends quotes to the running sequence (server draws them from memory).
+function handleExtendRoastSequence() {
+    if (!window.extendRoastBtn || window.extendRoastBtn.disabled || window.extendRoastBtn.style.display === 'none') return;
+    if (typeof window.sendMessage === 'function') {
+        window.extendRoastBtn.disabled = true;
+        console.log("Roast_Handlers: Sending action: 'extend_roast'.");
+        window.sendMessage({ action: "extend_roast" });
+    } else {
+         console.error("Roast_Handlers: sendMessage function not available.");
+         if (typeof window.updateStatus === 'function') window.updateStatus("WebSocket功能未初始化。", "error");
+    }
+}
+
 // Handles click on the "Exit Roast Mode" button.
 function handleExitRoastMode() {
     // Access global vars and check existence
@@ -123,6 +136,11 @@ function handleRoastSequenceReadyMessage(data) {
         window.exitRoastBtn.disabled = false; // 启用退出 
     } else console.warn("Roast_Handlers: exitRoastBtn element not found for sequence ready."); 
 
+    if (window.extendRoastBtn) {
+        window.extendRoastBtn.style.display = 'inline-block';
+        window.extendRoastBtn.disabled = false;
+    }
+
     if (window.roastTargetNameInput) window.roastTargetNameInput.disabled = true; 
 
     // FIX: 如果收到初始语录内容，立即更新 currentLineDiv 和 currentPromptDiv 
@@ -167,6 +185,15 @@ function handlePresenterRoastUpdateMessage(data) {
     console.debug("Roast_Handlers: UI updated for roast step.");
 }
 
+// Handles message confirming more quotes were appended.
+// data: { target_name, added, total_roasts, message, context }
+function handleRoastSequenceExtendedMessage(data) {
+    console.debug("Roast_Handlers: Received roast_sequence_extended:", data);
+    if (window.roastStatusDiv) window.roastStatusDiv.textContent = data.message || `已追加语录，共 ${data.total_roasts} 条。`;
+    if (typeof window.updateStatus === 'function') window.updateStatus("怼人语录已追加。", "success");
+    if (window.extendRoastBtn) window.extendRoastBtn.disabled = false;
+}
+
 // Handles message indicating the roast sequence has finished.
 // data: { message, target_name, context }
 // Assumes global DOM variables are assigned.
@@ -179,6 +206,7 @@ function handleRoastSequenceFinishedMessage(data) {
     // Hide advance/exit buttons, show start button
     if (window.advanceRoastBtn) window.advanceRoastBtn.style.display = 'none';
     if (window.exitRoastBtn) window.exitRoastBtn.style.display = 'none';
+    if (window.extendRoastBtn) window.extendRoastBtn.style.display = 'none';
     if (window.startRoastBtn) {
          window.startRoastBtn.style.display = 'inline-block';
          // Re-enabling start button and input is handled by reEnableAutoSendButtons helper
@@ -195,8 +223,10 @@ function handleRoastSequenceFinishedMessage(data) {
 window.handleStartRoastSequence = handleStartRoastSequence; // Called by event listener in init.js
 window.handleAdvanceRoastSequence = handleAdvanceRoastSequence; // Called by event listener in init.js and keyboard handler
 window.handleExitRoastMode = handleExitRoastMode; // Called by event listener in init.js
+window.handleExtendRoastSequence = handleExtendRoastSequence; // Called by event listener in init.js
 window.handleRoastSequenceReadyMessage = handleRoastSequenceReadyMessage; // Called by init.js dispatcher
 window.handlePresenterRoastUpdateMessage = handlePresenterRoastUpdateMessage; // Called by init.js dispatcher
 window.handleRoastSequenceFinishedMessage = handleRoastSequenceFinishedMessage; // Called by init.js dispatcher
+window.handleRoastSequenceExtendedMessage = handleRoastSequenceExtendedMessage; // Called by init.js dispatcher
 
 console.log("presenter_roast_handlers.js loaded.");
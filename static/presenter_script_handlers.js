@@ -4,19 +4,64 @@
 // Assumes sendMessage and updateStatus (window.*) are available from presenter_core.js.
 // Assumes UI utility functions (window.*) like updateLoadButtonState, updateProgress are available.
 
+// Page size for 'browse_scripts' (the server caps it); further pages are requested via the "load more" entry
+const SCRIPT_BROWSE_PAGE_SIZE = 200;
+// Listing currently shown in scriptSelect: its path, the filter it was requested with, and entries received so far
+let scriptBrowseState = { path: ".", filter: "", loaded: 0 };
+
+// Requests one page of the listing for path, using the current text of the filter box.
+function requestScriptOptions(path, offset = 0) {
+    if (typeof window.sendMessage !== 'function') {
+        console.error("Script_Handlers: sendMessage function not available.");
+        if (typeof window.updateStatus === 'function') window.updateStatus("WebSocket功能未初始化。", "error");
+        return false;
+    }
+    // Next pages keep the filter of the listing being extended
+    const filter = offset > 0 ? scriptBrowseState.filter : (window.scriptFilterInput ? window.scriptFilterInput.value.trim() : "");
+    window.sendMessage({ action: "browse_scripts", path: path, filter: filter, offset: offset, limit: SCRIPT_BROWSE_PAGE_SIZE });
+    return true;
+}
+
+// Navigating to another directory starts with an empty filter.
+function clearScriptFilter() {
+    if (window.scriptFilterInput) window.scriptFilterInput.value = "";
+}
+
+// Debounced 'input' handler of the filter box: re-requests the first page of the current directory.
+let scriptFilterTimer = null;
+function handleScriptFilterInput() {
+    if (scriptFilterTimer) clearTimeout(scriptFilterTimer);
+    scriptFilterTimer = setTimeout(() => {
+        scriptFilterTimer = null;
+        requestScriptOptions(scriptBrowseState.path, 0);
+    }, 250);
+}
+
 // --- Handler Functions (Called by Event Listeners or presenter_init.js's dispatcher) ---
 
 // Handles message updating script options (directories and files).
-// data: { current_path, breadcrumb: [{name, path}], options: [{name, path, type: 'browse_dir' | 'script_file'}] }
+// data: { current_path, breadcrumb: [{name, path}], options: [{name, path, type: 'browse_dir' | 'script_file'}],
+//         filter, offset, limit, total, has_more }
+// A page with offset > 0 for the listing being shown is appended instead of replacing it.
 function handleScriptOptionsMessage(data) {
     console.debug("Script_Handlers: Received script_options_update:", data);
     const options = data.options; // List of {name, path, type}
     const currentPath = data.current_path; // Relative path string
     const breadcrumb = data.breadcrumb; // List of {name, path}
+    const offset = data.offset || 0;
+    const isNextPage = offset > 0 && currentPath === scriptBrowseState.path;
+
+    const pageEntries = options ? options.filter(item => item.name !== "../").length : 0;
+    scriptBrowseState = { path: currentPath, filter: data.filter || "", loaded: (isNextPage ? offset : 0) + pageEntries };
 
     if (window.scriptSelect) { // Access global var
-        window.scriptSelect.innerHTML = ''; // Clear existing options
-        if (options && options.length > 0) {
+        if (isNextPage) {
+            const loadMoreOption = window.scriptSelect.querySelector('option[data-load_more="true"]');
+            if (loadMoreOption) loadMoreOption.remove();
+        } else {
+            window.scriptSelect.innerHTML = ''; // Clear existing options
+        }
+        if (options && (options.length > 0 || isNextPage)) {
             options.forEach(item => {
                 const option = document.createElement('option');
                 option.value = item.path; // Use relative path as value
@@ -24,6 +69,13 @@ function handleScriptOptionsMessage(data) {
                 option.dataset.is_dir = item.type === 'browse_dir'; // Store directory status
                 window.scriptSelect.appendChild(option);
             });
+            if (data.has_more) {
+                const option = document.createElement('option');
+                option.value = ""; // Not loadable; double click requests the next page
+                option.dataset.load_more = 'true';
+                option.textContent = `-- 加载更多 (已显示 ${scriptBrowseState.loaded} / ${data.total}) --`;
+                window.scriptSelect.appendChild(option);
+            }
              // Update load button state based on new options using the utility function
              if (typeof window.updateLoadButtonState === 'function') window.updateLoadButtonState();
              else console.warn("Script_Handlers: updateLoadButtonState function not available.");
@@ -32,7 +84,7 @@ function handleScriptOptionsMessage(data) {
         } else {
             const option = document.createElement('option');
             option.value = "";
-            option.textContent = "-- 无可用脚本或目录 --";
+            option.textContent = data.filter ? "-- 没有匹配的脚本或目录 --" : "-- 无可用脚本或目录 --";
             window.scriptSelect.appendChild(option);
              if (window.loadSelectedScriptBtn) window.loadSelectedScriptBtn.disabled = true;
              window.scriptSelect.disabled = true;
@@ -83,6 +135,11 @@ function handleScriptSelectDblClick() {
     const selectedOption = window.scriptSelect.options[window.scriptSelect.selectedIndex];
     if (!selectedOption) return;
 
+    if (selectedOption.dataset.load_more === 'true') {
+        requestScriptOptions(scriptBrowseState.path, scriptBrowseState.loaded);
+        return;
+    }
+
     const selectedPath = selectedOption.value;
     const isDir = selectedOption.dataset.is_dir === 'true'; // Check data attribute
 
@@ -90,7 +147,8 @@ function handleScriptSelectDblClick() {
     if (typeof window.sendMessage === 'function') {
         if (isDir) {
             console.log("Script_Handlers: Double clicked directory, sending 'browse_scripts' action:", selectedPath);
-            window.sendMessage({ action: "browse_scripts", path: selectedPath });
+            clearScriptFilter();
+            requestScriptOptions(selectedPath);
             if (typeof window.updateStatus === 'function') window.updateStatus(`浏览目录 "${selectedPath}"...`, "info");
         } else {
             console.log("Script_Handlers: Double clicked file, sending 'load_script' action:", selectedPath);
@@ -142,7 +200,8 @@ function handleBrowseUp() {
          // Assumes sendMessage is globally available via window.sendMessage
         if (typeof window.sendMessage === 'function') {
             console.log("Script_Handlers: scriptBrowseUpBtn clicked, sending 'browse_scripts' action with '..'");
-            window.sendMessage({ action: "browse_scripts", path: ".." }); // Send ".." to go up one level
+            clearScriptFilter();
+            requestScriptOptions(".."); // Send ".." to go up one level
             if (typeof window.updateStatus === 'function') window.updateStatus("返回上一级目录...", "info");
         } else {
              console.error("Script_Handlers: sendMessage function not available.");
@@ -163,7 +222,8 @@ function handleBreadcrumbClick(event) {
          // Assumes sendMessage is globally available via window.sendMessage
         if (typeof window.sendMessage === 'function') {
              console.log("Script_Handlers: Breadcrumb clicked, sending 'browse_scripts' action:", path);
-             window.sendMessage({ action: "browse_scripts", path: path });
+             clearScriptFilter();
+             requestScriptOptions(path);
              if (typeof window.updateStatus === 'function') window.updateStatus(`浏览目录 "${path}"...`, "info");
         } else {
              console.error("Script_Handlers: sendMessage function not available.");
@@ -173,6 +233,69 @@ function handleBreadcrumbClick(event) {
 }
 
 
+// Handles click on the "Stop cues" button: cancels timed cues from the script that are pending or sending.
+function handleCancelCues() {
+    if (typeof window.sendMessage === 'function') {
+        console.log("Script_Handlers: cancelCuesBtn clicked, sending 'cancel_cues' action...");
+        window.sendMessage({ action: "cancel_cues" });
+    } else {
+        console.error("Script_Handlers: sendMessage function not available.");
+        if (typeof window.updateStatus === 'function') window.updateStatus("WebSocket功能未初始化。", "error");
+    }
+}
+
+// Handles the script search button / Enter in the search box: full-text search across all scripts.
+function handleScriptSearch() {
+    if (!window.scriptSearchInput) return;
+    const query = window.scriptSearchInput.value.trim();
+    if (!query) {
+        if (window.scriptSearchResultsDiv) window.scriptSearchResultsDiv.style.display = 'none';
+        return;
+    }
+    if (typeof window.sendMessage === 'function') {
+        console.log("Script_Handlers: Sending 'search_scripts' action:", query);
+        window.sendMessage({ action: "search_scripts", query: query, limit: 30 });
+    } else {
+        console.error("Script_Handlers: sendMessage function not available.");
+        if (typeof window.updateStatus === 'function') window.updateStatus("WebSocket功能未初始化。", "error");
+    }
+}
+
+// Handles the ranked hits of 'search_scripts'. Clicking a hit jumps to it (loading its script first if needed).
+// data: { query, results: [{filename, event_index, line, score}] }
+function handleScriptSearchResultsMessage(data) {
+    console.debug("Script_Handlers: Received script_search_results:", data);
+    if (!window.scriptSearchResultsDiv) {
+        console.warn("Script_Handlers: scriptSearchResultsDiv element not found for script_search_results.");
+        return;
+    }
+    const resultsDiv = window.scriptSearchResultsDiv;
+    resultsDiv.innerHTML = '';
+    const results = data.results || [];
+    if (results.length === 0) {
+        const empty = document.createElement('div');
+        empty.textContent = data.query ? `没有找到 "${data.query}"` : "请输入搜索内容";
+        resultsDiv.appendChild(empty);
+    }
+    results.forEach(hit => {
+        const item = document.createElement('div');
+        const location = document.createElement('span');
+        location.className = 'hit-location';
+        location.textContent = `${hit.filename} #${hit.event_index + 1}  `;
+        item.appendChild(location);
+        item.appendChild(document.createTextNode(hit.line)); // textContent only: script lines are not HTML
+        item.addEventListener('click', () => {
+            resultsDiv.style.display = 'none';
+            if (typeof window.sendMessage === 'function') {
+                window.sendMessage({ action: "jump_to_event", filename: hit.filename, event_index: hit.event_index });
+                if (typeof window.updateStatus === 'function') window.updateStatus(`跳转到 ${hit.filename} 第 ${hit.event_index + 1} 句...`, "info");
+            }
+        });
+        resultsDiv.appendChild(item);
+    });
+    resultsDiv.style.display = 'block';
+}
+
 // Handles message updating the current script event display.
 // data: { script_filename, total_events, event_index, current_line, current_prompt, is_roast_mode, roast_target, roast_templates_count }
 // Assumes global DOM variables (window.*) are assigned.
@@ -220,6 +343,118 @@ function handleCurrentEventUpdateMessage(data) {
     console.debug("Script_Handlers: Script display and navigation state updated.");
 }
 
+// --- Versioned state (server broadcasts 'state_delta' to every presenter) ---
+// Last full state known to this console and its version; deltas must arrive in order (version + 1).
+let presenterState = {};
+let presenterStateVersion = null; // null: no snapshot yet
+let presenterStateEpoch = null; // Server run the version belongs to (versions restart when the server does)
+
+// Asks the server for what we missed since our version (a merged delta, or a full snapshot).
+function requestStateResync() {
+    if (typeof window.sendMessage !== 'function') return;
+    const request = { action: "get_current_state" };
+    if (presenterStateVersion !== null) {
+        request.since_version = presenterStateVersion;
+        request.epoch = presenterStateEpoch;
+    }
+    window.sendMessage(request);
+}
+
+// Prefetch window pushed with position changes: { start, events: [{line, prompt}] } around the server's position.
+let eventWindow = null;
+// Optimistic navigation: indices shown ahead of the server, in press order, until its state_delta confirms them
+let pendingNavigation = [];
+let pendingNavigationTimer = null;
+const OPTIMISTIC_NAV_TIMEOUT_MS = 3000; // Fall back to the server's state if a press is not confirmed in time
+
+function storeEventWindow(data) {
+    if (data && data.window && Array.isArray(data.window.events)) eventWindow = data.window;
+}
+
+function eventFromWindow(index) {
+    if (!eventWindow) return null;
+    return eventWindow.events[index - eventWindow.start] || null;
+}
+
+function clearPendingNavigation() {
+    pendingNavigation = [];
+    if (pendingNavigationTimer) {
+        clearTimeout(pendingNavigationTimer);
+        pendingNavigationTimer = null;
+    }
+}
+
+// Shows the event `step` away from the last displayed one right away, if it is in the prefetch window.
+// The server stays authoritative: its state_delta confirms the index or replaces what is shown.
+function showPredictedEvent(step) {
+    if (presenterStateVersion === null || presenterState.is_roast_mode) return false;
+    const from = pendingNavigation.length > 0 ? pendingNavigation[pendingNavigation.length - 1] : presenterState.event_index;
+    const target = from + step;
+    if (target < 0 || target >= presenterState.total_events) return false; // Start/end transitions come from the server
+    const event = eventFromWindow(target);
+    if (!event) return false;
+
+    pendingNavigation.push(target);
+    if (pendingNavigationTimer) clearTimeout(pendingNavigationTimer);
+    pendingNavigationTimer = setTimeout(() => {
+        console.warn("Script_Handlers: Navigation not confirmed by the server, showing its state.");
+        clearPendingNavigation();
+        handleCurrentEventUpdateMessage(presenterState);
+    }, OPTIMISTIC_NAV_TIMEOUT_MS);
+    handleCurrentEventUpdateMessage(Object.assign({}, presenterState, { event_index: target, current_line: event.line, current_prompt: event.prompt }));
+    return true;
+}
+
+// Handles 'state_snapshot' (and the legacy full-state 'script_loaded_presenter'): replaces the local state.
+function handleStateSnapshotMessage(data) {
+    const state = data.state || data;
+    presenterState = Object.assign({}, state);
+    delete presenterState.type;
+    delete presenterState.window;
+    if (typeof data.version === 'number') presenterStateVersion = data.version;
+    if (data.epoch !== undefined) presenterStateEpoch = data.epoch;
+    storeEventWindow(data);
+    clearPendingNavigation();
+    handleCurrentEventUpdateMessage(presenterState);
+}
+
+// Handles 'state_delta': applies the changed fields if it directly follows our version, otherwise resyncs.
+function handleStateDeltaMessage(data) {
+    if (data.epoch !== presenterStateEpoch) { // Server restarted: its versions are unrelated to ours
+        requestStateResync();
+        return;
+    }
+    const baseVersion = typeof data.base_version === 'number' ? data.base_version : data.version - 1;
+    if (presenterStateVersion === null || baseVersion !== presenterStateVersion) {
+        if (presenterStateVersion === null || data.version > presenterStateVersion) {
+            console.debug(`Script_Handlers: State v${data.version} does not follow v${presenterStateVersion}, resyncing.`);
+            requestStateResync();
+        }
+        return; // Stale or duplicate deltas are ignored
+    }
+    const changes = data.changes || {};
+    Object.assign(presenterState, changes);
+    presenterStateVersion = data.version;
+    storeEventWindow(data);
+    if (Object.keys(changes).length === 0) return;
+
+    // Reconcile optimistic navigation: a delta confirming the oldest predicted press keeps the display
+    // if more presses are still in flight; anything else (e.g. another console navigated) shows the server state.
+    const confirmsPrediction = pendingNavigation.length > 0 && Object.keys(changes).every(key => key === "event_index" || key === "current_line" || key === "current_prompt")
+        && changes.event_index === pendingNavigation[0];
+    if (confirmsPrediction) {
+        pendingNavigation.shift();
+        if (pendingNavigation.length > 0) return;
+    }
+    clearPendingNavigation();
+    handleCurrentEventUpdateMessage(presenterState);
+}
+
+// Handles 'event_window': the script was edited without moving the position, refresh the prefetched lines.
+function handleEventWindowMessage(data) {
+    if (data.epoch === presenterStateEpoch && data.version === presenterStateVersion) storeEventWindow(data);
+}
+
 // Handles click on the "Previous Event" button.
 function handlePrevEvent() {
      if (!window.prevEventBtn) return; // Access global var
@@ -227,6 +462,7 @@ function handlePrevEvent() {
          // Assumes sendMessage is globally available via window.sendMessage
         if (typeof window.sendMessage === 'function') {
             console.log("Script_Handlers: prevEventBtn clicked, sending 'prev_event' action...");
+            showPredictedEvent(-1); // Show the prefetched line now; the server's state_delta reconciles
             window.sendMessage({ action: "prev_event" });
         } else {
              console.error("Script_Handlers: sendMessage function not available.");
@@ -244,6 +480,7 @@ function handleNextEvent() {
          // Assumes sendMessage is globally available via window.sendMessage
         if (typeof window.sendMessage === 'function') {
             console.log("Script_Handlers: nextEventBtn clicked, sending 'next_event' action...");
+            showPredictedEvent(1); // Show the prefetched line now; the server's state_delta reconciles
             window.sendMessage({ action: "next_event" });
         } else {
              console.error("Script_Handlers: sendMessage function not available.");
@@ -289,11 +526,20 @@ function handleKeyboardShortcuts(event) {
 
 // Expose handlers globally via window object so they can be called by event listeners or dispatcher
 window.handleScriptOptionsMessage = handleScriptOptionsMessage; // Called by init.js dispatcher
+window.requestScriptOptions = requestScriptOptions; // Called by init.js and ui_utils to (re)load the listing
+window.handleScriptFilterInput = handleScriptFilterInput; // Called by event listener in init.js
 window.handleScriptSelectDblClick = handleScriptSelectDblClick; // Called by event listener in init.js
 window.handleLoadSelectedScript = handleLoadSelectedScript; // Called by event listener in init.js
 window.handleBrowseUp = handleBrowseUp; // Called by event listener in init.js
 window.handleBreadcrumbClick = handleBreadcrumbClick; // Called by inline onclick in HTML
 window.handleCurrentEventUpdateMessage = handleCurrentEventUpdateMessage; // Called by init.js dispatcher
+window.handleStateSnapshotMessage = handleStateSnapshotMessage; // Called by init.js dispatcher
+window.handleStateDeltaMessage = handleStateDeltaMessage; // Called by init.js dispatcher
+window.handleEventWindowMessage = handleEventWindowMessage; // Called by init.js dispatcher
+window.requestStateResync = requestStateResync; // Called by init.js on (re)registration
+window.handleScriptSearch = handleScriptSearch; // Called by event listeners in init.js
+window.handleCancelCues = handleCancelCues; // Called by event listener in init.js
+window.handleScriptSearchResultsMessage = handleScriptSearchResultsMessage; // Called by init.js dispatcher
 window.handlePrevEvent = handlePrevEvent; // Called by event listener in init.js and keyboard handler
 window.handleNextEvent = handleNextEvent; // Called by event listener in init.js and keyboard handler
 window.handleKeyboardShortcuts = handleKeyboardShortcuts; // Called by event listener in init.js
@@ -108,8 +108,8 @@ function reEnableNavigationButtons() {
     // Assumes sendMessage is globally available via window.sendMessage
     if (typeof window.sendMessage === 'function') {
          console.log("UI_Utils: Requesting state sync to re-enable navigation buttons.");
-         window.sendMessage({action: "get_current_state"}); // This triggers current_event_update message
-         // The current_event_update handler (in script_handlers.js) will then correctly enable/disable based on index/total
+         window.sendMessage({action: "get_current_state"}); // No since_version: the server replies with a full state_snapshot
+         // The snapshot handler (in script_handlers.js) will then correctly enable/disable based on index/total
     } else {
          console.error("UI_Utils: sendMessage function not available for reEnableNavigationButtons.");
          // As a fallback, try to enable elements directly if sendMessage is missing, but state might be wrong
@@ -133,7 +133,8 @@ function reEnableScriptBrowse() {
     // Assumes sendMessage is globally available via window.sendMessage
     if (typeof window.sendMessage === 'function') {
         console.log("UI_Utils: Requesting script options to re-enable browse controls.");
-        window.sendMessage({action: "browse_scripts", path: "."}); // Request current dir listing
+        if (typeof window.requestScriptOptions === 'function') window.requestScriptOptions("."); // Request current dir listing (first page)
+        else window.sendMessage({action: "browse_scripts", path: "."});
         // The script_options_update handler (in script_handlers.js) will then correctly enable/disable based on path/options
     } else {
          console.error("UI_Utils: sendMessage function not available for reEnableScriptBrowse.");
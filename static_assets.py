@@ -0,0 +1,110 @@
+# static_assets.py
+# Serves the output of build_assets.py (static/dist/):
+#  - content-hashed bundles with "immutable" cache headers
+#  - precompressed .br/.gz variants picked by Accept-Encoding
+#  - the rewritten HTML pages (revalidated via ETag), falling back to the source pages when no build
+#    exists or the build is stale (a source page or script changed since build_assets.py ran)
+
+import hashlib
+import json
+import logging
+
+from flask import request, send_from_directory
+
+import config
+from http_cache import parse_accept_encoding
+
+DIST_DIR = config.STATIC_FOLDER / "dist"
+MANIFEST_PATH = DIST_DIR / "manifest.json"
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PAGE_CACHE_CONTROL = "no-cache" # Pages point at the current bundle hash, so always revalidate
+
+_MIMETYPES = {".js": "application/javascript", ".html": "text/html", ".css": "text/css", ".json": "application/json"}
+
+_manifest = None
+
+
+def stale_sources(manifest) -> list:
+    """
+    Source files whose content no longer matches the hash recorded at build time (or that are gone).
+    Hashes rather than mtimes: a git checkout touches mtimes without changing anything.
+    """
+    sources = manifest.get("sources")
+    if not sources:
+        return ["<manifest without source hashes>"] # Built before hashes were recorded; cannot be verified
+    stale = []
+    for rel, digest in sources.items():
+        path = (config.STATIC_FOLDER / rel[len("static/"):]) if rel.startswith("static/") else (config.BASE_DIR / rel)
+        try:
+            if hashlib.sha256(path.read_bytes()).hexdigest()[:12] != digest:
+                stale.append(rel)
+        except OSError:
+            stale.append(rel)
+    return stale
+
+
+def load_manifest():
+    """
+    Reads static/dist/manifest.json (written by build_assets.py). Returns None if no build exists
+    or the build is stale, in which case the source pages and unbundled scripts are served.
+    """
+    global _manifest
+    try:
+        _manifest = json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+        stale = stale_sources(_manifest)
+        if stale:
+            logging.warning(f"static_assets: Asset build in {DIST_DIR} is older than its sources ({', '.join(stale[:5])}"
+                            f"{'...' if len(stale) > 5 else ''}). Serving source files; run 'python build_assets.py'.")
+            _manifest = None
+            return None
+        logging.info(f"static_assets: Serving built assets from {DIST_DIR} (bundles: {_manifest.get('bundles')}).")
+    except FileNotFoundError:
+        _manifest = None
+        logging.info("static_assets: No asset build found (run 'python build_assets.py'). Serving source files.")
+    except (OSError, ValueError) as e:
+        _manifest = None
+        logging.error(f"static_assets: Could not read asset manifest {MANIFEST_PATH}: {e}. Serving source files.")
+    return _manifest
+
+
+def _send_precompressed(directory, filename: str, cache_control: str):
+    """Sends filename from directory, preferring a precompressed .br/.gz sibling the client accepts."""
+    accepted = parse_accept_encoding(request.headers.get("Accept-Encoding", ""))
+    suffix = "." + filename.rsplit(".", 1)[-1] if "." in filename else ""
+    mimetype = _MIMETYPES.get(suffix)
+    for encoding, extension in (("br", ".br"), ("gzip", ".gz")):
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0 and (directory / (filename + extension)).is_file():
+            response = send_from_directory(directory, filename + extension, mimetype=mimetype, etag=True)
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename, mimetype=mimetype, etag=True)
+    response.headers["Cache-Control"] = cache_control
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+def serve_page(page: str):
+    """Serves an HTML page: the built copy from static/dist if available, else the source from BASE_DIR."""
+    if _manifest and page in _manifest.get("pages", {}):
+        return _send_precompressed(DIST_DIR, _manifest["pages"][page], PAGE_CACHE_CONTROL)
+    return send_from_directory(config.BASE_DIR, page)
+
+
+def register_static_asset_routes(flask_app_instance):
+    """Registers /static/dist/<file>. More specific than Flask's /static/<path> rule, so it takes precedence."""
+    load_manifest()
+
+    @flask_app_instance.route('/static/dist/<path:filename>')
+    def serve_dist_asset(filename):
+        if filename.endswith((".gz", ".br")) or filename == MANIFEST_PATH.name:
+            return send_from_directory(DIST_DIR, filename)
+        # Hashed bundles never change under the same name; pages are revalidated
+        cache_control = PAGE_CACHE_CONTROL if filename.endswith(".html") else IMMUTABLE_CACHE_CONTROL
+        return _send_precompressed(DIST_DIR, filename, cache_control)
+
+    logging.info("static_assets: Static asset routes registered.")
+
+
+__all__ = ['load_manifest', 'stale_sources', 'serve_page', 'register_static_asset_routes']
@@ -0,0 +1,12 @@
+# tests/conftest.py
+# Unit tests for the server modules. The modules are flat files in the repository root
+# (like benchmarks/, the tests put the root on sys.path).
+#
+#   python -m pytest -q tests
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
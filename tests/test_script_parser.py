@@ -0,0 +1,77 @@
+# tests/test_script_parser.py
+# Script format compatibility: "||" prompts and "@" cues only apply to files that opt in with
+# '# script-format: 2', and eager and lazy loading return the same events for the same file.
+
+import pytest
+
+from script_parser import FORMAT_DIRECTIVE, build_lazy_script, parse_script_file, script_cues
+
+PLAIN_SCRIPT = (
+    "# 旧脚本\n"
+    "const wsHost = window.location.hostname || 'localhost';\n"
+    "@welcome 张三\n"
+    "普通台词\n"
+)
+
+EXTENDED_SCRIPT = (
+    "# 新脚本\n"
+    f"{FORMAT_DIRECTIVE}\n"
+    "\n"
+    "开场 || 慢一点\n"
+    "@welcome 张三\n"
+    "@+30s roast 李四\n"
+    "第二句\n"
+    "@notacue\n"
+)
+
+
+def _load_both(path):
+    eager = parse_script_file(str(path))
+    lazy = build_lazy_script(str(path))
+    assert list(lazy) == eager
+    assert lazy.cues == script_cues(eager)
+    return eager
+
+
+@pytest.fixture
+def write(tmp_path):
+    def _write(content, name="script.txt"):
+        path = tmp_path / name
+        path.write_bytes(content.encode("utf-8") if isinstance(content, str) else content)
+        return path
+    return _write
+
+
+def test_plain_script_keeps_the_whole_line(write):
+    events = _load_both(write(PLAIN_SCRIPT))
+    assert [event["line"] for event in events] == [
+        "const wsHost = window.location.hostname || 'localhost';", "@welcome 张三", "普通台词",
+    ]
+    assert all(event["prompt"] == "" and "cues" not in event for event in events)
+
+
+def test_directive_enables_prompts_and_cues(write):
+    events = _load_both(write(EXTENDED_SCRIPT))
+    assert events[0] == {"line": "开场", "prompt": "慢一点"}
+    assert [cue["kind"] for cue in events[1]["cues"]] == ["welcome", "roast"]
+    assert events[1]["cues"][1]["delay"] == 30.0
+    assert events[2]["line"] == "@notacue" # Not a valid cue: stays an event line
+
+
+def test_directive_after_the_first_event_is_ignored(write):
+    events = _load_both(write(f"第一句 || 不是提示\n{FORMAT_DIRECTIVE}\n@welcome 张三\n"))
+    assert events[0]["line"] == "第一句 || 不是提示"
+    assert events[1]["line"] == "@welcome 张三"
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+def test_line_endings_are_equivalent(write, newline):
+    events = _load_both(write(EXTENDED_SCRIPT.replace("\n", newline)))
+    assert [event["line"] for event in events] == ["开场", "第二句", "@notacue"]
+
+
+
+def test_invalid_utf8_is_rejected_in_both_modes(write):
+    path = write(b"ok line\n\xff\xfe broken\n")
+    assert parse_script_file(str(path)) == []
+    assert build_lazy_script(str(path)) == []
@@ -0,0 +1,130 @@
+# tests/test_state_sync.py
+# StateSync.resync_message: what a reconnecting presenter at `since_version` gets back
+# (merged delta from the ring buffer, or a full snapshot when it cannot be served from it).
+
+import asyncio
+
+import pytest
+
+from script_parser import FORMAT_DIRECTIVE
+from state_manager import ApplicationStateManager
+from state_sync import StateSync
+
+
+async def _ignore_broadcast(target, message):
+    pass
+
+
+@pytest.fixture
+def manager(tmp_path):
+    script = tmp_path / "show.txt"
+    script.write_text(FORMAT_DIRECTIVE + "\n" + "".join(f"line {i} || prompt {i}\n" for i in range(10)), encoding="utf-8")
+    instance = ApplicationStateManager()
+    assert instance.load_script(str(script))
+    return instance
+
+
+def _sync(manager, history=16, prefetch=2):
+    return StateSync(manager, _ignore_broadcast, history=history, prefetch=prefetch)
+
+
+def _publish(sync):
+    return asyncio.run(sync.publish())
+
+
+def test_up_to_date_presenter_gets_an_empty_delta(manager):
+    sync = _sync(manager)
+    manager.advance_event()
+    version = _publish(sync)
+    message = sync.resync_message(version, sync.epoch)
+    assert message == {"type": "state_delta", "epoch": sync.epoch, "version": version, "changes": {}}
+
+
+def test_missing_deltas_are_merged(manager):
+    sync = _sync(manager)
+    base = sync.version
+    manager.advance_event()
+    _publish(sync)
+    manager.advance_event()
+    manager.advance_event()
+    _publish(sync)
+    message = sync.resync_message(base, sync.epoch)
+    assert message["type"] == "state_delta"
+    assert message["base_version"] == base and message["version"] == sync.version == base + 2
+    assert message["changes"]["event_index"] == 2
+    assert message["changes"]["current_line"] == "line 2"
+    assert message["window"]["start"] == 0 and len(message["window"]["events"]) == 5
+
+
+def test_unpublished_changes_are_folded_in(manager):
+    sync = _sync(manager)
+    base = sync.version
+    manager.jump_to_event(7) # Not published yet
+    message = sync.resync_message(base, sync.epoch)
+    assert message["version"] == base + 1
+    assert message["changes"]["event_index"] == 7
+
+
+@pytest.mark.parametrize("since_version, epoch_offset", [
+    (None, 0), # Fresh console
+    (0, 1), # Other server run
+    (99, 0), # Ahead of the server
+])
+def test_unknown_versions_get_a_snapshot(manager, since_version, epoch_offset):
+    sync = _sync(manager)
+    manager.advance_event()
+    _publish(sync)
+    message = sync.resync_message(since_version, sync.epoch + epoch_offset)
+    assert message["type"] == "state_snapshot"
+    assert message["version"] == sync.version
+    assert message["state"] == dict(manager.get_current_state())
+
+
+def test_gap_older_than_the_ring_buffer_gets_a_snapshot(manager):
+    sync = _sync(manager, history=2)
+    base = sync.version
+    for _ in range(3):
+        manager.advance_event()
+        _publish(sync)
+    assert sync.resync_message(base, sync.epoch)["type"] == "state_snapshot"
+    # The oldest delta still in the buffer is enough for the next presenter
+    message = sync.resync_message(base + 1, sync.epoch)
+    assert message["type"] == "state_delta" and message["changes"]["event_index"] == 2
+
+
+def test_no_window_without_prefetch(manager):
+    sync = _sync(manager, prefetch=0)
+    base = sync.version
+    manager.advance_event()
+    assert "window" not in sync.resync_message(base, sync.epoch)
+    assert "window" not in sync.resync_message(None)
+
+
+def test_recorded_snapshot_carries_the_sync_version(manager):
+    sync = _sync(manager)
+    manager.advance_event()
+    manager.advance_event() # Two snapshot commits, one sync version
+    version = _publish(sync)
+    recorded_version, snapshot = sync.recorded_snapshot()
+    assert recorded_version == version == sync.version
+    assert snapshot.state["event_index"] == 1
+    manager.advance_event() # Not recorded yet: readers keep the last recorded state
+    assert sync.recorded_snapshot() == (version, snapshot)
+    assert sync.resync_message(version, sync.epoch)["changes"]["event_index"] == 2
+    assert sync.recorded_snapshot()[0] == version + 1
+
+
+def test_state_api_reports_the_sync_version(manager, monkeypatch):
+    from flask import Flask
+    import flask_routes
+    sync = _sync(manager)
+    manager.advance_event()
+    _publish(sync)
+    monkeypatch.setattr(flask_routes, "get_state_sync", lambda: sync)
+    app = Flask(__name__)
+    flask_routes.register_flask_routes(app)
+    response = app.test_client().get("/api/state")
+    assert response.status_code == 200
+    assert response.headers["X-State-Version"] == str(sync.version)
+    assert response.headers["X-State-Epoch"] == str(sync.epoch)
+    assert response.get_json()["event_index"] == 0
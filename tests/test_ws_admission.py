@@ -0,0 +1,166 @@
+# tests/test_ws_admission.py
+# TokenBucket refill, AdmissionController caps / presenter exemptions / reconnect window,
+# and admit_registration's presenter-path check.
+
+import asyncio
+
+import pytest
+
+import ws_admission
+from metrics import EVENT_LOOP_LAG
+from ws_admission import AdmissionController, TokenBucket, CLOSE_POLICY_VIOLATION, CLOSE_TRY_AGAIN_LATER
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(ws_admission.time, "monotonic", fake)
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def no_loop_lag():
+    previous = EVENT_LOOP_LAG.value()
+    EVENT_LOOP_LAG.set(0.0)
+    yield
+    EVENT_LOOP_LAG.set(previous)
+
+
+def _controller(**overrides):
+    settings = dict(max_connections=10, max_per_ip=3, max_pending=5, register_rate=1.0, register_burst=2, max_loop_lag=0.25)
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+
+# --- TokenBucket ---
+def test_bucket_allows_the_burst_then_refuses(clock):
+    bucket = TokenBucket(rate=2.0, burst=3)
+    assert [bucket.try_take() for _ in range(4)] == [True, True, True, False]
+
+
+def test_bucket_refills_at_rate_up_to_burst(clock):
+    bucket = TokenBucket(rate=2.0, burst=3)
+    for _ in range(3):
+        bucket.try_take()
+    clock.now += 0.25 # Half a token
+    assert not bucket.try_take()
+    clock.now += 0.25
+    assert bucket.try_take()
+    clock.now += 60 # Long idle: capped at the burst
+    assert [bucket.try_take() for _ in range(4)] == [True, True, True, False]
+
+
+# --- Handshake caps ---
+def test_per_ip_cap_and_release(clock):
+    controller = _controller()
+    assert [controller.admit_handshake("1.1.1.1") for _ in range(3)] == [None, None, None]
+    assert controller.admit_handshake("1.1.1.1") == "ip_cap"
+    assert controller.admit_handshake("2.2.2.2") is None
+    controller.release("1.1.1.1", registered=False)
+    assert controller.admit_handshake("1.1.1.1") is None
+    assert controller.connections == 4 and controller.pending == 4
+
+
+def test_global_cap_applies_to_presenters_too(clock):
+    controller = _controller(max_connections=2, max_per_ip=10)
+    controller.admit_handshake("1.1.1.1")
+    controller.admit_handshake("1.1.1.1")
+    assert controller.admit_handshake("1.1.1.1") == "global_cap"
+    assert controller.admit_handshake("1.1.1.1", presenter=True) == "global_cap"
+
+
+def test_pending_cap_counts_unregistered_connections(clock):
+    controller = _controller(max_per_ip=100, max_pending=2)
+    controller.admit_handshake("1.1.1.1")
+    controller.admit_handshake("1.1.1.1")
+    assert controller.admit_handshake("1.1.1.1") == "pending_cap"
+    controller.mark_registered()
+    assert controller.admit_handshake("1.1.1.1") is None
+
+
+def test_loop_pressure_refuses_audience_but_not_presenters(clock):
+    controller = _controller()
+    EVENT_LOOP_LAG.set(1.0)
+    assert controller.admit_handshake("1.1.1.1") == "loop_pressure"
+    assert controller.admit_handshake("1.1.1.1", presenter=True) is None
+
+
+def test_presenter_skips_per_ip_and_pending_caps(clock):
+    controller = _controller(max_per_ip=1, max_pending=1)
+    assert controller.admit_handshake("1.1.1.1") is None
+    assert controller.admit_handshake("1.1.1.1") == "ip_cap"
+    assert controller.admit_handshake("1.1.1.1", presenter=True) is None
+
+
+# --- Registration ---
+def test_registration_bucket_and_presenter_bypass(clock):
+    controller = _controller(register_rate=1.0, register_burst=2)
+    assert [controller.admit_registration() for _ in range(3)] == [None, None, "register_rate"]
+    assert controller.admit_registration(presenter=True) is None
+    clock.now += 1.0
+    assert controller.admit_registration() is None
+
+
+def test_reconnect_window_admits_the_expected_clients_then_closes(clock):
+    controller = _controller(register_rate=1.0, register_burst=0, max_pending=0)
+    controller.open_reconnect_window(expected=2, seconds=5.0)
+    assert controller.admit_handshake("1.1.1.1") is None # Pending cap skipped inside the window
+    assert [controller.admit_registration() for _ in range(3)] == [None, None, "register_rate"]
+    controller.open_reconnect_window(expected=5, seconds=5.0)
+    clock.now += 6.0
+    assert controller.admit_registration() == "register_rate"
+
+
+def test_retry_hint_stays_within_configured_bounds(clock):
+    controller = _controller()
+    for _ in range(500):
+        controller._reject("register_rate")
+    hint = controller.retry_after_ms()
+    assert ws_admission.WS_RETRY_AFTER_MIN_MS <= hint <= ws_admission.WS_RETRY_AFTER_MAX_MS
+
+
+# --- admit_registration (server.websocket_handler) ---
+class FakeWebSocket:
+    def __init__(self, presenter_path):
+        self.admission_presenter = presenter_path
+        self.admission_held = True
+        self.admission_registered = False
+        self.closed_with = None
+
+    async def close(self, code, reason):
+        self.closed_with = (code, reason)
+
+
+@pytest.fixture
+def controller(monkeypatch, clock):
+    instance = _controller(register_rate=1.0, register_burst=0)
+    monkeypatch.setattr(ws_admission, "_controller", instance)
+    return instance
+
+
+def test_audience_on_the_presenter_path_is_closed(controller):
+    websocket = FakeWebSocket(presenter_path=True)
+    assert asyncio.run(ws_admission.admit_registration(websocket, "audience")) is False
+    assert websocket.closed_with[0] == CLOSE_POLICY_VIOLATION
+
+
+def test_presenter_on_the_presenter_path_skips_the_bucket(controller):
+    controller.pending = 1
+    websocket = FakeWebSocket(presenter_path=True)
+    assert asyncio.run(ws_admission.admit_registration(websocket, "presenter")) is True
+    assert websocket.admission_registered and controller.pending == 0
+
+
+def test_presenter_claim_on_another_path_goes_through_the_bucket(controller):
+    websocket = FakeWebSocket(presenter_path=False)
+    assert asyncio.run(ws_admission.admit_registration(websocket, "presenter")) is False
+    assert websocket.closed_with[0] == CLOSE_TRY_AGAIN_LATER
+    assert websocket.closed_with[1].startswith("retry_after_ms=")
@@ -0,0 +1,74 @@
+# tests/test_ws_heartbeat.py
+# TimingWheel slot/round arithmetic: a key scheduled `delay` ahead is due after exactly
+# round(delay / tick) advances (at least one), whatever the cursor position.
+
+import pytest
+
+from ws_heartbeat import TimingWheel
+
+SLOTS = 8
+TICK = 0.5
+
+
+def _advances_until_due(wheel, key, limit=1000):
+    for count in range(1, limit + 1):
+        if key in wheel.advance():
+            return count
+    raise AssertionError(f"{key!r} never became due")
+
+
+@pytest.mark.parametrize("ticks", [1, 3, SLOTS - 1, SLOTS, SLOTS + 1, 2 * SLOTS, 3 * SLOTS + 5])
+def test_key_is_due_after_exact_number_of_ticks(ticks):
+    wheel = TimingWheel(SLOTS, TICK)
+    wheel.schedule("a", ticks * TICK)
+    assert _advances_until_due(wheel, "a") == ticks
+    assert "a" not in wheel and len(wheel) == 0
+
+
+@pytest.mark.parametrize("cursor", [1, SLOTS - 1, SLOTS + 3])
+@pytest.mark.parametrize("ticks", [1, SLOTS, 2 * SLOTS + 1])
+def test_delay_is_relative_to_the_cursor(cursor, ticks):
+    wheel = TimingWheel(SLOTS, TICK)
+    for _ in range(cursor):
+        wheel.advance()
+    wheel.schedule("a", ticks * TICK)
+    assert _advances_until_due(wheel, "a") == ticks
+
+
+def test_delays_round_to_ticks_with_a_minimum_of_one():
+    wheel = TimingWheel(SLOTS, TICK)
+    wheel.schedule("zero", 0)
+    wheel.schedule("tiny", TICK / 10)
+    wheel.schedule("rounded_up", 2.6 * TICK)
+    assert sorted(wheel.advance()) == ["tiny", "zero"]
+    assert wheel.advance() == []
+    assert wheel.advance() == ["rounded_up"]
+
+
+def test_reschedule_moves_the_key():
+    wheel = TimingWheel(SLOTS, TICK)
+    wheel.schedule("a", 2 * TICK)
+    wheel.schedule("a", 5 * TICK)
+    assert len(wheel) == 1
+    assert _advances_until_due(wheel, "a") == 5
+
+
+def test_cancel_removes_the_key():
+    wheel = TimingWheel(SLOTS, TICK)
+    wheel.schedule("a", 2 * TICK)
+    wheel.schedule("b", 2 * TICK)
+    wheel.cancel("a")
+    wheel.cancel("missing") # No-op
+    assert "a" not in wheel
+    assert wheel.advance() == []
+    assert wheel.advance() == ["b"]
+    assert len(wheel) == 0
+
+
+def test_keys_in_the_same_slot_with_different_rounds():
+    wheel = TimingWheel(SLOTS, TICK)
+    wheel.schedule("near", 2 * TICK)
+    wheel.schedule("far", (SLOTS + 2) * TICK) # Same slot, one more revolution
+    assert _advances_until_due(wheel, "near") == 2
+    assert "far" in wheel
+    assert _advances_until_due(wheel, "far") == SLOTS
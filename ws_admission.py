@@ -0,0 +1,255 @@
+# ws_admission.py
+# Admission control for the WebSocket server, so a reconnect storm (every audience display
+# reconnecting at once after a network blip or restart) cannot starve the registered clients.
+#
+# Two checkpoints:
+#   1. Handshake (AdmissionServerProtocol.process_request, before the upgrade): global, per-IP and
+#      "unregistered connections" caps, and refusal of new handshakes while the event loop is lagging
+#      (registered clients first). Refused with a plain HTTP 503 + Retry-After; no handler coroutine,
+#      no register wait, no per-connection log line.
+#   2. Registration (admit_registration, from server.websocket_handler): token bucket on "register".
+#      Refused with close code 1013 (try again later) and reason "retry_after_ms=<n>".
+#      A connection exempted as presenter at the handshake must register as presenter (else 1008),
+#      and only such a connection skips the bucket.
+# After a graceful restart the new process opens a reconnect window sized to the clients it inherits,
+# so the expected reconnect wave is let in at once instead of being refused and spread out.
+# Retry hints are jittered over the time the bucket needs to admit the recent rejects, so the herd
+# comes back spread out instead of in one wave. The presenter path is only subject to the global cap.
+# Refusals are counted in danmaku_ws_admission_rejects_total and logged as a periodic summary.
+
+import logging
+import math
+import random
+import time
+from http import HTTPStatus
+
+import websockets
+
+try:
+    from config import (WS_MAX_CONNECTIONS, WS_MAX_CONNECTIONS_PER_IP, WS_MAX_PENDING_REGISTRATIONS,
+                        WS_REGISTER_RATE, WS_REGISTER_BURST, WS_ADMISSION_MAX_LOOP_LAG,
+                        WS_RETRY_AFTER_MIN_MS, WS_RETRY_AFTER_MAX_MS, WS_PRESENTER_PATH)
+except ImportError:
+    WS_MAX_CONNECTIONS = 2000
+    WS_MAX_CONNECTIONS_PER_IP = 200
+    WS_MAX_PENDING_REGISTRATIONS = 200
+    WS_REGISTER_RATE = 50.0
+    WS_REGISTER_BURST = 100
+    WS_ADMISSION_MAX_LOOP_LAG = 0.25
+    WS_RETRY_AFTER_MIN_MS = 2000
+    WS_RETRY_AFTER_MAX_MS = 30000
+    WS_PRESENTER_PATH = "/presenter"
+
+from metrics import EVENT_LOOP_LAG, WS_ADMISSION_REJECTS
+
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TRY_AGAIN_LATER = 1013
+REJECT_LOG_INTERVAL = 5.0 # Seconds between "refused N connections" summaries
+REJECT_DECAY_SECONDS = 10.0 # Time constant of the recent-rejections estimate used for retry hints
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `burst`. Not thread-safe (event loop only)."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self) -> bool:
+        self._refill(time.monotonic())
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+
+class AdmissionController:
+    """Connection counts and admission decisions. Used from the event loop only."""
+
+    def __init__(self, max_connections=WS_MAX_CONNECTIONS, max_per_ip=WS_MAX_CONNECTIONS_PER_IP,
+                 max_pending=WS_MAX_PENDING_REGISTRATIONS, register_rate=WS_REGISTER_RATE,
+                 register_burst=WS_REGISTER_BURST, max_loop_lag=WS_ADMISSION_MAX_LOOP_LAG):
+        self.max_connections = max_connections
+        self.max_per_ip = max_per_ip
+        self.max_pending = max_pending
+        self.max_loop_lag = max_loop_lag
+        self.register_bucket = TokenBucket(register_rate, register_burst)
+        self.connections = 0
+        self.pending = 0 # Admitted but not registered yet
+        self._per_ip = {}
+        self._recent_rejects = 0.0
+        self._recent_updated = time.monotonic()
+        self._unlogged_rejects = {}
+        self._last_reject_log = 0.0
+        self._window_credits = 0 # Registrations admitted outside the caps after a handoff (open_reconnect_window)
+        self._window_until = 0.0
+
+    # --- Handshake ---
+    def admit_handshake(self, ip, presenter=False):
+        """Returns None and takes a connection slot, or the rejection reason."""
+        if self.connections >= self.max_connections:
+            return self._reject("global_cap")
+        if not presenter:
+            if self._per_ip.get(ip, 0) >= self.max_per_ip:
+                return self._reject("ip_cap")
+            in_window = self._in_reconnect_window()
+            if self.pending >= self.max_pending and not in_window:
+                return self._reject("pending_cap")
+            if EVENT_LOOP_LAG.value() > self.max_loop_lag and not in_window:
+                return self._reject("loop_pressure")
+        self.connections += 1
+        self.pending += 1
+        self._per_ip[ip] = self._per_ip.get(ip, 0) + 1
+        return None
+
+    def release(self, ip, registered):
+        self.connections -= 1
+        if not registered:
+            self.pending -= 1
+        remaining = self._per_ip.get(ip, 0) - 1
+        if remaining > 0:
+            self._per_ip[ip] = remaining
+        else:
+            self._per_ip.pop(ip, None)
+
+    # --- Registration ---
+    def admit_registration(self, presenter=False):
+        """Returns None (registration may proceed) or the rejection reason."""
+        if presenter or self.register_bucket.try_take():
+            return None
+        if self._in_reconnect_window():
+            self._window_credits -= 1
+            return None
+        return self._reject("register_rate")
+
+    def mark_registered(self):
+        self.pending -= 1
+
+    # --- Handoff (server_handoff.py) ---
+    def open_reconnect_window(self, expected, seconds):
+        """
+        The clients of the previous process are about to reconnect all at once (close 1012). For `seconds`,
+        up to `expected` of them skip the registration bucket, pending cap and loop pressure check;
+        the global and per-IP caps still apply.
+        """
+        self._window_credits = max(0, int(expected))
+        self._window_until = time.monotonic() + seconds
+        logging.info(f"ws_admission: Reconnect window open for {self._window_credits} clients ({seconds}s).")
+
+    def _in_reconnect_window(self):
+        return self._window_credits > 0 and time.monotonic() < self._window_until
+
+    # --- Retry hints ---
+    def _decay_recent(self, now):
+        self._recent_rejects *= math.exp(-(now - self._recent_updated) / REJECT_DECAY_SECONDS)
+        self._recent_updated = now
+
+    def retry_after_ms(self) -> int:
+        """Jittered over the time the registration bucket needs to let the recent rejects back in."""
+        self._decay_recent(time.monotonic())
+        spread_ms = self._recent_rejects / self.register_bucket.rate * 1000
+        upper = min(WS_RETRY_AFTER_MAX_MS, WS_RETRY_AFTER_MIN_MS + spread_ms)
+        return int(random.uniform(WS_RETRY_AFTER_MIN_MS, upper))
+
+    def _reject(self, reason):
+        now = time.monotonic()
+        self._decay_recent(now)
+        self._recent_rejects += 1
+        WS_ADMISSION_REJECTS.inc(reason)
+        self._unlogged_rejects[reason] = self._unlogged_rejects.get(reason, 0) + 1
+        if now - self._last_reject_log >= REJECT_LOG_INTERVAL:
+            summary = ", ".join(f"{name}={count}" for name, count in sorted(self._unlogged_rejects.items()))
+            logging.warning(f"ws_admission: Refused connections ({summary}); {self.connections} open, {self.pending} unregistered.")
+            self._unlogged_rejects = {}
+            self._last_reject_log = now
+        return reason
+
+    def stats(self) -> dict:
+        return {"connections": self.connections, "pending": self.pending, "ips": len(self._per_ip),
+                "recent_rejects": round(self._recent_rejects, 1),
+                "reconnect_window": self._window_credits if self._in_reconnect_window() else 0}
+
+
+_controller = None
+
+
+def init_admission(**overrides):
+    global _controller
+    _controller = AdmissionController(**overrides)
+    logging.info(f"ws_admission: Admission control initialized (max {_controller.max_connections} connections, "
+                 f"{_controller.max_per_ip} per IP, register rate {_controller.register_bucket.rate}/s).")
+    return _controller
+
+
+def get_admission_controller():
+    return _controller
+
+
+def _client_ip(websocket):
+    address = websocket.remote_address
+    return address[0] if address else None
+
+
+async def admit_registration(websocket, client_type):
+    """
+    Called by server.websocket_handler before dispatching "register". Returns True if the client may
+    register; otherwise the connection has been closed with 1013 and a retry hint.
+    """
+    controller = _controller
+    if controller is None:
+        return True
+    presenter_path = getattr(websocket, "admission_presenter", False)
+    if presenter_path and client_type != "presenter":
+        # The presenter path skipped the per-IP, pending and loop-pressure caps; it is not an audience entrance
+        controller._reject("path_mismatch")
+        await websocket.close(code=CLOSE_POLICY_VIOLATION, reason=f"{WS_PRESENTER_PATH} is for presenter clients")
+        return False
+    if controller.admit_registration(presenter=(presenter_path and client_type == "presenter")) is None:
+        if getattr(websocket, "admission_held", False) and not websocket.admission_registered:
+            websocket.admission_registered = True
+            controller.mark_registered()
+        return True
+    await websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason=f"retry_after_ms={controller.retry_after_ms()}")
+    return False
+
+
+class AdmissionServerProtocol(websockets.WebSocketServerProtocol):
+    """Refuses handshakes over the admission caps with HTTP 503 before the upgrade; releases the slot on close."""
+
+    admission_ip = None
+    admission_held = False # Holds a connection slot in the controller
+    admission_registered = False
+    admission_presenter = False # Admitted through the presenter path (exempt from the per-IP/pending/lag caps)
+
+    async def process_request(self, path, request_headers):
+        controller = _controller
+        if controller is not None:
+            ip = _client_ip(self)
+            presenter = (path or "").rstrip("/") == WS_PRESENTER_PATH
+            if controller.admit_handshake(ip, presenter=presenter) is not None:
+                retry_after_ms = controller.retry_after_ms()
+                return (HTTPStatus.SERVICE_UNAVAILABLE,
+                        [("Retry-After", str(math.ceil(retry_after_ms / 1000))), ("Connection", "close")],
+                        f"Server busy, retry in {retry_after_ms} ms\n".encode())
+            self.admission_ip = ip
+            self.admission_held = True
+            self.admission_presenter = presenter
+        return await super().process_request(path, request_headers)
+
+    def connection_lost(self, exc):
+        if self.admission_held and _controller is not None:
+            _controller.release(self.admission_ip, self.admission_registered)
+            self.admission_held = False
+        super().connection_lost(exc)
+
+
+__all__ = [
+    'AdmissionController', 'AdmissionServerProtocol', 'TokenBucket', 'CLOSE_TRY_AGAIN_LATER', 'CLOSE_POLICY_VIOLATION',
+    'init_admission', 'get_admission_controller', 'admit_registration',
+]
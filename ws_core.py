@@ -4,10 +4,11 @@ import json
 import logging
 import time # Still useful for timestamps in messages, etc.
 
-# Global sets to store connected clients
-# Each element is the websocket connection object
-PRESENTER_CLIENTS = set()
-AUDIENCE_CLIENTS = set()
+from metrics import DISPATCH_TOTAL, DISPATCH_SECONDS
+from ws_sessions import SESSIONS
+
+# Connected clients live in ws_sessions.SESSIONS (ClientSession per websocket, indexed by type and room)
+CLIENT_TYPES = ("presenter", "audience")
 
 # Global dictionary to hold registered action handlers {action_name: handler_function}
 ACTION_HANDLERS = {}
@@ -18,12 +19,20 @@ _SEND_MESSAGE_FUNC = None
 # Global reference to the broadcast function from server.py for broadcasting specific core messages
 _BROADCAST_MESSAGE_FUNC = None
 
+# Set while this process hands its sockets and show state to a new one (server_handoff.py):
+# actions are answered with a "server_restarting" warning instead of changing state that was already handed over
+_DRAINING = False
+_DRAINING_ALLOWED_ACTIONS = ("register", "pong")
+
 async def handle_register_client(websocket, data): 
     """Handles the 'register' action.""" 
     client_type = data.get("client_type") 
     if client_type: 
         # 调用内部的注册逻辑 
-        success = await register_client(websocket, client_type) # register_client 负责发送 registration_success 
+        room = data.get("room") # Optional; client-supplied, so bounded before it becomes an index key
+        capabilities = data.get("capabilities")
+        success = await register_client(websocket, client_type, room=str(room)[:64] if room else None, # register_client 负责发送 registration_success
+                                        capabilities=[str(c)[:64] for c in capabilities[:32]] if isinstance(capabilities, list) else None)
         # 初始状态同步现在由 server.py 在注册成功消息发送后，在 websocket_handler 中处理。 
     else: 
         logging.warning(f"ws_core: Client {websocket.remote_address} sent 'register' without 'client_type'.") 
@@ -61,84 +70,56 @@ def init_ws_core(send_message_to_ws_func, broadcast_message_func, *handler_regis
     logging.info(f"ws_core: WebSocket core initialized with {len(ACTION_HANDLERS)} action handlers.")
 
 
-async def register_client(websocket, client_type):
-    """Registers a new client connection by type."""
+def set_draining(draining):
+    """Turns action handling off (handoff in progress) or back on (handoff rolled back)."""
+    global _DRAINING
+    _DRAINING = bool(draining)
+    logging.info(f"ws_core: Action handling {'suspended for server handoff' if _DRAINING else 'resumed'}.")
+
+
+def is_draining():
+    return _DRAINING
+
+
+async def register_client(websocket, client_type, room=None, capabilities=None):
+    """Registers a new client connection by type (one ClientSession per websocket, see ws_sessions.py)."""
     addr = websocket.remote_address
 
-    if client_type == "presenter":
-        if websocket not in PRESENTER_CLIENTS:
-            PRESENTER_CLIENTS.add(websocket)
-            logging.info(f"ws_core: Presenter client registered: {addr}. Total presenters: {len(PRESENTER_CLIENTS)}")
-            if _SEND_MESSAGE_FUNC:
-                await _SEND_MESSAGE_FUNC(websocket, {"type": "registration_success", "client_type": client_type, "message": "Presenter registered successfully."})
-            return True
-        else:
-            logging.warning(f"ws_core: Client {addr} attempted to re-register as Presenter.")
-            if _SEND_MESSAGE_FUNC:
-                await _SEND_MESSAGE_FUNC(websocket, {"type": "warning", "message": f"已注册为 {client_type}", "context": "re_registration"})
-            return False
-
-    elif client_type == "audience":
-         if websocket not in AUDIENCE_CLIENTS:
-            AUDIENCE_CLIENTS.add(websocket)
-            logging.info(f"ws_core: Audience client registered: {addr}. Total audience: {len(AUDIENCE_CLIENTS)}")
-            if _SEND_MESSAGE_FUNC:
-                await _SEND_MESSAGE_FUNC(websocket, {"type": "registration_success", "client_type": client_type, "message": "Audience registered successfully."})
-            return True
-         else:
-             logging.warning(f"ws_core: Client {addr} attempted to re-register as Audience.")
-             if _SEND_MESSAGE_FUNC:
-                 await _SEND_MESSAGE_FUNC(websocket, {"type": "warning", "message": f"已注册为 {client_type}", "context": "re_registration"})
-             return False
-    else:
+    if client_type not in CLIENT_TYPES:
         logging.warning(f"ws_core: Attempted to register client {addr} with unknown type: {client_type}")
         if _SEND_MESSAGE_FUNC:
             await _SEND_MESSAGE_FUNC(websocket, {"type": "error", "message": f"未知客户端类型: {client_type}", "context": "registration_error"})
         return False
 
+    existing = SESSIONS.get(websocket)
+    if existing is not None:
+        logging.warning(f"ws_core: Client {addr} attempted to re-register as {client_type} (registered as {existing.client_type}).")
+        if _SEND_MESSAGE_FUNC:
+            await _SEND_MESSAGE_FUNC(websocket, {"type": "warning", "message": f"已注册为 {existing.client_type}", "context": "re_registration"})
+        return False
 
-async def unregister_client(websocket):
-    """Unregisters a client connection."""
-    addr = websocket.remote_address
-    removed_from_presenter = False
-    removed_from_audience = False
-    # 在函数开始处添加日志
-    logging.info(f"ws_core: 开始处理客户端 {addr} 的注销操作。当前主播客户端数量: {len(PRESENTER_CLIENTS)}，当前观众客户端数量: {len(AUDIENCE_CLIENTS)}，主播客户端地址: {[client.remote_address for client in PRESENTER_CLIENTS]}，观众客户端地址: {[client.remote_address for client in AUDIENCE_CLIENTS]}")
+    session = SESSIONS.add(websocket, client_type, room=room, capabilities=capabilities)
+    logging.info(f"ws_core: {client_type.capitalize()} client registered: {addr} (session {session.id}, room '{session.room}'). Total {client_type}s: {SESSIONS.count(client_type)}")
+    if _SEND_MESSAGE_FUNC:
+        await _SEND_MESSAGE_FUNC(websocket, {"type": "registration_success", "client_type": client_type, "message": f"{client_type.capitalize()} registered successfully."})
+    return True
 
-    if websocket in PRESENTER_CLIENTS:
-        try:
-            PRESENTER_CLIENTS.remove(websocket)
-            removed_from_presenter = True
-            logging.info(f"ws_core: 主播客户端 {addr} 已移除。当前主播客户端数量: {len(PRESENTER_CLIENTS)}，当前主播客户端地址: {[client.remote_address for client in PRESENTER_CLIENTS]}")
-        except KeyError:
-            logging.debug(f"ws_core: 主播客户端 {addr} 在注销时未在集合中找到（可能已被移除）。")
 
-    if websocket in AUDIENCE_CLIENTS:
-        try:
-            AUDIENCE_CLIENTS.remove(websocket)
-            removed_from_audience = True
-            logging.info(f"ws_core: 观众客户端 {addr} 已移除。当前观众客户端数量: {len(AUDIENCE_CLIENTS)}，当前观众客户端地址: {[client.remote_address for client in AUDIENCE_CLIENTS]}")
-        except KeyError:
-            logging.debug(f"ws_core: 观众客户端 {addr} 在注销时未在集合中找到（可能已被移除）。")
+async def unregister_client(websocket):
+    """Unregisters a client connection. Its session (browse path, counters, job references) goes with it."""
+    addr = websocket.remote_address
+    session = SESSIONS.remove(websocket)
 
-    if not removed_from_presenter and not removed_from_audience:
+    if session is None:
         logging.info(f"ws_core: 未注册或未知客户端断开连接: {addr}")
+        return
+    if session.client_type == "presenter":
+        logging.info(f"ws_core: 主播客户端 {addr} 已移除 (session {session.id})。当前主播客户端数量: {SESSIONS.count('presenter')}")
     else:
-        logging.info(f"ws_core: 客户端 {addr} 断开连接处理完成。")
-
-    # Clear presenter-specific states if it was a presenter
-    if removed_from_presenter:
-        try:
-             from ws_script_handlers import clear_presenter_browse_path
-             clear_presenter_browse_path(websocket)
-             logging.debug(f"ws_core: 已清除主播 {addr} 的脚本浏览路径。")
-        except ImportError:
-             logging.debug("ws_core: ws_script_handlers 或 clear_presenter_browse_path 不可用于清理。")
-        except Exception as e:  # 明确捕获异常类型
-            logging.debug(f"ws_core: 清理过程中发生意外错误: {e}")  # 添加缩进的代码块
-    
-    # 在函数结束处添加日志
-    logging.info(f"ws_core: 客户端 {addr} 的注销操作处理结束。当前主播客户端数量: {len(PRESENTER_CLIENTS)}，当前观众客户端数量: {len(AUDIENCE_CLIENTS)}，主播客户端地址: {[client.remote_address for client in PRESENTER_CLIENTS]}，观众客户端地址: {[client.remote_address for client in AUDIENCE_CLIENTS]}")
+        logging.debug(f"ws_core: 观众客户端 {addr} 已移除 (session {session.id})。当前观众客户端数量: {SESSIONS.count('audience')}")
+    if session.active_jobs():
+        # Jobs keep running (a presenter reloading the page must not stop a danmaku flow); they just lose their owner
+        logging.info(f"ws_core: Client {addr} disconnected with {session.active_jobs()} running job(s).")
 
 
 async def dispatch_message(websocket, data): 
@@ -154,15 +135,31 @@ async def dispatch_message(websocket, data):
             await _SEND_MESSAGE_FUNC(websocket, {"type": "error", "message": "消息缺少 'action' 字段。", "context": "dispatch"}) 
         return 
  
+    session = SESSIONS.get(websocket)
+    if session is not None:
+        session.messages_in += 1
+
+    if _DRAINING and action not in _DRAINING_ALLOWED_ACTIONS:
+        DISPATCH_TOTAL.inc("draining", "refused")
+        if _SEND_MESSAGE_FUNC:
+            await _SEND_MESSAGE_FUNC(websocket, {"type": "warning", "message": "服务器正在重启，连接将自动恢复，请稍后重试。", "action": action, "context": "server_restarting"})
+        return
+
     handler = ACTION_HANDLERS.get(action) 
     if handler: 
+        started = time.perf_counter()
         try: 
             await handler(websocket, data) 
+            DISPATCH_TOTAL.inc(action, "ok")
         except Exception as e: 
+            DISPATCH_TOTAL.inc(action, "error")
             logging.error(f"ws_core: Error processing message from {addr}: Action='{action}', Error: {e}", exc_info=True) 
             if _SEND_MESSAGE_FUNC: 
                 await _SEND_MESSAGE_FUNC(websocket, {"type": "error", "message": f"服务器处理消息时出错: {e}", "action": action, "context": "handler_error"}) 
+        finally:
+            DISPATCH_SECONDS.observe(time.perf_counter() - started, action)
     else: 
+        DISPATCH_TOTAL.inc("unknown", "unknown_action") # Don't label by client-supplied action names
         logging.warning(f"ws_core: No handler registered for action '{action}' from {addr}. Message: {data}") 
         if _SEND_MESSAGE_FUNC: 
             await _SEND_MESSAGE_FUNC(websocket, {"type": "error", "message": f"未知操作: {action}", "action": action, "context": "unknown_action"}) 
@@ -183,6 +180,8 @@ __all__ = [
     'dispatch_message', 
     'unregister_client', 
     'broadcast_message', 
-    'PRESENTER_CLIENTS', 
-    'AUDIENCE_CLIENTS', 
+    'register_client',
+    'set_draining',
+    'is_draining',
+    'CLIENT_TYPES',
 ]
\ No newline at end of file
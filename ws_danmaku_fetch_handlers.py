@@ -8,7 +8,8 @@ import json
 
 # Import from the new database package
 
-from database import get_db_manager, db_config, search_streamer_names, fetch_danmaku, fetch_reversal_copy_data, fetch_social_topics_data, fetch_anti_fan_quotes
+from database import get_db_manager, db_config, search_streamer_names, fetch_danmaku, fetch_reversal_copy_data, fetch_social_topics_data, fetch_anti_fan_quotes, fetch_distinct_values
+from readiness import requires_content # Answers warming_up until the content backend is connected
 
 
 
@@ -344,27 +345,14 @@ async def handle_search_topics(websocket, data):
 
     results = []
     try:
-        manager = get_db_manager()
-        db = manager.get_db() if manager and manager.is_connected() else None
-
-        if db:
-             # Assuming db_config.CAPTIONS_COLLECTION is 'Generated_Captions' or similar
-             # And documents in this collection have a field like 'topic_name' or 'theme'
-             collection_name = getattr(db_config, 'CAPTIONS_COLLECTION', 'Generated_Captions')
-             topic_field_name = getattr(db_config, 'CAPTIONS_TOPIC_FIELD', 'topic_name') # Or 'theme', 'event_name'
-
-             collection = db[collection_name]
-             
-             # Search for distinct topic names matching the term
-             # Using $regex for case-insensitive partial match
-             regex_query = {"$regex": term, "$options": "i"}
-             
-             # distinct() returns a list of unique values for the specified field
-             distinct_topics = collection.distinct(topic_field_name, {topic_field_name: regex_query})
-             
-             # Limit results server-side
-             results = distinct_topics[:20] 
-             logging.debug(f"ws_danmaku_fetch_handlers: Found {len(results)} distinct topics for term '{term}' in '{collection_name}'.")
+        # Assuming db_config.CAPTIONS_COLLECTION is 'Generated_Captions' or similar
+        # And documents in this collection have a field like 'topic_name' or 'theme'
+        collection_name = getattr(db_config, 'CAPTIONS_COLLECTION', 'Generated_Captions')
+        topic_field_name = getattr(db_config, 'CAPTIONS_TOPIC_FIELD', 'topic_name') # Or 'theme', 'event_name'
+
+        # Distinct topic names matching the term (case-insensitive partial match), limited server-side
+        results = fetch_distinct_values(collection_name, topic_field_name, term=term, limit=20)
+        logging.debug(f"ws_danmaku_fetch_handlers: Found {len(results)} distinct topics for term '{term}' in '{collection_name}'.")
 
         await websocket.send(json.dumps({
 
@@ -397,13 +385,13 @@ def register_danmaku_fetch_handlers():
 
     handlers = {
 
-        "fetch_danmaku_list": handle_fetch_danmaku_list,         # For Welcome_Danmaku, Mock_Danmaku
-        "fetch_reversal": handle_fetch_reversal,                 # For Reversal_Copy
-        "fetch_captions": handle_fetch_captions,                 # For Generated_Captions/Social_Topics
-        "fetch_anti_fan_quotes": handle_fetch_anti_fan_quotes,   # For Anti_Fan_Quotes (general fetch)
+        "fetch_danmaku_list": requires_content(handle_fetch_danmaku_list),         # For Welcome_Danmaku, Mock_Danmaku
+        "fetch_reversal": requires_content(handle_fetch_reversal),               # For Reversal_Copy
+        "fetch_captions": requires_content(handle_fetch_captions),               # For Generated_Captions/Social_Topics
+        "fetch_anti_fan_quotes": requires_content(handle_fetch_anti_fan_quotes),   # For Anti_Fan_Quotes (general fetch)
         
-        "search_streamers": handle_search_streamers,             # For streamer name autocomplete
-        "search_topics": handle_search_topics,                   # For topic/theme name autocomplete
+        "search_streamers": requires_content(handle_search_streamers),           # For streamer name autocomplete
+        "search_topics": requires_content(handle_search_topics),                 # For topic/theme name autocomplete
     }
 
     logging.info(f"ws_danmaku_fetch_handlers: Registering fetch handlers: {list(handlers.keys())}")
@@ -8,14 +8,20 @@ import time
 import re # 确保 re 已导入
 
 # Import from the new database package
-from database import get_db_manager, db_config, get_random_danmaku, fetch_danmaku
+from database import get_db_manager, db_config, get_random_danmaku, fetch_danmaku, fetch_distinct_values
+from metrics import ACTIVE_JOBS
+from ws_sessions import get_session
+from readiness import requires_content # Answers warming_up until the content backend is connected
 
 # Global references to dependencies
 _broadcast_message = None
 
-# Interval between sending individual danmaku within an auto-send group
-SEND_INTERVAL_MS = 2200
-GROUP_PAUSE_MS = 3000
+# Interval between sending individual danmaku within an auto-send group (config, overridable from the environment)
+try:
+    from config import SEND_INTERVAL_MS, GROUP_PAUSE_MS
+except ImportError:
+    SEND_INTERVAL_MS = 2200
+    GROUP_PAUSE_MS = 3000
 AUTO_SEND_DURATION_MS = 10000
 BOSS_GIFT_DANMAKU_DURATION_MS = 22000
 
@@ -27,6 +33,13 @@ def init_danmaku_send_handlers(broadcast_message_func):
     _broadcast_message = broadcast_message_func
     logging.info("ws_danmaku_send_handlers: Send handlers module initialized.")
 
+def build_danmaku_message(text, duration_ms=AUTO_SEND_DURATION_MS, is_roast=False):
+    """The 'danmaku' message audience pages render (also used by cue_scheduler)."""
+    return {
+        "type": "danmaku", "text": text, "duration_ms": duration_ms,
+        "is_roast": is_roast, "timestamp": time.time()
+    }
+
 def _is_db_connected():
     manager = get_db_manager()
     return manager and manager.is_connected()
@@ -55,10 +68,7 @@ async def _send_danmaku_group(danmaku_list, danmaku_type_label, websocket=None,
 
         processed_text = raw_text # 直接使用，因为已在 auto_send_boss_danmaku_flow 中处理
 
-        danmaku_message = {
-            "type": "danmaku", "text": processed_text, "duration_ms": duration_to_use,
-            "is_roast": is_roast, "timestamp": time.time()
-        }
+        danmaku_message = build_danmaku_message(processed_text, duration_to_use, is_roast)
         try:
             if _broadcast_message:
                 await _broadcast_message("audience", danmaku_message)
@@ -104,10 +114,9 @@ async def handle_auto_send_danmaku(websocket, data):
 
     welcome_danmaku_list_to_send = []
     roast_danmaku_list_to_send = []
+    job_active = False
     try:
-        db_manager = get_db_manager()
-        db = db_manager.get_db() if db_manager and db_manager.is_connected() else None
-        if db is None:
+        if not _is_db_connected():
             logging.error(f"ws_danmaku_send_handlers: DB connection lost before fetching danmaku for {streamer_name}.")
             await websocket.send(json.dumps({"type": "error", "message": "数据库连接丢失。", "context": "auto_send_db_fetch_error"}))
             # Re-enable buttons on error
@@ -115,40 +124,19 @@ async def handle_auto_send_danmaku(websocket, data):
             return # 直接返回，因为没有数据库连接无法继续
 
         # --- 获取欢迎弹幕 ---
-        welcome_collection = db[db_config.WELCOME_COLLECTION]
-        # 修改查询条件和字段名
-        welcome_query = {"streamer_name": {"$regex": f"^{re.escape(streamer_name)}$", "$options": "i"}}
-        welcome_projection = {"generated_danmaku": 1, "_id": 0}
-        welcome_doc = welcome_collection.find_one(welcome_query, welcome_projection)
-
-        if welcome_doc and 'generated_danmaku' in welcome_doc and isinstance(welcome_doc['generated_danmaku'], list):
-            source_welcome_list = [tpl for tpl in welcome_doc['generated_danmaku'] if isinstance(tpl, str) and tpl.strip()]
-            if source_welcome_list:
-                logging.info(f"ws_danmaku_send_handlers: Fetched {len(source_welcome_list)} 'welcome' danmaku for '{streamer_name}'.")
-                random.shuffle(source_welcome_list)
-                welcome_danmaku_list_to_send = source_welcome_list[:desired_count_per_type]
-            else:
-                logging.info(f"ws_danmaku_send_handlers: 'generated_danmaku' array for 'welcome' is empty or invalid for '{streamer_name}'.")
+        # fetch_danmaku 已经在超过 limit 时随机打乱并截取
+        welcome_danmaku_list_to_send = [tpl for tpl in fetch_danmaku(streamer_name, "welcome", limit=desired_count_per_type) if isinstance(tpl, str) and tpl.strip()]
+        if welcome_danmaku_list_to_send:
+            logging.info(f"ws_danmaku_send_handlers: Fetched {len(welcome_danmaku_list_to_send)} 'welcome' danmaku for '{streamer_name}'.")
         else:
-            logging.info(f"ws_danmaku_send_handlers: No 'welcome' danmaku document found for '{streamer_name}'.")
+            logging.info(f"ws_danmaku_send_handlers: No 'welcome' danmaku found for '{streamer_name}'.")
 
         # --- 获取吐槽弹幕 ---
-        mock_collection = db[db_config.MOCK_COLLECTION]
-        # 修改查询条件和字段名
-        roast_query = {"streamer_name": {"$regex": f"^{re.escape(streamer_name)}$", "$options": "i"}}
-        roast_projection = {"generated_danmaku": 1, "_id": 0}
-        roast_doc = mock_collection.find_one(roast_query, roast_projection)
-
-        if roast_doc and 'generated_danmaku' in roast_doc and isinstance(roast_doc['generated_danmaku'], list):
-            source_roast_list = [tpl for tpl in roast_doc['generated_danmaku'] if isinstance(tpl, str) and tpl.strip()]
-            if source_roast_list:
-                logging.info(f"ws_danmaku_send_handlers: Fetched {len(source_roast_list)} 'roast' (mock) danmaku for '{streamer_name}'.")
-                random.shuffle(source_roast_list)
-                roast_danmaku_list_to_send = source_roast_list[:desired_count_per_type]
-            else:
-                logging.info(f"ws_danmaku_send_handlers: 'generated_danmaku' array for 'roast' is empty or invalid for '{streamer_name}'.")
+        roast_danmaku_list_to_send = [tpl for tpl in fetch_danmaku(streamer_name, "roast", limit=desired_count_per_type) if isinstance(tpl, str) and tpl.strip()]
+        if roast_danmaku_list_to_send:
+            logging.info(f"ws_danmaku_send_handlers: Fetched {len(roast_danmaku_list_to_send)} 'roast' (mock) danmaku for '{streamer_name}'.")
         else:
-            logging.info(f"ws_danmaku_send_handlers: No 'roast' (mock) danmaku document found for '{streamer_name}'.")
+            logging.info(f"ws_danmaku_send_handlers: No 'roast' (mock) danmaku found for '{streamer_name}'.")
 
         # --- 后续发送逻辑 ---
         if not welcome_danmaku_list_to_send and not roast_danmaku_list_to_send:
@@ -160,6 +148,8 @@ async def handle_auto_send_danmaku(websocket, data):
             return
 
         logging.info(f"ws_danmaku_send_handlers: Starting auto-send for '{streamer_name}'. Welcome: {len(welcome_danmaku_list_to_send)}, Mock: {len(roast_danmaku_list_to_send)}")
+        ACTIVE_JOBS.inc("auto_send")
+        job_active = True
         await websocket.send(json.dumps({"type": "info", "message": f"开始自动发送 {streamer_name} 的弹幕...", "context": "auto_send_starting"}))
         await websocket.send(json.dumps({"type": "auto_send_started", "context": "auto_send_started"})) # 前端可以用这个消息来禁用按钮
 
@@ -181,9 +171,38 @@ async def handle_auto_send_danmaku(websocket, data):
         logging.error(f"ws_danmaku_send_handlers: Error during auto-send for '{streamer_name}' from {presenter_addr}: {e}", exc_info=True)
         await websocket.send(json.dumps({"type": "error", "message": f"自动发送弹幕时出错: {e}", "action": "auto_send_danmaku", "context": "auto_send_error"}))
     finally:
+        if job_active:
+            ACTIVE_JOBS.dec("auto_send")
         # 确保按钮在任何情况下都会重新启用
         await websocket.send(json.dumps({"type": "re_enable_auto_send_buttons", "context": "auto_send_finally_reenable"}))
 
+def fill_boss_template(raw_template, danmaku_type, boss_name, gift_name=""):
+    """Fills the {} placeholders of a boss template (welcome_boss: boss name; thanks_boss_gift: boss name, then gift name)."""
+    processed_text = raw_template
+    s_boss_name = str(boss_name) if boss_name else "大哥" # 默认值
+    s_gift_name = str(gift_name) if gift_name else "礼物" # 默认值
+
+    if danmaku_type == "welcome_boss":
+        # 欢迎大哥：只替换 boss_name
+        processed_text = processed_text.replace("{}", s_boss_name, 1)
+        if "{}" in processed_text:
+            logging.warning(f"ws_danmaku_send_handlers: Welcome boss template '{raw_template}' still contains '{{}}' after replacing boss_name: '{processed_text}'")
+
+    elif danmaku_type == "thanks_boss_gift":
+        # 感谢大哥礼物：模板通常是 "感谢{大哥名}的{礼物名}..."
+        # 按顺序替换：第一个 {} 是 boss_name，第二个 {} 是 gift_name
+
+        # 先替换第一个 {} 为 boss_name
+        if "{}" in processed_text:
+            processed_text = processed_text.replace("{}", s_boss_name, 1)
+        else: # 如果模板本身没有占位符，或者第一个已被意外处理（不太可能）
+            logging.warning(f"ws_danmaku_send_handlers: Thanks gift template '{raw_template}' did not have a first '{{}}' for boss_name.")
+
+        # 再替换（可能存在的）第二个 {} 为 gift_name
+        if "{}" in processed_text:
+            processed_text = processed_text.replace("{}", s_gift_name, 1)
+    return processed_text
+
 def _boss_task_done_callback(task):
     try:
         task.result() # 如果任务有异常，这里会重新抛出
@@ -248,6 +267,9 @@ async def handle_send_boss_danmaku(websocket, data):
         name=new_task_name
     )
     current_boss_danmaku_task.add_done_callback(_boss_task_done_callback)
+    session = get_session(websocket)
+    if session is not None:
+        session.add_job(current_boss_danmaku_task) # The presenter that started it owns the job
     logging.info(f"Created new boss danmaku task: {new_task_name}")
     await websocket.send(json.dumps({"type": "auto_send_started", "message": f"开始发送 {danmaku_type} 弹幕...", "context": f"send_boss_{danmaku_type}_started"}))
 
@@ -262,11 +284,11 @@ async def auto_send_boss_danmaku_flow(websocket, boss_name, gift_name, danmaku_t
     if danmaku_type == "welcome_boss":
         collection_name = db_config.BIG_BROTHERS_COLLECTION
         danmaku_type_label = "欢迎大哥"
-        db_field_name = "welcome_text"
+        db_field_name = db_config.TEXT_FIELDS[collection_name]
     elif danmaku_type == "thanks_boss_gift":
         collection_name = db_config.GIFT_THANKS_COLLECTION
         danmaku_type_label = "感谢大哥礼物"
-        db_field_name = "danmaku_text"
+        db_field_name = db_config.TEXT_FIELDS[collection_name] # 'danmaku_text', like fetch_danmaku("gift_thanks") and db_import
     else:
         logging.error(f"Task {task_name}: ws_danmaku_send_handlers: Invalid danmaku_type '{danmaku_type}' in auto_send_boss_danmaku_flow.")
         if websocket:
@@ -274,22 +296,20 @@ async def auto_send_boss_danmaku_flow(websocket, boss_name, gift_name, danmaku_t
         logging.info(f"Task {task_name}: Invalid danmaku type, RETURNING.")
         return
 
+    ACTIVE_JOBS.inc("boss_flow")
     try: # This is the main try block for the entire flow
-        db_manager = get_db_manager()
         logging.info(f"Task {task_name}: BEFORE checking DB connection")
-        db = db_manager.get_db() if db_manager and db_manager.is_connected() else None
-        logging.info(f"Task {task_name}: AFTER checking DB connection")
-        if db is None:
+        if not _is_db_connected():
             logging.error(f"Task {task_name}: ws_danmaku_send_handlers: DB connection lost before fetching {danmaku_type_label} templates for {boss_name}.")
             if websocket:
                 await websocket.send(json.dumps({"type": "error", "message": "数据库连接丢失。", "context": "send_boss_db_fetch_error"}))
             logging.info(f"Task {task_name}: DB connection lost, RETURNING.")
             return
+        logging.info(f"Task {task_name}: AFTER checking DB connection")
 
-        mongo_collection = db[collection_name]
         # 获取所有不为空的模板
         logging.info(f"Task {task_name}: BEFORE fetching distinct danmaku templates")
-        unique_danmaku_templates_raw = mongo_collection.distinct(db_field_name)
+        unique_danmaku_templates_raw = fetch_distinct_values(collection_name, db_field_name)
         logging.info(f"Task {task_name}: AFTER fetching distinct danmaku templates")
         unique_danmaku_templates = [tpl for tpl in unique_danmaku_templates_raw if isinstance(tpl, str) and tpl.strip()]
 
@@ -315,30 +335,7 @@ async def auto_send_boss_danmaku_flow(websocket, boss_name, gift_name, danmaku_t
 
         # 进行占位符替换
         for raw_template in temp_template_list:
-            processed_text = raw_template
-            s_boss_name = str(boss_name) if boss_name else "大哥" # 默认值
-            s_gift_name = str(gift_name) if gift_name else "礼物" # 默认值
-
-            if danmaku_type == "welcome_boss":
-                # 欢迎大哥：只替换 boss_name
-                processed_text = processed_text.replace("{}", s_boss_name, 1)
-                if "{}" in processed_text:
-                    logging.warning(f"Task {task_name}: ws_danmaku_send_handlers: Welcome boss template '{raw_template}' still contains '{{}}' after replacing boss_name: '{processed_text}'")
-
-            elif danmaku_type == "thanks_boss_gift":
-                # 感谢大哥礼物：模板通常是 "感谢{大哥名}的{礼物名}..."
-                # 按顺序替换：第一个 {} 是 boss_name，第二个 {} 是 gift_name
-
-                # 先替换第一个 {} 为 boss_name
-                if "{}" in processed_text:
-                    processed_text = processed_text.replace("{}", s_boss_name, 1)
-                else: # 如果模板本身没有占位符，或者第一个已被意外处理（不太可能）
-                    logging.warning(f"Task {task_name}: ws_danmaku_send_handlers: Thanks gift template '{raw_template}' did not have a first '{{}}' for boss_name.")
-
-                # 再替换（可能存在的）第二个 {} 为 gift_name
-                if "{}" in processed_text:
-                    processed_text = processed_text.replace("{}", s_gift_name, 1)
-            processed_danmaku_list.append(processed_text)
+            processed_danmaku_list.append(fill_boss_template(raw_template, danmaku_type, boss_name, gift_name))
 
         if not processed_danmaku_list:
             logging.info(f"Task {task_name}: No processed danmaku, RETURNING EARLY.")
@@ -372,6 +369,7 @@ async def auto_send_boss_danmaku_flow(websocket, boss_name, gift_name, danmaku_t
         if websocket:
             await websocket.send(json.dumps({"type": "error", "message": f"大哥弹幕自动发送时出错: {e}", "context": "send_boss_error"}))
     finally:
+        ACTIVE_JOBS.dec("boss_flow")
         # 确保按钮在任何情况下都会重新启用
         if websocket:
             await websocket.send(json.dumps({"type": "re_enable_auto_send_buttons", "context": "send_boss_finally_reenable"}))
@@ -381,8 +379,8 @@ def register_danmaku_send_handlers():
         logging.error("ws_danmaku_send_handlers: Dependencies missing. Send handlers will be unavailable.")
         return {}
     handlers = {
-        "auto_send_danmaku": handle_auto_send_danmaku,
-        "send_boss_danmaku": handle_send_boss_danmaku,
+        "auto_send_danmaku": requires_content(handle_auto_send_danmaku),
+        "send_boss_danmaku": requires_content(handle_send_boss_danmaku),
     }
     logging.info(f"ws_danmaku_send_handlers: Registering send handlers: {list(handlers.keys())}")
     return handlers
@@ -390,4 +388,6 @@ def register_danmaku_send_handlers():
 __all__ = [
     'init_danmaku_send_handlers',
     'register_danmaku_send_handlers',
+    'build_danmaku_message',
+    'fill_boss_template',
 ]
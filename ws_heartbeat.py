@@ -0,0 +1,208 @@
+# ws_heartbeat.py
+# Shared keepalive for all WebSocket connections (HEARTBEAT_MODE="wheel").
+# The websockets library keepalive runs one task per connection: an asyncio.sleep(ping_interval)
+# timer, then a wait_for(pong, ping_timeout) timer. With thousands of audience displays that is
+# thousands of timer handles in the loop's heap and thousands of task wake-ups per interval.
+#
+# Here every connection is an entry in one hashed timing wheel (HEARTBEAT_WHEEL_SLOTS slots of
+# HEARTBEAT_TICK seconds) driven by a single task. Each tick only the entries of the current slot are
+# visited: due connections get a ping (written synchronously, no drain), and connections whose ping
+# from the previous visit is still unanswered after PING_TIMEOUT are failed with 1011 like the
+# library does. New connections are placed at a random offset within the ping interval, so pings go
+# out in small staggered batches instead of in step with the connect order.
+# Scheduling/cancelling an entry is O(1); a tick costs O(entries in one slot).
+
+import asyncio
+import logging
+import random
+import struct
+import time
+
+import websockets
+from websockets.legacy.protocol import State
+from websockets.frames import OP_PING
+
+try:
+    from config import PING_INTERVAL, PING_TIMEOUT_FOR_WEBSOCKETS_LIB, HEARTBEAT_TICK, HEARTBEAT_WHEEL_SLOTS
+except ImportError:
+    PING_INTERVAL = 20
+    PING_TIMEOUT_FOR_WEBSOCKETS_LIB = 30
+    HEARTBEAT_TICK = 0.25
+    HEARTBEAT_WHEEL_SLOTS = 128
+
+from metrics import HEARTBEAT_PINGS, HEARTBEAT_TIMEOUTS
+
+
+class TimingWheel:
+    """
+    Hashed timing wheel. schedule(key, delay) puts key in slot (cursor + ticks) % slots with
+    ticks // slots remaining rounds; advance() moves the cursor one slot and returns the keys that
+    are due there. A key is in at most one slot; re-scheduling moves it.
+    """
+
+    def __init__(self, slots, tick):
+        self.tick = tick
+        self._slots = [dict() for _ in range(slots)] # key -> remaining rounds
+        self._where = {} # key -> slot index
+        self._cursor = 0
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def schedule(self, key, delay):
+        self.cancel(key)
+        ticks = max(1, int(round(delay / self.tick)))
+        rounds, offset = divmod(ticks, len(self._slots))
+        if offset == 0: # A full revolution lands on the current slot, which is visited again after `slots` ticks
+            rounds -= 1
+        index = (self._cursor + offset) % len(self._slots)
+        self._slots[index][key] = rounds
+        self._where[key] = index
+
+    def cancel(self, key):
+        index = self._where.pop(key, None)
+        if index is not None:
+            del self._slots[index][key]
+
+    def advance(self):
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        slot = self._slots[self._cursor]
+        due = []
+        for key, rounds in slot.items():
+            if rounds == 0:
+                due.append(key)
+            else:
+                slot[key] = rounds - 1
+        for key in due:
+            del slot[key]
+            del self._where[key]
+        return due
+
+
+class Heartbeat:
+    """Pings every connection each `interval`, fails it when a ping is unanswered after `timeout`."""
+
+    def __init__(self, interval=PING_INTERVAL, timeout=PING_TIMEOUT_FOR_WEBSOCKETS_LIB,
+                 tick=HEARTBEAT_TICK, slots=HEARTBEAT_WHEEL_SLOTS):
+        self.interval = interval
+        self.timeout = timeout
+        self.wheel = TimingWheel(slots, tick)
+        self._outstanding = {} # websocket -> (pong_waiter, sent_at) of the last ping
+        self.pings_sent = 0
+        self.timeouts = 0
+
+    def add(self, websocket):
+        # Random first ping within the interval: spreads connections that arrived together over the slots
+        self.wheel.schedule(websocket, random.uniform(self.wheel.tick, self.interval))
+
+    def remove(self, websocket):
+        self.wheel.cancel(websocket)
+        self._outstanding.pop(websocket, None)
+
+    def tick(self, now=None):
+        """Visits the connections due in the next slot. Returns the number visited."""
+        now = time.monotonic() if now is None else now
+        due = self.wheel.advance()
+        for websocket in due:
+            self._visit(websocket, now)
+        return len(due)
+
+    def _visit(self, websocket, now):
+        if websocket.state is not State.OPEN:
+            self._outstanding.pop(websocket, None)
+            return
+        outstanding = self._outstanding.get(websocket)
+        if outstanding is not None:
+            pong_waiter, sent_at = outstanding
+            if not pong_waiter.done():
+                if now - sent_at >= self.timeout - self.wheel.tick / 2:
+                    self._fail(websocket)
+                else:
+                    self.wheel.schedule(websocket, sent_at + self.timeout - now)
+                return
+            if now - sent_at < self.interval - self.wheel.tick / 2: # Pong checked early (timeout < interval)
+                self.wheel.schedule(websocket, sent_at + self.interval - now)
+                return
+        self._ping(websocket, now)
+
+    def _ping(self, websocket, now):
+        # Same bookkeeping as WebSocketCommonProtocol.ping(), so the library resolves the waiter on pong,
+        # but written without awaiting drain(): a ping is a few bytes and the batch must not yield per connection.
+        data = struct.pack("!I", random.getrandbits(32))
+        while data in websocket.pings:
+            data = struct.pack("!I", random.getrandbits(32))
+        pong_waiter = websocket.loop.create_future()
+        websocket.pings[data] = (pong_waiter, time.perf_counter())
+        try:
+            websocket.write_frame_sync(True, OP_PING, data)
+        except Exception as e:
+            logging.debug(f"ws_heartbeat: Ping to {websocket.remote_address} failed: {e}")
+            websocket.pings.pop(data, None)
+            self._outstanding.pop(websocket, None)
+            return
+        self._outstanding[websocket] = (pong_waiter, now)
+        self.pings_sent += 1
+        HEARTBEAT_PINGS.inc()
+        self.wheel.schedule(websocket, min(self.interval, self.timeout))
+
+    def _fail(self, websocket):
+        self._outstanding.pop(websocket, None)
+        self.timeouts += 1
+        HEARTBEAT_TIMEOUTS.inc()
+        logging.info(f"ws_heartbeat: No pong from {websocket.remote_address} within {self.timeout}s, closing.")
+        websocket.fail_connection(1011, "keepalive ping timeout")
+
+    async def run(self):
+        """The only timer: sleeps until the next tick, catching up on missed ticks if the loop was late."""
+        loop = asyncio.get_running_loop()
+        tick = self.wheel.tick
+        next_tick = loop.time() + tick
+        logging.info(f"ws_heartbeat: Shared heartbeat started (interval {self.interval}s, timeout {self.timeout}s, tick {tick}s, {len(self.wheel._slots)} slots).")
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            now = time.monotonic()
+            while next_tick <= loop.time():
+                try:
+                    self.tick(now)
+                except Exception as e:
+                    logging.error(f"ws_heartbeat: Error during heartbeat tick: {e}", exc_info=True)
+                next_tick += tick
+
+    def stats(self) -> dict:
+        return {"connections": len(self.wheel), "awaiting_pong": sum(1 for waiter, _ in self._outstanding.values() if not waiter.done()),
+                "pings_sent": self.pings_sent, "timeouts": self.timeouts}
+
+
+_heartbeat = None
+
+
+def init_heartbeat(**overrides):
+    global _heartbeat
+    _heartbeat = Heartbeat(**overrides)
+    return _heartbeat
+
+
+def get_heartbeat():
+    return _heartbeat
+
+
+class HeartbeatServerProtocol(websockets.WebSocketServerProtocol):
+    """Adds open connections to the shared heartbeat (if initialized) and removes them when the connection is lost."""
+
+    def connection_open(self):
+        super().connection_open()
+        if _heartbeat is not None:
+            _heartbeat.add(self)
+
+    def connection_lost(self, exc):
+        if _heartbeat is not None:
+            _heartbeat.remove(self)
+        super().connection_lost(exc)
+
+
+__all__ = [
+    'TimingWheel', 'Heartbeat', 'HeartbeatServerProtocol', 'init_heartbeat', 'get_heartbeat',
+]
@@ -6,7 +6,16 @@ import random
 import re # Import re for string splitting
 import asyncio # Import asyncio
 import time # FIX: 添加这一行，导入 time 模块
-from database import get_db_manager, db_config, fetch_anti_fan_quotes # 新增导入语句
+from database import get_db_manager, db_config # 新增导入语句
+from roast_engine import get_roast_pool
+from state_sync import publish_state
+from readiness import requires_content # Answers warming_up until the content backend is connected
+
+try:
+    from config import ROAST_SEQUENCE_LENGTH, ROAST_EXTEND_MAX
+except ImportError:
+    ROAST_SEQUENCE_LENGTH = 3
+    ROAST_EXTEND_MAX = 20
 
 # Global references to dependencies
 # These will be assigned by the init_roast_handlers function
@@ -46,7 +55,11 @@ async def handle_get_roast_sequence(websocket, data):
     logging.info(f"ws_roast_handlers: Presenter ({presenter_addr}) requested roast sequence for target: '{target_name}'")
 
     try:
-        templates = fetch_anti_fan_quotes(limit=3)
+        # One in-memory draw from the quote pool (loaded from the DB once, refreshed in the background),
+        # random and not repeating quotes this target already heard
+        pool = get_roast_pool()
+        await pool.ensure_loaded()
+        templates = pool.draw(target_name, ROAST_SEQUENCE_LENGTH)
     except Exception as e:
         logging.error(f"ws_roast_handlers: Error fetching anti-fan quotes for roast sequence from {presenter_addr}: {e}", exc_info=True)
         await websocket.send(json.dumps({"type": "error", "message": f"获取怼人语录时出错: {e}", "action": "get_roast_sequence", "context": "roast_fetch_error"}))
@@ -59,11 +72,11 @@ async def handle_get_roast_sequence(websocket, data):
         await websocket.send(json.dumps({"type": "re_enable_auto_send_buttons", "context": "roast_empty_db_reenable"}))
         return
 
-    # 启动怼黑粉序列
+    # 启动怼黑粉序列（弹幕/提示部分在这里一次性拆分好）
     _state_manager.start_roast_sequence(target_name, templates)
 
-    # 获取并发送第一条语录的内容到前端，以便 UI 立即显示
-    first_danmaku_part, first_presenter_line, first_raw_template, first_num, first_total = _state_manager.get_next_roast_template()
+    # 获取并发送第一条语录的内容到前端，以便 UI 立即显示（只预览，不移动索引：第一次 advance_roast 发送的就是这一条）
+    first_danmaku_part, first_presenter_line, first_raw_template, first_num, first_total = _state_manager.peek_next_roast_template()
 
     if first_danmaku_part is None:
         logging.error(f"ws_roast_handlers: Failed to get first roast template for {target_name}. Templates: {templates}")
@@ -84,52 +97,44 @@ async def handle_get_roast_sequence(websocket, data):
         "initial_roast_num": first_num,
         "initial_total_roasts": first_total
     }))
+    await publish_state() # Other presenter consoles see roast mode start (state_delta)
     logging.info(f"ws_roast_handlers: Roast sequence for target '{target_name}' loaded with {len(templates)} templates. Ready to advance. From {presenter_addr}.")
-
-    if _db_manager is None: # This check remains relevant if _db_manager is used elsewhere for connection status
-        logging.error(f"ws_roast_handlers: DB manager not initialized. Cannot fetch roast quotes for {target_name}.")
-        await websocket.send(json.dumps({"type": "error", "message": "服务器内部错误：数据库连接未初始化。", "context": "roast_db_init_error"}))
-        await websocket.send(json.dumps({"type": "re_enable_auto_send_buttons", "context": "roast_db_init_error_reenable"}))
-        return
-
-    # Send a message to the presenter indicating the process has started (optional, but good UX)
-    await websocket.send(json.dumps({"type": "info", "message": f"正在获取 {target_name} 的怼人语录...", "context": "roast_fetching"}))
+    # The frontend handler for "roast_sequence_ready" will update the UI
+    # (hide start button, show advance/exit buttons, re-enable them via re_enable_auto_send_buttons).
 
 
+async def handle_extend_roast_sequence(websocket, data):
+    """
+    Handles 'extend_roast': appends more quotes to the running roast sequence.
+    data: {"count": int (optional, default ROAST_SEQUENCE_LENGTH)}. Drawn from the in-memory pool, no DB round trip.
+    """
+    presenter_addr = f"{websocket.remote_address}" if websocket else "N/A"
+    current_target = _state_manager.get_current_state().get('current_roast_target') if _state_manager else None
+    if not current_target:
+        await websocket.send(json.dumps({"type": "warning", "message": "当前不在怼人模式。", "context": "roast_extend_inactive"}))
+        return
     try:
-        # FIX: Call the facade function directly, and remove 'await' because fetch_anti_fan_quotes is synchronous
-        templates = fetch_anti_fan_quotes(limit=3)
-
-        if not templates:
-            logging.info(f"ws_roast_handlers: No anti-fan quotes found in collection '{ANTI_FAN_COLLECTION}'.")
-            await websocket.send(json.dumps({"type": "info", "message": "数据库中没有找到怼黑粉语录。", "context": "roast_empty_db"}))
-            await websocket.send(json.dumps({"type": "re_enable_auto_send_buttons", "context": "roast_empty_db_reenable"}))
-            return
-
-        logging.info(f"ws_roast_handlers: Fetched {len(templates)} anti-fan quotes for roast sequence.")
-
-        # Initialize roast sequence state in State Manager
-        # State manager stores the raw templates list and target name
-        _state_manager.start_roast_sequence(target_name, templates)
-
-        # Send confirmation message to presenter indicating readiness
-        await websocket.send(json.dumps({
-            "type": "roast_sequence_ready",
-            "target_name": target_name,
-            "total_roasts": len(templates),
-            "message": f"已加载 {len(templates)} 条语录。", # Message for status display
-            "context": "roast_ready"
-        }))
-        logging.info(f"ws_roast_handlers: Roast sequence for target '{target_name}' loaded with {len(templates)} templates. Ready to advance. From {presenter_addr}.")
+        count = min(max(1, int(data.get("count") or ROAST_SEQUENCE_LENGTH)), ROAST_EXTEND_MAX)
+    except (TypeError, ValueError):
+        count = ROAST_SEQUENCE_LENGTH
 
-        # The frontend handler for "roast_sequence_ready" will update the UI
-        # (hide start button, show advance/exit buttons, re-enable them via re_enable_auto_send_buttons).
-
-
-    except Exception as e:
-        logging.error(f"ws_roast_handlers: Error fetching anti-fan quotes for roast sequence from {presenter_addr}: {e}", exc_info=True)
-        await websocket.send(json.dumps({"type": "error", "message": f"获取怼人语录时出错: {e}", "action": "get_roast_sequence", "context": "roast_fetch_error"}))
-        await websocket.send(json.dumps({"type": "re_enable_auto_send_buttons", "context": "roast_fetch_error_reenable"}))
+    pool = get_roast_pool()
+    await pool.ensure_loaded()
+    templates = pool.draw(current_target, count)
+    if not templates:
+        await websocket.send(json.dumps({"type": "info", "message": "数据库中没有找到怼黑粉语录。", "context": "roast_empty_db"}))
+        return
+    total = _state_manager.extend_roast_sequence(templates)
+    await websocket.send(json.dumps({
+        "type": "roast_sequence_extended",
+        "target_name": current_target,
+        "added": len(templates),
+        "total_roasts": total,
+        "message": f"已追加 {len(templates)} 条语录（共 {total} 条）。",
+        "context": "roast_extended"
+    }))
+    await publish_state()
+    logging.info(f"ws_roast_handlers: Roast sequence for '{current_target}' extended by {len(templates)} to {total} from {presenter_addr}.")
 
 
 async def handle_advance_roast_sequence(websocket, data):
@@ -151,8 +156,8 @@ async def handle_advance_roast_sequence(websocket, data):
     current_state = _state_manager.get_current_state()
     target_name = current_state.get('current_roast_target_name', 'N/A')
 
-    # 调用 _state_manager.get_next_roast_template() 来获取下一条文案数据 
-    danmaku_part_to_send, presenter_line_to_display, raw_template_for_display, current_num, total_num = _state_manager.get_next_roast_template() 
+    # 先预览下一条文案数据；发送后由 advance_roast_sequence() 移动索引并记录当前提示（进入状态快照、增量同步和状态日志）
+    danmaku_part_to_send, presenter_line_to_display, raw_template_for_display, current_num, total_num = _state_manager.peek_next_roast_template() 
 
     if danmaku_part_to_send is None: # 表示序列已结束 
         current_state = _state_manager.get_current_state()
@@ -165,6 +170,7 @@ async def handle_advance_roast_sequence(websocket, data):
             "target_name": target_name, 
             "context": "roast_finished_natural" 
         })) 
+        await publish_state()
         await websocket.send(json.dumps({"type": "re_enable_auto_send_buttons", "context": "roast_finished_natural_reenable"})) 
         return 
  
@@ -192,6 +198,7 @@ async def handle_advance_roast_sequence(websocket, data):
             logging.error(f"ws_roast_handlers: Error sending roast danmaku #{current_num} to audience: {e}", exc_info=True) 
     else: 
         logging.warning(f"ws_roast_handlers: No processed danmaku to send for template #{current_num}.") 
+    _state_manager.advance_roast_sequence(danmaku_part_to_send, presenter_line_to_display, raw_template_for_display)
 
     # --- Send Presenter Update Message ---
     # Send message to the presenter with the split prompt and other relevant info for the next step
@@ -207,6 +214,7 @@ async def handle_advance_roast_sequence(websocket, data):
         # Optionally include the danmaku that was just sent for reference on presenter UI
         "danmaku_sent": danmaku_part_to_send
     }))
+    await publish_state()
     logging.debug(f"ws_roast_handlers: Presenter ('{presenter_addr}'): Sent roast update #{current_num}/{total_num} for {target_name}. Presenter Line: '{presenter_line_to_display}'. Raw Template: '{raw_template_for_display}'")
 
 
@@ -241,6 +249,7 @@ async def handle_exit_roast_mode(websocket, data):
         "target_name": current_target, # Include target name for frontend context
         "context": "roast_exit"
     }))
+    await publish_state()
     logging.info(f"ws_roast_handlers: Exited roast mode for {current_target}. Sent roast_sequence_finished to {presenter_addr}.")
 
     # Signal client to re-enable buttons (start roast, script nav, etc.)
@@ -262,9 +271,10 @@ def register_roast_handlers():
     """
     logging.info("ws_roast_handlers: Registering roast handlers.")
     handlers = {
-        "get_roast_sequence": handle_get_roast_sequence, # Action to start fetching roast quotes
+        "get_roast_sequence": requires_content(handle_get_roast_sequence), # Action to start fetching roast quotes
         "advance_roast": handle_advance_roast_sequence,     # Action to send the current roast danmaku and get next prompt
         "exit_roast_mode": handle_exit_roast_mode,         # Action to exit the roast mode
+        "extend_roast": requires_content(handle_extend_roast_sequence), # Action to append more quotes to the running sequence
         # Add other roast-related actions and their handlers here if any
     }
     logging.info(f"ws_roast_handlers: Registered handlers: {list(handlers.keys())}")
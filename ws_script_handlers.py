@@ -1,10 +1,19 @@
 # ws_script_handlers.py
 
+import asyncio
 import logging
 import os
 from pathlib import Path
 import json # Need json for sending messages
 
+import config
+from script_cache import get_script_cache
+from script_tree import get_listing_cache, DIR_ENTRY, SCRIPT_ENTRY
+from script_search import get_search_index
+from cue_scheduler import get_cue_scheduler
+from state_sync import get_state_sync, publish_state
+from ws_sessions import get_session
+
 # Assume script_parser.py exists and has parse_script_file function
 try:
     from script_parser import parse_script_file
@@ -34,9 +43,20 @@ if not SCRIPTS_DIR.exists():
         logging.error(f"ws_script_handlers: Failed to create scripts directory at {SCRIPTS_DIR}: {e}")
 
 
-# Dictionary to track the current browsing path for each presenter client {websocket: current_path_str}
-# This allows different presenters to browse different directories simultaneously
-_presenter_browse_paths = {}
+# Each presenter's current browsing path is ClientSession.browse_path (ws_sessions.py), so different
+# presenters can browse different directories simultaneously and the path goes away with the session
+def _get_browse_path(websocket):
+    session = get_session(websocket)
+    return session.browse_path if session is not None else "."
+
+
+def _set_browse_path(websocket, relative_path):
+    session = get_session(websocket)
+    if session is not None:
+        session.browse_path = relative_path
+
+# Background pre-parse of the directory a presenter is browsing (one at a time)
+_preparse_task = None
 
 
 def init_script_handlers(state_manager_instance): # Removed db_manager_instance parameter
@@ -74,7 +94,7 @@ async def handle_browse_script_path(websocket, data):
                  logging.warning(f"ws_script_handlers: Presenter {presenter_addr} attempted path traversal: {req_path_str} resolved to {requested_path}")
                  await websocket.send(json.dumps({"type": "error", "message": "无效的路径。", "context": "path_traversal"}))
                  # Send script options for the current valid path instead of an error
-                 current_valid_path = _presenter_browse_paths.get(websocket, ".") # Get their last known valid path
+                 current_valid_path = _get_browse_path(websocket) # Get their last known valid path
                  await _send_script_options(websocket, current_valid_path)
                  return
 
@@ -86,134 +106,144 @@ async def handle_browse_script_path(websocket, data):
             # Otherwise, calculate the relative path from SCRIPTS_DIR
             current_relative_path = requested_path.relative_to(SCRIPTS_DIR).as_posix() # Use as_posix() for consistent path separators
 
-        _presenter_browse_paths[websocket] = current_relative_path # Store the current valid path for this presenter
+        _set_browse_path(websocket, current_relative_path) # Store the current valid path for this presenter
 
         # Send the updated options list for the new path
-        await _send_script_options(websocket, current_relative_path)
+        await _send_script_options(websocket, current_relative_path, *_parse_browse_page_args(data))
 
 
     except Exception as e:
         logging.error(f"ws_script_handlers: Error browsing path '{req_path_str}' for {presenter_addr}: {e}", exc_info=True)
         await websocket.send(json.dumps({"type": "error", "message": f"浏览目录时出错: {e}", "context": "browse_error"}))
         # On error, try to send options for the last known valid path
-        current_valid_path = _presenter_browse_paths.get(websocket, ".")
+        current_valid_path = _get_browse_path(websocket)
         await _send_script_options(websocket, current_valid_path) # Attempt to send options for last good path
 
 
-async def _send_script_options(websocket, relative_path_str):
-    """Fetches and sends the list of items in a given relative path within SCRIPTS_DIR."""
-    presenter_addr = websocket.remote_address
+def _build_script_options_message(relative_path_str, name_filter="", offset=0, limit=None):
+    """
+    Builds the 'script_options_update' message for a directory (blocking: runs in a worker thread).
+    Raises FileNotFoundError / NotADirectoryError for bad paths.
+    """
     full_path_to_browse = SCRIPTS_DIR / relative_path_str
-
-    if not full_path_to_browse.exists(): # Check if path exists at all
-         logging.warning(f"ws_script_handlers: Requested path does not exist: {full_path_to_browse}")
-         await websocket.send(json.dumps({"type": "error", "message": "请求的路径不存在。", "context": "path_not_found"}))
-         # Attempt to send options for the last known valid path
-         current_valid_path = _presenter_browse_paths.get(websocket, ".")
-         # Avoid potential infinite recursion if '.' itself is problematic.
-         # This check might not be strictly necessary if the initial browse of '.' always works or fails fast.
-         # Let's remove this recursive attempt on error for simplicity unless proven needed.
-         # if relative_path_str != ".":
-         #    await _send_script_options(websocket, current_valid_path)
-         return
-
-    if not full_path_to_browse.is_dir():
-         logging.warning(f"ws_script_handlers: Requested path is not a directory: {full_path_to_browse}")
-         await websocket.send(json.dumps({"type": "error", "message": "请求的路径不是一个目录。", "context": "not_a_directory"}))
-         # Attempt to send options for the last known valid path. Similar to above, simplify.
-         # current_valid_path = _presenter_browse_paths.get(websocket, ".")
-         # if relative_path_str != current_valid_path:
-         #    await _send_script_options(websocket, current_valid_path)
-         return
+    # Cached per directory until its mtime changes (see script_tree.py)
+    page, total = get_listing_cache().list_page(full_path_to_browse, name_filter, offset, limit)
+
+    # Build the options list for the frontend
+    options = []
+    # Add ".." option if not at the root SCRIPTS_DIR (first page only, it is not part of the paginated listing)
+    if relative_path_str != "." and offset == 0:
+         # Calculate the path for ".." relative to SCRIPTS_DIR
+         parent_path = full_path_to_browse.parent
+         parent_relative_path = parent_path.relative_to(SCRIPTS_DIR).as_posix() if parent_path != SCRIPTS_DIR else "."
+         options.append({"name": "../", "path": parent_relative_path, "type": DIR_ENTRY})
+
+    for item_name, item_type in page:
+        # Calculate the relative path of the item from SCRIPTS_DIR
+        item_relative_path = (full_path_to_browse / item_name).relative_to(SCRIPTS_DIR).as_posix()
+        if item_type == DIR_ENTRY:
+            options.append({"name": f"{item_name}/", "path": item_relative_path, "type": DIR_ENTRY})
+        else:
+            options.append({"name": item_name, "path": item_relative_path, "type": SCRIPT_ENTRY})
+
+    # Build the breadcrumb path
+    # Split the relative path and build breadcrumb names
+    breadcrumb_list = [{"name": "脚本根目录", "path": "."}] # Link for root
+    cumulative_path_parts = []
+    for part in relative_path_str.split('/'):
+        if part and part != '.': # Ignore empty parts and the initial '.'
+             cumulative_path_parts.append(part)
+             # Join parts with '/' and use as_posix()
+             breadcrumb_list.append({"name": part, "path": Path(*cumulative_path_parts).as_posix()})
+
+    return {
+        "type": "script_options_update",
+        "current_path": relative_path_str, # Send the relative path string
+        "breadcrumb": breadcrumb_list, # Send list of {name, path} dicts for breadcrumb
+        "options": options,
+        # Pagination/filter echo: the client appends pages with offset > 0
+        "filter": name_filter,
+        "offset": offset,
+        "limit": limit,
+        "total": total,
+        "has_more": limit is not None and offset + limit < total,
+    }
 
 
-    items_list = []
-    breadcrumb_list = []
+async def _send_script_options(websocket, relative_path_str, name_filter="", offset=0, limit=None):
+    """Fetches and sends (a page of) the items in a given relative path within SCRIPTS_DIR."""
+    presenter_addr = websocket.remote_address
 
     try:
-        # Get list of items in the directory
-        logging.debug(f"ws_script_handlers: Browsing directory: {full_path_to_browse}") # DEBUG LOG
-        raw_items = []
-        try:
-            raw_items = list(full_path_to_browse.iterdir())
-        except Exception as e_iter:
-            logging.error(f"ws_script_handlers: Error during iterdir for {full_path_to_browse}: {e_iter}", exc_info=True) # DEBUG LOG
-
-        logging.debug(f"ws_script_handlers: Raw items found in {full_path_to_browse}: {[item.name for item in raw_items]}") # DEBUG LOG
-
-        items_list = sorted([item.name for item in raw_items])
-
-        # Build the options list for the frontend
-        options = []
-        # Add ".." option if not at the root SCRIPTS_DIR
-        if relative_path_str != ".":
-             # Calculate the path for ".." relative to SCRIPTS_DIR
-             parent_path = full_path_to_browse.parent
-             parent_relative_path = parent_path.relative_to(SCRIPTS_DIR).as_posix() if parent_path != SCRIPTS_DIR else "."
-             options.append({"name": "../", "path": parent_relative_path, "type": "browse_dir"})
-
-
-        for item_name in items_list:
-            item_path = full_path_to_browse / item_name
-            logging.debug(f"ws_script_handlers: Checking item: {item_path}, is_dir: {item_path.is_dir()}, is_file: {item_path.is_file()}, suffix: {item_path.suffix.lower()}") # DEBUG LOG
-            # Calculate the relative path of the item from SCRIPTS_DIR
-            try:
-                 item_relative_path = item_path.relative_to(SCRIPTS_DIR).as_posix()
-            except ValueError:
-                 logging.warning(f"ws_script_handlers: Failed to calculate relative path for item {item_path}. Skipping.")
-                 continue # Skip this item
-
-            if item_path.is_dir():
-                options.append({"name": f"{item_name}/", "path": item_relative_path, "type": "browse_dir"})
-            elif item_path.is_file() and item_path.suffix.lower() == ".txt": # Only list .txt files as scripts
-                options.append({"name": item_name, "path": item_relative_path, "type": "script_file"})
-
-        # Build the breadcrumb path
-        # Split the relative path and build breadcrumb names
-        path_parts = relative_path_str.split('/')
-        current_breadcrumb_path_str = ""
-        breadcrumb_list.append({"name": "脚本根目录", "path": "."}) # Link for root
-
-        # Build breadcrumb for subdirectories
-        # Join parts incrementally to build paths
-        cumulative_path_parts = []
-        for part in path_parts:
-            if part and part != '.': # Ignore empty parts and the initial '.'
-                 cumulative_path_parts.append(part)
-                 # Join parts with '/' and use as_posix()
-                 breadcrumb_path = Path(*cumulative_path_parts).as_posix()
-                 breadcrumb_list.append({"name": part, "path": breadcrumb_path})
-
-
-        message = {
-            "type": "script_options_update",
-            "current_path": relative_path_str, # Send the relative path string
-            "breadcrumb": breadcrumb_list, # Send list of {name, path} dicts for breadcrumb
-            "options": options
-        }
-        await websocket.send(json.dumps(message))
-        logging.info(f"ws_script_handlers: Sent script options for '{relative_path_str}' to {presenter_addr}. Found {len(options)} items.")
-
+        # Directory listing and stat calls stay off the event loop (slow on network shares)
+        message = await asyncio.to_thread(_build_script_options_message, relative_path_str, name_filter, offset, limit)
+    except FileNotFoundError:
+        logging.warning(f"ws_script_handlers: Requested path does not exist: {SCRIPTS_DIR / relative_path_str}")
+        await websocket.send(json.dumps({"type": "error", "message": "请求的路径不存在。", "context": "path_not_found"}))
+        return
+    except NotADirectoryError:
+        logging.warning(f"ws_script_handlers: Requested path is not a directory: {SCRIPTS_DIR / relative_path_str}")
+        await websocket.send(json.dumps({"type": "error", "message": "请求的路径不是一个目录。", "context": "not_a_directory"}))
+        return
     except Exception as e:
         logging.error(f"ws_script_handlers: Error sending script options for '{relative_path_str}' to {presenter_addr}: {e}", exc_info=True)
         await websocket.send(json.dumps({"type": "error", "message": f"获取脚本列表时出错: {e}", "context": "list_scripts_error"}))
+        return
 
+    await websocket.send(json.dumps(message))
+    logging.info(f"ws_script_handlers: Sent script options for '{relative_path_str}' to {presenter_addr}. "
+                 f"Sent {len(message['options'])} of {message['total']} items (offset {offset}, filter '{name_filter}').")
 
-async def handle_load_script(websocket, data):
-    """Handles the 'load_script' action."""
-    if _state_manager is None or parse_script_file is None:
-         logging.error("ws_script_handlers: Handlers not initialized or parser missing. Cannot process load_script.")
-         await websocket.send(json.dumps({"type": "error", "message": "服务器内部错误：脚本功能未初始化或解析器缺失。", "context": "load_init"}))
-         return
+    # Warm the parsed-script cache so picking one of these scripts loads instantly
+    if offset == 0:
+        _schedule_preparse(SCRIPTS_DIR / relative_path_str)
 
 
-    script_relative_path_str = data.get("filename") # This should be the relative path from the frontend
+def _parse_browse_page_args(data):
+    """Reads the optional 'filter', 'offset' and 'limit' fields of a browse_scripts request."""
+    name_filter = str(data.get("filter") or "").strip()
+    try:
+        offset = max(0, int(data.get("offset") or 0))
+    except (TypeError, ValueError):
+        offset = 0
+    limit = data.get("limit")
+    try:
+        limit = None if limit is None else min(max(1, int(limit)), config.SCRIPT_BROWSE_MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        limit = None
+    return name_filter, offset, limit
+
+
+def _schedule_preparse(directory):
+    """Starts a background pre-parse of the scripts in directory unless one is already running."""
+    global _preparse_task
+    if not config.SCRIPT_PREPARSE_ENABLED:
+        return
+    if _preparse_task is not None and not _preparse_task.done():
+        return
+    _preparse_task = asyncio.create_task(
+        asyncio.to_thread(get_script_cache().preparse_directory, directory, config.SCRIPT_LOAD_MODE, config.SCRIPT_LAZY_MIN_BYTES),
+        name="script_preparse",
+    )
+    _preparse_task.add_done_callback(_preparse_done_callback)
+
+
+def _preparse_done_callback(task):
+    if not task.cancelled() and task.exception() is not None:
+        logging.warning(f"ws_script_handlers: Background script pre-parse failed: {task.exception()}")
+
+
+async def _resolve_script_file(websocket, script_relative_path_str):
+    """
+    Resolves a script path sent by a presenter to a .txt file inside SCRIPTS_DIR.
+    Sends the error to the presenter and returns None if it is not acceptable.
+    """
     presenter_addr = websocket.remote_address
 
     if not script_relative_path_str:
         logging.warning(f"ws_script_handlers: Presenter {presenter_addr} sent load_script with no filename.")
         await websocket.send(json.dumps({"type": "error", "message": "未提供脚本文件名。", "context": "load_no_filename"}))
-        return
+        return None
 
     # Resolve the full path, ensuring it is within the SCRIPTS_DIR
     script_full_path = (SCRIPTS_DIR / script_relative_path_str).resolve(strict=False)
@@ -222,31 +252,44 @@ async def handle_load_script(websocket, data):
     if not script_full_path.is_relative_to(SCRIPTS_DIR):
         logging.warning(f"ws_script_handlers: Presenter {presenter_addr} attempted to load script outside SCRIPTS_DIR: {script_relative_path_str} resolved to {script_full_path}")
         await websocket.send(json.dumps({"type": "error", "message": "无效的脚本文件路径。", "context": "load_path_traversal"}))
-        return
+        return None
 
     if not script_full_path.is_file():
         logging.warning(f"ws_script_handlers: Presenter {presenter_addr} attempted to load path that is not a file: {script_full_path}")
         await websocket.send(json.dumps({"type": "error", "message": "请求的路径不是一个文件。", "context": "load_not_a_file"}))
-        return
+        return None
 
     if script_full_path.suffix.lower() != ".txt":
          logging.warning(f"ws_script_handlers: Presenter {presenter_addr} attempted to load non-.txt file as script: {script_full_path}")
          await websocket.send(json.dumps({"type": "error", "message": "仅支持加载 .txt 文件。", "context": "load_wrong_type"}))
+         return None
+
+    return script_full_path
+
+
+async def handle_load_script(websocket, data):
+    """Handles the 'load_script' action."""
+    if _state_manager is None or parse_script_file is None:
+         logging.error("ws_script_handlers: Handlers not initialized or parser missing. Cannot process load_script.")
+         await websocket.send(json.dumps({"type": "error", "message": "服务器内部错误：脚本功能未初始化或解析器缺失。", "context": "load_init"}))
          return
 
 
+    script_relative_path_str = data.get("filename") # This should be the relative path from the frontend
+    presenter_addr = websocket.remote_address
+    script_full_path = await _resolve_script_file(websocket, script_relative_path_str)
+    if script_full_path is None:
+        return
+
     logging.info(f"ws_script_handlers: Presenter {presenter_addr} requested to load script: {script_full_path}")
 
-    # Load the script using the state manager
-    success = _state_manager.load_script(script_full_path)
+    # Load the script using the state manager (file I/O runs in a worker thread)
+    success = await _state_manager.load_script_async(script_full_path)
 
     if success:
         logging.info(f"ws_script_handlers: Script '{script_relative_path_str}' loaded by {presenter_addr}.")
-        # Send the initial state of the loaded script back to the presenter
-        current_state = _state_manager.get_current_state()
-        # Modify state data for presenter-specific message if needed, or reuse generic
-        # Let's reuse get_current_state and send a specific message type for the presenter
-        await websocket.send(json.dumps({"type": "script_loaded_presenter", **current_state}))
+        # The new script state goes to every presenter as a versioned state_delta
+        await publish_state()
 
         # Optional: Notify audience page that a new script is loaded (if audience needs to know filename)
         # This would require a broadcast to audience clients - needs broadcast_message dependency
@@ -261,8 +304,8 @@ async def handle_load_script(websocket, data):
     else:
         logging.error(f"ws_script_handlers: Failed to load script '{script_full_path}' for {presenter_addr}.")
         await websocket.send(json.dumps({"type": "error", "message": f"加载脚本时出错: {script_full_path}", "context": "load_script_error"}))
-        # Also send an empty state update to clear frontend if loading failed
-        await websocket.send(json.dumps({"type": "script_loaded_presenter", "script_filename": None, "total_events": 0, "event_index": -1, "current_line": "", "current_prompt": ""}))
+        # A failed load clears the script; presenters get the cleared state as a state_delta
+        await publish_state()
 
 
 async def handle_prev_event(websocket, data):
@@ -277,15 +320,13 @@ async def handle_prev_event(websocket, data):
 
     try:
         new_index = _state_manager.prev_event()
-        current_state = _state_manager.get_current_state()
 
-        # Send state update to the presenter who triggered the action
-        # Using presenter_generic_update for navigation updates
-        await websocket.send(json.dumps({"type": "presenter_generic_update", **current_state}))
+        # Changed fields go to every presenter console (not just the one that clicked) as a state_delta
+        await publish_state()
 
         # Optional: Broadcast the new state to audience clients if they need to update display
         # This might be redundant if audience only cares about the *current* line/prompt being displayed
-        # and presenter_generic_update is not needed for audience.
+        # and the presenter state is not needed for audience.
         # If audience needs *any* update on presenter navigation, broadcast here.
         # Let's assume audience display updates based on explicit 'audience_display' message types sent by core/server
         # Need the broadcast_message function for this. Add it to init if needed.
@@ -315,10 +356,14 @@ async def handle_next_event(websocket, data):
 
     try:
         new_index = _state_manager.advance_event()
-        current_state = _state_manager.get_current_state()
 
-        # Send state update to the presenter who triggered the action
-        await websocket.send(json.dumps({"type": "presenter_generic_update", **current_state}))
+        # Fire the timed cues attached to the event we just reached
+        cue_scheduler = get_cue_scheduler()
+        if cue_scheduler is not None and 0 <= new_index < _state_manager._total_events:
+            cue_scheduler.on_event_reached(new_index)
+
+        # Changed fields go to every presenter console as a state_delta
+        await publish_state()
 
         # Optional: Broadcast the new state to audience clients
         # If _broadcast_message is available and audience needs updates:
@@ -343,11 +388,84 @@ async def handle_next_event(websocket, data):
         await websocket.send(json.dumps({"type": "error", "message": f"导航到下一条出错: {e}", "context": "next_event_error"}))
 
 
+async def handle_search_scripts(websocket, data):
+    """
+    Handles the 'search_scripts' action: full-text search over all scripts in SCRIPTS_DIR.
+    data: {"query": str, "limit": int (optional)}. Replies with 'script_search_results'.
+    """
+    query = str(data.get("query") or "").strip()
+    presenter_addr = websocket.remote_address
+    if not query:
+        await websocket.send(json.dumps({"type": "script_search_results", "query": "", "results": []}))
+        return
+    try:
+        limit = min(max(1, int(data.get("limit") or 20)), config.SCRIPT_SEARCH_MAX_RESULTS)
+    except (TypeError, ValueError):
+        limit = 20
+
+    try:
+        # (Re)indexing changed files and ranking run in a worker thread
+        results = await asyncio.to_thread(get_search_index().search, query, limit)
+    except Exception as e:
+        logging.error(f"ws_script_handlers: Error searching scripts for '{query}' ({presenter_addr}): {e}", exc_info=True)
+        await websocket.send(json.dumps({"type": "error", "message": f"搜索脚本时出错: {e}", "context": "search_scripts_error"}))
+        return
+
+    logging.info(f"ws_script_handlers: Presenter {presenter_addr} searched scripts for '{query}': {len(results)} hits.")
+    await websocket.send(json.dumps({"type": "script_search_results", "query": query, "results": results}))
+
+
+async def handle_jump_to_event(websocket, data):
+    """
+    Handles the 'jump_to_event' action: seeks straight to an event, e.g. a search hit.
+    data: {"event_index": int, "filename": relative script path (optional; loaded first if it is not the current script)}
+    """
+    if _state_manager is None:
+         logging.error("ws_script_handlers: State manager not initialized. Cannot process jump_to_event.")
+         await websocket.send(json.dumps({"type": "error", "message": "服务器内部错误：状态管理器缺失。", "context": "jump_init"}))
+         return
+
+    presenter_addr = websocket.remote_address
+    try:
+        event_index = int(data.get("event_index"))
+    except (TypeError, ValueError):
+        await websocket.send(json.dumps({"type": "error", "message": "无效的事件序号。", "context": "jump_invalid_index"}))
+        return
+
+    script_relative_path_str = data.get("filename")
+    if script_relative_path_str:
+        script_full_path = await _resolve_script_file(websocket, script_relative_path_str)
+        if script_full_path is None:
+            return
+        if str(script_full_path) != _state_manager.get_script_path():
+            if not await _state_manager.load_script_async(script_full_path):
+                await websocket.send(json.dumps({"type": "error", "message": f"加载脚本时出错: {script_relative_path_str}", "context": "load_script_error"}))
+                return
+            logging.info(f"ws_script_handlers: Loaded '{script_relative_path_str}' for jump_to_event from {presenter_addr}.")
+
+    if _state_manager.jump_to_event(event_index) is None:
+        await websocket.send(json.dumps({"type": "error", "message": f"事件序号超出范围: {event_index}", "context": "jump_out_of_range"}))
+        return
+
+    await publish_state()
+    logging.info(f"ws_script_handlers: Presenter {presenter_addr} jumped to event index {event_index}.")
+
+
+async def handle_cancel_cues(websocket, data):
+    """Handles the 'cancel_cues' action: stops pending and running script cues."""
+    cue_scheduler = get_cue_scheduler()
+    cancelled = cue_scheduler.cancel_all() if cue_scheduler is not None else 0
+    logging.info(f"ws_script_handlers: Presenter {websocket.remote_address} cancelled {cancelled} cue(s).")
+    await websocket.send(json.dumps({"type": "info", "message": f"已取消 {cancelled} 个脚本提示。", "context": "cues_cancelled"}))
+
+
 async def handle_get_current_event_for_presenter(websocket, data):
     """
-    Handles the 'get_current_event_for_presenter' action.
+    Handles the 'get_current_state' action.
     Sends the current script state back to the requesting presenter.
     Useful for syncing UI on reconnect or exiting modes.
+    data: {"since_version": int, "epoch": int (optional)} - with them, the reply is a state_delta with
+    the changes since that version when the server still has them, else a full state_snapshot.
     """
     if _state_manager is None:
          logging.error("ws_script_handlers: State manager not initialized. Cannot process get_current_event_for_presenter.")
@@ -358,9 +476,19 @@ async def handle_get_current_event_for_presenter(websocket, data):
     logging.info(f"ws_script_handlers: Presenter {presenter_addr} requested current state.")
 
     try:
-        current_state = _state_manager.get_current_state()
-        # Send the state specifically using the presenter-specific message type
-        await websocket.send(json.dumps({"type": "script_loaded_presenter", **current_state})) # Reuse type for initial load
+        state_sync = get_state_sync()
+        if state_sync is None:
+            current_state = _state_manager.get_current_state()
+            await websocket.send(json.dumps({"type": "script_loaded_presenter", **current_state})) # Unversioned fallback
+            return
+        since_version = data.get("since_version")
+        if since_version is not None:
+            try:
+                since_version = int(since_version)
+            except (TypeError, ValueError):
+                since_version = None
+        message = state_sync.resync_message(since_version, data.get("epoch")) if since_version is not None else state_sync.snapshot_message()
+        await websocket.send(json.dumps(message))
 
     except Exception as e:
         logging.error(f"ws_script_handlers: Error processing get_current_event_for_presenter for {presenter_addr}: {e}", exc_info=True)
@@ -372,17 +500,9 @@ async def send_initial_script_options(websocket):
     """Sends the initial script options for the root directory to a newly connected presenter."""
     # This function is called by server.py after presenter registration
     # Set their initial browse path context to root
-    _presenter_browse_paths[websocket] = "."
+    _set_browse_path(websocket, ".")
     await _send_script_options(websocket, ".")
 
-# --- Helper for clearing browse path on presenter disconnect ---
-def clear_presenter_browse_path(websocket):
-    """Removes the presenter's browsing path context on disconnect."""
-    if websocket in _presenter_browse_paths:
-        del _presenter_browse_paths[websocket]
-        logging.debug(f"ws_script_handlers: Cleared browse path for {websocket.remote_address}.")
-
-
 # --- Registering Handlers (called by ws_core) ---
 def register_script_handlers():
     """Registers script-related WebSocket action handlers."""
@@ -398,6 +518,9 @@ def register_script_handlers():
         "prev_event": handle_prev_event,
         "next_event": handle_next_event,
         "get_current_state": handle_get_current_event_for_presenter,
+        "search_scripts": handle_search_scripts,
+        "jump_to_event": handle_jump_to_event,
+        "cancel_cues": handle_cancel_cues,
     }
     logging.info(f"ws_script_handlers: Registering script handlers: {list(handlers.keys())}")
     return handlers
@@ -407,7 +530,6 @@ __all__ = [
     'init_script_handlers',
     'register_script_handlers',
     'send_initial_script_options', # Called by server.py after registration
-    'clear_presenter_browse_path', # Called by ws_core.py on disconnect
     # handle_get_current_event_for_presenter is needed by server.py's initial sync logic
     'handle_get_current_event_for_presenter', # Called by server.py after initial registration
 ]
@@ -0,0 +1,151 @@
+# ws_sessions.py
+# Registry of connected clients. One ClientSession per registered WebSocket holds what used to be
+# spread over ws_core's PRESENTER_CLIENTS/AUDIENCE_CLIENTS sets and ws_script_handlers'
+# _presenter_browse_paths dict: id, client type, room, capabilities, browse path, the jobs
+# (asyncio tasks) the client started, and per-client counters.
+#
+# SESSIONS keeps indexed views by client type and by room (dicts keyed by websocket, so add and
+# remove are O(1)) and hands out iteration snapshots: a tuple per view, built on first use after a
+# membership change and reused by every broadcast until the next register/unregister, instead of
+# copying (or, for "all", unioning) the client sets on every broadcast.
+
+import itertools
+import time
+
+DEFAULT_ROOM = "main"
+
+
+class ClientSession:
+    """One registered connection. __slots__: thousands of these live as long as the connections."""
+
+    __slots__ = (
+        "id", "websocket", "client_type", "room", "capabilities", "browse_path", "jobs",
+        "connected_at", "messages_in", "messages_out", "send_failures",
+    )
+
+    def __init__(self, session_id, websocket, client_type, room=DEFAULT_ROOM, capabilities=frozenset()):
+        self.id = session_id
+        self.websocket = websocket
+        self.client_type = client_type
+        self.room = room
+        self.capabilities = capabilities
+        self.browse_path = "." # Presenter script browsing position (ws_script_handlers)
+        self.jobs = None # Set of asyncio tasks started for this client, created on first add_job
+        self.connected_at = time.time()
+        self.messages_in = 0
+        self.messages_out = 0
+        self.send_failures = 0
+
+    @property
+    def remote_address(self):
+        return self.websocket.remote_address
+
+    def add_job(self, task):
+        """Tracks a task started on behalf of this client until it finishes."""
+        if self.jobs is None:
+            self.jobs = set()
+        self.jobs.add(task)
+        task.add_done_callback(self.jobs.discard)
+
+    def active_jobs(self) -> int:
+        return 0 if not self.jobs else sum(1 for task in self.jobs if not task.done())
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id, "client_type": self.client_type, "room": self.room,
+            "capabilities": sorted(self.capabilities), "browse_path": self.browse_path,
+            "remote_address": str(self.remote_address), "connected_at": self.connected_at,
+            "messages_in": self.messages_in, "messages_out": self.messages_out,
+            "send_failures": self.send_failures, "active_jobs": self.active_jobs(),
+        }
+
+    def __repr__(self):
+        return f"ClientSession(id={self.id}, type={self.client_type}, room={self.room}, addr={self.remote_address})"
+
+
+class SessionRegistry:
+    """Sessions indexed by websocket, client type and room; event loop only (not thread-safe)."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._by_websocket = {} # websocket -> ClientSession
+        self._by_type = {} # client_type -> {websocket: ClientSession}
+        self._by_room = {} # room -> {websocket: ClientSession}
+        self._snapshots = {} # (client_type or None, room or None) -> tuple of sessions
+
+    def __len__(self):
+        return len(self._by_websocket)
+
+    def __contains__(self, websocket):
+        return websocket in self._by_websocket
+
+    def get(self, websocket):
+        return self._by_websocket.get(websocket)
+
+    def add(self, websocket, client_type, room=DEFAULT_ROOM, capabilities=()):
+        """Registers websocket (which must not be registered yet) and returns its session."""
+        session = ClientSession(next(self._ids), websocket, client_type, room or DEFAULT_ROOM, frozenset(capabilities or ()))
+        self._by_websocket[websocket] = session
+        self._by_type.setdefault(client_type, {})[websocket] = session
+        self._by_room.setdefault(session.room, {})[websocket] = session
+        self._invalidate(session)
+        return session
+
+    def remove(self, websocket):
+        """Unregisters websocket; returns its session, or None if it was not registered."""
+        session = self._by_websocket.pop(websocket, None)
+        if session is None:
+            return None
+        for index, key in ((self._by_type, session.client_type), (self._by_room, session.room)):
+            view = index[key]
+            del view[websocket]
+            if not view:
+                del index[key]
+        self._invalidate(session)
+        return session
+
+    def clear(self):
+        self._by_websocket.clear()
+        self._by_type.clear()
+        self._by_room.clear()
+        self._snapshots.clear()
+
+    def _invalidate(self, session):
+        snapshots = self._snapshots
+        for key in ((None, None), (session.client_type, None), (None, session.room), (session.client_type, session.room)):
+            snapshots.pop(key, None)
+
+    def snapshot(self, client_type=None, room=None) -> tuple:
+        """Sessions of a view (all / one type / one room / type in room) as a tuple shared until membership changes."""
+        key = (client_type, room)
+        sessions = self._snapshots.get(key)
+        if sessions is None:
+            if room is None:
+                source = self._by_websocket if client_type is None else self._by_type.get(client_type, {})
+                sessions = tuple(source.values())
+            else:
+                members = self._by_room.get(room, {}).values()
+                sessions = tuple(members) if client_type is None else tuple(s for s in members if s.client_type == client_type)
+            self._snapshots[key] = sessions
+        return sessions
+
+    def count(self, client_type=None) -> int:
+        if client_type is None:
+            return len(self._by_websocket)
+        return len(self._by_type.get(client_type, ()))
+
+    def rooms(self) -> dict:
+        return {room: len(members) for room, members in self._by_room.items()}
+
+
+SESSIONS = SessionRegistry()
+
+
+def get_session(websocket):
+    """The ClientSession of a registered websocket, or None."""
+    return SESSIONS.get(websocket)
+
+
+__all__ = [
+    'ClientSession', 'SessionRegistry', 'SESSIONS', 'DEFAULT_ROOM', 'get_session',
+]
@@ -0,0 +1,100 @@
+# ws_transport.py
+# Per-client-type WebSocket transport settings (config.WS_TRANSPORT_PROFILES).
+# Hundreds of audience overlays only receive small danmaku JSON, so their connections get
+# compression off (or small deflate windows) and small read/queue/write buffers; the few
+# presenter consoles send and receive larger messages (script listings, state snapshots).
+#
+# The profile is chosen from the request path during the opening handshake ("/presenter" ->
+# WS_PRESENTER_PROFILE, anything else -> WS_AUDIENCE_PROFILE), which is the only point where
+# permessage-deflate can be negotiated. After "register" the buffer limits are set again for
+# the registered client type, in case a client connected on an unexpected path.
+# The StreamReader read limit is fixed when the connection is created, so it is one global
+# setting (WS_READ_LIMIT).
+
+import logging
+
+import websockets
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+try:
+    from config import WS_TRANSPORT_PROFILES, WS_AUDIENCE_PROFILE, WS_PRESENTER_PROFILE, WS_PRESENTER_PATH
+except ImportError:
+    WS_TRANSPORT_PROFILES = {
+        "default": {"compression": "deflate", "window_bits": 12, "mem_level": 5, "max_size": 2**20, "max_queue": 32, "write_limit": 2**16},
+    }
+    WS_AUDIENCE_PROFILE = "default"
+    WS_PRESENTER_PROFILE = "default"
+    WS_PRESENTER_PATH = "/presenter"
+
+
+def get_transport_profile(name):
+    profile = WS_TRANSPORT_PROFILES.get(name)
+    if profile is None:
+        logging.warning(f"ws_transport: Unknown transport profile '{name}', using 'default'.")
+        profile = WS_TRANSPORT_PROFILES["default"]
+    return profile
+
+
+def profile_name_for_client_type(client_type):
+    return WS_PRESENTER_PROFILE if client_type == "presenter" else WS_AUDIENCE_PROFILE
+
+
+def profile_name_for_path(path):
+    return WS_PRESENTER_PROFILE if (path or "").rstrip("/") == WS_PRESENTER_PATH else WS_AUDIENCE_PROFILE
+
+
+def server_extensions(profile):
+    """permessage-deflate factory list for a profile (empty = no compression)."""
+    if profile.get("compression") != "deflate":
+        return []
+    window_bits = profile.get("window_bits", 12)
+    no_context_takeover = profile.get("no_context_takeover", False)
+    return [ServerPerMessageDeflateFactory(
+        server_no_context_takeover=no_context_takeover,
+        client_no_context_takeover=no_context_takeover,
+        server_max_window_bits=window_bits,
+        client_max_window_bits=window_bits,
+        compress_settings={"memLevel": profile.get("mem_level", 5)},
+    )]
+
+
+def apply_buffer_limits(websocket, profile):
+    """Incoming message size / queue and outgoing write buffer limits; safe to call on an open connection."""
+    websocket.max_size = profile.get("max_size")
+    websocket.max_queue = profile.get("max_queue")
+    write_limit = profile.get("write_limit")
+    if write_limit is not None:
+        websocket.write_limit = write_limit
+        transport = getattr(websocket, "transport", None)
+        if transport is not None:
+            transport.set_write_buffer_limits(write_limit)
+
+
+def apply_transport_profile(websocket, client_type):
+    """Called after a successful register: buffer limits of the registered client type."""
+    name = profile_name_for_client_type(client_type)
+    if getattr(websocket, "transport_profile", None) != name:
+        apply_buffer_limits(websocket, get_transport_profile(name))
+        websocket.transport_profile = name
+
+
+class ProfiledServerProtocol(websockets.WebSocketServerProtocol):
+    """Server protocol that negotiates compression and sets buffer limits from the path's transport profile."""
+
+    transport_profile = None
+
+    async def process_request(self, path, request_headers):
+        self.transport_profile = profile_name_for_path(path)
+        apply_buffer_limits(self, get_transport_profile(self.transport_profile))
+        return await super().process_request(path, request_headers)
+
+    def process_extensions(self, headers, available_extensions):
+        if self.transport_profile is not None:
+            available_extensions = server_extensions(get_transport_profile(self.transport_profile))
+        return super().process_extensions(headers, available_extensions)
+
+
+__all__ = [
+    'ProfiledServerProtocol', 'apply_transport_profile', 'get_transport_profile',
+    'profile_name_for_client_type', 'profile_name_for_path', 'server_extensions',
+]